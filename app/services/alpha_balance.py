@@ -0,0 +1,249 @@
+"""
+Capacity-balanced alphabetical buckets (sorting.default_mode: alpha_balanced).
+
+Provides:
+ - name_key(name): normalized sort key (casefolded, accents stripped, non-letters as spaces;
+   a non A-Z first character sorts as "a", like alpha_exact)
+ - learn_weights(names, prefix_len, max_prefix_len, split_above): card counts per name prefix;
+   prefixes heavier than split_above are refined to longer prefixes (St -> Sta, Ste, ...)
+ - balance(weights, cells, expected_cards) -> BalancedMap: contiguous prefix ranges over the
+   placement cells (grid order), sized to each cell's capacity so the fullest cell is as
+   empty as possible
+ - BalancedMap.lookup(name) -> (cell_id, label); save/load as JSON between runs
+ - rebalance(cfg, names, expected_cards): learn + balance + save, installed as cfg.balanced
+ - names_from_ledger(root) / names_from_db(cards, sample): where the distribution comes from
+
+Ranges stay alphabetical across cells (B1 holds "a"-"bo", B2 "bp"-"ch", ...), so piles
+concatenated in cell order are still in letter order; S and B get several cells while X, Y
+and Z share one. A map only changes between runs (all placement cells empty): a range moved
+mid-run would mix two ranges in one pile.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import bisect
+import json
+import os
+import random
+import unicodedata
+
+DEFAULT_FILE = os.path.join("data", "state", "alpha_ranges.json")
+
+
+def name_key(name: str) -> str:
+    s = unicodedata.normalize("NFKD", (name or "").strip()).casefold()
+    s = "".join(ch if "a" <= ch <= "z" else " " for ch in s if not unicodedata.combining(ch))
+    if not s or s[0] == " ":
+        s = "a" + s[1:]
+    return s
+
+
+def learn_weights(names: Iterable[str], prefix_len: int = 2, max_prefix_len: int = 4,
+                  split_above: Optional[float] = None) -> Dict[str, int]:
+    """Cards per prefix; a prefix with more than split_above cards is split one level deeper."""
+    keys = [name_key(n) for n in names if n]
+
+    def count(ks: List[str], length: int) -> Dict[str, List[str]]:
+        groups: Dict[str, List[str]] = {}
+        for k in ks:
+            groups.setdefault(k[:length], []).append(k)
+        return groups
+
+    out: Dict[str, int] = {}
+    todo = [(p, ks, prefix_len) for p, ks in count(keys, prefix_len).items()]
+    while todo:
+        p, ks, length = todo.pop()
+        if split_above is not None and len(ks) > split_above and length < max_prefix_len:
+            sub = count(ks, length + 1)
+            if len(sub) > 1:
+                todo.extend((sp, sks, length + 1) for sp, sks in sub.items())
+                continue
+        out[p] = len(ks)
+    return out
+
+
+@dataclass
+class BalancedMap:
+    starts: List[str]                        # first prefix of each range (starts[0] == "")
+    cells: List[str]
+    labels: List[str]
+    predicted: Dict[str, float] = field(default_factory=dict)   # expected cards per cell
+    expected_cards: int = 0
+    source: str = ""
+
+    def lookup(self, name: str) -> Tuple[str, str]:
+        i = max(0, bisect.bisect_right(self.starts, name_key(name)) - 1)
+        return self.cells[i], self.labels[i]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "starts": self.starts,
+            "cells": self.cells,
+            "labels": self.labels,
+            "predicted": self.predicted,
+            "expected_cards": self.expected_cards,
+            "source": self.source,
+        }
+
+    def save(self, path: str = DEFAULT_FILE) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf8") as fh:
+            json.dump(self.as_dict(), fh, indent=1)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_FILE) -> Optional["BalancedMap"]:
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf8") as fh:
+            d = json.load(fh)
+        return cls(d["starts"], d["cells"], d["labels"], d.get("predicted", {}),
+                   int(d.get("expected_cards", 0)), d.get("source", ""))
+
+
+# ---------- Partitioning ----------
+def _fill(w: List[float], caps: List[float], r: float) -> Optional[List[int]]:
+    """Greedy: fill each cell up to r * capacity. Cut indices, or None if it does not fit."""
+    cuts, i, n = [], 0, len(w)
+    for c in caps:
+        load = 0.0
+        while i < n and load + w[i] <= r * c + 1e-9:
+            load += w[i]
+            i += 1
+        cuts.append(i)
+    return cuts if i == n else None
+
+
+def _partition(w: List[float], caps: List[float]) -> List[int]:
+    """
+    Contiguous split of items w over cells caps (in order): smallest possible max load /
+    capacity, then, within that bound, each cell as close as possible to its proportional
+    share of what is left. Returns the end index of each cell's range.
+    """
+    n, total = len(w), sum(w)
+    lo, hi = 0.0, max(max(w) / min(caps), total / min(caps)) + 1.0
+    for _ in range(50):
+        mid = (lo + hi) / 2.0
+        if _fill(w, caps, mid) is not None:
+            hi = mid
+        else:
+            lo = mid
+    r = hi
+    cmin = min(caps)
+    # need[i]: cells the suffix from item i needs at bound r (conservatively at the smallest capacity)
+    need = [0] * (n + 1)
+    for i in range(n - 1, -1, -1):
+        load, j, cells = 0.0, i, 1
+        while j < n:
+            if load + w[j] > r * cmin + 1e-9:
+                if load == 0.0:
+                    break
+                cells += 1
+                load = 0.0
+                continue
+            load += w[j]
+            j += 1
+        need[i] = cells if j == n else n + len(caps)     # an item too big for the smallest cell
+    cuts, i, left = [], 0, total
+    for j, c in enumerate(caps):
+        rest_cells = len(caps) - j - 1
+        if rest_cells == 0:
+            cuts.append(n)
+            break
+        target = left * c / sum(caps[j:])
+        best, best_err, load, k = i, None, 0.0, i
+        while True:
+            if need[k] <= rest_cells or k == n:
+                err = abs(load - target)
+                if best_err is None or err < best_err:
+                    best, best_err = k, err
+            if k == n or load + w[k] > r * c + 1e-9:
+                break
+            load += w[k]
+            k += 1
+        if best_err is None:
+            best = k            # nothing keeps the rest feasible at the smallest capacity: fill up
+        cuts.append(best)
+        left -= sum(w[i:best])
+        i = best
+    return cuts
+
+
+def _label(a: str, b: str) -> str:
+    return f"{a.strip() or 'a'}-{b.strip() or 'a'}"
+
+
+def balance(weights: Dict[str, int], cells: List[Tuple[str, int]], expected_cards: Optional[int] = None,
+            source: str = "") -> BalancedMap:
+    """
+    weights: cards per prefix (learn_weights); cells: (cell_id, capacity) in grid order; cells
+    with no capacity get no range. expected_cards scales the sample to the collection being
+    sorted (default: sample size).
+    """
+    cells = [(cid, c) for cid, c in cells if c > 0]
+    if not cells:
+        raise ValueError("alpha_balanced needs at least one placement cell with capacity > 0")
+    prefixes = sorted(weights)
+    if not prefixes:
+        raise ValueError("alpha_balanced: no names to learn the distribution from")
+    sample = sum(weights.values())
+    expected = int(expected_cards or sample)
+    w = [weights[p] * expected / sample for p in prefixes]
+    caps = [float(c) for _, c in cells]
+    cuts = _partition(w, caps)
+    starts, out_cells, labels, predicted = [], [], [], {}
+    i = 0
+    for (cid, _), end in zip(cells, cuts):
+        if end <= i:
+            continue        # more cells than prefixes: leave the rest unused
+        starts.append(prefixes[i] if starts else "")
+        out_cells.append(cid)
+        labels.append(_label(prefixes[i], prefixes[end - 1]))
+        predicted[cid] = round(sum(w[i:end]), 1)
+        i = end
+    return BalancedMap(starts, out_cells, labels, predicted, expected, source)
+
+
+def predicted_overflow(bmap: BalancedMap, capacity: Dict[str, int]) -> float:
+    return round(sum(max(0.0, v - capacity.get(c, 0)) for c, v in bmap.predicted.items()), 1)
+
+
+def rebalance(cfg: Any, names: List[str], expected_cards: Optional[int] = None, source: str = "",
+              save: bool = True) -> BalancedMap:
+    """
+    Learn ranges for cfg (assign.Config) from names and install them as cfg.balanced.
+    Options from the config's alpha_balanced: section: prefix_len, max_prefix_len,
+    split_fraction (refine prefixes heavier than this share of a cell), expected_cards,
+    ranges_file.
+    """
+    opts = cfg.balance_opts or {}
+    cells = [(cid, c.capacity) for cid, c in cfg.cells.items()
+             if not (cfg.feeder_re and cfg.feeder_re.search(cid)) and cid not in cfg.overflow_cells
+             and c.capacity > 0]
+    expected = int(expected_cards or opts.get("expected_cards") or len(names))
+    if not names or not cells:
+        raise ValueError("alpha_balanced: need names and placement cells to rebalance")
+    # split threshold in sample units
+    split_above = float(opts.get("split_fraction", 0.2)) * min(c for _, c in cells) * len(names) / expected
+    weights = learn_weights(names, int(opts.get("prefix_len", 2)), int(opts.get("max_prefix_len", 4)), split_above)
+    bmap = balance(weights, cells, expected, source)
+    if save:
+        bmap.save(opts.get("ranges_file", DEFAULT_FILE))
+    cfg.balanced = bmap
+    return bmap
+
+
+# ---------- Sources ----------
+def names_from_ledger(root: str) -> List[str]:
+    """Names of every card ever assigned (placement ledger, services/state_journal.py)."""
+    from .state_journal import iter_ledger
+    if not os.path.isdir(root):
+        return []
+    return [r["card"] for r in iter_ledger(root) if r.get("op") == "add" and r.get("card")]
+
+
+def names_from_db(cards: List[Dict[str, Any]], sample: Optional[int] = 20000, seed: int = 0) -> List[str]:
+    names = [c.get("name") for c in cards if c.get("name")]
+    if sample and len(names) > sample:
+        names = random.Random(seed).sample(names, sample)
+    return names
@@ -1,9 +1,13 @@
 # services/assign.py
 from __future__ import annotations
+import os
 import re
 from dataclasses import dataclass
 from typing import Dict, List, Optional, Tuple
 
+from .alpha_balance import BalancedMap
+from .rules import RuleSet, compile_rules, first_letter
+
 # ---------- Data types ----------
 @dataclass
 class Card:
@@ -12,6 +16,11 @@ class Card:
     set_code: Optional[str] = None
     collector_number: Optional[str] = None
     confidence: float = 1.0
+    # optional attributes for rule-based sorting (services/rules.py)
+    rarity: Optional[str] = None
+    color_identity: Optional[str] = None     # WUBRG letters, "" = colorless
+    mana_value: Optional[float] = None
+    price: Optional[float] = None
 
 @dataclass
 class Cell:
@@ -37,6 +46,13 @@ class Config:
     letter_to_cell: Dict[str, str]   # 'A'..'Z' -> cell_id
     overflow_cells: List[str]
 
+    # rule-based sorting (default_mode: rules); letters remain the fallback
+    mode: str = "alpha_exact"
+    rules: Optional[RuleSet] = None
+    # default_mode: alpha_balanced -> learned prefix ranges (None until learned: letters)
+    balanced: Optional[BalancedMap] = None
+    balance_opts: Dict[str, object] = None
+
 # ---------- Loader ----------
 def load_config(yaml_dict: dict) -> Config:
     # cells
@@ -69,6 +85,22 @@ def load_config(yaml_dict: dict) -> Config:
         if oc not in cell_map:
             raise ValueError(f"overflow cell '{oc}' not defined in cells:")
 
+    # sorting mode
+    mode = str(yaml_dict.get("sorting", {}).get("default_mode", "alpha_exact"))
+    if mode not in ("alpha_exact", "rules", "alpha_balanced"):
+        raise ValueError(f"sorting.default_mode must be alpha_exact, rules or alpha_balanced, not '{mode}'")
+    rules = None
+    if mode == "rules":
+        if not yaml_dict.get("rules"):
+            raise ValueError("sorting.default_mode: rules needs a non-empty rules: list")
+        rules = compile_rules(yaml_dict["rules"], cell_map, feeder_re)
+    balance_opts = dict(yaml_dict.get("alpha_balanced") or {})
+    balanced = None
+    if mode == "alpha_balanced":
+        balanced = BalancedMap.load(balance_opts.get("ranges_file", os.path.join("data", "state", "alpha_ranges.json")))
+        if balanced is not None and any(c not in cell_map or (feeder_re and feeder_re.search(c)) for c in balanced.cells):
+            raise ValueError("alpha_balanced: saved ranges use cells that are missing or feeders; rebalance")
+
     return Config(
         low_conf_thresh=float(yaml_dict.get("sorting", {}).get("low_confidence_threshold", 0.80)),
         near_full_thresh=float(yaml_dict.get("sorting", {}).get("near_full_threshold", 0.90)),
@@ -76,6 +108,10 @@ def load_config(yaml_dict: dict) -> Config:
         feeder_re=feeder_re,
         letter_to_cell=letter_to_cell,
         overflow_cells=overflow_cells,
+        mode=mode,
+        rules=rules,
+        balanced=balanced,
+        balance_opts=balance_opts,
     )
 
 # ---------- Helpers ----------
@@ -98,6 +134,8 @@ def assign_card(card: Card, cfg: Config, state: SystemState) -> Tuple[str, str]:
     """
     Manual letter-based assignment:
       - If confidence < threshold -> overflow (ERR1)
+      - default_mode: rules -> first matching rule; its cells in order, overflow when all full
+      - default_mode: alpha_balanced -> the learned prefix range's cell (letters until learned)
       - Determine first A–Z; map via cfg.letter_to_cell
       - If target full -> overflow
       - Never place into feeder cells (assert)
@@ -108,20 +146,34 @@ def assign_card(card: Card, cfg: Config, state: SystemState) -> Tuple[str, str]:
         target = _overflow_target(cfg, state)
         return target, "divert:low_confidence"
 
-    # 2) Letter mapping (non A–Z defaults to 'A')
-    first = (card.name.strip()[:1] or "#").upper()
-    if first < "A" or first > "Z":
-        first = "A"
+    # 2) Compiled rules (unmatched cards fall through to the letter mapping)
+    if cfg.rules is not None:
+        rule = cfg.rules.match(card)
+        if rule is not None:
+            for cid in rule.cells:
+                if _has_capacity(cfg.cells[cid], state):
+                    return cid, f"rule:{rule.name}"
+            return _overflow_target(cfg, state), f"overflow:rule:{rule.name}"
+
+    # 3) Balanced prefix ranges
+    if cfg.balanced is not None:
+        target_id, label = cfg.balanced.lookup(card.name)
+        if _has_capacity(cfg.cells[target_id], state):
+            return target_id, f"alpha_balanced:{label}"
+        return _overflow_target(cfg, state), f"overflow:{label}"
+
+    # 4) Letter mapping (non A–Z defaults to 'A')
+    first = first_letter(card.name)
 
     target_id = cfg.letter_to_cell[first]
     # safety: never feeder
     assert not _is_feeder(target_id, cfg.feeder_re), f"Mapping points to feeder cell: {target_id}"
 
-    # 3) Capacity check
+    # 5) Capacity check
     target_cell = cfg.cells[target_id]
     if _has_capacity(target_cell, state):
         return target_id, f"alpha_exact:{first}"
 
-    # 4) Overflow
+    # 6) Overflow
     overflow_id = _overflow_target(cfg, state)
     return overflow_id, f"overflow:{first}"
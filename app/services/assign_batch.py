@@ -0,0 +1,230 @@
+"""
+Vectorized batch assignment: whole collections through assign_card's logic at once.
+
+Provides:
+ - assign_batch(names, confidences, cfg, state, attrs) -> BatchResult: the cell and reason
+   assign_card would give every card if they were assigned one after another (each card
+   counted in its cell before the next), without touching state
+ - assign_cards_batch(cards, cfg, state): same, from Card objects
+ - BatchResult: cells / reasons per card, final counts, overflow count, as_dict()
+
+How it stays identical to the sequential loop: every card gets a preference list -- its
+primary cells (letter cell, balanced range cell, or the matching rule's cells) followed by
+the overflow cells; low-confidence cards only get the overflow cells; a card whose list is
+exhausted falls back to overflow_cells[0] regardless of capacity, like _overflow_target.
+Counts only grow, so a cell that is full for card i stays full for every later card. The
+solver assigns every card to the current entry of its list, ranks cards per cell with a
+stable sort (running count = initial count + rank), finds the earliest card that does not
+fit anywhere and moves exactly the cards at or after it in that cell one step down their
+lists. Cards before that point can no longer change, so each round fixes one more cell as
+full: at most (number of cells) rounds of NumPy work over the batch. Cells no card can move
+into (letter / range cells) are all settled in the first round, so a letter or balanced
+batch takes a couple of rounds plus one per overflow cell.
+
+Primary cells come from NumPy lookups too: first letters are read from the code points of a
+string array and index a 26-entry table, balanced ranges are a searchsorted over the range
+starts (name_key itself is per name). Only rule matching stays per card (Python
+bitmask, cached per distinct attribute tuple); rule hit counters are not touched.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .alpha_balance import name_key
+from .assign import Card, Config, SystemState
+from .rules import first_letter
+
+ATTRS = ("game", "set_code", "collector_number", "rarity", "color_identity", "mana_value", "price")
+
+
+@dataclass
+class BatchResult:
+    cells: List[str]
+    reasons: List[str]
+    counts: Dict[str, int]          # counts after the whole batch
+    overflow: int                   # cards that ended in an overflow cell
+    rounds: int
+
+    def as_dict(self, include_cards: bool = True) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "cards": len(self.cells),
+            "overflow": self.overflow,
+            "counts": self.counts,
+            "rounds": self.rounds,
+        }
+        if include_cards:
+            out["cells"] = self.cells
+            out["reasons"] = self.reasons
+        return out
+
+
+class _Row:
+    """Attribute view of one card for RuleSet.mask."""
+    __slots__ = ATTRS + ("name",)
+
+    def __init__(self, name: str, values: Sequence[Any]):
+        self.name = name
+        for k, v in zip(ATTRS, values):
+            setattr(self, k, v)
+
+
+_WS = np.array([ord(c) for c in " \t\n\r\x0b\x0c"], dtype=np.uint32)
+
+
+def _first_letters(names: Sequence[str]) -> np.ndarray:
+    """first_letter() for every name as 0..25, from the UTF-32 code points of a string array."""
+    n = len(names)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    arr = np.asarray(names, dtype=str)
+    width = max(1, arr.dtype.itemsize // 4)
+    code = np.ascontiguousarray(arr).view(np.uint32).reshape(n, width)[:, 0].astype(np.int64)
+    code = np.where((code >= 97) & (code <= 122), code - 32, code)
+    out = np.where((code >= 65) & (code <= 90), code - 65, 0)
+    # leading whitespace or non-ASCII (str.upper may map it into A-Z): the exact Python rule
+    odd = np.flatnonzero(np.isin(code, _WS) | (code > 127))
+    for i in odd.tolist():
+        out[i] = ord(first_letter(names[i])) - 65
+    return out
+
+
+def assign_batch(names: Sequence[str],
+                 confidences: Optional[Sequence[float]],
+                 cfg: Config,
+                 state: SystemState,
+                 attrs: Optional[Dict[str, Sequence[Any]]] = None) -> BatchResult:
+    """
+    names[i], confidences[i] (default 1.0) and attrs[field][i] (Card field names: game,
+    set_code, rarity, color_identity, mana_value, price; rules mode only) describe card i.
+    """
+    n = len(names)
+    cell_ids = list(cfg.cells)
+    index = {cid: i for i, cid in enumerate(cell_ids)}
+    K = len(cell_ids)
+    overflow = np.array([index[c] for c in cfg.overflow_cells], dtype=np.int64)
+    conf = np.ones(n) if confidences is None else np.asarray(confidences, dtype=float)
+    low = conf < cfg.low_conf_thresh
+
+    # ------ primary cells (+ the label that goes into the reason) ------
+    rule_idx = np.full(n, -1, dtype=np.int64)
+    if cfg.rules is not None:
+        attrs = attrs or {}
+        cols = [attrs.get(k) for k in ATTRS]
+        cache: Dict[Any, int] = {}
+        for i in np.flatnonzero(~low):
+            vals = tuple(c[i] if c is not None else None for c in cols)
+            vals = (vals[0] or "mtg",) + vals[1:]
+            key = (names[i],) + vals
+            hit = cache.get(key)
+            if hit is None:
+                m = cfg.rules.mask(_Row(names[i], vals))
+                hit = cache[key] = (m & -m).bit_length() - 1 if m else -1
+            rule_idx[i] = hit
+    firsts = _first_letters(names)
+    letter_cell = np.array([index[cfg.letter_to_cell[chr(65 + k)]] if chr(65 + k) in cfg.letter_to_cell else -1
+                            for k in range(26)], dtype=np.int64)
+    if cfg.balanced is not None:
+        keys = np.array([name_key(s) for s in names]) if n else np.array([], dtype=str)
+        starts = np.array(cfg.balanced.starts)
+        rng = np.maximum(np.searchsorted(starts, keys, side="right") - 1, 0)
+        range_cell = np.array([index[c] for c in cfg.balanced.cells], dtype=np.int64)
+        primary_one = range_cell[rng]
+    else:
+        rng = None
+        primary_one = letter_cell[firsts]
+
+    # ------ preference lists: primaries then overflow cells (padded with -1) ------
+    rules = cfg.rules.rules if cfg.rules is not None else []
+    max_primary = max([1] + [len(r.cells) for r in rules])
+    width = max_primary + len(overflow)
+    pref = np.full((n, width), -1, dtype=np.int64)
+    n_primary = np.zeros(n, dtype=np.int64)
+    plain = ~low & (rule_idx < 0)
+    pref[plain, 0] = primary_one[plain]
+    n_primary[plain] = 1
+    for r in rules:
+        sel = rule_idx == r.index
+        if sel.any():
+            pref[sel, :len(r.cells)] = [index[c] for c in r.cells]
+            n_primary[sel] = len(r.cells)
+    # overflow cells right after each card's primaries
+    cols = n_primary[:, None] + np.arange(len(overflow))[None, :]
+    pref[np.arange(n)[:, None], cols] = overflow[None, :]
+    length = n_primary + len(overflow)
+
+    # ------ capacity solver ------
+    room = np.array([cfg.cells[c].capacity - state.counts_by_cell.get(c, 0) for c in cell_ids], dtype=np.int64)
+    full_from = np.full(K, n + 1, dtype=np.int64)   # first card index that sees the cell full
+    ptr = np.zeros(n, dtype=np.int64)
+    idx = np.arange(n)
+    rounds = 0
+
+    def current():
+        forced = ptr >= length
+        cur = np.where(forced, overflow[0], pref[idx, np.minimum(ptr, width - 1)])
+        return cur, forced
+
+    # cells no card can move into (only ever first in a list): their fill point is final as
+    # soon as it shows up, so all of them are settled in the same round
+    enterable = np.zeros(K + 1, dtype=bool)
+    later = pref[:, 1:].ravel()
+    enterable[later[later >= 0]] = True
+
+    while True:
+        rounds += 1
+        cur, forced = current()
+        eff = np.where(forced, K, cur)
+        order = np.argsort(eff, kind="stable")
+        srt = eff[order]
+        starts_at = np.searchsorted(srt, np.arange(K + 1), side="left")
+        rank = np.arange(n) - starts_at[srt]
+        misfit = (srt < K) & (rank >= np.append(room, 0)[srt])
+        if not misfit.any():
+            break
+        bad_idx = order[misfit]
+        bad_cell = srt[misfit]
+        first_bad = bad_idx.min()
+        # per cell, the first card that does not fit (bad_idx is sorted within each cell)
+        cells_hit, first_pos = np.unique(bad_cell, return_index=True)
+        settle = (~enterable[cells_hit]) | (cells_hit == cur[first_bad])
+        full_from[cells_hit[settle]] = bad_idx[first_pos[settle]]
+        # step past every full cell (cells already known full at the card's index)
+        move = (~forced) & (full_from[cur] <= idx)
+        while move.any():
+            ptr[move] += 1
+            nxt, f = current()
+            move = (~f) & (full_from[nxt] <= idx)
+
+    cur, forced = current()
+    cells = [cell_ids[c] for c in cur.tolist()]
+    counts = dict(state.counts_by_cell)
+    for cid, cnt in zip(cell_ids, np.bincount(cur, minlength=K).tolist()):
+        counts[cid] = counts.get(cid, 0) + cnt
+
+    # ------ reasons, as assign_card words them ------
+    # one table of every possible reason; per card a code = 2 * label slot + placed-in-primary
+    in_primary = ((ptr < n_primary) & ~forced).astype(np.int64)
+    table = ["divert:low_confidence", "divert:low_confidence"]
+    base_rule = len(table) // 2
+    for r in rules:
+        table += [f"overflow:rule:{r.name}", f"rule:{r.name}"]
+    base_label = len(table) // 2
+    if rng is not None:
+        for label in cfg.balanced.labels:
+            table += [f"overflow:{label}", f"alpha_balanced:{label}"]
+        slot = base_label + rng
+    else:
+        for k in range(26):
+            table += [f"overflow:{chr(65 + k)}", f"alpha_exact:{chr(65 + k)}"]
+        slot = base_label + firsts
+    slot = np.where(rule_idx >= 0, base_rule + rule_idx, slot)
+    slot = np.where(low, 0, slot)
+    reasons = [table[k] for k in (2 * slot + in_primary).tolist()]
+    n_overflow = int(np.isin(cur, overflow).sum())
+    return BatchResult(cells, reasons, counts, n_overflow, rounds)
+
+
+def assign_cards_batch(cards: Sequence[Card], cfg: Config, state: SystemState) -> BatchResult:
+    attrs = {k: [getattr(c, k) for c in cards] for k in ATTRS}
+    return assign_batch([c.name for c in cards], [c.confidence for c in cards], cfg, state, attrs)
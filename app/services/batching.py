@@ -0,0 +1,159 @@
+"""
+In-process dynamic micro-batching for encoder forward passes.
+
+Provides:
+ - MicroBatcher(fn, max_batch, max_latency_ms): callers submit single items from any
+   thread (or await them from async code); a background thread collects items for up to
+   max_latency_ms or max_batch items, runs fn(batch) once and resolves each caller's future.
+ - stats(): queue depth, batch-size and latency counters for /debug endpoints
+
+fn must take a list of items and return a sequence of results of the same length
+(e.g. lambda texts: encoder.encode(texts, convert_to_numpy=True)).
+"""
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from concurrent.futures import Future
+import asyncio
+import logging
+import queue
+import threading
+import time
+
+LOG = logging.getLogger("sort.batching")
+
+
+class MicroBatcher:
+    def __init__(self,
+                 fn: Callable[[List[Any]], Sequence[Any]],
+                 max_batch: int = 32,
+                 max_latency_ms: float = 2.0,
+                 name: str = "batcher"):
+        if max_batch < 1:
+            raise ValueError("max_batch must be >= 1")
+        self.fn = fn
+        self.max_batch = int(max_batch)
+        self.max_latency_s = max(0.0, float(max_latency_ms)) / 1000.0
+        self.name = name
+        self._q: "queue.Queue[Optional[Tuple[Any, Future, float]]]" = queue.Queue()
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "submitted": 0,
+            "batches": 0,
+            "items": 0,
+            "errors": 0,
+            "max_batch_seen": 0,
+            "max_queue_depth": 0,
+            "wait_s_total": 0.0,
+            "forward_s_total": 0.0,
+        }
+        self._thread = threading.Thread(target=self._worker, name=f"microbatch-{name}", daemon=True)
+        self._thread.start()
+
+    # ------ submission ------
+    def submit(self, item: Any) -> Future:
+        if self._closed:
+            raise RuntimeError(f"MicroBatcher {self.name} is closed")
+        fut: Future = Future()
+        self._q.put((item, fut, time.perf_counter()))
+        depth = self._q.qsize()
+        with self._stats_lock:
+            self._stats["submitted"] += 1
+            if depth > self._stats["max_queue_depth"]:
+                self._stats["max_queue_depth"] = depth
+        return fut
+
+    def run(self, item: Any, timeout: Optional[float] = None) -> Any:
+        """Blocking single-item call."""
+        return self.submit(item).result(timeout=timeout)
+
+    async def run_async(self, item: Any) -> Any:
+        return await asyncio.wrap_future(self.submit(item))
+
+    # ------ worker ------
+    def _collect(self) -> List[Tuple[Any, Future, float]]:
+        first = self._q.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.max_latency_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                nxt = self._q.get(timeout=remaining) if remaining > 0 else self._q.get_nowait()
+            except queue.Empty:
+                break
+            if nxt is None:
+                # re-post the sentinel so the outer loop exits after this batch
+                self._q.put(None)
+                break
+            batch.append(nxt)
+        return batch
+
+    def _worker(self) -> None:
+        while True:
+            batch = self._collect()
+            if not batch:
+                return
+            try:
+                self._run_batch(batch)
+            except Exception:
+                # never let one batch end the thread: every later caller would wait forever
+                LOG.exception("MicroBatcher %s: batch of %d failed", self.name, len(batch))
+                for _, fut, _ in batch:
+                    if not fut.done():
+                        fut.set_exception(RuntimeError(f"MicroBatcher {self.name} batch failed"))
+
+    def _run_batch(self, batch: List[Tuple[Any, Future, float]]) -> None:
+        # claim each future: a running future can no longer be cancelled, so setting its result
+        # below cannot race a caller's cancel(); cancelled ones are left out of the batch
+        batch = [b for b in batch if b[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        items = [b[0] for b in batch]
+        started = time.perf_counter()
+        try:
+            results = list(self.fn(items))
+            if len(results) != len(items):
+                raise RuntimeError(f"batch fn returned {len(results)} results for {len(items)} items")
+            err = None
+        except Exception as exc:
+            results, err = [], exc
+        done = time.perf_counter()
+        for i, (_, fut, _) in enumerate(batch):
+            if err is not None:
+                fut.set_exception(err)
+            else:
+                fut.set_result(results[i])
+        with self._stats_lock:
+            s = self._stats
+            s["batches"] += 1
+            s["items"] += len(batch)
+            s["errors"] += 1 if err is not None else 0
+            s["max_batch_seen"] = max(s["max_batch_seen"], len(batch))
+            s["wait_s_total"] += sum(started - t for _, _, t in batch)
+            s["forward_s_total"] += done - started
+
+    # ------ lifecycle / metrics ------
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        """Stop accepting items; items already queued are still processed."""
+        if self._closed:
+            return
+        self._closed = True
+        self._q.put(None)
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            s = dict(self._stats)
+        batches = s["batches"] or 1
+        items = s["items"] or 1
+        s.update({
+            "name": self.name,
+            "max_batch": self.max_batch,
+            "max_latency_ms": self.max_latency_s * 1000.0,
+            "queue_depth": self._q.qsize(),
+            "avg_batch_size": s["items"] / batches if s["batches"] else 0.0,
+            "avg_wait_ms": 1000.0 * s["wait_s_total"] / items if s["items"] else 0.0,
+            "avg_forward_ms": 1000.0 * s["forward_s_total"] / batches if s["batches"] else 0.0,
+        })
+        return s
@@ -0,0 +1,236 @@
+"""
+Shared card catalog: every card list (embedding metadata, card DB) parsed once per process.
+
+Provides:
+ - get_catalog(path) -> CardCatalog: the file's rows, loaded on first use, reloaded when the
+   file changes (checked at most every SORTME_CATALOG_CHECK_S seconds, default 30)
+ - CardCatalog views, built lazily from the same rows:
+     * rows: the card dicts (string values interned; shared -- do not mutate)
+     * vocabulary: sorted lower-case name words for OCR post-correction
+     * names / by_name(name): distinct normalized names and name -> rows for identification
+ - version(): one counter for every catalog in the process, bumped on every load, reload or
+   drop; each catalog carries the value it was loaded at (CardCatalog.version). Everything
+   derived from a file -- vocabulary, name index, the embedding NN index over its rows --
+   is keyed by that number, so all of them go stale together when the file changes
+ - catalog_of(rows): the catalog a row list came from (lets callers that were handed a plain
+   list use its indexes)
+ - drop(path), stats(), normalize_name(s), read_rows(path)
+"""
+from typing import Any, Dict, List, Optional
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+
+CHECK_S = float(os.environ.get("SORTME_CATALOG_CHECK_S", "30"))
+_INTERN_MAX = 64          # longer strings (oracle text) are rarely repeated: not worth interning
+
+
+def normalize_name(s: Optional[str]) -> str:
+    if not s:
+        return ""
+    s = str(s)
+    # remove diacritics, lowercase, remove punctuation, collapse whitespace
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    s = s.lower()
+    s = re.sub(r"[^\w\s]", " ", s)
+    s = re.sub(r"\s+", " ", s).strip()
+    return s
+
+
+def _intern(v: Any) -> Any:
+    if isinstance(v, str):
+        return sys.intern(v) if len(v) <= _INTERN_MAX else v
+    if isinstance(v, list):
+        return [_intern(x) for x in v]
+    if isinstance(v, dict):
+        return {sys.intern(k) if isinstance(k, str) else k: _intern(x) for k, x in v.items()}
+    return v
+
+
+def read_rows(path: str) -> List[Dict[str, Any]]:
+    """
+    Card dicts from JSON (a list, or {"data": [...]} as in Scryfall exports), NDJSON, or a
+    SQLite DB with a 'cards' table. Expected keys: 'name', ideally 'oracle_text' /
+    'collector_number' / 'set'.
+    """
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf8") as fh:
+            data = json.load(fh)
+            if isinstance(data, dict) and "data" in data:
+                data = data["data"]
+            return data
+    if path.endswith(".ndjson") or path.endswith(".ndjsonl") or path.endswith(".ndjsonl.txt"):
+        out = []
+        with open(path, "r", encoding="utf8") as fh:
+            for line in fh:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    out.append(json.loads(line))
+                except Exception:
+                    continue
+        return out
+    # try sqlite
+    try:
+        conn = sqlite3.connect(path)
+        cur = conn.cursor()
+        # try common column names
+        for colset in (("name", "oracle_text", "collector_number", "set", "id"),
+                       ("name", "oracle", "collector_number", "set_code", "id"),
+                       ("name", "oracle_text", "collector", "set_code", "id")):
+            try:
+                col_list = ", ".join(colset)
+                cur.execute(f"SELECT {col_list} FROM cards")
+                rows = cur.fetchall()
+                cols = [d[0] for d in cur.description]
+                conn.close()
+                return [{cols[i]: r[i] for i in range(len(cols))} for r in rows]
+            except Exception:
+                continue
+        conn.close()
+    except Exception:
+        pass
+    # fallback: try to read as JSON anyway
+    with open(path, "r", encoding="utf8") as fh:
+        try:
+            return json.load(fh)
+        except Exception:
+            raise RuntimeError("Unsupported DB format or no cards found")
+
+
+class CardCatalog:
+    def __init__(self, path: str, rows: List[Dict[str, Any]], version: int, stamp: Any):
+        self.path = path
+        self.rows = rows
+        self.version = version
+        self.stamp = stamp                  # (mtime_ns, size) of the file when loaded
+        self.checked = time.monotonic()
+        self._lock = threading.Lock()
+        self._vocabulary: Optional[List[str]] = None
+        self._by_name: Optional[Dict[str, List[Dict[str, Any]]]] = None
+
+    @property
+    def vocabulary(self) -> List[str]:
+        """Unique lower-case alphabetic name words (>= 2 letters), sorted."""
+        with self._lock:
+            if self._vocabulary is None:
+                words = set()
+                for card in self.rows:
+                    name = card.get("name") or card.get("title") or ""
+                    for tok in name.split():
+                        tok2 = "".join(c for c in tok if c.isalpha())
+                        if len(tok2) >= 2:
+                            words.add(sys.intern(tok2.lower()))
+                self._vocabulary = sorted(words)
+            return self._vocabulary
+
+    def _name_index(self) -> Dict[str, List[Dict[str, Any]]]:
+        with self._lock:
+            if self._by_name is None:
+                index: Dict[str, List[Dict[str, Any]]] = {}
+                for card in self.rows:
+                    key = sys.intern(normalize_name(card.get("name") or card.get("title") or ""))
+                    index.setdefault(key, []).append(card)
+                self._by_name = index
+            return self._by_name
+
+    @property
+    def names(self) -> List[str]:
+        """Distinct normalized names (keys of the name index)."""
+        return list(self._name_index())
+
+    def by_name(self, name: str, normalized: bool = False) -> List[Dict[str, Any]]:
+        return self._name_index().get(name if normalized else normalize_name(name), [])
+
+    def nbytes(self) -> int:
+        """Rough resident size: rows, plus the vocabulary / name index once built."""
+        n = 250 * len(self.rows)
+        if self._vocabulary is not None:
+            n += sum(50 + len(w) for w in self._vocabulary)
+        if self._by_name is not None:
+            n += 120 * len(self._by_name)
+        return n
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rows": len(self.rows),
+            "version": self.version,
+            "vocabulary": len(self._vocabulary) if self._vocabulary is not None else None,
+            "names": len(self._by_name) if self._by_name is not None else None,
+            "mb": round(self.nbytes() / 2 ** 20, 2),
+        }
+
+
+_CATALOGS: Dict[str, CardCatalog] = {}
+_BY_ROWS: Dict[int, CardCatalog] = {}
+_LOCK = threading.Lock()
+_VERSION = 0
+
+
+def _stamp(path: str) -> Any:
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def version() -> int:
+    return _VERSION
+
+
+def get_catalog(path: str) -> CardCatalog:
+    """The catalog for path (FileNotFoundError if missing); loaded once per process."""
+    global _VERSION
+    key = os.path.abspath(os.path.expanduser(path))
+    with _LOCK:
+        cat = _CATALOGS.get(key)
+        now = time.monotonic()
+        if cat is not None:
+            if now - cat.checked < CHECK_S:
+                return cat
+            cat.checked = now
+            try:
+                if _stamp(key) == cat.stamp:
+                    return cat
+            except OSError:
+                return cat          # file went away: keep serving what we have
+        if not os.path.exists(key):
+            raise FileNotFoundError(path)
+        stamp = _stamp(key)
+        rows = [_intern(r) for r in read_rows(key)]
+        _VERSION += 1
+        if cat is not None:
+            _BY_ROWS.pop(id(cat.rows), None)
+        cat = CardCatalog(key, rows, _VERSION, stamp)
+        _CATALOGS[key] = cat
+        _BY_ROWS[id(rows)] = cat
+        return cat
+
+
+def catalog_of(rows: Any) -> Optional[CardCatalog]:
+    cat = _BY_ROWS.get(id(rows))
+    return cat if cat is not None and cat.rows is rows else None
+
+
+def drop(path: str) -> None:
+    global _VERSION
+    key = os.path.abspath(os.path.expanduser(path))
+    with _LOCK:
+        cat = _CATALOGS.pop(key, None)
+        if cat is not None:
+            _BY_ROWS.pop(id(cat.rows), None)
+            _VERSION += 1
+
+
+def loaded(path: str) -> Optional[CardCatalog]:
+    return _CATALOGS.get(os.path.abspath(os.path.expanduser(path)))
+
+
+def stats() -> Dict[str, Any]:
+    with _LOCK:
+        return {"version": _VERSION, "catalogs": {p: c.stats() for p, c in _CATALOGS.items()}}
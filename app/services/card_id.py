@@ -20,11 +20,21 @@ Matching strategy:
 from typing import Dict, Any, List, Optional, Tuple
 import json
 import os
-import sqlite3
-import unicodedata
 import re
-import numpy as np
-from sklearn.neighbors import NearestNeighbors
+import threading
+import time
+
+try:
+    from . import card_catalog
+    from .lazy import LazyModule
+except ImportError:             # run as a script: python app/services/card_id.py
+    import card_catalog
+    from lazy import LazyModule
+
+# scikit-learn is imported when the first embedding index is built, not with this module;
+# numpy (~50 ms) with the first embedding lookup, so fuzzy-name-only callers never pay for it
+_neighbors = LazyModule("sklearn.neighbors")
+np = LazyModule("numpy")
 
 # try to use rapidfuzz for better fuzzy matching, otherwise fallback
 try:
@@ -34,81 +44,149 @@ except Exception:
     HAVE_RAPIDFUZZ = False
     import difflib
 
+# query encoder backend for embedding lookup: 'fp32' (default), 'int8' or 'onnx'.
+# int8/onnx artifacts and their fp32 agreement check come from export_encoder.py.
+ENCODER_BACKEND = os.environ.get("SORTME_ENCODER_BACKEND", "fp32")
+ENCODER_DIR = os.environ.get("SORTME_ENCODER_DIR", os.path.join("data", "models", "encoder"))
+ENCODER_MIN_AGREEMENT = float(os.environ.get("SORTME_ENCODER_MIN_AGREEMENT", "0.98"))
+# concurrent query encodes are coalesced into one forward pass (see batching.MicroBatcher);
+# SORTME_ENCODER_MAX_BATCH=1 disables batching. Pool workers identify one image at a time, so
+# workers.py turns it off there (set_query_batching): a lone query would only wait out the latency.
+ENCODER_MAX_BATCH = int(os.environ.get("SORTME_ENCODER_MAX_BATCH", "32"))
+ENCODER_MAX_LATENCY_MS = float(os.environ.get("SORTME_ENCODER_MAX_LATENCY_MS", "2"))
+# embeddings.npy is memory-mapped read-only: the vectors live in the page cache, shared by every
+# worker process (and by forked workers, see prefork.py) instead of copied into each heap.
+# SORTME_EMB_MMAP=0 reads them into memory.
+EMB_MMAP = os.environ.get("SORTME_EMB_MMAP", "1") != "0"
+
 # ------ helpers ------
 
-def _normalize(s: Optional[str]) -> str:
-    if not s:
-        return ""
-    s = str(s)
-    # remove diacritics, lowercase, remove punctuation, collapse whitespace
-    s = unicodedata.normalize("NFKD", s)
-    s = "".join(ch for ch in s if not unicodedata.combining(ch))
-    s = s.lower()
-    s = re.sub(r"[^\w\s]", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+_normalize = card_catalog.normalize_name
+
+def _load_query_encoder():
+    """Load the configured query encoder; returns None if no backend can be loaded."""
+    try:
+        from . import text_encoder
+        return text_encoder.load_encoder(ENCODER_BACKEND,
+                                         model_dir=ENCODER_DIR,
+                                         min_agreement=ENCODER_MIN_AGREEMENT)
+    except Exception:
+        return None
+
+_QUERY_BATCHER = None
+_QUERY_BATCHER_KEY = None           # (encoder, max_batch, max_latency_ms) _QUERY_BATCHER was built for
+_QUERY_BATCHER_LOCK = threading.Lock()
+_UNBATCHED = {"queries": 0, "forward_s_total": 0.0}
+
+def set_query_batching(max_batch: int, max_latency_ms: Optional[float] = None) -> None:
+    """Change the query batching limits for this process (max_batch=1 turns batching off)."""
+    global ENCODER_MAX_BATCH, ENCODER_MAX_LATENCY_MS
+    ENCODER_MAX_BATCH = max(1, int(max_batch))
+    if max_latency_ms is not None:
+        ENCODER_MAX_LATENCY_MS = float(max_latency_ms)
+
+def _encode_query(encoder, query_text: str):
+    """Encode one query, sharing a batched forward pass with concurrent callers."""
+    global _QUERY_BATCHER, _QUERY_BATCHER_KEY
+    if ENCODER_MAX_BATCH <= 1:
+        started = time.perf_counter()
+        out = encoder.encode([query_text], convert_to_numpy=True)[0]
+        with _QUERY_BATCHER_LOCK:
+            _UNBATCHED["queries"] += 1
+            _UNBATCHED["forward_s_total"] += time.perf_counter() - started
+        return out
+    with _QUERY_BATCHER_LOCK:
+        key = (encoder, ENCODER_MAX_BATCH, ENCODER_MAX_LATENCY_MS)
+        if _QUERY_BATCHER is None or _QUERY_BATCHER_KEY != key:
+            from .batching import MicroBatcher
+            if _QUERY_BATCHER is not None:
+                _QUERY_BATCHER.close()
+            _QUERY_BATCHER = MicroBatcher(lambda texts: encoder.encode(texts, convert_to_numpy=True),
+                                          max_batch=ENCODER_MAX_BATCH,
+                                          max_latency_ms=ENCODER_MAX_LATENCY_MS,
+                                          name="query_encoder")
+            _QUERY_BATCHER_KEY = key
+        batcher = _QUERY_BATCHER
+    return batcher.run(query_text)
+
+def encoder_stats() -> Dict[str, Any]:
+    """Query encodes and forward passes in this process, batched or not (plus batcher metrics)."""
+    with _QUERY_BATCHER_LOCK:
+        unbatched = dict(_UNBATCHED)
+        batched = _QUERY_BATCHER.stats() if _QUERY_BATCHER is not None else {}
+    queries = unbatched["queries"] + batched.get("items", 0)
+    passes = unbatched["queries"] + batched.get("batches", 0)
+    return {
+        "max_batch": ENCODER_MAX_BATCH,
+        "max_latency_ms": ENCODER_MAX_LATENCY_MS,
+        "queries": queries,
+        "forward_passes": passes,
+        "forward_s_total": unbatched["forward_s_total"] + batched.get("forward_s_total", 0.0),
+        "avg_batch_size": queries / passes if passes else 0.0,
+        "batcher": batched,
+    }
+
+# ------ embedding indexes (one per directory, e.g. one per game catalog) ------
+_EMB_CACHES: Dict[str, Dict[str, Any]] = {}
+_EMB_LOCK = threading.Lock()
+_ENCODER_CACHE: Dict[str, Any] = {}
+
+def load_embedding_index(embeddings_dir: str) -> Optional[Dict[str, Any]]:
+    """
+    embeddings.npy + fitted NN for a directory, with cards_metadata.json's rows from the shared
+    card catalog as 'meta'; loaded once, rebuilt when the catalog's version moves. None if absent.
+    """
+    key = os.path.abspath(embeddings_dir)
+    emb_path = os.path.join(embeddings_dir, 'embeddings.npy')
+    meta_path = os.path.join(embeddings_dir, 'cards_metadata.json')
+    with _EMB_LOCK:
+        cache = _EMB_CACHES.get(key)
+        if cache is None and (not os.path.exists(emb_path) or not os.path.exists(meta_path)):
+            return None
+        try:
+            cat = card_catalog.get_catalog(meta_path)
+        except FileNotFoundError:
+            return cache
+        if cache is not None and cache['version'] == cat.version:
+            return cache
+        vectors = np.load(emb_path, mmap_mode='r' if EMB_MMAP else None)
+        cache = {'embeddings': vectors, 'meta': cat.rows, 'version': cat.version}
+        cache['nn'] = _neighbors.NearestNeighbors(n_neighbors=min(16, len(cache['embeddings'])), algorithm='auto')
+        cache['nn'].fit(cache['embeddings'])
+        _EMB_CACHES[key] = cache
+        return cache
+
+def drop_embedding_index(embeddings_dir: str) -> None:
+    with _EMB_LOCK:
+        _EMB_CACHES.pop(os.path.abspath(embeddings_dir), None)
+
+def embedding_index_nbytes(embeddings_dir: str) -> int:
+    """
+    Approximate resident size of a loaded index (rows are the catalog's). Brute-force NN (the
+    choice for embedding widths) keeps a reference to the vectors; tree methods copy them.
+    """
+    cache = _EMB_CACHES.get(os.path.abspath(embeddings_dir))
+    if cache is None:
+        return 0
+    fit = getattr(cache['nn'], '_fit_X', None)
+    copies = 1 if fit is not None and np.may_share_memory(fit, cache['embeddings']) else 2
+    return copies * int(cache['embeddings'].nbytes)
+
+def _query_encoder():
+    # one text encoder for every index (loaded lazily, None if no backend loads)
+    with _EMB_LOCK:
+        if 'encoder' not in _ENCODER_CACHE:
+            _ENCODER_CACHE['encoder'] = _load_query_encoder()
+        return _ENCODER_CACHE['encoder']
 
 def load_local_db(path: str) -> List[Dict[str, Any]]:
     """
-    Load local db from JSON/NDJSON or SQLite file. Returns a list of card dicts.
-    Expected minimal keys per card: 'name' and ideally 'oracle_text'/'collector_number'/'set'
+    Card DB rows from JSON/NDJSON or SQLite (see card_catalog.read_rows), parsed once per
+    process and shared: the list is the card catalog's, do not mutate it.
     """
     if not path:
         return []
-    path = os.path.expanduser(path)
-    if not os.path.exists(path):
-        raise FileNotFoundError(path)
-    if path.endswith(".json"):
-        with open(path, "r", encoding="utf8") as fh:
-            data = json.load(fh)
-            if isinstance(data, dict) and "data" in data:
-                # some exports (scryfall) wrap list in "data"
-                data = data["data"]
-            return data
-    if path.endswith(".ndjson") or path.endswith(".ndjsonl") or path.endswith(".ndjsonl.txt"):
-        out = []
-        with open(path, "r", encoding="utf8") as fh:
-            for line in fh:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    out.append(json.loads(line))
-                except Exception:
-                    continue
-        return out
-    # try sqlite
-    try:
-        conn = sqlite3.connect(path)
-        cur = conn.cursor()
-        # try common column names
-        for colset in (("name","oracle_text","collector_number","set","id"),
-                       ("name","oracle","collector_number","set_code","id"),
-                       ("name","oracle_text","collector","set_code","id")):
-            try:
-                col_list = ", ".join(col for col in colset if col)
-                cur.execute(f"SELECT {col_list} FROM cards LIMIT 1")
-                rows = cur.fetchall()
-                # if query succeeded, fetch all rows
-                cur.execute(f"SELECT {col_list} FROM cards")
-                rows = cur.fetchall()
-                cols = [d[0] for d in cur.description]
-                out = []
-                for r in rows:
-                    out.append({cols[i]: r[i] for i in range(len(cols))})
-                conn.close()
-                return out
-            except Exception:
-                continue
-        conn.close()
-    except Exception:
-        pass
-    # fallback: try to read as JSON anyway
-    with open(path, "r", encoding="utf8") as fh:
-        try:
-            return json.load(fh)
-        except Exception:
-            raise RuntimeError("Unsupported DB format or no cards found")
+    return card_catalog.get_catalog(path).rows
 
 # ------ scoring / matching ------
 
@@ -119,31 +197,33 @@ def _name_candidates_from_db(name: str, cards: List[Dict[str,Any]], top_n: int =
     if not name:
         return []
     norm_name = _normalize(name)
-    # build name list and mapping
-    name_map = {}
-    names = []
-    for c in cards:
-        n = _normalize(c.get("name") or c.get("title") or "")
-        names.append(n)
-        name_map[n] = name_map.get(n, []) + [c]
+    cat = card_catalog.catalog_of(cards)
+    if cat is not None:
+        # a catalog's rows: its name index is built once per version
+        choices = cat.names
+        lookup = lambda n: cat.by_name(n, normalized=True)
+    else:
+        name_map: Dict[str, List[Dict[str, Any]]] = {}
+        for c in cards:
+            name_map.setdefault(_normalize(c.get("name") or c.get("title") or ""), []).append(c)
+        choices = list(name_map)
+        lookup = lambda n: name_map.get(n, [])
     if HAVE_RAPIDFUZZ:
         # rapidfuzz can return (match, score, index)
-        choices = list(set(names))
         matches = rf_process.extract(norm_name, choices, scorer=rf_fuzz.WRatio, limit=top_n)
         out = []
         for match, score, _ in matches:
-            for card in name_map.get(match, []):
+            for card in lookup(match):
                 out.append((card, float(score)))
         return out
     else:
         # difflib fallback
-        choices = list(set(names))
         matches = difflib.get_close_matches(norm_name, choices, n=top_n, cutoff=0.0)
         out = []
         for m in matches:
             # approximate score with SequenceMatcher ratio *100
             score = int(difflib.SequenceMatcher(None, norm_name, m).ratio() * 100)
-            for card in name_map.get(m, []):
+            for card in lookup(m):
                 out.append((card, float(score)))
         return out
 
@@ -217,31 +297,13 @@ def identify_card_from_ocr(ocr_map: Dict[str,str],
         if not embeddings_dir:
             return None
         try:
-            emb_path = os.path.join(embeddings_dir, 'embeddings.npy')
-            meta_path = os.path.join(embeddings_dir, 'cards_metadata.json')
-            if not os.path.exists(emb_path) or not os.path.exists(meta_path):
+            cache = load_embedding_index(embeddings_dir)
+            if cache is None:
                 return None
-            # cache loader on module attribute to avoid repeated loads
-            if not hasattr(identify_card_from_ocr, '_emb_cache'):
-                identify_card_from_ocr._emb_cache = {}
-            cache = identify_card_from_ocr._emb_cache
-            if 'embeddings' not in cache:
-                cache['embeddings'] = np.load(emb_path)
-                with open(meta_path, 'r', encoding='utf8') as fh:
-                    cache['meta'] = json.load(fh)
-                cache['nn'] = NearestNeighbors(n_neighbors=min(16, len(cache['embeddings'])), algorithm='auto')
-                cache['nn'].fit(cache['embeddings'])
-            # load encoder model lazily
-            if 'encoder' not in cache:
-                try:
-                    from sentence_transformers import SentenceTransformer
-                    cache['encoder'] = SentenceTransformer('all-MiniLM-L6-v2')
-                except Exception:
-                    cache['encoder'] = None
-            encoder = cache.get('encoder')
+            encoder = _query_encoder()
             if encoder is None:
                 return None
-            q_emb = encoder.encode([query_text], convert_to_numpy=True)[0]
+            q_emb = _encode_query(encoder, query_text)
             dists, idxs = cache['nn'].kneighbors(q_emb.reshape(1, -1), n_neighbors=min(8, cache['embeddings'].shape[0]))
             # build candidate list from metadata
             out = []
@@ -279,9 +341,11 @@ def identify_card_from_ocr(ocr_map: Dict[str,str],
             results['debug']['embed_match'] = True
             return results
 
-    # 1) try exact normalized name match
+    # 1) try exact normalized name match (catalog rows: one name-index lookup)
     if norm_o_name:
-        for c in cards:
+        cat = card_catalog.catalog_of(cards)
+        exact = cat.by_name(norm_o_name, normalized=True)[:1] if cat is not None else cards
+        for c in exact:
             if _normalize(c.get("name") or c.get("title") or "") == norm_o_name:
                 # immediate perfect-ish match
                 results['best'] = c
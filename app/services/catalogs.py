@@ -0,0 +1,280 @@
+"""
+Per-game catalogs: identification index, OCR vocabulary and sorting config for each game.
+
+Provides:
+ - GameSpec: where a game's data lives (config.yaml games: section) and how to spot its frame
+ - GameCatalog: one game's sorting Config (built on first use) and its embedding index /
+   correction vocabulary (loaded on first use, dropped on eviction)
+ - CatalogRegistry: catalogs keyed by game; get(game) loads lazily and evicts the least
+   recently used other games while loaded indexes exceed memory_budget_mb; config(game)
+   for assignment; detect(image) -> (game, distance). One registry per process: the budget
+   and the metrics are per process (see workers.catalog_stats for the pool's totals)
+ - detect_game(image, specs): cheap frame check -- mean colour of the card border ring
+   against each game's border_rgb (MTG black, Pokemon yellow, ...), a few thousand pixels
+ - get_registry(raw_cfg, base_cfg): the per-process registry (created on first use); games
+   without sorting overrides use base_cfg, the Config the rest of the process already holds
+   (attached on a later call when the registry was created without one)
+
+config.yaml:
+
+    games:
+      default: mtg                     # unknown / undetected cards
+      memory_budget_mb: 512            # loaded indexes + vocabularies, all games, per process
+      mtg:
+        embeddings_dir: data/embeddings
+        frame: { border_rgb: [20, 20, 20] }
+      pokemon:
+        embeddings_dir: data/games/pokemon/embeddings
+        card_db: data/games/pokemon/cards.json
+        frame: { border_rgb: [235, 200, 40] }
+        alpha_exact: { letter_to_cell: {...} }   # sorting overrides for this game
+
+A game's sorting overrides replace whole top-level sections (sorting, alpha_exact,
+alpha_balanced, rules, overflow) of config.yaml; cells and feeders are physical and shared.
+Without a games: section there is one game, mtg, with the paths used so far.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+import copy
+import logging
+import os
+import threading
+
+import numpy as np
+
+from .assign import Config, load_config
+
+LOG = logging.getLogger("sort.catalogs")
+
+DEFAULT_GAME = "mtg"
+SORTING_SECTIONS = ("sorting", "alpha_exact", "alpha_balanced", "rules", "overflow")
+METRICS = ("loads", "evictions", "hits", "detected", "undetected")
+# border ring used for detection: from 1% to 5% of the short side in from each edge
+_RING = (0.01, 0.05)
+
+
+@dataclass
+class GameSpec:
+    game: str
+    embeddings_dir: str = os.path.join("data", "embeddings")
+    card_db: Optional[str] = None
+    vocab_path: Optional[str] = None          # default: <embeddings_dir>/cards_metadata.json
+    border_rgb: Optional[Tuple[float, float, float]] = None
+    max_border_dist: float = 90.0
+    overrides: Dict[str, Any] = field(default_factory=dict)
+
+    def __post_init__(self):
+        if self.vocab_path is None:
+            self.vocab_path = os.path.join(self.embeddings_dir, "cards_metadata.json")
+
+
+class GameCatalog:
+    def __init__(self, spec: GameSpec, raw_cfg: Dict[str, Any], base_cfg: Optional[Config] = None):
+        self.spec = spec
+        self._raw_cfg = raw_cfg
+        # games without overrides share the process's Config (balanced map, rule counters)
+        self._cfg: Optional[Config] = base_cfg if not spec.overrides else None
+        self.loaded = False
+
+    @property
+    def game(self) -> str:
+        return self.spec.game
+
+    @property
+    def embeddings_dir(self) -> str:
+        return self.spec.embeddings_dir
+
+    @property
+    def vocab_path(self) -> str:
+        return self.spec.vocab_path
+
+    @property
+    def config(self) -> Config:
+        if self._cfg is None:
+            raw = copy.deepcopy(self._raw_cfg)
+            raw.update(copy.deepcopy(self.spec.overrides))
+            self._cfg = load_config(raw)
+        return self._cfg
+
+    def _files(self) -> List[str]:
+        # card lists behind this game (card_catalog): vocabulary / index metadata, card DB
+        meta = os.path.join(self.embeddings_dir, "cards_metadata.json")
+        return list(dict.fromkeys(p for p in (self.vocab_path, meta, self.spec.card_db) if p))
+
+    def load(self) -> None:
+        from . import card_catalog, card_id
+        card_id.load_embedding_index(self.embeddings_dir)
+        if os.path.exists(self.vocab_path):
+            card_catalog.get_catalog(self.vocab_path).vocabulary
+        self.loaded = True
+
+    def unload(self) -> None:
+        from . import card_catalog, card_id
+        card_id.drop_embedding_index(self.embeddings_dir)
+        for path in self._files():
+            card_catalog.drop(path)
+        self.loaded = False
+
+    def nbytes(self) -> int:
+        if not self.loaded:
+            return 0
+        from . import card_catalog, card_id
+        cats = [card_catalog.loaded(p) for p in self._files()]
+        return card_id.embedding_index_nbytes(self.embeddings_dir) + sum(c.nbytes() for c in cats if c)
+
+
+# ---------- Detection ----------
+def _border_rgb(image: Any) -> np.ndarray:
+    """Mean RGB of the border ring of a BGR or grayscale image (array or path), on a strided sample."""
+    if isinstance(image, str):
+        import cv2
+        image = cv2.imread(image, cv2.IMREAD_COLOR)
+        if image is None:
+            raise FileNotFoundError("Could not load image")
+    img = np.asarray(image)
+    if img.ndim == 2:
+        img = img[:, :, None]       # grayscale: one channel, compared as grey RGB below
+    h, w = img.shape[:2]
+    short = min(h, w)
+    a, b = max(1, int(short * _RING[0])), max(2, int(short * _RING[1]))
+    step = max(1, short // 200)
+    parts = [img[a:b:step, a:w - a:step], img[h - b:h - a:step, a:w - a:step],
+             img[b:h - b:step, a:b:step], img[b:h - b:step, w - b:w - a:step]]
+    px = np.concatenate([p.reshape(-1, img.shape[2]) for p in parts if p.size])
+    return px[:, 2::-1].mean(axis=0) if img.shape[2] >= 3 else np.repeat(px.mean(), 3)
+
+
+def detect_game(image: Any, specs: List[GameSpec]) -> Tuple[Optional[str], float]:
+    """Closest game by border colour; (None, distance) when no game is within its max distance."""
+    candidates = [s for s in specs if s.border_rgb is not None]
+    if not candidates:
+        return None, float("inf")
+    rgb = _border_rgb(image)
+    best, best_d = None, float("inf")
+    for s in candidates:
+        d = float(np.linalg.norm(rgb - np.asarray(s.border_rgb, dtype=float)))
+        if d < best_d and d <= s.max_border_dist:
+            best, best_d = s.game, d
+    return best, best_d
+
+
+# ---------- Registry ----------
+def specs_from_cfg(raw_cfg: Dict[str, Any]) -> Tuple[List[GameSpec], str, float]:
+    games = dict((raw_cfg or {}).get("games") or {})
+    default = str(games.pop("default", DEFAULT_GAME))
+    budget = float(games.pop("memory_budget_mb", 512))
+    specs = []
+    for game, g in games.items():
+        g = g or {}
+        frame = g.get("frame") or {}
+        unknown = set(g) - {"embeddings_dir", "card_db", "vocab_path", "frame"} - set(SORTING_SECTIONS)
+        if unknown:
+            raise ValueError(f"games: '{game}' has unknown key(s) {sorted(unknown)}")
+        specs.append(GameSpec(
+            game=str(game),
+            embeddings_dir=g.get("embeddings_dir", os.path.join("data", "games", str(game), "embeddings")),
+            card_db=g.get("card_db"),
+            vocab_path=g.get("vocab_path"),
+            border_rgb=tuple(frame["border_rgb"]) if frame.get("border_rgb") else None,
+            max_border_dist=float(frame.get("max_dist", 90.0)),
+            overrides={k: g[k] for k in SORTING_SECTIONS if k in g},
+        ))
+    if not any(s.game == default for s in specs):
+        specs.append(GameSpec(default))
+    return specs, default, budget
+
+
+class CatalogRegistry:
+    def __init__(self, raw_cfg: Dict[str, Any], base_cfg: Optional[Config] = None):
+        specs, self.default, budget_mb = specs_from_cfg(raw_cfg)
+        self.specs = {s.game: s for s in specs}
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self._raw = {k: v for k, v in (raw_cfg or {}).items() if k != "games"}
+        self._catalogs = {g: GameCatalog(s, self._raw, base_cfg) for g, s in self.specs.items()}
+        self._lru: "OrderedDict[str, None]" = OrderedDict()     # loaded games, oldest first
+        self._lock = threading.RLock()
+        self.metrics = {k: 0 for k in METRICS}
+
+    def set_base_config(self, base_cfg: Config) -> None:
+        """Share base_cfg with games that have no overrides (registry created before it existed)."""
+        for cat in self._catalogs.values():
+            if not cat.spec.overrides and cat._cfg is None:
+                cat._cfg = base_cfg
+
+    def resolve(self, game: Optional[str]) -> str:
+        g = (game or "").strip().lower()
+        return g if g in self.specs else self.default
+
+    def catalog(self, game: Optional[str]) -> GameCatalog:
+        """The game's catalog without loading its index (config / paths only)."""
+        return self._catalogs[self.resolve(game)]
+
+    def config(self, game: Optional[str]) -> Config:
+        return self.catalog(game).config
+
+    def get(self, game: Optional[str]) -> GameCatalog:
+        """The game's catalog with its index and vocabulary loaded."""
+        g = self.resolve(game)
+        with self._lock:
+            cat = self._catalogs[g]
+            if g in self._lru:
+                self._lru.move_to_end(g)
+                self.metrics["hits"] += 1
+                return cat
+            cat.load()
+            self._lru[g] = None
+            self.metrics["loads"] += 1
+            LOG.info("Loaded catalog '%s' (%.1f MB)", g, cat.nbytes() / 2 ** 20)
+            self._evict(keep=g)
+            return cat
+
+    def _evict(self, keep: str) -> None:
+        while self._loaded_bytes() > self.budget_bytes:
+            victim = next((g for g in self._lru if g != keep), None)
+            if victim is None:
+                break           # the game in use alone is over budget: keep it
+            self._catalogs[victim].unload()
+            del self._lru[victim]
+            self.metrics["evictions"] += 1
+            LOG.info("Evicted catalog '%s' (memory budget %.0f MB)", victim, self.budget_bytes / 2 ** 20)
+
+    def _loaded_bytes(self) -> int:
+        return sum(self._catalogs[g].nbytes() for g in self._lru)
+
+    def detect(self, image: Any) -> Tuple[str, float]:
+        """Game from the card frame; the default game when nothing matches."""
+        game, dist = detect_game(image, list(self.specs.values()))
+        with self._lock:
+            self.metrics["detected" if game else "undetected"] += 1
+        return game or self.default, dist
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "default": self.default,
+                "games": sorted(self.specs),
+                "loaded": {g: round(self._catalogs[g].nbytes() / 2 ** 20, 2) for g in self._lru},
+                "budget_mb": round(self.budget_bytes / 2 ** 20, 1),
+                **self.metrics,
+            }
+
+
+_REGISTRY: Optional[CatalogRegistry] = None
+_REGISTRY_LOCK = threading.Lock()
+
+
+def get_registry(raw_cfg: Optional[Dict[str, Any]] = None, base_cfg: Optional[Config] = None) -> CatalogRegistry:
+    """The process-wide registry; raw_cfg (parsed config.yaml) and base_cfg are used on first use."""
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        if _REGISTRY is None:
+            if raw_cfg is None:
+                import yaml
+                with open("config.yaml", "r", encoding="utf8") as fh:
+                    raw_cfg = yaml.safe_load(fh)
+            _REGISTRY = CatalogRegistry(raw_cfg, base_cfg)
+        elif base_cfg is not None:
+            # e.g. created by prefork.preload in the parent before main built its Config
+            _REGISTRY.set_base_config(base_cfg)
+        return _REGISTRY
@@ -0,0 +1,159 @@
+"""
+Authoritative cell-count store shared by everything that places cards in one process.
+
+Provides:
+ - CellStore: thread-safe live counts per cell
+     * state: a SystemState whose counts_by_cell IS the store's dict, so existing readers
+       (assign_card, /debug endpoints) keep working unchanged
+     * assign(card, cfg): assign_card + reservation of the destination as one atomic step, so
+       two heads (or the HTTP API and the run loop) can never both take the last slot of a pile
+     * release(cell, card) to undo a reservation after a failed transfer; add/reset/snapshot
+     * placed(cell, card) once the transfer finished: the card is now on top of the pile
+     * inventory: InventoryIndex of which pile (and how deep) every card is in, rebuilt from
+       the placement ledger on startup; locate / pile / plan_dig read it under the lock
+ - get_store(cfg): the per-process store (created on first use), persisted through a
+   StateJournal in SORTME_STATE_DIR (default data/state; empty string = in-memory only)
+
+Counts only change through the store's methods; direct writes to state.counts_by_cell still
+work but bypass the lock and the journal. With a journal, every change is also appended to
+the write-ahead log (services/state_journal.py) and counts survive a restart.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import os
+import threading
+
+from .assign import Card, Config, SystemState, assign_card
+from .inventory import InventoryIndex, Want, plan_dig
+from .state_journal import StateJournal, iter_ledger
+
+
+class CellStore:
+    def __init__(self, cell_ids, counts: Optional[Dict[str, int]] = None,
+                 journal: Optional[StateJournal] = None):
+        self._lock = threading.RLock()
+        self.state = SystemState(counts_by_cell={cid: 0 for cid in cell_ids})
+        self.journal = journal
+        self.inventory = InventoryIndex()
+        if journal is not None:
+            recovered, _ = journal.recover()
+            self.state.counts_by_cell.update(recovered)
+            self.inventory.replay(iter_ledger(journal.root))
+        if counts:
+            self.state.counts_by_cell.update({k: int(v) for k, v in counts.items()})
+
+    def _log(self, op: str, **fields: Any) -> None:
+        if self.journal is not None:
+            self.journal.append(dict(fields, op=op))
+
+    # ------ reads ------
+    def get(self, cell_id: str) -> int:
+        return self.state.counts_by_cell.get(cell_id, 0)
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.state.counts_by_cell)
+
+    def snapshot(self) -> SystemState:
+        """Independent copy for dry runs / previews."""
+        return SystemState(counts_by_cell=self.counts())
+
+    def locate(self, name: str, set_code: Optional[str] = None,
+               collector_number: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            return self.inventory.locate(name, set_code, collector_number)
+
+    def pile(self, cell_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return self.inventory.pile(cell_id)
+
+    def plan_dig(self, wants: List[Want]) -> Dict[str, Any]:
+        with self._lock:
+            return plan_dig(self.inventory, wants)
+
+    # ------ writes ------
+    def assign(self, card: Card, cfg: Config, route=None) -> Tuple[str, str]:
+        """
+        Pick the destination and reserve one slot in it atomically. route(card, cfg, state)
+        replaces assign_card (e.g. a radix_plan.SortPass while a sort pass runs).
+        """
+        with self._lock:
+            cell_id, reason = (route or assign_card)(card, cfg, self.state)
+            self._add(cell_id, 1)
+            self.inventory.reserve(cell_id, card)
+            self._log("add", cell=cell_id, n=1, card=card.name, reason=reason, **_ids(card))
+            return cell_id, reason
+
+    def add(self, cell_id: str, n: int = 1) -> int:
+        with self._lock:
+            self._log("add", cell=cell_id, n=n)
+            self.inventory.add_unknown(cell_id, n)
+            return self._add(cell_id, n)
+
+    def release(self, cell_id: str, card: Optional[Card] = None) -> int:
+        """Undo one reservation (transfer failed, card never arrived)."""
+        with self._lock:
+            self._log("release", cell=cell_id, n=-1, **({"card": card.name} if card else {}))
+            self.inventory.cancel(cell_id, card)
+            return self._add(cell_id, -1)
+
+    def placed(self, cell_id: str, card: Card) -> None:
+        """The transfer of an assigned card finished (counts already include it)."""
+        with self._lock:
+            self._log("placed", cell=cell_id, card=card.name, **_ids(card))
+            self.inventory.place(cell_id, card)
+
+    def set(self, cell_id: str, count: int) -> None:
+        with self._lock:
+            self._log("set", cell=cell_id, n=max(0, int(count)))
+            self.state.counts_by_cell[cell_id] = max(0, int(count))
+            self.inventory.set_count(cell_id, max(0, int(count)))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._log("reset")
+            for k in self.state.counts_by_cell:
+                self.state.counts_by_cell[k] = 0
+            self.inventory.clear()
+
+    def flush(self) -> None:
+        if self.journal is not None:
+            self.journal.flush()
+
+    def close(self) -> None:
+        if self.journal is not None:
+            self.journal.close()
+
+    def _add(self, cell_id: str, n: int) -> int:
+        counts = self.state.counts_by_cell
+        counts[cell_id] = max(0, counts.get(cell_id, 0) + n)
+        return counts[cell_id]
+
+
+def _ids(card: Card) -> Dict[str, str]:
+    # printing identifiers for the ledger, only when known
+    out = {}
+    if card.set_code:
+        out["set"] = card.set_code
+    if card.collector_number:
+        out["number"] = str(card.collector_number)
+    return out
+
+
+_STORE: Optional[CellStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_store(cfg: Config) -> CellStore:
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            root = os.environ.get("SORTME_STATE_DIR", os.path.join("data", "state"))
+            journal = None
+            if root:
+                journal = StateJournal(
+                    root,
+                    group_commit_ms=float(os.environ.get("SORTME_STATE_GROUP_MS", "5")),
+                    compact_every=int(os.environ.get("SORTME_STATE_COMPACT_EVERY", "5000")),
+                )
+            _STORE = CellStore(cfg.cells.keys(), journal=journal)
+        return _STORE
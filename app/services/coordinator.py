@@ -0,0 +1,346 @@
+"""
+Multi-head coordination: several MotionControllers working one cell grid.
+
+Provides:
+ - ZoneTable: collision zones along the shared rail (X). A transfer reserves the X span it
+   sweeps (head position, source, destination, +/- clearance); spans of different heads may
+   not overlap. Requests are granted in arrival order, so pile order is preserved and nobody
+   starves. Idle heads still occupy their parked position; if an idle head is in the way it
+   is moved to its park position (its own end of the rail) first.
+ - Coordinator(controllers, cfg, store, feeders): place(card) assigns through the shared
+   CellStore (atomic assign + reservation), hands the transfer to the free head closest to
+   the destination (or, with partition=True, to the head owning that slice of the rail),
+   picks the feeder from that head's position and runs the transfer under a zone reservation.
+   serve(queue) runs one worker per head pulling from a shared queue of cards/metas.
+ - stats(): per-head transfers, busy and zone-wait time
+
+Heads are assumed to sit on one rail in list order (head 0 leftmost), so they cannot pass
+each other; park positions default to the rail ends.
+
+Every transfer sweeps the rail from its feeder to its destination, so heads only work apart
+when each has feeders in its own slice (e.g. feeders at both ends). With partition=True and a
+slice without feeders, every head would queue for the zone around the shared feeders and two
+heads would place fewer cards than one; the coordinator then runs on a single head (the one
+whose slice holds the most feeders) and keeps the others parked at their rail ends.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import asyncio
+import itertools
+import logging
+
+from .assign import Card, Config
+from .cell_store import CellStore
+from .feeders import FeederScheduler
+
+LOG = logging.getLogger("sort.coordinator")
+
+Span = Tuple[float, float]
+
+
+def _overlaps(a: Span, b: Span) -> bool:
+    return a[0] < b[1] and b[0] < a[1]
+
+
+@dataclass
+class _Request:
+    ticket: int
+    xs: Tuple[float, ...]            # source and destination x
+    head: Optional[int] = None       # set once a head is allocated; only then can it be granted
+    owner: Optional[int] = None      # head this request must run on (partitioned rail)
+    granted: bool = False
+    park: List[int] = field(default_factory=list)   # idle heads to move out of the way first
+
+
+class ZoneTable:
+    """
+    pos_x(head) -> current x of a head; park_x[head] -> where an idle head can be moved.
+    Tickets are taken at assignment time so grants follow assignment order.
+    """
+    def __init__(self, clearance: float, pos_x, park_x: List[float]):
+        self.clearance = clearance
+        self.pos_x = pos_x
+        self.park_x = park_x
+        self.active: Dict[int, Span] = {}        # head -> span held for a transfer
+        self._waiting: List[_Request] = []
+        self._tickets = itertools.count()
+
+    def span(self, *xs: float) -> Span:
+        return (min(xs) - self.clearance, max(xs) + self.clearance)
+
+    def req_span(self, req: _Request) -> Span:
+        if req.head is None:
+            return self.span(*req.xs)
+        return self.span(self.pos_x(req.head), *req.xs)
+
+    def open(self, *xs: float) -> _Request:
+        req = _Request(next(self._tickets), tuple(xs))
+        self._waiting.append(req)
+        return req
+
+    def cancel(self, req: _Request) -> None:
+        if req in self._waiting:
+            self._waiting.remove(req)
+
+    def _grant_check(self, req: _Request) -> Optional[List[int]]:
+        """None if req must wait, else the idle heads that have to be parked first."""
+        if req.head is None:
+            return None
+        span = self.req_span(req)
+        # FIFO among overlapping requests: an earlier waiting request that overlaps goes first
+        for other in self._waiting:
+            if other.ticket >= req.ticket:
+                break
+            if _overlaps(self.req_span(other), span):
+                return None
+        park = []
+        for h in range(len(self.park_x)):
+            if h == req.head:
+                continue
+            if h in self.active:
+                if _overlaps(self.active[h], span):
+                    return None
+            elif _overlaps(self.span(self.pos_x(h)), span):
+                # a head that is not moving is in the way: park it, if its park spot is clear
+                if _overlaps(self.span(self.park_x[h]), span):
+                    return None
+                park.append(h)
+        return park
+
+    def grant_ready(self) -> None:
+        for req in list(self._waiting):
+            park = self._grant_check(req)
+            if park is None:
+                continue
+            self._waiting.remove(req)
+            self.active[req.head] = self.req_span(req)
+            req.park = park
+            req.granted = True
+
+    def release(self, head: int) -> None:
+        self.active.pop(head, None)
+
+
+@dataclass
+class HeadStats:
+    transfers: int = 0
+    failures: int = 0
+    busy_s: float = 0.0
+    zone_wait_s: float = 0.0
+    parks: int = 0
+
+
+class Coordinator:
+    def __init__(self,
+                 controllers: List[Any],
+                 cfg: Config,
+                 store: CellStore,
+                 feeders: Optional[FeederScheduler] = None,
+                 clearance: float = 60.0,
+                 park_x: Optional[List[float]] = None,
+                 partition: bool = True):
+        if not controllers:
+            raise ValueError("Coordinator needs at least one controller")
+        self.heads = controllers
+        self.cfg = cfg
+        self.store = store
+        self.feeders = feeders
+        xs = [c["x"] for c in controllers[0].cells.values()] or [0.0]
+        lo, hi = min(xs) - 2 * clearance, max(xs) + 2 * clearance
+        if park_x is None:
+            n = len(controllers)
+            park_x = [lo + (hi - lo) * i / max(1, n - 1) for i in range(n)] if n > 1 else [lo]
+        self.park_x = park_x
+        # partition: head i only serves destinations in the i-th slice of the rail (by x), so
+        # heads mostly work apart instead of queueing for overlapping zones
+        self.partition = partition and len(controllers) > 1
+        dest_xs = sorted({c["x"] for c in controllers[0].cells.values()})
+        n = len(controllers)
+        self._bounds = [dest_xs[min(len(dest_xs) - 1, (len(dest_xs) * i) // n)] for i in range(1, n)] if dest_xs else []
+        # heads that take work; the rest stay parked (see the module docstring)
+        self.active = list(range(n))
+        if self.partition and feeders is not None:
+            fed = [0] * n
+            for f in feeders.feeders:
+                if f in controllers[0].cells:
+                    fed[self._slice(self._cell_x_of(controllers[0], f))] += 1
+            if not all(fed):
+                self.active = [max(range(n), key=lambda i: (fed[i], -i))]
+                self.partition = False
+                LOG.warning("Feeders only in %d of %d head slices; placing with head %d alone "
+                            "(put feeders at both ends of the rail to use every head)",
+                            sum(1 for c in fed if c), n, self.active[0])
+        self.zones = ZoneTable(clearance, lambda h: self.heads[h].current[0], park_x)
+        self._idle = asyncio.Condition()
+        self._zones_changed = asyncio.Condition()
+        self._busy = [False] * len(controllers)
+        self.stats_by_head = [HeadStats() for _ in controllers]
+
+    # ------ helpers ------
+    @staticmethod
+    def _cell_x_of(ctrl: Any, cell_id: str) -> float:
+        return ctrl.cells[cell_id]["x"]
+
+    def _cell_x(self, cell_id: str) -> float:
+        return self.heads[0].cells[cell_id]["x"]
+
+    def _slice(self, x: float) -> int:
+        return sum(1 for b in self._bounds if x >= b)
+
+    def _owner(self, cell_id: str) -> Optional[int]:
+        if not self.partition:
+            return None
+        return self._slice(self._cell_x(cell_id))
+
+    def _earlier_headless(self, req: _Request, owner: Optional[int]) -> bool:
+        return any(r.head is None and r.ticket < req.ticket and (owner is None or r.owner == owner)
+                   for r in self.zones._waiting)
+
+    async def _acquire_head(self, req: _Request, cell_id: str) -> int:
+        """Wait for a free head (in ticket order); prefer the one closest to the cell."""
+        cx = self._cell_x(cell_id)
+        owner = req.owner = self._owner(cell_id)
+        candidates = [owner] if owner is not None else list(self.active)
+        async with self._idle:
+            while all(self._busy[i] for i in candidates) or self._earlier_headless(req, owner):
+                await self._idle.wait()
+            free = [i for i in candidates if not self._busy[i]]
+            head = min(free, key=lambda i: abs(self.heads[i].current[0] - cx))
+            self._busy[head] = True
+            req.head = head
+            self._idle.notify_all()
+            return head
+
+    async def _release_head(self, head: int) -> None:
+        async with self._idle:
+            self._busy[head] = False
+            self._idle.notify_all()
+
+    async def _park(self, head: int) -> None:
+        ctrl = self.heads[head]
+        x = self.park_x[head]
+        _, y, z = ctrl.current
+        async with ctrl.lock:
+            await ctrl.driver.move_absolute(x, y, z, ctrl.default_speed)
+            ctrl.current = (x, y, z)
+        self.stats_by_head[head].parks += 1
+
+    async def _reserve(self, req: _Request) -> None:
+        async with self._zones_changed:
+            while True:
+                self.zones.grant_ready()
+                if req.granted:
+                    break
+                await self._zones_changed.wait()
+        # heads in the way are not moving (idle, or waiting for their own zone, which cannot be
+        # granted while ours overlaps); move them aside before we start
+        for h in req.park:
+            await self._park(h)
+        if req.park:
+            async with self._zones_changed:
+                self._zones_changed.notify_all()
+
+    async def _release_zone(self, head: int) -> None:
+        async with self._zones_changed:
+            self.zones.release(head)
+            self._zones_changed.notify_all()
+
+    def _choose_feeder(self, ctrl: Any, cell_id: str) -> str:
+        if self.feeders is None:
+            raise RuntimeError("No source cell and no feeder scheduler")
+        # from this head's position: heads at opposite ends of the rail use different feeders
+        return self.feeders.choose(cell_id, ctrl.cells, ctrl.current, ctrl.default_speed, ctrl.driver,
+                                   plan_ahead=False)
+
+    # ------ placement ------
+    async def place(self, card: Card, from_cell: Optional[str] = None,
+                    assign: Optional[Callable[[Card], Tuple[str, str]]] = None) -> Dict[str, Any]:
+        """
+        Assign, pick a source, run the transfer on a free head. Returns the transfer result.
+        assign(card) -> (cell, reason) replaces store.assign(card, cfg); it must reserve the
+        cell in the same store (e.g. run_loop._route_assign for per-game config / sort passes).
+        """
+        cell_id, reason = assign(card) if assign is not None else self.store.assign(card, self.cfg)
+        # ticket now (no await since assign) so head allocation and zone grants follow assignment order
+        req = self.zones.open(self._cell_x(cell_id))
+        try:
+            head = await self._acquire_head(req, cell_id)
+        except BaseException:
+            self.zones.cancel(req)
+            self.store.release(cell_id, card)
+            raise
+        ctrl = self.heads[head]
+        try:
+            source = from_cell or self._choose_feeder(ctrl, cell_id)
+        except BaseException:
+            self.zones.cancel(req)
+            self.store.release(cell_id, card)
+            await self._release_head(head)
+            raise
+        if self.feeders is not None:
+            self.feeders.take(source, cell_id)
+        req.xs = req.xs + (self._cell_x(source),)
+        st = self.stats_by_head[head]
+        try:
+            clock = ctrl.driver.clock       # driver seconds (simulated time for simulators)
+            t0 = clock()
+            await self._reserve(req)
+            t1 = clock()
+            st.zone_wait_s += t1 - t0
+            try:
+                res = await ctrl.transfer_card(source, cell_id)
+            finally:
+                await self._release_zone(head)
+            st.busy_s += clock() - t1
+            st.transfers += 1
+            self.store.placed(cell_id, card)
+        except BaseException:
+            self.zones.cancel(req)
+            st.failures += 1
+            self.store.release(cell_id, card)
+            if self.feeders is not None:
+                self.feeders.release(source)
+            raise
+        finally:
+            await self._release_head(head)
+        res.update({"head": head, "reason": reason, "card": card.name})
+        return res
+
+    async def serve(self, queue: "asyncio.Queue", to_card=None) -> None:
+        """
+        One worker per head pulling items from queue until a None sentinel arrives.
+        to_card converts queue items (e.g. run-loop metas) to (Card, from_cell or None).
+        """
+        async def worker():
+            while True:
+                item = await queue.get()
+                try:
+                    if item is None:
+                        await queue.put(None)   # let the other workers see it too
+                        return
+                    card, src = to_card(item) if to_card else (item, None)
+                    try:
+                        await self.place(card, src)
+                    except Exception as exc:
+                        LOG.error("placement of %s failed: %s", getattr(card, "name", card), exc)
+                finally:
+                    queue.task_done()
+        await asyncio.gather(*(worker() for _ in self.heads))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "heads": [
+                {
+                    "head": i,
+                    "active": i in self.active,
+                    "transfers": s.transfers,
+                    "failures": s.failures,
+                    "busy_s": round(s.busy_s, 3),
+                    "zone_wait_s": round(s.zone_wait_s, 3),
+                    "parks": s.parks,
+                    "position": self.heads[i].current,
+                }
+                for i, s in enumerate(self.stats_by_head)
+            ],
+            "counts": self.store.counts(),
+        }
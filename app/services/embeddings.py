@@ -1,8 +1,12 @@
-from typing import Any
-import numpy as np
-import torch
-import torchvision.transforms as T
-from PIL import Image
+from typing import Any, List, Sequence
+
+from .lazy import LazyModule
+
+# numpy / torch / torchvision load with the first SimpleEmbedder, not with this module
+np = LazyModule("numpy")
+torch = LazyModule("torch")
+T = LazyModule("torchvision.transforms")
+Image = LazyModule("PIL.Image")
 
 
 class SimpleEmbedder:
@@ -23,7 +27,7 @@ class SimpleEmbedder:
             T.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
         ])
 
-    def _pil_from_input(self, image: Any) -> Image.Image:
+    def _pil_from_input(self, image: Any) -> "Image.Image":
         # Accept either a file path or a numpy array (OpenCV BGR)
         if isinstance(image, str):
             img = Image.open(image).convert('RGB')
@@ -36,8 +40,11 @@ class SimpleEmbedder:
         return Image.fromarray(arr.astype('uint8'))
 
     def embed(self, image: Any):
-        img = self._pil_from_input(image)
-        x = self.transform(img).unsqueeze(0).to(self.device)
+        return self.embed_batch([image])[0]
+
+    def embed_batch(self, images: Sequence[Any]) -> List["np.ndarray"]:
+        """Embed several images in one forward pass; returns one vector per image."""
+        x = torch.stack([self.transform(self._pil_from_input(im)) for im in images]).to(self.device)
         with torch.no_grad():
-            feat = self.model(x).squeeze()
-        return feat.cpu().numpy()
+            feats = self.model(x).flatten(1)
+        return list(feats.cpu().numpy())
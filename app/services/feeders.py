@@ -0,0 +1,168 @@
+"""
+Feeder scheduling for the intake (A-row feeder stacks).
+
+Provides:
+ - FeederScheduler: tracks the remaining stack in each feeder and picks the feeder for the
+   next transfer
+     * only feeders with cards left and not being reloaded are eligible
+     * among those, the one with the cheapest estimated transfer to the predicted destination
+       (services/route_plan cost, from where the head will be after the previous transfer)
+     * ties (e.g. cells without coordinates) rotate: fullest stack first, then least recently used
+ - begin_reload(cell) / end_reload(cell, count): an operator takes one feeder out of rotation,
+   refills it and puts it back; the others keep feeding meanwhile
+ - FeederEmpty: raised when no feeder can supply a card
+
+State lives in the server process next to SystemState; it is not persisted (after a restart
+feeders are assumed full unless end_reload reports otherwise).
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+from . import route_plan
+
+LOG = logging.getLogger("sort.feeders")
+
+
+class FeederEmpty(Exception):
+    pass
+
+
+@dataclass
+class FeederState:
+    cell_id: str
+    capacity: int
+    remaining: int
+    reloading: bool = False
+    picks: int = 0
+    reloads: int = 0
+    last_used: int = -1     # pick sequence number of the last take()
+
+
+class FeederScheduler:
+    def __init__(self, capacities: Dict[str, int], initial: Optional[Dict[str, int]] = None):
+        if not capacities:
+            raise ValueError("FeederScheduler needs at least one feeder")
+        initial = initial or {}
+        self.feeders: Dict[str, FeederState] = {
+            cid: FeederState(cid, int(cap), int(initial.get(cid, cap))) for cid, cap in capacities.items()
+        }
+        self._seq = 0
+        self._last_dest: Optional[str] = None
+
+    @classmethod
+    def from_cfg(cls, cfg: Any, initial: Optional[Dict[str, int]] = None) -> "FeederScheduler":
+        """Feeders are the cells matching feeder.reserve_pattern (assign.Config.feeder_re)."""
+        caps = {cid: c.capacity for cid, c in cfg.cells.items() if cfg.feeder_re and cfg.feeder_re.search(cid)}
+        return cls(caps, initial)
+
+    # ------ queries ------
+    def available(self) -> List[str]:
+        return [f.cell_id for f in self.feeders.values() if f.remaining > 0 and not f.reloading]
+
+    def stock(self) -> Dict[str, int]:
+        """Remaining cards per eligible feeder (reloading feeders count as empty)."""
+        return {f.cell_id: (0 if f.reloading else max(0, f.remaining)) for f in self.feeders.values()}
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "feeders": {
+                f.cell_id: {
+                    "remaining": f.remaining,
+                    "capacity": f.capacity,
+                    "reloading": f.reloading,
+                    "picks": f.picks,
+                    "reloads": f.reloads,
+                }
+                for f in self.feeders.values()
+            },
+            "available": self.available(),
+            "total_remaining": sum(max(0, f.remaining) for f in self.feeders.values()),
+        }
+
+    # ------ choice ------
+    def _start_pos(self, cells: Dict[str, Dict[str, float]], current: Tuple[float, float, float]):
+        # transfers are queued ahead of the gantry: plan from above the last scheduled destination
+        if self._last_dest and self._last_dest in cells:
+            c = cells[self._last_dest]
+            return (c["x"], c["y"], c.get("z", 0.0) + 10.0)
+        return current
+
+    def choose(self,
+               to_cell: str,
+               cells: Optional[Dict[str, Dict[str, float]]] = None,
+               current: Tuple[float, float, float] = (0.0, 0.0, 0.0),
+               speed: float = 200.0,
+               driver: Any = None,
+               plan_ahead: bool = True) -> str:
+        """
+        Pick (but do not take) the feeder for a transfer to to_cell. plan_ahead: cost it from
+        the previously scheduled destination instead of `current` (single head, queued work).
+        """
+        eligible = self.available()
+        if not eligible:
+            raise FeederEmpty("all feeders empty or reloading")
+
+        def rotation(cid: str):
+            f = self.feeders[cid]
+            return (-f.remaining, f.last_used)
+
+        if not cells or driver is None or to_cell not in cells or any(c not in cells for c in eligible):
+            return min(eligible, key=rotation)
+        start = self._start_pos(cells, current) if plan_ahead else current
+        costs = {}
+        for cid in eligible:
+            est, _ = route_plan.estimate_transfer_s(cells, cid, to_cell, start, speed, driver)
+            costs[cid] = round(est, 4)   # treat near-identical costs as ties so rotation applies
+        return min(eligible, key=lambda cid: (costs[cid],) + rotation(cid))
+
+    # ------ bookkeeping ------
+    def take(self, cell_id: str, to_cell: Optional[str] = None) -> None:
+        f = self.feeders.get(cell_id)
+        if f is None:
+            return   # explicit source outside the feeder row
+        f.remaining -= 1
+        f.picks += 1
+        f.last_used = self._seq
+        self._seq += 1
+        if to_cell is not None:
+            self._last_dest = to_cell
+        if f.remaining == 0:
+            LOG.info("Feeder %s is empty", cell_id)
+
+    def release(self, cell_id: str) -> None:
+        """Undo take() after a failed pick (the card is still on the stack)."""
+        f = self.feeders.get(cell_id)
+        if f is not None:
+            f.remaining += 1
+            f.picks -= 1
+
+    def next_source(self, to_cell: str, controller: Any = None) -> str:
+        """choose() + take() using a MotionController's cells, position, speed and driver."""
+        if controller is not None:
+            cid = self.choose(to_cell, controller.cells, controller.current, controller.default_speed, controller.driver)
+        else:
+            cid = self.choose(to_cell)
+        self.take(cid, to_cell)
+        return cid
+
+    # ------ operator reloads ------
+    def begin_reload(self, cell_id: str) -> Dict[str, Any]:
+        f = self._get(cell_id)
+        f.reloading = True
+        LOG.info("Feeder %s out of rotation for reload (%d left on it)", cell_id, f.remaining)
+        return self.status()
+
+    def end_reload(self, cell_id: str, count: Optional[int] = None) -> Dict[str, Any]:
+        """Back in rotation with count cards (default: full)."""
+        f = self._get(cell_id)
+        f.remaining = f.capacity if count is None else max(0, min(int(count), f.capacity))
+        f.reloading = False
+        f.reloads += 1
+        LOG.info("Feeder %s reloaded with %d cards", cell_id, f.remaining)
+        return self.status()
+
+    def _get(self, cell_id: str) -> FeederState:
+        if cell_id not in self.feeders:
+            raise KeyError(f"Unknown feeder {cell_id}")
+        return self.feeders[cell_id]
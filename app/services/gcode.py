@@ -0,0 +1,351 @@
+"""
+G-code streaming driver (GRBL/Marlin style controllers over a serial port).
+
+Provides:
+ - GcodeDriver: MotionDriver that streams G-code with character-counting flow control.
+   Lines are written as long as they fit in the controller's serial RX buffer (rx_buffer
+   bytes, 128 on GRBL); each `ok` frees the oldest line's bytes and completes its future,
+   `error:N` fails it. Primitives return once their line is on the wire, so the controller's
+   planner always has the next blocks queued instead of idling for a round-trip per move.
+ - GcodeError: a line rejected by the controller (or the link failing)
+ - FakeGrblController: pty-based stand-in for tests and bench work without hardware; it
+   enforces the RX buffer limit, buffers motion in a small planner and records what it saw
+
+Ordering/sync: lines go out strictly in order. flush() waits for every outstanding `ok`
+(motion_plan.execute calls it at the end of each plan so errors surface per transfer);
+sync() additionally waits until queued motion has finished (G4 P0). Speeds are mm/s and
+are sent as F in mm/min. Serial setup uses termios, so this is POSIX-only.
+"""
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import re
+import select
+import termios
+import threading
+import time
+import tty
+
+from .motion import MotionDriver
+
+LOG = logging.getLogger("sort.gcode")
+
+GRBL_RX_BUFFER = 128
+
+DEFAULT_COMMANDS: Dict[str, str] = {
+    "vacuum_on": "M8",
+    "vacuum_off": "M9",
+    "plunger_down": "M3 S1000",
+    "plunger_up": "M5",
+}
+
+_BAUDS = {
+    9600: termios.B9600, 19200: termios.B19200, 38400: termios.B38400,
+    57600: termios.B57600, 115200: termios.B115200,
+}
+
+
+class GcodeError(Exception):
+    pass
+
+
+def _open_serial(port: str, baud: int) -> int:
+    fd = os.open(port, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    try:
+        tty.setraw(fd)
+        attrs = termios.tcgetattr(fd)
+        speed = _BAUDS.get(int(baud), termios.B115200)
+        attrs[4] = attrs[5] = speed
+        termios.tcsetattr(fd, termios.TCSANOW, attrs)
+    except termios.error:
+        # not a tty (e.g. a socket or fifo in a test rig): use as-is
+        pass
+    return fd
+
+
+class GcodeDriver(MotionDriver):
+    def __init__(self,
+                 port: str,
+                 baud: int = 115200,
+                 rx_buffer: int = GRBL_RX_BUFFER,
+                 commands: Optional[Dict[str, str]] = None,
+                 ack_timeout_s: float = 30.0):
+        self.port = port
+        self.baud = baud
+        self.rx_buffer = int(rx_buffer)
+        self.commands = dict(DEFAULT_COMMANDS)
+        self.commands.update(commands or {})
+        self.ack_timeout_s = ack_timeout_s
+        self.pos: Tuple[float, float, float] = (0.0, 0.0, 0.0)
+        self.speed = 100.0
+        self._fd: Optional[int] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._rx = b""
+        # lines written but not acknowledged yet: (bytes, future, line)
+        self._in_flight: Deque[Tuple[int, asyncio.Future, str]] = deque()
+        self._in_flight_chars = 0
+        self._unflushed: List[asyncio.Future] = []
+        self._space: Optional[asyncio.Event] = None
+        self._send_lock: Optional[asyncio.Lock] = None
+        self.stats: Dict[str, Any] = {
+            "lines_sent": 0,
+            "acks": 0,
+            "errors": 0,
+            "max_chars_in_flight": 0,
+            "max_lines_in_flight": 0,
+            "buffer_full_waits": 0,
+        }
+
+    # ------ connection ------
+    async def connect(self) -> None:
+        if self._fd is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._space = asyncio.Event()
+        self._send_lock = asyncio.Lock()
+        self._fd = _open_serial(self.port, self.baud)
+        self._loop.add_reader(self._fd, self._on_readable)
+        LOG.info("G-code link open on %s @ %d (rx buffer %d)", self.port, self.baud, self.rx_buffer)
+
+    async def close(self) -> None:
+        if self._fd is None:
+            return
+        self._loop.remove_reader(self._fd)
+        os.close(self._fd)
+        self._fd = None
+        self._fail_all(GcodeError("link closed"))
+
+    def _fail_all(self, exc: Exception) -> None:
+        while self._in_flight:
+            _, fut, _ = self._in_flight.popleft()
+            if not fut.done():
+                fut.set_exception(exc)
+        self._in_flight_chars = 0
+        if self._space is not None:
+            self._space.set()
+
+    # ------ receive ------
+    def _on_readable(self) -> None:
+        try:
+            data = os.read(self._fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError as exc:
+            LOG.error("G-code link read failed: %s", exc)
+            self._fail_all(GcodeError(str(exc)))
+            return
+        self._rx += data
+        while b"\n" in self._rx:
+            raw, self._rx = self._rx.split(b"\n", 1)
+            line = raw.decode("ascii", "replace").strip()
+            if line:
+                self._on_line(line)
+
+    def _on_line(self, line: str) -> None:
+        if line == "ok" or line.startswith("error"):
+            if not self._in_flight:
+                LOG.warning("Unexpected %r from controller (nothing in flight)", line)
+                return
+            n, fut, sent = self._in_flight.popleft()
+            self._in_flight_chars -= n
+            self._space.set()
+            if fut.done():
+                return
+            if line == "ok":
+                self.stats["acks"] += 1
+                fut.set_result(None)
+            else:
+                self.stats["errors"] += 1
+                fut.set_exception(GcodeError(f"{sent!r} rejected: {line}"))
+        else:
+            # status reports, [MSG:...], alarms, startup banner
+            LOG.info("controller: %s", line)
+            if line.startswith("ALARM"):
+                self._fail_all(GcodeError(line))
+
+    # ------ send ------
+    async def _write(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            try:
+                n = os.write(self._fd, view)
+                view = view[n:]
+            except BlockingIOError:
+                await asyncio.sleep(0.001)
+
+    async def send(self, line: str) -> asyncio.Future:
+        """
+        Queue one line; returns once it has been written (there was room in the controller's
+        RX buffer). The returned future completes on its `ok`.
+        """
+        if self._fd is None:
+            await self.connect()
+        data = (line.strip() + "\n").encode("ascii")
+        if len(data) > self.rx_buffer:
+            raise GcodeError(f"line longer than controller buffer ({len(data)} > {self.rx_buffer}): {line!r}")
+        async with self._send_lock:
+            if self._in_flight_chars + len(data) > self.rx_buffer:
+                self.stats["buffer_full_waits"] += 1
+            while self._in_flight_chars + len(data) > self.rx_buffer:
+                self._space.clear()
+                await asyncio.wait_for(self._space.wait(), self.ack_timeout_s)
+            fut = self._loop.create_future()
+            self._in_flight.append((len(data), fut, line))
+            self._in_flight_chars += len(data)
+            self._unflushed.append(fut)
+            s = self.stats
+            s["lines_sent"] += 1
+            s["max_chars_in_flight"] = max(s["max_chars_in_flight"], self._in_flight_chars)
+            s["max_lines_in_flight"] = max(s["max_lines_in_flight"], len(self._in_flight))
+            await self._write(data)
+        return fut
+
+    async def command(self, line: str) -> None:
+        """Send one line and wait for its acknowledgement."""
+        fut = await self.send(line)
+        await asyncio.wait_for(fut, self.ack_timeout_s)
+
+    async def flush(self) -> None:
+        """Wait for every line sent so far to be acknowledged; raise the first error."""
+        pending, self._unflushed = self._unflushed, []
+        if not pending:
+            return
+        results = await asyncio.wait_for(asyncio.gather(*pending, return_exceptions=True), self.ack_timeout_s)
+        for r in results:
+            if isinstance(r, Exception):
+                raise r
+
+    async def sync(self) -> None:
+        """Wait until all queued motion has finished (G4 P0 is acknowledged after the planner drains)."""
+        await self.send("G4 P0")
+        await self.flush()
+
+    # ------ MotionDriver ------
+    async def move_absolute(self, x: float, y: float, z: float, speed: float) -> None:
+        await self.send(f"G90 G1 X{x:.3f} Y{y:.3f} Z{z:.3f} F{max(1.0, speed) * 60.0:.0f}")
+        self.pos = (x, y, z)
+
+    async def set_speed(self, speed: float) -> None:
+        # feed rate travels with every G1
+        self.speed = speed
+
+    async def dwell(self, seconds: float) -> None:
+        # executed by the controller in sequence with the motion around it
+        await self.send(f"G4 P{max(0.0, seconds):.3f}")
+
+    async def vacuum_on(self) -> None:
+        await self.send(self.commands["vacuum_on"])
+
+    async def vacuum_off(self) -> None:
+        await self.send(self.commands["vacuum_off"])
+
+    async def plunger_down(self) -> None:
+        await self.send(self.commands["plunger_down"])
+
+    async def plunger_up(self) -> None:
+        await self.send(self.commands["plunger_up"])
+
+    async def stop(self) -> None:
+        # realtime feed hold + soft reset: bypass the line buffer
+        if self._fd is None:
+            return
+        await self._write(b"!\x18")
+        self._fail_all(GcodeError("stopped"))
+        self._unflushed = []
+
+    async def home_all(self) -> None:
+        await self.command("$H")
+        self.pos = (0.0, 0.0, 0.0)
+
+
+# ------ pty stand-in for a GRBL controller ------
+_G_WORD = re.compile(r"([A-Z])(-?\d+(?:\.\d*)?)")
+
+
+class FakeGrblController:
+    """
+    Speaks enough GRBL for GcodeDriver over a pty. Motion lines go into a planner of
+    planner_blocks entries, each taking block_s to "execute"; a line is only acknowledged
+    once it is in the planner, so a full planner stalls acks exactly like the real thing.
+    Records received lines, peak RX buffer use (overflow = protocol violation) and planner depth.
+    """
+    def __init__(self, rx_buffer: int = GRBL_RX_BUFFER, planner_blocks: int = 15,
+                 block_s: float = 0.002, reject: Tuple[str, ...] = ()):
+        self.rx_buffer = rx_buffer
+        self.planner_blocks = planner_blocks
+        self.block_s = block_s
+        self.reject = reject            # line prefixes answered with error:20
+        self.lines: List[str] = []
+        self.max_rx_used = 0
+        self.max_planner_depth = 0
+        self.overflow = False
+        self.realtime: List[bytes] = []
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="fake-grbl", daemon=True)
+
+    def start(self) -> "FakeGrblController":
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join(2.0)
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _reply(self, text: str) -> None:
+        os.write(self._master, (text + "\r\n").encode("ascii"))
+
+    def _run(self) -> None:
+        rx = b""
+        planner: Deque[float] = deque()     # finish time of each queued block
+        waiting_sync: Optional[str] = None  # G4 P0 / $H acked once the planner drains
+        while not self._stop.is_set():
+            now = time.monotonic()
+            while planner and planner[0] <= now:
+                planner.popleft()
+            if waiting_sync is not None and not planner:
+                self._reply("ok")
+                waiting_sync = None
+            r, _, _ = select.select([self._master], [], [], 0.001)
+            if r:
+                try:
+                    data = os.read(self._master, 4096)
+                except OSError:
+                    return
+                for ch in (b"!", b"?", b"~", b"\x18"):
+                    if ch in data:
+                        self.realtime.append(ch)
+                        data = data.replace(ch, b"")
+                rx += data
+                self.max_rx_used = max(self.max_rx_used, len(rx))
+                if len(rx) > self.rx_buffer:
+                    self.overflow = True
+            # move complete lines from RX into the planner while there is room
+            while waiting_sync is None and b"\n" in rx and len(planner) < self.planner_blocks:
+                raw, rx = rx.split(b"\n", 1)
+                line = raw.decode("ascii", "replace").strip()
+                self.lines.append(line)
+                if any(line.startswith(p) for p in self.reject):
+                    self._reply("error:20")
+                elif line == "$H" or line == "G4 P0":
+                    waiting_sync = line
+                else:
+                    start = planner[-1] if planner else time.monotonic()
+                    planner.append(start + self.block_s)
+                    self.max_planner_depth = max(self.max_planner_depth, len(planner))
+                    self._reply("ok")
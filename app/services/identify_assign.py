@@ -1,26 +1,29 @@
 import os
 from typing import Optional, List, Dict, Any
-from . import card_id, assign
+from . import card_id, assign, rules
 
 def identify_and_assign(ocr_map: Dict[str, str],
                         db_path: Optional[str],
                         cards_list: Optional[List[Dict[str,Any]]],
                         cfg: assign.Config,
-                        state: assign.SystemState
+                        state: assign.SystemState,
+                        game: str = 'mtg',
+                        embeddings_dir: Optional[str] = None
                         ) -> Dict[str, Any]:
     """
     Take OCR region->text, identify the card against a local DB (or list),
     then wrap that result into an assign.Card and call assign.assign_card.
 
     Returns a dict with the assigned cell, reason, constructed card and
-    the identification debug info.
+    the identification debug info. embeddings_dir defaults to data/embeddings; pass the
+    game's catalog directory (catalogs.GameCatalog.embeddings_dir) for other games.
     """
     # prefer using precomputed embeddings when available
     id_res = card_id.identify_card_from_ocr(
         ocr_map,
         db_path=db_path,
         cards_list=cards_list,
-        embeddings_dir=os.path.join("data", "embeddings"),
+        embeddings_dir=embeddings_dir or os.path.join("data", "embeddings"),
     )
 
     # identification confidence -> 0.0..1.0
@@ -34,11 +37,12 @@ def identify_and_assign(ocr_map: Dict[str, str],
     collector = (best.get('collector_number') or best.get('collector') or ocr_map.get('collector') or None)
 
     card = assign.Card(
-        game = 'mtg',                # change per-game when needed
+        game = game,
         name = name,
         set_code = set_code,
         collector_number = collector,
-        confidence = float(id_conf)
+        confidence = float(id_conf),
+        **rules.card_attrs(best)      # rarity / colors / mana value / price for rule sorting
     )
 
     cell, reason = assign.assign_card(card, cfg, state)
@@ -0,0 +1,288 @@
+"""
+Physical inventory index: which pile every sorted card is in, and how deep.
+
+Provides:
+ - Placement: one card in (or on its way to) a pile
+ - InventoryIndex: per-cell stacks (bottom -> top) plus a name index
+     * reserve(cell, card) when a card is assigned (pending: counted, not yet on the pile)
+     * place(cell, card) when its transfer completes: the card goes on top of the pile, so
+       stack order follows transfer completion, not assignment (route windows reorder)
+     * cancel(cell, card) when the transfer fails; clear / set_count mirror count overrides
+     * locate(name, set_code, collector_number) -> cell, position (0 = bottom), depth
+       (cards on top of it)
+     * replay(records): rebuild from the placement ledger (services/state_journal.py)
+ - plan_dig(index, wants): the dig sequence that pulls a decklist with the fewest cards
+   lifted off piles
+ - parse_decklist(text): "4 Lightning Bolt" / "1 Opt (ELD) 59" lines -> wants
+
+The index is kept by the CellStore next to the counts (assign/release/placed), so anything
+that places through the store keeps it current. Cards taken off piles by hand are not seen;
+an operator set/reset of a cell's count truncates or clears its stack.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import itertools
+import re
+
+
+def _key(name: Optional[str]) -> str:
+    return (name or "").strip().casefold()
+
+
+@dataclass(eq=False)
+class Placement:
+    id: int
+    cell: str
+    name: Optional[str]                 # None: count set by hand, card unknown
+    set_code: Optional[str] = None
+    collector_number: Optional[str] = None
+    placed: bool = False
+
+    def matches(self, name: str, set_code: Optional[str] = None, collector_number: Optional[str] = None) -> bool:
+        if self.name is None or _key(self.name) != _key(name):
+            return False
+        if set_code and _key(self.set_code) != _key(set_code):
+            return False
+        if collector_number and str(self.collector_number or "") != str(collector_number):
+            return False
+        return True
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "set_code": self.set_code,
+            "collector_number": self.collector_number,
+            "cell": self.cell,
+        }
+
+
+def _card_fields(card: Any) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    if card is None:
+        return None, None, None
+    if isinstance(card, str):
+        return card, None, None
+    if isinstance(card, dict):
+        return card.get("name"), card.get("set_code"), card.get("collector_number")
+    return card.name, getattr(card, "set_code", None), getattr(card, "collector_number", None)
+
+
+class InventoryIndex:
+    """Not thread-safe on its own; CellStore calls it under its lock."""
+    def __init__(self):
+        self.piles: Dict[str, List[Placement]] = {}       # placed cards, bottom -> top
+        self.pending: Dict[str, List[Placement]] = {}     # assigned, transfer not finished
+        self._by_name: Dict[str, List[Placement]] = {}
+        self._ids = itertools.count(1)
+
+    # ------ updates ------
+    def reserve(self, cell: str, card: Any) -> Placement:
+        name, set_code, number = _card_fields(card)
+        p = Placement(next(self._ids), cell, name, set_code, number)
+        self.pending.setdefault(cell, []).append(p)
+        if name is not None:
+            self._by_name.setdefault(_key(name), []).append(p)
+        return p
+
+    def _take_pending(self, cell: str, card: Any, newest: bool) -> Optional[Placement]:
+        name = _card_fields(card)[0]
+        queue = self.pending.get(cell, [])
+        order = range(len(queue) - 1, -1, -1) if newest else range(len(queue))
+        for i in order:
+            if name is None or queue[i].matches(name):
+                return queue.pop(i)
+        return None
+
+    def place(self, cell: str, card: Any) -> Placement:
+        """The transfer for a reserved card finished: it is now the top of the pile."""
+        p = self._take_pending(cell, card, newest=False)
+        if p is None:
+            p = self.reserve(cell, card)      # placed without a reservation (e.g. replay gap)
+            self.pending[cell].remove(p)
+        p.placed = True
+        self.piles.setdefault(cell, []).append(p)
+        return p
+
+    def add_unknown(self, cell: str, n: int = 1) -> None:
+        """Cards put on a pile by hand (count added without a card)."""
+        pile = self.piles.setdefault(cell, [])
+        for _ in range(n):
+            pile.append(Placement(next(self._ids), cell, None, placed=True))
+
+    def cancel(self, cell: str, card: Any = None) -> Optional[Placement]:
+        """Drop a reservation whose transfer failed (the newest matching one)."""
+        p = self._take_pending(cell, card, newest=True)
+        if p is not None:
+            self._forget(p)
+        return p
+
+    def clear(self, cell: Optional[str] = None) -> None:
+        cells = [cell] if cell is not None else list(set(self.piles) | set(self.pending))
+        for c in cells:
+            for p in self.piles.pop(c, []) + self.pending.pop(c, []):
+                self._forget(p)
+
+    def set_count(self, cell: str, count: int) -> None:
+        """Count overridden by hand: keep the bottom of the pile, pad with unknown cards."""
+        for p in self.pending.pop(cell, []):
+            self._forget(p)
+        pile = self.piles.setdefault(cell, [])
+        while len(pile) > count:
+            self._forget(pile.pop())
+        self.add_unknown(cell, count - len(pile))
+
+    def _forget(self, p: Placement) -> None:
+        if p.name is not None:
+            same = self._by_name.get(_key(p.name), [])
+            if p in same:
+                same.remove(p)
+            if not same:
+                self._by_name.pop(_key(p.name), None)
+
+    def replay(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Apply ledger records (state_journal format) in order; returns records applied."""
+        n = 0
+        for rec in records:
+            op, cell = rec.get("op"), rec.get("cell")
+            card = {"name": rec.get("card"), "set_code": rec.get("set"), "collector_number": rec.get("number")}
+            if op == "add" and rec.get("card"):
+                self.reserve(cell, card)
+            elif op == "add":
+                self.add_unknown(cell, int(rec.get("n", 1)))
+            elif op == "release":
+                self.cancel(cell, rec.get("card"))
+            elif op == "placed":
+                self.place(cell, card)
+            elif op == "set":
+                self.set_count(cell, int(rec["n"]))
+            elif op == "reset":
+                self.clear()
+            else:
+                continue
+            n += 1
+        return n
+
+    # ------ queries ------
+    def locate(self, name: str, set_code: Optional[str] = None,
+               collector_number: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Every copy on a pile (shallowest first), then copies still in transit."""
+        out = []
+        for p in self._by_name.get(_key(name), []):
+            if not p.matches(name, set_code, collector_number):
+                continue
+            d = p.as_dict()
+            if p.placed:
+                pile = self.piles[p.cell]
+                pos = pile.index(p)
+                d.update({"status": "placed", "position": pos, "depth": len(pile) - 1 - pos})
+            else:
+                d.update({"status": "pending", "position": None, "depth": None})
+            out.append(d)
+        out.sort(key=lambda d: (d["depth"] is None, d["depth"] or 0, d["cell"]))
+        return out
+
+    def pile(self, cell: str) -> List[Dict[str, Any]]:
+        """Cards in one pile, top first."""
+        return [p.as_dict() for p in reversed(self.piles.get(cell, []))]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "placed": sum(len(v) for v in self.piles.values()),
+            "pending": sum(len(v) for v in self.pending.values()),
+            "unknown": sum(1 for v in self.piles.values() for p in v if p.name is None),
+            "distinct_names": len(self._by_name),
+        }
+
+
+# ---------- Retrieval planning ----------
+@dataclass
+class Want:
+    name: str
+    qty: int = 1
+    set_code: Optional[str] = None
+    collector_number: Optional[str] = None
+
+    def matches(self, p: Placement) -> bool:
+        return p.matches(self.name, self.set_code, self.collector_number)
+
+
+_DECK_LINE = re.compile(r"^\s*(?:(\d+)\s*x?\s+)?(.+?)(?:\s+\(([A-Za-z0-9]+)\)(?:\s+(\S+))?)?\s*$")
+
+
+def parse_decklist(text: str) -> List[Want]:
+    """One card per line: "[qty[x]] name [(SET) [number]]". Blank lines, // and # comments and
+    section headers ("Sideboard", "Deck") are skipped."""
+    wants: List[Want] = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith(("#", "//")) or line.rstrip(":").lower() in ("deck", "sideboard", "commander"):
+            continue
+        m = _DECK_LINE.match(line)
+        if not m:
+            continue
+        wants.append(Want(name=m.group(2), qty=int(m.group(1) or 1), set_code=m.group(3), collector_number=m.group(4)))
+    return wants
+
+
+def plan_dig(index: InventoryIndex, wants: List[Want]) -> Dict[str, Any]:
+    """
+    Choose which copies to pull and how far to dig into each pile so the fewest unwanted
+    cards are lifted. Digging a pile to depth d lifts its top d+1 cards; every wanted card in
+    that range comes out for free. Greedy: repeatedly take the pile extension with the fewest
+    unwanted cards lifted per wanted card gained (exact when every wanted card has one copy).
+
+    Returns per-pile digs (top first: pull or set aside, then restack the set-aside cards in
+    reverse so the pile keeps its order), missing wants and totals.
+    """
+    need = [w.qty for w in wants]
+    dug = {cell: 0 for cell in index.piles}               # cards already lifted per pile
+    chosen: Dict[str, Dict[int, int]] = {cell: {} for cell in index.piles}   # depth -> want idx
+
+    def walk(cell: str):
+        """Yield (depth, gained) for each depth below the dug part where a wanted card sits."""
+        pile = index.piles[cell]
+        left = list(need)
+        gained: Dict[int, int] = {}
+        for depth in range(dug[cell], len(pile)):
+            p = pile[len(pile) - 1 - depth]
+            for i, w in enumerate(wants):
+                if left[i] > 0 and w.matches(p):
+                    left[i] -= 1
+                    gained[depth] = i
+                    yield depth, dict(gained)
+                    break
+
+    while any(need):
+        best = None
+        for cell in index.piles:
+            for depth, gained in walk(cell):
+                lifted = depth + 1 - dug[cell] - len(gained)
+                score = (lifted / len(gained), lifted, cell, depth)
+                if best is None or score < best[0]:
+                    best = (score, cell, depth, gained)
+        if best is None:
+            break
+        _, cell, depth, gained = best
+        for i in gained.values():
+            need[i] -= 1
+        chosen[cell].update(gained)
+        dug[cell] = depth + 1
+
+    digs = []
+    for cell in sorted(c for c in dug if dug[c]):
+        pile = index.piles[cell]
+        steps = []
+        for depth in range(dug[cell]):
+            p = pile[len(pile) - 1 - depth]
+            steps.append(dict(p.as_dict(), depth=depth,
+                              action="pull" if depth in chosen[cell] else "set_aside"))
+        aside = sum(1 for s in steps if s["action"] == "set_aside")
+        digs.append({"cell": cell, "lift": dug[cell], "set_aside": aside, "steps": steps})
+    missing = [{"name": w.name, "set_code": w.set_code, "collector_number": w.collector_number, "qty": n}
+               for w, n in zip(wants, need) if n > 0]
+    return {
+        "digs": digs,
+        "missing": missing,
+        "pulled": sum(len(chosen[c]) for c in chosen),
+        "lifted": sum(dug.values()),
+        "set_aside": sum(d["set_aside"] for d in digs),
+    }
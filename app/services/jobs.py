@@ -0,0 +1,348 @@
+"""
+Background job queue for large identification batches.
+
+Provides:
+ - JobManager: submit a directory or archive (.zip/.tar/.tar.gz) of card scans, get a job id,
+   poll status, read/stream results and cancel
+ - bounded queue of pending jobs (JobQueueFull when full), a fixed number of job runners,
+   and a bounded window of in-flight images per job so memory stays flat for huge intakes
+ - on-disk layout (one directory per job under root, default data/jobs/<id>/):
+     job.json        status + counters (rewritten atomically)
+     results.ndjson  one JSON line per finished image (append-only, flushed per line)
+ - resume(): jobs left queued/running by a restart are re-queued and skip the files already
+   recorded (by filename) in results.ndjson
+
+Listing a source, scanning results, reading image bytes, appending results and saving job.json
+are blocking file / archive I/O; while a job runs they happen on a thread (asyncio.to_thread)
+so a large intake never stalls the event loop.
+
+The per-image work is delegated: analyze(raw, db_path) -> analysis (services/workers.run_analysis)
+and finish(file_result, analysis, state) -> file_result (main.py's per-image assignment), so
+jobs produce exactly the same records as /demo/batch_identify.
+"""
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import os
+import tarfile
+import time
+import uuid
+import zipfile
+
+LOG = logging.getLogger("sort.jobs")
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+TERMINAL = ("done", "cancelled", "failed")
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobNotFound(KeyError):
+    pass
+
+
+# ------ image sources ------
+
+def _list_images(source: str) -> List[str]:
+    """Return image member names (archive) or relative paths (directory), sorted."""
+    if os.path.isdir(source):
+        out = []
+        for dirpath, _, files in os.walk(source):
+            for f in files:
+                if f.lower().endswith(IMAGE_EXTS):
+                    out.append(os.path.relpath(os.path.join(dirpath, f), source))
+        return sorted(out)
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as zf:
+            return sorted(n for n in zf.namelist() if n.lower().endswith(IMAGE_EXTS))
+    if tarfile.is_tarfile(source):
+        with tarfile.open(source) as tf:
+            return sorted(m.name for m in tf.getmembers() if m.isfile() and m.name.lower().endswith(IMAGE_EXTS))
+    raise ValueError(f"Unsupported job source (expected a directory, .zip or .tar): {source}")
+
+
+def _iter_image_bytes(source: str, names: List[str]) -> Iterator[Tuple[str, bytes]]:
+    """Yield (name, raw bytes) one image at a time."""
+    if os.path.isdir(source):
+        for n in names:
+            with open(os.path.join(source, n), "rb") as fh:
+                yield n, fh.read()
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as zf:
+            for n in names:
+                yield n, zf.read(n)
+    else:
+        with tarfile.open(source) as tf:
+            for n in names:
+                fh = tf.extractfile(n)
+                yield n, (fh.read() if fh else b"")
+
+
+def _drop_torn_tail(path: str) -> None:
+    """Truncate a half-written last line (crash mid-write) so appends start on a fresh line."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as fh:
+        data = fh.read()
+        if data and not data.endswith(b"\n"):
+            fh.truncate(data.rfind(b"\n") + 1)
+
+
+# ------ manager ------
+
+class JobManager:
+    def __init__(self,
+                 analyze: Callable[[bytes, Optional[str]], Awaitable[Dict[str, Any]]],
+                 finish: Callable[[Dict[str, Any], Dict[str, Any], Any], Dict[str, Any]],
+                 new_state: Callable[[], Any],
+                 root: str = os.path.join("data", "jobs"),
+                 max_queued: int = 16,
+                 runners: int = 1,
+                 in_flight: int = 8):
+        self.analyze = analyze
+        self.finish = finish
+        self.new_state = new_state
+        self.root = root
+        self.max_queued = max_queued
+        self.runners = runners
+        self.in_flight = in_flight
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        os.makedirs(self.root, exist_ok=True)
+
+    # ------ persistence ------
+    def _dir(self, job_id: str) -> str:
+        return os.path.join(self.root, job_id)
+
+    def _save(self, job: Dict[str, Any]) -> None:
+        job["updated"] = time.time()
+        self._write_job(dict(job))
+
+    async def _save_async(self, job: Dict[str, Any]) -> None:
+        # a snapshot: the loop keeps updating the job's counters while the thread writes
+        job["updated"] = time.time()
+        await asyncio.to_thread(self._write_job, dict(job))
+
+    def _write_job(self, job: Dict[str, Any]) -> None:
+        path = os.path.join(self._dir(job["id"]), "job.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf8") as fh:
+            json.dump(job, fh)
+        os.replace(tmp, path)
+
+    def _scan_results(self, job_id: str) -> Tuple[set, Dict[str, int]]:
+        """Filenames already written to results.ndjson plus the counters they imply."""
+        path = os.path.join(self._dir(job_id), "results.ndjson")
+        done = set()
+        counts = {"done": 0, "errors": 0, "name_matches": 0, "cell_matches": 0}
+        if not os.path.exists(path):
+            return done, counts
+        with open(path, "r", encoding="utf8") as fh:
+            for line in fh:
+                try:
+                    rec = json.loads(line)
+                    done.add(rec["filename"])
+                except Exception:
+                    # a torn last line from a crash: that image is simply redone
+                    continue
+                counts["done"] += 1
+                counts["errors"] += 1 if "error" in rec else 0
+                counts["name_matches"] += 1 if rec.get("match_name") else 0
+                counts["cell_matches"] += 1 if rec.get("match_cell") else 0
+        return done, counts
+
+    # ------ lifecycle ------
+    async def start(self) -> None:
+        """Start job runners and re-queue jobs interrupted by a restart."""
+        self._queue = asyncio.Queue()
+        resumed = self.resume()
+        self._tasks = [asyncio.create_task(self._runner(i)) for i in range(self.runners)]
+        if resumed:
+            LOG.info("Resumed %d job(s): %s", len(resumed), ", ".join(resumed))
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def resume(self) -> List[str]:
+        resumed = []
+        for job_id in sorted(os.listdir(self.root)):
+            path = os.path.join(self._dir(job_id), "job.json")
+            if not os.path.exists(path):
+                continue
+            try:
+                with open(path, "r", encoding="utf8") as fh:
+                    job = json.load(fh)
+            except Exception:
+                continue
+            self._jobs[job_id] = job
+            if job.get("status") in ("queued", "running"):
+                job["status"] = "queued"
+                job["resumed"] = job.get("resumed", 0) + 1
+                self._save(job)
+                self._queue.put_nowait(job_id)
+                resumed.append(job_id)
+        return resumed
+
+    # ------ API ------
+    def pending(self) -> int:
+        return sum(1 for j in self._jobs.values() if j.get("status") == "queued")
+
+    async def submit(self, source: str, db_path: Optional[str] = None) -> Dict[str, Any]:
+        if self._queue is None:
+            raise RuntimeError("JobManager not started")
+        source = os.path.abspath(os.path.expanduser(source))
+        if not os.path.exists(source):
+            raise FileNotFoundError(source)
+        if self.pending() >= self.max_queued:
+            raise JobQueueFull(f"{self.max_queued} jobs already queued")
+        names = await asyncio.to_thread(_list_images, source)
+        job_id = uuid.uuid4().hex[:12]
+        os.makedirs(self._dir(job_id), exist_ok=True)
+        job = {
+            "id": job_id,
+            "source": source,
+            "db_path": db_path,
+            "status": "queued",
+            "created": time.time(),
+            "total": len(names),
+            "done": 0,
+            "errors": 0,
+            "name_matches": 0,
+            "cell_matches": 0,
+        }
+        self._jobs[job_id] = job
+        self._save(job)
+        self._queue.put_nowait(job_id)
+        LOG.info("Queued job %s (%d images from %s)", job_id, len(names), source)
+        return dict(job)
+
+    def get(self, job_id: str) -> Dict[str, Any]:
+        if job_id not in self._jobs:
+            raise JobNotFound(job_id)
+        return dict(self._jobs[job_id])
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [dict(j) for j in sorted(self._jobs.values(), key=lambda j: j.get("created", 0))]
+
+    def cancel(self, job_id: str) -> Dict[str, Any]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise JobNotFound(job_id)
+        if job["status"] not in TERMINAL:
+            job["status"] = "cancelled"
+            self._save(job)
+        return dict(job)
+
+    async def iter_results(self, job_id: str, offset: int = 0, follow: bool = False, poll_s: float = 0.5):
+        """Yield NDJSON lines from results.ndjson starting at line offset; optionally tail until the job ends."""
+        if job_id not in self._jobs:
+            raise JobNotFound(job_id)
+        path = os.path.join(self._dir(job_id), "results.ndjson")
+        line_no = 0
+        pos = 0
+        while True:
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf8") as fh:
+                    fh.seek(pos)
+                    while True:
+                        line = fh.readline()
+                        if not line or not line.endswith("\n"):
+                            break  # partial line still being written
+                        pos = fh.tell()
+                        if line_no >= offset:
+                            yield line
+                        line_no += 1
+            if not follow or self._jobs[job_id]["status"] in TERMINAL:
+                # one last read above already picked up anything flushed before the status change
+                return
+            await asyncio.sleep(poll_s)
+
+    # ------ execution ------
+    async def _runner(self, n: int) -> None:
+        while True:
+            job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != "queued":
+                continue
+            try:
+                await self._run_job(job)
+            except asyncio.CancelledError:
+                # server shutdown: leave the job 'running' so resume() picks it up
+                raise
+            except Exception as exc:
+                LOG.exception("Job %s failed", job_id)
+                job["status"] = "failed"
+                job["error"] = str(exc)
+                await self._save_async(job)
+
+    async def _run_job(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        job["status"] = "running"
+        job.setdefault("started", time.time())
+        await self._save_async(job)
+
+        out_path = os.path.join(self._dir(job_id), "results.ndjson")
+        names = await asyncio.to_thread(_list_images, job["source"])
+        job["total"] = len(names)           # re-listed on resume: the source may have changed
+        await asyncio.to_thread(_drop_torn_tail, out_path)
+        skip, counts = await asyncio.to_thread(self._scan_results, job_id)
+        job.update(counts)
+        state = self.new_state()
+        sem = asyncio.Semaphore(self.in_flight)
+        # one line at a time (on a thread): lines never interleave and the loop never blocks
+        write_lock = asyncio.Lock()
+
+        def append(out, line: str) -> None:
+            out.write(line)
+            out.flush()
+
+        with open(out_path, "a", encoding="utf8") as out:
+            async def one(idx: int, name: str, raw: bytes) -> None:
+                file_result: Dict[str, Any] = {"index": idx, "filename": name}
+                try:
+                    analysis = await self.analyze(raw, job.get("db_path"))
+                    self.finish(file_result, analysis, state)
+                except Exception as exc:
+                    file_result["error"] = str(exc)
+                finally:
+                    sem.release()
+                if job["status"] == "cancelled":
+                    return
+                async with write_lock:
+                    await asyncio.to_thread(append, out, json.dumps(file_result, default=str) + "\n")
+                job["done"] += 1
+                job["errors"] += 1 if "error" in file_result else 0
+                job["name_matches"] += 1 if file_result.get("match_name") else 0
+                job["cell_matches"] += 1 if file_result.get("match_cell") else 0
+                if job["done"] % 25 == 0:
+                    await self._save_async(job)
+
+            pending: List[asyncio.Task] = []
+            # resume by filename: the listing order may differ after files are added or removed
+            todo = [(i, n) for i, n in enumerate(names, start=1) if n not in skip]
+            images = _iter_image_bytes(job["source"], [n for _, n in todo])
+            for idx, _ in todo:
+                await sem.acquire()
+                # checked after the wait: a cancel usually lands while the window is full
+                item = None if job["status"] == "cancelled" else await asyncio.to_thread(next, images, None)
+                if item is None:
+                    sem.release()
+                    break
+                name, raw = item
+                pending.append(asyncio.create_task(one(idx, name, raw)))
+                pending = [t for t in pending if not t.done()]
+            images.close()
+            await asyncio.gather(*pending)
+
+        if job["status"] != "cancelled":
+            job["status"] = "done"
+        job["finished"] = time.time()
+        await self._save_async(job)
+        LOG.info("Job %s %s: %d/%d images", job_id, job["status"], job["done"], job["total"])
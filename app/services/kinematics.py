@@ -0,0 +1,254 @@
+"""
+Kinematic gantry simulator.
+
+Provides:
+ - AxisLimits + trapezoid_s(dist, vmax, accel): move time for one axis with a trapezoidal
+   (or triangular, for short moves) velocity profile
+ - VirtualClock: simulated time; sleeping advances the clock instead of waiting
+ - KinematicDriver: MotionDriver whose moves take the time the per-axis profiles say, with
+   configurable actuator latencies, per-axis busy time and optional virtual time (or a
+   scaled real clock, for several heads running concurrently)
+ - grid_layout(cell_ids, pitch_x, pitch_y): x/y positions for cells named like "B3"
+   (letter = column, number = row), used when the config has no coordinates
+ - cell_layout(raw_cfg, cell_ids): grid_layout at the config's simulator.pitch_mm, with any
+   x/y given in the config's cells: entries taking precedence
+
+Units: mm, mm/s, mm/s^2. The `speed` passed to move_absolute is the requested path feed
+rate; each axis is further capped by its own vmax/accel, and all axes finish together.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional, Tuple
+import asyncio
+import logging
+import math
+import re
+import time
+
+from .motion import MotionDriver
+
+LOG = logging.getLogger("sort.kinematics")
+
+AXES = ("x", "y", "z")
+
+
+@dataclass
+class AxisLimits:
+    vmax: float     # mm/s
+    accel: float    # mm/s^2 (deceleration is symmetric)
+
+
+DEFAULT_AXES: Dict[str, AxisLimits] = {
+    "x": AxisLimits(vmax=500.0, accel=3000.0),
+    "y": AxisLimits(vmax=500.0, accel=3000.0),
+    "z": AxisLimits(vmax=150.0, accel=1500.0),
+}
+
+DEFAULT_ACTUATORS: Dict[str, float] = {
+    "vacuum_on": 0.05,
+    "vacuum_off": 0.02,
+    "plunger_down": 0.07,
+    "plunger_up": 0.07,
+}
+
+HOME_S = 0.5
+
+
+def trapezoid_s(dist: float, vmax: float, accel: float) -> float:
+    """Time to travel |dist| from rest to rest with the given velocity cap and acceleration."""
+    d = abs(dist)
+    if d <= 0.0:
+        return 0.0
+    if vmax <= 0.0 or accel <= 0.0:
+        raise ValueError("vmax and accel must be positive")
+    d_ramp = vmax * vmax / accel          # accelerate to vmax and back down
+    if d >= d_ramp:
+        return d / vmax + vmax / accel
+    return 2.0 * math.sqrt(d / accel)     # triangular profile, never reaches vmax
+
+
+class VirtualClock:
+    """Simulated time source: sleep() advances the clock and only yields to the event loop."""
+    def __init__(self, start: float = 0.0):
+        self.t = float(start)
+
+    def __call__(self) -> float:
+        return self.t
+
+    async def sleep(self, seconds: float) -> None:
+        self.t += max(0.0, float(seconds))
+        await asyncio.sleep(0)
+
+
+class KinematicDriver(MotionDriver):
+    def __init__(self,
+                 axes: Optional[Dict[str, AxisLimits]] = None,
+                 actuators: Optional[Dict[str, float]] = None,
+                 virtual_time: bool = True,
+                 time_scale: float = 1.0):
+        self.axes = dict(DEFAULT_AXES)
+        self.axes.update(axes or {})
+        self.actuator_s = dict(DEFAULT_ACTUATORS)
+        self.actuator_s.update(actuators or {})
+        self.virtual = VirtualClock() if virtual_time else None
+        # real-time mode only: sleep seconds * time_scale and report time / time_scale, so
+        # concurrent heads (coordinator) can be simulated faster than real time
+        self.time_scale = float(time_scale)
+        self._due = 0.0
+        self.pos: Tuple[float, float, float] = (0.0, 0.0, 0.0)
+        self.speed = 100.0
+        self.vacuum = False
+        self.plunger = "up"
+        self.reset_stats()
+
+    @classmethod
+    def from_cfg(cls, cfg: Optional[Dict[str, Any]], virtual_time: bool = True,
+                 time_scale: float = 1.0) -> "KinematicDriver":
+        """cfg: the `simulator:` config section ({axes: {x: {vmax, accel}, ...}, actuators: {...}})."""
+        cfg = cfg or {}
+        axes = {
+            a: AxisLimits(vmax=float(v.get("vmax", DEFAULT_AXES[a].vmax)),
+                          accel=float(v.get("accel", DEFAULT_AXES[a].accel)))
+            for a, v in (cfg.get("axes") or {}).items() if a in AXES
+        }
+        actuators = {k: float(v) for k, v in (cfg.get("actuators") or {}).items()}
+        return cls(axes=axes, actuators=actuators, virtual_time=virtual_time, time_scale=time_scale)
+
+    # ------ time ------
+    def clock(self) -> float:
+        return self.virtual() if self.virtual is not None else time.perf_counter() / self.time_scale
+
+    async def dwell(self, seconds: float) -> None:
+        if self.virtual is not None:
+            await self.virtual.sleep(seconds)
+        else:
+            # sleep to a running deadline, so one late wake-up is made up by the next dwell
+            # instead of adding up over a transfer's many short steps (matters at small time_scale)
+            now = time.perf_counter()
+            self._due = max(self._due, now) + seconds * self.time_scale
+            await asyncio.sleep(self._due - now)
+
+    # ------ kinematics ------
+    def _axis_times(self, start, end, speed: float) -> Dict[str, float]:
+        deltas = {a: e - s for a, s, e in zip(AXES, start, end)}
+        length = math.sqrt(sum(d * d for d in deltas.values()))
+        out = {}
+        for a, d in deltas.items():
+            if abs(d) <= 0.0:
+                continue
+            lim = self.axes[a]
+            # the path feed rate projected on this axis, capped by the axis itself
+            vmax = min(lim.vmax, max(1.0, speed) * abs(d) / length)
+            out[a] = trapezoid_s(d, vmax, lim.accel)
+        return out
+
+    def estimate_move_s(self, start, end, speed) -> float:
+        return max(self._axis_times(start, end, speed).values(), default=0.0)
+
+    # ------ stats ------
+    def reset_stats(self) -> None:
+        self.stats: Dict[str, Any] = {
+            "moves": 0,
+            "move_s": 0.0,
+            "axis_busy_s": {a: 0.0 for a in AXES},
+            "axis_limiting": {a: 0 for a in AXES},   # moves whose duration this axis decided
+            "axis_travel_mm": {a: 0.0 for a in AXES},
+            "actuations": {k: 0 for k in self.actuator_s},
+            "actuator_s": 0.0,
+            "dwell_s": 0.0,
+        }
+        self._t0 = self.clock()
+
+    def utilization(self) -> Dict[str, Any]:
+        """Fraction of elapsed (virtual or real) time each axis spent moving."""
+        wall = self.clock() - self._t0
+        return {
+            "elapsed_s": wall,
+            "axes": {a: (self.stats["axis_busy_s"][a] / wall if wall > 0 else 0.0) for a in AXES},
+        }
+
+    # ------ MotionDriver ------
+    async def move_absolute(self, x: float, y: float, z: float, speed: float) -> None:
+        target = (float(x), float(y), float(z))
+        times = self._axis_times(self.pos, target, speed)
+        duration = max(times.values(), default=0.0)
+        s = self.stats
+        s["moves"] += 1
+        s["move_s"] += duration
+        for a, t in times.items():
+            s["axis_busy_s"][a] += t
+        if times:
+            s["axis_limiting"][max(times, key=times.get)] += 1
+        for a, p0, p1 in zip(AXES, self.pos, target):
+            s["axis_travel_mm"][a] += abs(p1 - p0)
+        LOG.debug("Kinematic move -> (%.2f,%.2f,%.2f) feed=%.1f (t=%.3fs)", x, y, z, speed, duration)
+        await self.dwell(duration)
+        self.pos = target
+
+    async def set_speed(self, speed: float) -> None:
+        self.speed = speed
+
+    async def _actuate(self, op: str) -> None:
+        self.stats["actuations"][op] = self.stats["actuations"].get(op, 0) + 1
+        latency = self.actuator_s.get(op, 0.0)
+        self.stats["actuator_s"] += latency
+        await self.dwell(latency)
+
+    async def vacuum_on(self) -> None:
+        self.vacuum = True
+        await self._actuate("vacuum_on")
+
+    async def vacuum_off(self) -> None:
+        self.vacuum = False
+        await self._actuate("vacuum_off")
+
+    async def plunger_down(self) -> None:
+        self.plunger = "down"
+        await self._actuate("plunger_down")
+
+    async def plunger_up(self) -> None:
+        self.plunger = "up"
+        await self._actuate("plunger_up")
+
+    async def stop(self) -> None:
+        pass
+
+    async def home_all(self) -> None:
+        await self.dwell(HOME_S)
+        self.pos = (0.0, 0.0, 0.0)
+
+
+# ------ layout ------
+_GRID_ID = re.compile(r"^([A-Z])(\d+)$")
+
+
+def grid_layout(cell_ids: Iterable[str], pitch_x: float = 90.0, pitch_y: float = 70.0) -> Dict[str, Dict[str, float]]:
+    """
+    Positions for grid-named cells ("B3" -> column B, row 3). Other ids (e.g. ERR1) are
+    lined up in an extra column after the last lettered one.
+    """
+    ids = list(cell_ids)
+    out: Dict[str, Dict[str, float]] = {}
+    others = []
+    last_col = 0
+    for cid in ids:
+        m = _GRID_ID.match(str(cid).upper())
+        if not m:
+            others.append(cid)
+            continue
+        col = ord(m.group(1)) - ord("A")
+        row = int(m.group(2)) - 1
+        last_col = max(last_col, col)
+        out[cid] = {"x": col * pitch_x, "y": row * pitch_y, "z": 0.0}
+    for i, cid in enumerate(others):
+        out[cid] = {"x": (last_col + 1) * pitch_x, "y": i * pitch_y, "z": 0.0}
+    return out
+
+
+def cell_layout(raw_cfg: Dict[str, Any], cell_ids: Iterable[str]) -> Dict[str, Dict[str, float]]:
+    """Cell positions from config.yaml: explicit cells: x/y, else the generated grid."""
+    pitch = (raw_cfg.get("simulator") or {}).get("pitch_mm") or {}
+    layout = grid_layout(cell_ids, float(pitch.get("x", 90.0)), float(pitch.get("y", 70.0)))
+    for c in raw_cfg.get("cells") or []:
+        if c.get("id") in layout and "x" in c and "y" in c:
+            layout[c["id"]] = {"x": float(c["x"]), "y": float(c["y"]), "z": float(c.get("z", 0.0))}
+    return layout
@@ -0,0 +1,60 @@
+"""
+Deferred imports for heavy backends (cv2, pytesseract, PIL, scikit-learn, torch, numpy).
+
+Provides:
+ - LazyModule(name): module stand-in that imports `name` on first attribute access; assign it
+   at module level where the real import used to be (cv2 = LazyModule("cv2")) and the code
+   using cv2.xxx stays as it was
+ - available(name): whether a module could be imported, without importing it
+ - loaded(name): whether it has been imported yet (for tests / the import-time budget)
+
+Importing main, the CLIs or a service module then costs what the module itself needs; the
+backend is paid for by the first request that uses it (or up front by prefork.preload).
+A missing backend raises its ImportError at that first use instead of at import time.
+"""
+from typing import Any
+import importlib
+import importlib.util
+import sys
+import threading
+
+_LOCK = threading.Lock()
+
+
+class LazyModule:
+    def __init__(self, name: str):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def _load(self) -> Any:
+        mod = self.__dict__["_module"]
+        if mod is None:
+            with _LOCK:
+                mod = self.__dict__["_module"]
+                if mod is None:
+                    mod = importlib.import_module(self.__dict__["_name"])
+                    self.__dict__["_module"] = mod
+        return mod
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr: str, value: Any) -> None:
+        setattr(self._load(), attr, value)       # e.g. pytesseract.pytesseract.tesseract_cmd = ...
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.__dict__["_module"] is not None else "not loaded"
+        return f"<lazy module '{self.__dict__['_name']}' ({state})>"
+
+
+def available(name: str) -> bool:
+    if name in sys.modules:
+        return True
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def loaded(name: str) -> bool:
+    return name in sys.modules
@@ -9,13 +9,17 @@ Provides:
  - Async API so existing FastAPI endpoints can call these functions easily
 
 Note: replace SimulatedDriver with a real hardware driver implementing the same
-methods (move_absolute, set_speed, vacuum_on/off, plunger_up/down, stop).
+methods (move_absolute, set_speed, vacuum_on/off, plunger_up/down, stop), e.g. the
+G-code streaming driver in services/gcode.py.
 """
 from typing import Dict, Any, Optional, Tuple
 import asyncio
+import os
 import time
 import logging
 
+from . import motion_plan
+
 LOG = logging.getLogger("sort.motion")
 logging.basicConfig(level=logging.INFO)
 
@@ -38,18 +42,37 @@ class MotionDriver:
     async def home_all(self) -> None:
         raise NotImplementedError()
 
+    # kinematics model used by planners to cost a plan without running it
+    actuator_s: Dict[str, float] = {}
+
+    def estimate_move_s(self, start: Tuple[float, float, float], end: Tuple[float, float, float], speed: float) -> float:
+        dist = sum((a - b) ** 2 for a, b in zip(start, end)) ** 0.5
+        return dist / max(1.0, speed)
+
+    # time source for plan timings; simulators may run on virtual time
+    def clock(self) -> float:
+        return time.perf_counter()
+
+    async def dwell(self, seconds: float) -> None:
+        await asyncio.sleep(seconds)
+
 # Simple simulated driver for local testing
 class SimulatedDriver(MotionDriver):
+    actuator_s = {"vacuum_on": 0.05, "vacuum_off": 0.02, "plunger_down": 0.07, "plunger_up": 0.07}
+
     def __init__(self):
         self.pos = (0.0, 0.0, 0.0)
         self.speed = 100.0
         self.vacuum = False
         self.plunger = "up"
 
-    async def _fake_move(self, x, y, z, speed):
-        dist = ((self.pos[0]-x)**2 + (self.pos[1]-y)**2 + (self.pos[2]-z)**2) ** 0.5
+    def estimate_move_s(self, start, end, speed) -> float:
+        dist = ((start[0]-end[0])**2 + (start[1]-end[1])**2 + (start[2]-end[2])**2) ** 0.5
         # simple time model: dist / (speed/100) seconds (speed is arbitrary)
-        duration = max(0.02, dist / max(1.0, speed/100.0))
+        return max(0.02, dist / max(1.0, speed/100.0))
+
+    async def _fake_move(self, x, y, z, speed):
+        duration = self.estimate_move_s(self.pos, (x, y, z), speed)
         LOG.info("Simulated move -> (%.2f,%.2f,%.2f) speed=%.1f (t=%.2fs)", x, y, z, speed, duration)
         await asyncio.sleep(duration)
         self.pos = (x, y, z)
@@ -64,22 +87,22 @@ class SimulatedDriver(MotionDriver):
     async def vacuum_on(self) -> None:
         LOG.info("Simulated vacuum ON")
         self.vacuum = True
-        await asyncio.sleep(0.05)
+        await asyncio.sleep(self.actuator_s["vacuum_on"])
 
     async def vacuum_off(self) -> None:
         LOG.info("Simulated vacuum OFF")
         self.vacuum = False
-        await asyncio.sleep(0.02)
+        await asyncio.sleep(self.actuator_s["vacuum_off"])
 
     async def plunger_down(self) -> None:
         LOG.info("Simulated plunger DOWN")
         self.plunger = "down"
-        await asyncio.sleep(0.07)
+        await asyncio.sleep(self.actuator_s["plunger_down"])
 
     async def plunger_up(self) -> None:
         LOG.info("Simulated plunger UP")
         self.plunger = "up"
-        await asyncio.sleep(0.07)
+        await asyncio.sleep(self.actuator_s["plunger_up"])
 
     async def stop(self) -> None:
         LOG.info("Simulated stop")
@@ -114,11 +137,14 @@ class MotionController:
 
     async def home_all(self) -> None:
         async with self.lock:
-            await self.driver.home_all()
-            self.homed = True
-            # trust driver to zero position; update current pos
-            self.current = (0.0, 0.0, 0.0)
-            LOG.info("Homed and set current position to %s", self.current)
+            await self._home_all_unlocked()
+
+    async def _home_all_unlocked(self) -> None:
+        await self.driver.home_all()
+        self.homed = True
+        # trust driver to zero position; update current pos
+        self.current = (0.0, 0.0, 0.0)
+        LOG.info("Homed and set current position to %s", self.current)
 
     async def move_to_cell(self, cell_id: str, speed: Optional[float] = None) -> None:
         """
@@ -166,7 +192,8 @@ class MotionController:
         If no points provided, will iterate configured cells but only a small sample to speed up.
         """
         async with self.lock:
-            await self.home_all()
+            # self.lock is not reentrant: use the unlocked variant while holding it
+            await self._home_all_unlocked()
             observed = {}
             sample_keys = list(points.keys()) if points else list(self.cells.keys())[:12]
             for k in sample_keys:
@@ -181,6 +208,13 @@ class MotionController:
                 LOG.info("Calib visit %s -> observed %s", k, observed[k])
             return {"observed": observed, "sampled": len(observed)}
 
+    async def _run_plan(self, plan) -> Dict[str, Any]:
+        """Execute a primitive plan; caller must hold self.lock."""
+        plan = motion_plan.optimize(plan, self.current)
+        res = await motion_plan.execute(self.driver, plan)
+        self.current = motion_plan.end_position(plan, self.current)
+        return res
+
     async def pick_card_from_cell(self, cell_id: str, pick_z_offset: float = -5.0) -> None:
         """
         Pick (vacuum + plunger sequence) from a given cell. Sequence:
@@ -191,18 +225,7 @@ class MotionController:
         if cell_id not in self.cells:
             raise KeyError(f"Unknown cell {cell_id}")
         async with self.lock:
-            pos = self.cells[cell_id]
-            # move to safe above position (use z + 10 mm)
-            safe_z = pos.get('z', 0.0) + 10.0
-            await self.driver.move_absolute(pos['x'], pos['y'], safe_z, self.default_speed)
-            # plunge
-            await self.driver.plunger_down()
-            # move to pick height
-            pick_z = pos.get('z', 0.0) + pick_z_offset
-            await self.driver.move_absolute(pos['x'], pos['y'], pick_z, self.default_speed/2)
-            await self.driver.vacuum_on()
-            await asyncio.sleep(0.06)
-            await self.driver.plunger_up()
+            await self._run_plan(motion_plan.compile_pick(self.cells, cell_id, self.default_speed, pick_z_offset))
             LOG.info("Picked card from %s", cell_id)
 
     async def place_card_to_cell(self, cell_id: str, place_z_offset: float = -5.0) -> None:
@@ -213,43 +236,51 @@ class MotionController:
         if cell_id not in self.cells:
             raise KeyError(f"Unknown cell %s" % cell_id)
         async with self.lock:
-            pos = self.cells[cell_id]
-            safe_z = pos.get('z', 0.0) + 10.0
-            await self.driver.move_absolute(pos['x'], pos['y'], safe_z, self.default_speed)
-            await self.driver.move_absolute(pos['x'], pos['y'], pos.get('z', 0.0) + place_z_offset, self.default_speed/2)
-            # release
-            await self.driver.vacuum_off()
-            await asyncio.sleep(0.03)
-            await self.driver.move_absolute(pos['x'], pos['y'], safe_z, self.default_speed/2)
+            await self._run_plan(motion_plan.compile_place(self.cells, cell_id, self.default_speed, place_z_offset))
             LOG.info("Placed card to %s", cell_id)
 
     async def transfer_card(self, from_cell: str, to_cell: str) -> Dict[str, Any]:
         """
         Complete pick-and-place operation from from_cell -> to_cell.
-        Returns dict with timings and final current position.
+        The pick, travel and place sequences are compiled into one primitive plan,
+        redundant moves are removed (motion_plan.optimize) and the plan runs under a
+        single lock acquisition.
+        Returns dict with timings (total, per phase, per primitive) and final current position.
         """
         if from_cell not in self.cells or to_cell not in self.cells:
             raise KeyError("Unknown source or target cell")
         async with self.lock:
-            start = time.time()
-            await self.pick_card_from_cell(from_cell)
-            # small travel move to target safe height
-            tpos = self.cells[to_cell]
-            safe_z = tpos.get('z', 0.0) + 10.0
-            await self.driver.move_absolute(tpos['x'], tpos['y'], safe_z, self.default_speed)
-            await asyncio.sleep(0.02)
-            await self.place_card_to_cell(to_cell)
-            end = time.time()
+            start = self.driver.clock()
+            raw_plan = motion_plan.compile_transfer(self.cells, from_cell, to_cell, self.default_speed)
+            res = await self._run_plan(raw_plan)
+            end = self.driver.clock()
             LOG.info("Transfer %s -> %s took %.3fs", from_cell, to_cell, end - start)
-            return {"from": from_cell, "to": to_cell, "duration_s": end - start, "current_pos": self.current}
+            return {
+                "from": from_cell,
+                "to": to_cell,
+                "duration_s": end - start,
+                "current_pos": self.current,
+                "phases": res["phases"],
+                "primitives": res["primitives"],
+                "primitives_removed": len(raw_plan) - len(res["primitives"]),
+            }
 
 # convenience singleton used by endpoints
 _controller: Optional[MotionController] = None
 
 def get_controller() -> MotionController:
+    """
+    Shared controller. SORTME_GCODE_PORT (+ optional SORTME_GCODE_BAUD) selects the
+    streaming G-code driver (services/gcode.py); otherwise the SimulatedDriver is used.
+    """
     global _controller
     if _controller is None:
-        _controller = MotionController()
+        driver = None
+        port = os.environ.get("SORTME_GCODE_PORT")
+        if port:
+            from .gcode import GcodeDriver
+            driver = GcodeDriver(port, baud=int(os.environ.get("SORTME_GCODE_BAUD", "115200")))
+        _controller = MotionController(driver=driver)
     return _controller
 
 # helper to wire cells from config YAML/dict
@@ -0,0 +1,166 @@
+"""
+Motion plans: compile pick/place/transfer operations into primitive sequences.
+
+Provides:
+ - Primitive: one driver call (move / vacuum / plunger / dwell) tagged with its phase
+ - compile_pick / compile_place / compile_transfer: primitive sequences equivalent to the
+   MotionController pick/place routines
+ - optimize(plan, start): drop moves to where the head already is, merge collinear
+   consecutive moves and adjacent dwells
+ - execute(driver, plan): run a plan (caller holds the controller lock) and return
+   per-primitive timings plus per-phase totals (for streaming drivers such as
+   services/gcode.py these are queueing times; motion continues after the call returns)
+
+Plans are plain lists so they can be inspected, costed (see route planning) or replayed on a
+different driver.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import time
+
+Pos = Tuple[float, float, float]
+
+SAFE_DZ = 10.0          # safe travel height above a cell
+VACUUM_SETTLE_S = 0.06  # let suction build before lifting
+TRAVEL_SETTLE_S = 0.02  # damp oscillation after the long travel move
+RELEASE_SETTLE_S = 0.03 # let the card drop before retracting
+_EPS = 1e-6
+
+
+@dataclass
+class Primitive:
+    op: str                          # move | vacuum_on | vacuum_off | plunger_down | plunger_up | dwell
+    phase: str                       # pick | travel | place
+    target: Optional[Pos] = None     # move only
+    speed: float = 0.0               # move only
+    seconds: float = 0.0             # dwell only
+    merged: int = field(default=1)   # how many source primitives this one stands for
+
+
+def _cell_pos(cells: Dict[str, Dict[str, float]], cell_id: str) -> Pos:
+    if cell_id not in cells:
+        raise KeyError(f"Unknown cell {cell_id}")
+    p = cells[cell_id]
+    return (p['x'], p['y'], p.get('z', 0.0))
+
+
+def compile_pick(cells: Dict[str, Dict[str, float]], cell_id: str, speed: float,
+                 pick_z_offset: float = -5.0) -> List[Primitive]:
+    x, y, z = _cell_pos(cells, cell_id)
+    return [
+        Primitive("move", "pick", (x, y, z + SAFE_DZ), speed),
+        Primitive("plunger_down", "pick"),
+        Primitive("move", "pick", (x, y, z + pick_z_offset), speed / 2),
+        Primitive("vacuum_on", "pick"),
+        Primitive("dwell", "pick", seconds=VACUUM_SETTLE_S),
+        Primitive("plunger_up", "pick"),
+    ]
+
+
+def compile_place(cells: Dict[str, Dict[str, float]], cell_id: str, speed: float,
+                  place_z_offset: float = -5.0) -> List[Primitive]:
+    x, y, z = _cell_pos(cells, cell_id)
+    return [
+        Primitive("move", "place", (x, y, z + SAFE_DZ), speed),
+        Primitive("move", "place", (x, y, z + place_z_offset), speed / 2),
+        Primitive("vacuum_off", "place"),
+        Primitive("dwell", "place", seconds=RELEASE_SETTLE_S),
+        Primitive("move", "place", (x, y, z + SAFE_DZ), speed / 2),
+    ]
+
+
+def compile_transfer(cells: Dict[str, Dict[str, float]], from_cell: str, to_cell: str,
+                     speed: float) -> List[Primitive]:
+    tx, ty, tz = _cell_pos(cells, to_cell)
+    travel = [
+        Primitive("move", "travel", (tx, ty, tz + SAFE_DZ), speed),
+        Primitive("dwell", "travel", seconds=TRAVEL_SETTLE_S),
+    ]
+    return compile_pick(cells, from_cell, speed) + travel + compile_place(cells, to_cell, speed)
+
+
+# ------ optimization ------
+
+def _same(a: Pos, b: Pos) -> bool:
+    return all(abs(p - q) <= _EPS for p, q in zip(a, b))
+
+
+def _collinear_between(a: Pos, b: Pos, c: Pos) -> bool:
+    """True if b lies on segment a->c, so a->b->c can be flown as a->c."""
+    ab = [q - p for p, q in zip(a, b)]
+    ac = [q - p for p, q in zip(a, c)]
+    cross = (ab[1] * ac[2] - ab[2] * ac[1], ab[2] * ac[0] - ab[0] * ac[2], ab[0] * ac[1] - ab[1] * ac[0])
+    if any(abs(v) > 1e-6 for v in cross):
+        return False
+    dot = sum(p * q for p, q in zip(ab, ac))
+    return -_EPS <= dot <= sum(v * v for v in ac) + _EPS
+
+
+def optimize(plan: List[Primitive], start: Pos) -> List[Primitive]:
+    """
+    Remove redundant primitives without changing the path the head takes:
+      - moves to the position the head is already at
+      - a move whose end point lies on the straight line of the next same-speed move (merged)
+      - back-to-back dwells (summed)
+    """
+    out: List[Primitive] = []
+    pos = start
+    prev_pos = start   # position before the last emitted move
+    for p in plan:
+        if p.op == "move":
+            if _same(p.target, pos):
+                continue
+            last = out[-1] if out else None
+            if (last is not None and last.op == "move" and abs(last.speed - p.speed) <= _EPS
+                    and _collinear_between(prev_pos, pos, p.target)):
+                out[-1] = Primitive("move", last.phase, p.target, p.speed, merged=last.merged + p.merged)
+            else:
+                prev_pos = pos
+                out.append(Primitive("move", p.phase, p.target, p.speed, merged=p.merged))
+            pos = p.target
+        elif p.op == "dwell" and out and out[-1].op == "dwell":
+            last = out[-1]
+            out[-1] = Primitive("dwell", last.phase, seconds=last.seconds + p.seconds, merged=last.merged + p.merged)
+        else:
+            out.append(p)
+    return out
+
+
+def end_position(plan: List[Primitive], start: Pos) -> Pos:
+    pos = start
+    for p in plan:
+        if p.op == "move":
+            pos = p.target
+    return pos
+
+
+# ------ execution ------
+
+async def execute(driver: Any, plan: List[Primitive]) -> Dict[str, Any]:
+    """
+    Run plan on driver. The caller is responsible for holding the controller lock.
+    Returns {'primitives': [...], 'phases': {phase: seconds}, 'duration_s': total}.
+    """
+    # drivers may run on virtual time (kinematic simulator); fall back to the wall clock
+    now = getattr(driver, "clock", time.perf_counter)
+    dwell = getattr(driver, "dwell", asyncio.sleep)
+    timings = []
+    phases: Dict[str, float] = {}
+    t_start = now()
+    for p in plan:
+        t0 = now()
+        if p.op == "move":
+            await driver.move_absolute(*p.target, p.speed)
+        elif p.op == "dwell":
+            await dwell(p.seconds)
+        else:
+            await getattr(driver, p.op)()
+        dt = now() - t0
+        phases[p.phase] = phases.get(p.phase, 0.0) + dt
+        timings.append({"op": p.op, "phase": p.phase, "target": p.target, "duration_s": dt})
+    # streaming drivers return once a line is queued; wait for the acks so errors surface here
+    flush = getattr(driver, "flush", None)
+    if flush is not None:
+        await flush()
+    return {"primitives": timings, "phases": phases, "duration_s": now() - t_start}
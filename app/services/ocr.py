@@ -4,20 +4,41 @@ Robust OCR helper for card images.
 Provides process_card_image(path_or_array, game='mtg') which returns a dict with
 rotation metadata and per-region OCR text and confidences. Adapted from
 the working simple-text-ocr implementation.
+
+profile= picks one of OCR_PROFILES: 'default' is what every card gets; 'thorough' upscales
+more, boosts contrast harder and tries two extra page-segmentation modes (roughly twice the
+tesseract time), for re-scanning low-confidence cards. rotation= turns the image first
+(cards fed sideways / upside down). vocab_path= is the card metadata the post-correction
+vocabulary comes from (the game catalog's; default data/embeddings/cards_metadata.json).
 """
 
 from typing import Dict, Any, Optional, Callable, Tuple
-import cv2
-import numpy as np
-from PIL import Image
-import pytesseract
-from pytesseract import Output
 import difflib
 import json
 import os
 
+try:
+    from . import card_catalog
+    from .lazy import LazyModule
+except ImportError:             # run as a script: python app/services/ocr.py
+    import card_catalog
+    from lazy import LazyModule
+
+# imported on first OCR call (see lazy.py): importing this module stays cheap
+np = LazyModule("numpy")
+cv2 = LazyModule("cv2")
+pytesseract = LazyModule("pytesseract")
+Image = LazyModule("PIL.Image")
+
 # Simplified OCR: only perform a whole-image OCR and return a single 'full' region.
 
+OCR_PROFILES: Dict[str, Dict[str, Any]] = {
+    'default': {'psms': (6, 11), 'scale': 3, 'clip_limit': 3.0, 'inset': 0.02},
+    'thorough': {'psms': (6, 11, 4, 3), 'scale': 4, 'clip_limit': 4.0, 'inset': 0.04},
+}
+
+_ROTATIONS = {90: "ROTATE_90_CLOCKWISE", 180: "ROTATE_180", 270: "ROTATE_90_COUNTERCLOCKWISE"}
+
 
 def load_image(path_or_array):
     if isinstance(path_or_array, str):
@@ -29,7 +50,7 @@ def load_image(path_or_array):
     return img
 
 
-def preprocess_for_ocr(img_gray: np.ndarray) -> np.ndarray:
+def preprocess_for_ocr(img_gray: "np.ndarray", scale: int = 3, clip_limit: float = 3.0) -> "np.ndarray":
     # Improved preprocessing pipeline to boost OCR quality:
     # - apply CLAHE for contrast
     # - bilateral filter to reduce noise while keeping edges
@@ -37,12 +58,11 @@ def preprocess_for_ocr(img_gray: np.ndarray) -> np.ndarray:
     # - median blur + adaptive threshold
     h, w = img_gray.shape[:2]
     # apply CLAHE (contrast limited adaptive histogram equalization)
-    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+    clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=(8, 8))
     img_clahe = clahe.apply(img_gray)
     # bilateral filter preserves edges
     img_bilat = cv2.bilateralFilter(img_clahe, d=9, sigmaColor=75, sigmaSpace=75)
     # upscale more aggressively to help small text
-    scale = 3
     img_up = cv2.resize(img_bilat, (w * scale, h * scale), interpolation=cv2.INTER_CUBIC)
     # median blur to remove salt-and-pepper
     img_med = cv2.medianBlur(img_up, 3)
@@ -55,12 +75,12 @@ def preprocess_for_ocr(img_gray: np.ndarray) -> np.ndarray:
     return img_open
 
 
-def ocr_image_full(img_bgr, lang='eng', psm=6) -> Tuple[str, float, dict]:
+def ocr_image_full(img_bgr, lang='eng', psm=6, scale=3, clip_limit=3.0) -> Tuple[str, float, dict]:
     gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
-    prep = preprocess_for_ocr(gray)
+    prep = preprocess_for_ocr(gray, scale=scale, clip_limit=clip_limit)
     pil = Image.fromarray(prep)
     config = f'--psm {psm} --oem 3'
-    data = pytesseract.image_to_data(pil, lang=lang, config=config, output_type=Output.DICT)
+    data = pytesseract.image_to_data(pil, lang=lang, config=config, output_type=pytesseract.Output.DICT)
 
     # join all non-empty words as a single text blob
     words = [t.strip() for t in data.get('text', []) if t and t.strip()]
@@ -90,49 +110,35 @@ def _keep_english_letters(text: str) -> str:
     return cleaned
 
 
-_CORRECTION_WORDS = None
+DEFAULT_VOCAB_PATH = os.path.join("data", "embeddings", "cards_metadata.json")
+# used when there is no card metadata to build the vocabulary from
+_FALLBACK_WORDS = sorted({
+    'the', 'and', 'of', 'to', 'a', 'in', 'for', 'you', 'your', 'when', 'target', 'creature', 'owner',
+    'hand', 'draw', 'life', 'gain', 'card', 'battlefield', 'enters', 'exile'
+})
 
 
-def _load_correction_words() -> list:
-    """Load a list of candidate words from the cards metadata to use for lightweight OCR correction.
+def _load_correction_words(path: Optional[str] = None) -> list:
+    """Candidate words for lightweight OCR correction: the shared card catalog's vocabulary.
 
-    Returns a sorted list of unique lower-case words (alphabetic only). Caches the result.
+    Sorted unique lower-case name words from the metadata file (one per game catalog;
+    DEFAULT_VOCAB_PATH when not given), parsed once per process by card_catalog.
     """
-    global _CORRECTION_WORDS
-    if _CORRECTION_WORDS is not None:
-        return _CORRECTION_WORDS
-    path = os.path.join("data", "embeddings", "cards_metadata.json")
-    words = set()
     try:
-        if os.path.exists(path):
-            with open(path, 'r', encoding='utf8') as fh:
-                meta = json.load(fh)
-            for card in meta:
-                name = card.get('name') or card.get('title') or ''
-                for tok in name.split():
-                    tok2 = ''.join([c for c in tok if c.isalpha()])
-                    if len(tok2) >= 2:
-                        words.add(tok2.lower())
+        words = card_catalog.get_catalog(path or DEFAULT_VOCAB_PATH).vocabulary
     except Exception:
-        pass
-    # fallback: small common words to avoid empty
-    if not words:
-        words = {w for w in [
-            'the', 'and', 'of', 'to', 'a', 'in', 'for', 'you', 'your', 'when', 'target', 'creature', 'owner',
-            'hand', 'draw', 'life', 'gain', 'card', 'battlefield', 'enters', 'exile'
-        ]}
-    _CORRECTION_WORDS = sorted(words)
-    return _CORRECTION_WORDS
-
-
-def _post_correct_text(text: str) -> str:
+        words = []
+    return words or _FALLBACK_WORDS
+
+
+def _post_correct_text(text: str, vocab_path: Optional[str] = None) -> str:
     """Simple word-level correction: for words not in dict, find a close match from card words.
 
     Only attempts correction for words length >= 4 to avoid over-correcting small words.
     """
     if not text:
         return text
-    dict_words = _load_correction_words()
+    dict_words = _load_correction_words(vocab_path)
     if not dict_words:
         return text
     dict_set = set(dict_words)
@@ -160,30 +166,38 @@ def _post_correct_text(text: str) -> str:
 def process_card_image(path_or_array,
                        game: str = 'mtg',
                        lang: str = 'eng',
-                       identifier_callback: Optional[Callable[[Dict[str, str]], Any]] = None
+                       identifier_callback: Optional[Callable[[Dict[str, str]], Any]] = None,
+                       profile: str = 'default',
+                       rotation: int = 0,
+                       vocab_path: Optional[str] = None
                        ) -> Dict[str, Any]:
+    if profile not in OCR_PROFILES:
+        raise ValueError(f"unknown OCR profile '{profile}' (one of {sorted(OCR_PROFILES)})")
+    opts = OCR_PROFILES[profile]
     img = load_image(path_or_array)
+    if rotation % 360:
+        img = cv2.rotate(img, getattr(cv2, _ROTATIONS[rotation % 360]))
     # use the full (inset slightly) image for OCR to avoid border artifacts
     h, w = img.shape[:2]
-    inset = 0.02
+    inset = opts['inset']
     x0, y0 = int(w * inset), int(h * inset)
     x1, y1 = int(w * (1 - inset)), int(h * (1 - inset))
     crop = img[y0:y1, x0:x1]
 
-    # Try two different psm modes and pick the one with higher average confidence
-    text1, conf1, data1 = ocr_image_full(crop, lang=lang, psm=6)
-    text2, conf2, data2 = ocr_image_full(crop, lang=lang, psm=11)
-    if conf2 > conf1:
-        text, conf, data = text2, conf2, data2
-    else:
-        text, conf, data = text1, conf1, data1
+    # Try the profile's psm modes and pick the one with the highest average confidence
+    text, conf, data = '', -1.0, {}
+    for psm in opts['psms']:
+        t, c, d = ocr_image_full(crop, lang=lang, psm=psm, scale=opts['scale'], clip_limit=opts['clip_limit'])
+        if c > conf:
+            text, conf, data = t, c, d
     # filter to only English letters for downstream processing
     text_filtered = _keep_english_letters(text)
     # apply lightweight post-correction based on card-word dictionary
-    text_corrected = _post_correct_text(text_filtered)
+    text_corrected = _post_correct_text(text_filtered, vocab_path)
 
     results = {
-        'rotation_detected': 0,
+        'rotation_detected': rotation % 360,
+        'profile': profile,
         'rotation_confidence': 0.0,
         'regions': {
             'full': {
@@ -0,0 +1,202 @@
+"""
+Preload-then-fork serving: large read-only state loaded once, shared copy-on-write by workers.
+
+Provides:
+ - preload(raw_cfg): load what every worker would otherwise load for itself -- heavy imports
+   (cv2 / tesseract bindings), the default game's embedding index (memory-mapped, see
+   card_id.EMB_MMAP) and card catalogs with their name index and vocabulary, the card DB --
+   then gc.freeze() so the collector never writes to those objects in a child (which would
+   un-share their pages). The query encoder is not preloaded: torch's thread pools and
+   allocator state do not survive a fork, so each worker loads it on its first query
+ - run_workers(n, serve_one, sock): fork n workers after preload; each runs serve_one(index,
+   sock) on the inherited listening socket; the parent restarts workers that die and
+   forwards SIGTERM / SIGINT
+ - process_memory(pid) / worker_memory(): RSS split into unique (private pages: what one
+   more worker costs) and shared (pages still shared with the parent / siblings / page cache),
+   plus PSS, from /proc/<pid>/smaps_rollup
+ - prefork_parent(): the parent pid when running under run_workers (SORTME_PREFORK_PARENT)
+ - worker_index() / is_primary_worker(): this worker's index (SORTME_WORKER_INDEX, set by
+   serve.py); worker 0 -- or a process not started by serve.py -- owns the single-writer
+   state: the state journal and the background job table
+
+Numpy arrays keep their data outside Python object headers, so they stay shared even as
+workers touch the objects around them; memory-mapped embeddings are shared through the page
+cache even between processes that did not fork from a common parent. Python dicts / strings
+(catalog rows) stay shared only as long as nothing writes to them -- refcount changes do, so
+expect some of the catalog to turn private over time; gc.freeze() at least keeps the
+collector itself from doing it.
+"""
+from typing import Any, Callable, Dict, List, Optional
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+
+LOG = logging.getLogger("sort.prefork")
+
+_SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty", "Swap")
+
+
+# ---------- Preload ----------
+def preload(raw_cfg: Dict[str, Any], card_db: Optional[str] = None) -> Dict[str, Any]:
+    """Load the shared read-only state in this (parent) process; returns what was loaded."""
+    from . import card_catalog, card_id, ocr
+    from .catalogs import get_registry
+    t0 = time.perf_counter()
+    loaded: Dict[str, Any] = {}
+    # the OCR backends are imported on first use (lazy.py); pay for them once, here
+    for mod in (ocr.cv2, ocr.pytesseract, ocr.Image, card_id._neighbors):
+        try:
+            mod._load()
+        except ImportError as exc:
+            LOG.warning("preload: %s", exc)
+    registry = get_registry(raw_cfg)
+    cat = registry.get(None)
+    loaded["game"] = cat.game
+    for path in cat._files():
+        c = card_catalog.loaded(path)
+        if c is not None:
+            c.vocabulary
+            c.names                                     # name index
+            loaded.setdefault("card_catalogs", []).append(path)
+    if card_db and os.path.exists(card_db):
+        c = card_catalog.get_catalog(card_db)
+        c.names
+        loaded.setdefault("card_catalogs", []).append(card_db)
+    if card_id.load_embedding_index(cat.embeddings_dir) is not None:
+        loaded["embeddings"] = cat.embeddings_dir
+    gc.collect()
+    gc.freeze()
+    loaded["seconds"] = round(time.perf_counter() - t0, 2)
+    LOG.info("Preloaded shared state in %.2fs: %s", loaded["seconds"], loaded)
+    return loaded
+
+
+# ---------- Fork / supervise ----------
+def prefork_parent() -> Optional[int]:
+    v = os.environ.get("SORTME_PREFORK_PARENT")
+    return int(v) if v else None
+
+
+def worker_index() -> int:
+    v = os.environ.get("SORTME_WORKER_INDEX")
+    return int(v) if v else 0
+
+
+def is_primary_worker() -> bool:
+    return worker_index() == 0
+
+
+def _spawn(index: int, serve_one: Callable[[int, socket.socket], None], sock: socket.socket) -> int:
+    pid = os.fork()
+    if pid == 0:
+        # child: default signal handling, run the server, never return into the parent's loop
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        code = 0
+        try:
+            serve_one(index, sock)
+        except BaseException:
+            LOG.exception("worker %d crashed", index)
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def run_workers(n: int, serve_one: Callable[[int, socket.socket], None], sock: socket.socket,
+                restart_delay_s: float = 1.0) -> None:
+    """Fork n workers sharing sock; restart any that exit until SIGTERM / SIGINT."""
+    os.environ["SORTME_PREFORK_PARENT"] = str(os.getpid())
+    children: Dict[int, int] = {}          # pid -> worker index
+    stopping = False
+
+    def stop(signum, _frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for i in range(n):
+        children[_spawn(i, serve_one, sock)] = i
+    LOG.info("Started %d workers: %s", n, sorted(children))
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index = children.pop(pid, None)
+        if index is None or stopping:
+            continue
+        LOG.warning("worker %d (pid %d) exited with status %d; restarting", index, pid, status)
+        time.sleep(restart_delay_s)
+        children[_spawn(index, serve_one, sock)] = index
+
+
+# ---------- Memory accounting ----------
+def _smaps(pid: int) -> Optional[Dict[str, int]]:
+    out: Dict[str, int] = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as fh:
+            for line in fh:
+                key, _, rest = line.partition(":")
+                if key in _SMAPS_FIELDS:
+                    out[key] = int(rest.split()[0]) * 1024
+    except (OSError, ValueError):
+        return None
+    return out
+
+
+def process_memory(pid: Optional[int] = None) -> Dict[str, Any]:
+    """RSS of one process split into unique (private) and shared pages, in MB."""
+    pid = pid or os.getpid()
+    m = _smaps(pid)
+    if m is None:
+        # not Linux (or no permission): peak RSS of this process only
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {"pid": pid, "rss_mb": round(peak / 1024.0, 1), "unique_mb": None, "shared_mb": None,
+                "pss_mb": None}
+    mb = lambda v: round(v / 2 ** 20, 1)
+    return {
+        "pid": pid,
+        "rss_mb": mb(m.get("Rss", 0)),
+        "unique_mb": mb(m.get("Private_Clean", 0) + m.get("Private_Dirty", 0)),
+        "shared_mb": mb(m.get("Shared_Clean", 0) + m.get("Shared_Dirty", 0)),
+        "pss_mb": mb(m.get("Pss", 0)),
+    }
+
+
+def _children(pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", "r") as fh:
+            return [int(p) for p in fh.read().split()]
+    except (OSError, ValueError):
+        return []
+
+
+def worker_memory() -> Dict[str, Any]:
+    """This process, or under run_workers the parent and every worker; totals by PSS."""
+    parent = prefork_parent()
+    if parent is None:
+        procs = [process_memory()]
+        return {"mode": "single", "processes": procs, "total_pss_mb": procs[0]["pss_mb"]}
+    workers = [process_memory(p) for p in _children(parent)] or [process_memory()]
+    procs = [dict(process_memory(parent), role="parent")] + [dict(w, role="worker") for w in workers]
+    pss = [p["pss_mb"] for p in procs if p["pss_mb"] is not None]
+    return {
+        "mode": "prefork",
+        "processes": procs,
+        # PSS splits each shared page between its users: the sum is the real footprint
+        "total_pss_mb": round(sum(pss), 1) if pss else None,
+        "sum_rss_mb": round(sum(p["rss_mb"] for p in procs), 1),
+    }
@@ -0,0 +1,269 @@
+"""
+Multi-pass sort planner: full alphabetical (or set/collector) order with ~26 cells.
+
+Provides:
+ - sort_key(card, order): "name" -> (name, set, number); "set" -> (set, number, name)
+ - plan_sort(cards, cfg, state, order): pass-by-pass script (MSD radix with data-driven
+   digits) that puts every card in order with the fewest pick-and-place operations
+ - SortPass: one pass of the script; route(card, state) -> (cell_id, reason) replaces the
+   normal assignment while the pass runs (run_loop.begin_sort_pass)
+
+How passes are chosen: the keys are known (inventory index or a card list), so instead of
+fixed digits (letter 1, letter 2, ...) each pass splits its group into up to D contiguous key
+ranges, D = placement cells free in the state. A card costs one pick-and-place per pass it
+goes through, so the planner minimizes the card-weighted depth of an order-preserving D-ary
+tree: ranges are cut at weight quantiles, keys heavier than 1/D of the group (basic lands,
+playsets) get a bucket of their own, and any group with <= D distinct keys is finished in one
+pass. Cards with equal keys are interchangeable, so a single-key bucket is done.
+
+Capacity: each bucket gets one cell, spare cells go to the buckets most over capacity. A
+bucket larger than its cells needs operator sweeps (empty its cells into the bucket's box
+mid-pass); the script counts them. After a pass every cell is collected into a labelled box;
+passes run depth-first, so finished buckets come out in order. Feeders only hold the group
+being fed; feeder_loads is how many fills a pass needs.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import bisect
+import itertools
+import math
+import re
+
+from .assign import Card, Config, SystemState, _overflow_target
+
+ORDERS = ("name", "set")
+_NUM = re.compile(r"^(\d+)(.*)$")
+
+
+def _number_key(number: Optional[str]) -> Tuple[int, str]:
+    # collector numbers: "12" < "12a" < "100"; non-numeric ones after all numeric ones
+    m = _NUM.match(str(number or ""))
+    return (int(m.group(1)), m.group(2)) if m else (10 ** 9, str(number or ""))
+
+
+def sort_key(card: Any, order: str = "name") -> Tuple:
+    name = (card.name or "").strip().casefold()
+    set_code = (card.set_code or "").casefold()
+    number = _number_key(card.collector_number)
+    if order == "set":
+        return (set_code, number, name)
+    return (name, set_code, number)
+
+
+@dataclass
+class Bucket:
+    id: str
+    first: Tuple                 # smallest key routed here (inclusive)
+    last: Tuple
+    cards: int
+    keys: int                    # distinct keys
+    cells: List[str] = field(default_factory=list)
+    sweeps: int = 0
+    final: bool = False          # one key: in order once the pass is done
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "first": _show(self.first),
+            "last": _show(self.last),
+            "cards": self.cards,
+            "keys": self.keys,
+            "cells": self.cells,
+            "sweeps": self.sweeps,
+            "final": self.final,
+        }
+
+
+def _show(key: Tuple) -> str:
+    parts = []
+    for k in key:
+        if isinstance(k, tuple):    # collector number
+            parts.append(k[1] if k[0] == 10 ** 9 else f"{k[0]}{k[1]}")
+        else:
+            parts.append(str(k))
+    return " / ".join(p for p in parts if p)
+
+
+@dataclass
+class SortPass:
+    index: int
+    group: str                   # bucket id(s) being split ("all" for the first pass)
+    cards: int
+    feeder_loads: int
+    order: str
+    buckets: List[Bucket]
+
+    def __post_init__(self):
+        self._firsts = [b.first for b in self.buckets]
+
+    def route(self, card: Card, cfg: Config, state: SystemState) -> Tuple[str, str]:
+        """Destination for card during this pass: first cell of its bucket with room."""
+        if card.confidence < cfg.low_conf_thresh:
+            return _overflow_target(cfg, state), "divert:low_confidence"
+        key = sort_key(card, self.order)
+        i = max(0, bisect.bisect_right(self._firsts, key) - 1)
+        b = self.buckets[i]
+        if b.final and key != b.first:
+            # not in the planned key set: it would break a finished pile
+            return _overflow_target(cfg, state), "divert:unplanned"
+        for cid in b.cells:
+            if state.counts_by_cell.get(cid, 0) < cfg.cells[cid].capacity:
+                return cid, f"pass{self.index}:{b.id}"
+        # bucket full: the operator missed a sweep; keep the sort intact by diverting
+        return _overflow_target(cfg, state), f"sweep_needed:{b.id}"
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "pass": self.index,
+            "group": self.group,
+            "cards": self.cards,
+            "feeder_loads": self.feeder_loads,
+            "buckets": [b.as_dict() for b in self.buckets],
+        }
+
+
+# ---------- Splitting ----------
+def _split(keys: List[Tuple], weights: List[int], fanout: int) -> List[Tuple[int, int]]:
+    """Contiguous [lo, hi) ranges over sorted distinct keys, at most fanout of them."""
+    k = len(keys)
+    if k <= fanout:
+        return [(i, i + 1) for i in range(k)]
+    total = sum(weights)
+    heavy = total / fanout
+    cum = list(itertools.accumulate(weights))
+    cuts = set()
+    for j in range(1, fanout):
+        cuts.add(bisect.bisect_left(cum, j * total / fanout) + 1)
+    for i, w in enumerate(weights):
+        if w >= heavy:      # isolate: finished after this pass
+            cuts.update((i, i + 1))
+    cuts = sorted(c for c in cuts if 0 < c < k)
+    ranges = [(a, b) for a, b in zip([0] + cuts, cuts + [k])]
+    # too many (heavy keys isolated): merge the lightest neighbouring pair
+    def wsum(r):
+        return cum[r[1] - 1] - (cum[r[0] - 1] if r[0] else 0)
+    while len(ranges) > fanout:
+        i = min(range(len(ranges) - 1), key=lambda i: wsum(ranges[i]) + wsum(ranges[i + 1]))
+        ranges[i:i + 2] = [(ranges[i][0], ranges[i + 1][1])]
+    # too few: split the heaviest multi-key range at its weighted median
+    while len(ranges) < fanout:
+        multi = [r for r in ranges if r[1] - r[0] > 1]
+        if not multi:
+            break
+        a, b = max(multi, key=lambda r: sum(weights[r[0]:r[1]]))
+        half = sum(weights[a:b]) / 2.0
+        acc, m = 0, a + 1
+        for i in range(a, b - 1):
+            acc += weights[i]
+            m = i + 1
+            if acc >= half:
+                break
+        i = ranges.index((a, b))
+        ranges[i:i + 1] = [(a, m), (m, b)]
+    return ranges
+
+
+def _allocate(buckets: List[Bucket], cells: List[Tuple[str, int]]) -> None:
+    """One cell per bucket (in key order along the grid), spares to the most over-full."""
+    n_extra = len(cells) - len(buckets)
+    want = [1] * len(buckets)
+    cap = sum(c for _, c in cells) / len(cells) if cells else 1
+    for _ in range(max(0, n_extra)):
+        i = max(range(len(buckets)), key=lambda i: buckets[i].cards / (want[i] * cap))
+        if buckets[i].cards <= want[i] * cap:
+            break
+        want[i] += 1
+    it = iter(cells)
+    for b, w in zip(buckets, want):
+        chosen = [next(it) for _ in range(w)]
+        b.cells = [cid for cid, _ in chosen]
+        room = sum(c for _, c in chosen)
+        b.sweeps = max(0, math.ceil(b.cards / room) - 1) if room else 0
+
+
+def placement_cells(cfg: Config) -> List[Tuple[str, int]]:
+    """Cells a pass may use: not feeders, not overflow; grid order."""
+    return [(cid, c.capacity) for cid, c in cfg.cells.items()
+            if not (cfg.feeder_re and cfg.feeder_re.search(cid)) and cid not in cfg.overflow_cells]
+
+
+def plan_sort(cards: Iterable[Card], cfg: Config, state: Optional[SystemState] = None,
+              order: str = "name") -> Dict[str, Any]:
+    """
+    Script for sorting `cards` into full `order`. Cells that are not empty in `state` are
+    left alone (they are not used as buckets).
+    """
+    if order not in ORDERS:
+        raise ValueError(f"order must be one of {ORDERS}")
+    counts = state.counts_by_cell if state is not None else {}
+    cells = [(cid, cap) for cid, cap in placement_cells(cfg) if counts.get(cid, 0) == 0]
+    if len(cells) < 2:
+        raise ValueError("need at least two empty placement cells to plan a sort")
+    fanout = len(cells)
+    feeder_cap = sum(c.capacity for cid, c in cfg.cells.items() if cfg.feeder_re and cfg.feeder_re.search(cid))
+    weight: Dict[Tuple, int] = {}
+    for c in cards:
+        k = sort_key(c, order)
+        weight[k] = weight.get(k, 0) + 1
+    keys = sorted(weight)
+    passes: List[SortPass] = []
+    ids = itertools.count(1)
+
+    def run(groups: List[Tuple[str, int, int]]) -> None:
+        """One pass splitting consecutive groups; several only when each finishes in it."""
+        buckets: List[Bucket] = []
+        spans: List[Tuple[int, int]] = []
+        for _, lo, hi in groups:
+            ks = keys[lo:hi]
+            ws = [weight[k] for k in ks]
+            for a, b in _split(ks, ws, fanout if len(groups) == 1 else len(ks)):
+                buckets.append(Bucket(id=f"g{next(ids)}", first=ks[a], last=ks[b - 1],
+                                      cards=sum(ws[a:b]), keys=b - a, final=(b - a == 1)))
+                spans.append((lo + a, lo + b))
+        _allocate(buckets, cells)
+        n = sum(b.cards for b in buckets)
+        passes.append(SortPass(index=len(passes) + 1, group=",".join(g for g, _, _ in groups), cards=n,
+                               feeder_loads=math.ceil(n / feeder_cap) if feeder_cap else 0,
+                               order=order, buckets=buckets))
+        # depth-first so finished buckets come out in key order; pack consecutive small
+        # groups (each finishing in one pass) into a shared pass
+        batch: List[Tuple[str, int, int]] = []
+        for bk, (lo, hi) in zip(buckets, spans):
+            if bk.final:
+                continue
+            if bk.keys <= fanout and sum(h - l for _, l, h in batch) + bk.keys <= fanout:
+                batch.append((bk.id, lo, hi))
+                continue
+            if batch:
+                run(batch)
+                batch = []
+            if bk.keys > fanout:
+                run([(bk.id, lo, hi)])
+            else:
+                batch = [(bk.id, lo, hi)]
+        if batch:
+            run(batch)
+
+    if len(keys) > 1:
+        run([("all", 0, len(keys))])
+    total = sum(weight.values())
+    ops = sum(p.cards for p in passes)
+    return {
+        "order": order,
+        "cards": total,
+        "distinct_keys": len(keys),
+        "cells": fanout,
+        "passes": passes,
+        "pick_and_place": ops,
+        "avg_passes_per_card": round(ops / total, 3) if total else 0.0,
+        "sweeps": sum(b.sweeps for p in passes for b in p.buckets),
+        # passes the deepest card needs at least, for any scheme with `fanout` cells
+        "min_depth": math.ceil(math.log(len(keys), fanout) - 1e-9) if len(keys) > 1 else 0,
+    }
+
+
+def script(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """JSON-friendly form of plan_sort's result (passes as dicts)."""
+    out = dict(plan)
+    out["passes"] = [p.as_dict() for p in plan["passes"]]
+    return out
@@ -0,0 +1,254 @@
+"""
+Low-confidence re-scan cascade: retry identification in place before a card goes to ERR1.
+
+Provides:
+ - Tier(name, run, est_ms): one retry strategy; run(item) -> meta (name, confidence, ...) or
+   None when the tier cannot say anything about this card (no image, no index)
+ - RescanCascade(tiers, threshold, budget_ms).rescue(item, meta) -> meta: while the card is
+   under threshold, tries the tiers in order and keeps the most confident answer
+ - RescanCascade.stats(): per tier attempts / rescued / improved / skipped for budget / busy
+   time, plus the handling it saved (rescued cards need no ERR1 re-feed)
+ - ImageIndex: image-embedding lookup (embeddings.SimpleEmbedder against precomputed
+   reference-image vectors), the last tier
+ - default_tiers(identify) / from_cfg(raw_cfg, identify, threshold): the cascade configured
+   in config.yaml's rescan: section (None when disabled)
+
+Budget: a tier only starts if its expected cost -- mean of its own past runs, est_ms before
+it has any -- fits in what is left of the card's budget_ms. Tiers are synchronous OCR /
+model calls and are not interrupted, so a card spends at most budget_ms plus one estimate
+error. The cascade runs in the identify stage, before the card is assigned and the gantry
+commits to a destination, so a rescued card goes straight to its pile.
+"""
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+LOG = logging.getLogger("sort.rescan")
+
+TIERS = ("ocr_thorough", "rotate_180", "image_embedding")
+
+
+@dataclass
+class Tier:
+    name: str
+    run: Callable[[dict], Optional[dict]]
+    est_ms: float = 500.0
+    # ------ counters ------
+    attempts: int = 0
+    rescued: int = 0          # reached the threshold with this tier
+    improved: int = 0         # more confident than before, still under the threshold
+    unavailable: int = 0      # returned None
+    errors: int = 0
+    skipped_budget: int = 0
+    busy_s: float = 0.0
+    timed: int = 0            # runs folded into the estimate (the first one loads models)
+
+    def expected_s(self) -> float:
+        return self.busy_s / self.timed if self.timed else self.est_ms / 1000.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "attempts": self.attempts,
+            "rescued": self.rescued,
+            "improved": self.improved,
+            "unavailable": self.unavailable,
+            "errors": self.errors,
+            "skipped_budget": self.skipped_budget,
+            "busy_s": round(self.busy_s, 3),
+            "expected_ms": round(1000.0 * self.expected_s(), 1),
+        }
+
+
+class RescanCascade:
+    def __init__(self, tiers: List[Tier], threshold: float, budget_ms: float = 1500.0,
+                 refeed_s: float = 8.0, clock: Callable[[], float] = time.perf_counter):
+        self.tiers = tiers
+        self.threshold = threshold
+        self.budget_s = budget_ms / 1000.0
+        self.refeed_s = refeed_s          # handling one ERR1 card costs later (re-feed + scan + place)
+        self.clock = clock
+        self._lock = threading.Lock()     # identify runs on executor threads
+        self.cards = 0
+        self.low = 0
+        self.rescued = 0
+        self.spent_s = 0.0
+
+    def rescue(self, item: dict, meta: dict) -> dict:
+        """meta from the normal identify; returns it, or a better tier's meta (with 'rescan')."""
+        conf = float(meta.get("confidence", 0.0))
+        with self._lock:
+            self.cards += 1
+            if conf >= self.threshold:
+                return meta
+            self.low += 1
+        start = self.clock()
+        best, best_conf, winner, tried = meta, conf, None, []
+        for tier in self.tiers:
+            left = self.budget_s - (self.clock() - start)
+            if tier.expected_s() > left:
+                with self._lock:
+                    tier.skipped_budget += 1
+                continue
+            t0 = self.clock()
+            try:
+                out = tier.run(item)
+                failed = False
+            except Exception as exc:
+                LOG.warning("rescan tier %s failed: %s", tier.name, exc)
+                out, failed = None, True
+            dt = self.clock() - t0
+            tried.append(tier.name)
+            with self._lock:
+                tier.attempts += 1
+                if tier.attempts > 1:        # the first run pays for loading models
+                    tier.busy_s += dt
+                    tier.timed += 1
+                if failed:
+                    tier.errors += 1
+                elif out is None:
+                    tier.unavailable += 1
+            if out is None:
+                continue
+            c = float(out.get("confidence", 0.0))
+            if c <= best_conf:
+                continue
+            best, best_conf, winner = out, c, tier.name
+            if c >= self.threshold:
+                with self._lock:
+                    tier.rescued += 1
+                break
+            with self._lock:
+                tier.improved += 1
+        spent = self.clock() - start
+        with self._lock:
+            self.spent_s += spent
+            if best_conf >= self.threshold:
+                self.rescued += 1
+        best = dict(best)
+        best["rescan"] = {"tier": winner, "tried": tried, "ms": round(1000.0 * spent, 1),
+                          "confidence_before": round(conf, 3)}
+        return best
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            saved = self.rescued * self.refeed_s
+            return {
+                "threshold": self.threshold,
+                "budget_ms": round(1000.0 * self.budget_s, 1),
+                "cards": self.cards,
+                "low_confidence": self.low,
+                "rescued": self.rescued,
+                "still_low": self.low - self.rescued,
+                "rescue_rate": round(self.rescued / self.low, 3) if self.low else 0.0,
+                "spent_s": round(self.spent_s, 3),
+                "avg_ms_per_low_card": round(1000.0 * self.spent_s / self.low, 1) if self.low else 0.0,
+                # re-feed handling avoided minus time spent re-scanning
+                "refeed_saved_s": round(saved, 1),
+                "net_saved_s": round(saved - self.spent_s, 1),
+                "tiers": {t.name: t.as_dict() for t in self.tiers},
+            }
+
+
+# ---------- Image-embedding tier ----------
+class ImageIndex:
+    """
+    Nearest reference image by SimpleEmbedder vector (cosine). Files in `directory`:
+    image_embeddings.npy (N x D) and image_metadata.json (N card dicts, same order).
+    Loaded on first lookup; missing files make every lookup return None.
+    """
+    def __init__(self, directory: str = os.path.join("data", "embeddings")):
+        self.emb_path = os.path.join(directory, "image_embeddings.npy")
+        self.meta_path = os.path.join(directory, "image_metadata.json")
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._meta: List[Dict[str, Any]] = []
+        self._embedder = None
+
+    def available(self) -> bool:
+        return os.path.exists(self.emb_path) and os.path.exists(self.meta_path)
+
+    def _load(self) -> None:
+        with self._lock:
+            if self._vectors is not None:
+                return
+            from .embeddings import SimpleEmbedder
+            vecs = np.load(self.emb_path).astype(np.float32)
+            vecs /= np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+            with open(self.meta_path, "r", encoding="utf8") as fh:
+                self._meta = json.load(fh)
+            self._embedder = SimpleEmbedder()
+            self._vectors = vecs
+
+    def lookup(self, image: Any) -> Optional[Dict[str, Any]]:
+        """(best card dict, cosine similarity 0..1) as {'best', 'score'}; None without an index."""
+        if not self.available():
+            return None
+        self._load()
+        q = np.asarray(self._embedder.embed(image), dtype=np.float32).ravel()
+        q /= max(float(np.linalg.norm(q)), 1e-12)
+        sims = self._vectors @ q
+        i = int(np.argmax(sims))
+        return {"best": self._meta[i], "score": float(sims[i])}
+
+
+def _image_tier(index: ImageIndex) -> Callable[[dict], Optional[dict]]:
+    def run(item: dict) -> Optional[dict]:
+        if item.get("image") is None:
+            return None
+        hit = index.lookup(item["image"])
+        if hit is None:
+            return None
+        best = hit["best"]
+        meta = {k: v for k, v in item.items() if k != "image"}
+        meta.update({
+            "name": (best.get("name") or "").strip(),
+            "confidence": max(0.0, min(1.0, hit["score"])),
+            "set_code": best.get("set") or best.get("set_code"),
+            "collector_number": best.get("collector_number") or best.get("collector"),
+        })
+        return meta
+    return run
+
+
+def default_tiers(identify: Callable[..., dict], index: Optional[ImageIndex] = None) -> Dict[str, Callable]:
+    """identify(item, profile=..., rotation=...) -> meta, e.g. run_loop.identify_from_image."""
+    index = index or ImageIndex()
+    return {
+        "ocr_thorough": lambda item: identify(item, profile="thorough"),
+        "rotate_180": lambda item: identify(item, rotation=180),
+        "image_embedding": _image_tier(index),
+    }
+
+
+def from_cfg(raw_cfg: Dict[str, Any], identify: Callable[..., dict],
+             threshold: float) -> Optional[RescanCascade]:
+    """
+    config.yaml:
+        rescan:
+          enabled: true
+          budget_ms: 1500
+          refeed_s: 8.0
+          tiers:                       # in order; est_ms = cost guess until measured
+            - { name: ocr_thorough, est_ms: 600 }
+            - { name: rotate_180, est_ms: 300 }
+            - { name: image_embedding, est_ms: 150 }
+    """
+    opts = (raw_cfg or {}).get("rescan") or {}
+    if not opts.get("enabled", False):
+        return None
+    runners = default_tiers(identify)
+    tiers = []
+    for t in opts.get("tiers") or [{"name": n} for n in TIERS]:
+        t = t if isinstance(t, dict) else {"name": t}
+        name = str(t.get("name"))
+        if name not in runners:
+            raise ValueError(f"rescan: unknown tier '{name}' (one of {TIERS})")
+        tiers.append(Tier(name, runners[name], float(t.get("est_ms", 500.0))))
+    return RescanCascade(tiers, threshold, float(opts.get("budget_ms", 1500.0)),
+                         float(opts.get("refeed_s", 8.0)))
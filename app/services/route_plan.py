@@ -0,0 +1,126 @@
+"""
+Batch route planning for queued placements.
+
+Provides:
+ - estimate_plan_s(plan, start, driver): time of a motion_plan using the driver's kinematics
+   (driver.estimate_move_s + driver.actuator_s), without moving anything
+ - Transfer: one pending placement (destination + optional fixed source)
+ - plan_window(...): order a window of pending transfers and choose each one's feeder so the
+   estimated total time is minimal (greedy nearest-next over the full transfer cost)
+
+Sort contract: cards bound for the same destination keep their arrival order (pile order is
+part of the sort), and a transfer with an explicit source cell keeps it. Everything else
+(interleaving between destinations, feeder choice among feeders with stock) is free.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import motion_plan
+
+Pos = Tuple[float, float, float]
+
+
+@dataclass
+class Transfer:
+    to_cell: str
+    from_cell: Optional[str] = None     # fixed source; None = any feeder with stock
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class PlannedTransfer:
+    transfer: Transfer
+    from_cell: str
+    est_s: float
+
+
+def estimate_plan_s(plan: List[motion_plan.Primitive], start: Pos, driver: Any) -> float:
+    actuators = getattr(driver, "actuator_s", {}) or {}
+    pos = start
+    total = 0.0
+    for p in plan:
+        if p.op == "move":
+            total += driver.estimate_move_s(pos, p.target, p.speed)
+            pos = p.target
+        elif p.op == "dwell":
+            total += p.seconds
+        else:
+            total += actuators.get(p.op, 0.0)
+    return total
+
+
+def estimate_transfer_s(cells: Dict[str, Dict[str, float]], from_cell: str, to_cell: str,
+                        start: Pos, speed: float, driver: Any) -> Tuple[float, Pos]:
+    plan = motion_plan.optimize(motion_plan.compile_transfer(cells, from_cell, to_cell, speed), start)
+    return estimate_plan_s(plan, start, driver), motion_plan.end_position(plan, start)
+
+
+def _baseline(pending: List[Transfer], feeders: List[str], stock: Dict[str, int],
+              cells, start: Pos, speed: float, driver: Any) -> Tuple[List[PlannedTransfer], float]:
+    """Arrival order, always the first feeder that has stock (the run loop's old behaviour)."""
+    stock = dict(stock)
+    pos, total = start, 0.0
+    order = []
+    for t in pending:
+        src = t.from_cell or next((f for f in feeders if stock.get(f, 0) > 0), feeders[0])
+        stock[src] = stock.get(src, 0) - 1
+        dt, pos = estimate_transfer_s(cells, src, t.to_cell, pos, speed, driver)
+        order.append(PlannedTransfer(t, src, dt))
+        total += dt
+    return order, total
+
+
+def plan_window(pending: List[Transfer],
+                cells: Dict[str, Dict[str, float]],
+                feeders: List[str],
+                stock: Dict[str, int],
+                start: Pos,
+                speed: float,
+                driver: Any) -> Dict[str, Any]:
+    """
+    Order pending transfers and pick feeders to minimize estimated total time.
+    stock: remaining cards per feeder (not mutated).
+    Returns {'order': [PlannedTransfer], 'est_planned_s', 'est_baseline_s', 'est_saved_s'}.
+    """
+    if not feeders:
+        raise ValueError("plan_window needs at least one feeder")
+    remaining = dict(stock)
+    # per-destination FIFO: only the head of each destination queue is eligible
+    queues: Dict[str, List[Transfer]] = {}
+    for t in pending:
+        queues.setdefault(t.to_cell, []).append(t)
+
+    order: List[PlannedTransfer] = []
+    pos, total = start, 0.0
+    while any(queues.values()):
+        best = None
+        for dest, q in queues.items():
+            if not q:
+                continue
+            t = q[0]
+            sources = [t.from_cell] if t.from_cell else [f for f in feeders if remaining.get(f, 0) > 0]
+            if not sources:
+                # every feeder reported empty: fall back to the first one (operator reload pending)
+                sources = [feeders[0]]
+            for src in sources:
+                dt, end = estimate_transfer_s(cells, src, dest, pos, speed, driver)
+                if best is None or dt < best[0]:
+                    best = (dt, end, dest, src)
+        dt, end, dest, src = best
+        t = queues[dest].pop(0)
+        if not t.from_cell:
+            remaining[src] = remaining.get(src, 0) - 1
+        order.append(PlannedTransfer(t, src, dt))
+        pos, total = end, total + dt
+
+    base_order, baseline = _baseline(pending, feeders, stock, cells, start, speed, driver)
+    if baseline <= total:
+        # greedy is not optimal; never do worse than arrival order
+        order, total = base_order, baseline
+    return {
+        "order": order,
+        "est_planned_s": total,
+        "est_baseline_s": baseline,
+        "est_saved_s": baseline - total,
+    }
+
@@ -0,0 +1,295 @@
+"""
+Sorting-rule engine: a declarative rule list from config.yaml compiled into lookup tables.
+
+Provides:
+ - compile_rules(rule_dicts, cells, feeder_re) -> RuleSet
+ - RuleSet.match(card) -> Rule or None: first rule (config order) whose conditions all hold
+ - RuleSet.stats(): per-rule hit counters (every evaluation, previews included)
+ - card_attrs(record): rarity / color_identity / mana_value / price from a card-DB record
+   (Scryfall-style keys), as Card keyword arguments
+
+Rule format (config.yaml `rules:`, used with sorting.default_mode: rules):
+
+    - name: cheap_blue_commons        # optional, defaults to rule<N>
+      when:                           # all conditions must hold; omitted fields match anything
+        set: [DMU, BRO]               # set codes (case-insensitive)
+        rarity: [common, uncommon]
+        color_identity: [U, UB]       # exact color sets; "C" = colorless, "multi" = 2+ colors
+        color_match: exact            # exact | within (card colors are a subset) | includes
+        mana_value: { min: 0, max: 3 }          # min/max inclusive, below exclusive
+        price: { min: 0.5, below: 5 }           # USD
+        letter: [A, B]                # first letter of the name (non A-Z counts as A)
+        name: ["Lightning Bolt"]      # exact names (case-insensitive)
+        game: [mtg]
+      cells: [C1, C2]                 # or cell: C1; tried in order, overflow when all are full
+
+How it compiles: every rule gets one bit. For each field a table maps every distinguishable
+value (set code, rarity, one of the 32 WUBRG combinations, first letter, numeric slot) to the
+bitmask of rules accepting it; numeric conditions split the axis at every bound, so a value
+is a bisect into precomputed slots. Matching a card is one table lookup per field, an AND of
+the masks and the lowest set bit -- independent of how many rules there are.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import bisect
+import re
+
+COLORS = "WUBRG"
+FIELDS = ("game", "set", "rarity", "color_identity", "letter", "name", "mana_value", "price")
+NUMERIC = ("mana_value", "price")
+COLOR_MATCH = ("exact", "within", "includes")
+
+
+@dataclass
+class Rule:
+    index: int
+    name: str
+    cells: List[str]
+    when: Dict[str, Any] = field(default_factory=dict)
+
+
+def _low(v: Any) -> str:
+    return str(v).strip().casefold()
+
+
+def _as_list(v: Any) -> List[Any]:
+    return list(v) if isinstance(v, (list, tuple, set)) else [v]
+
+
+def _color_mask(v: Any) -> Optional[int]:
+    """WUBRG letters (string or list) -> 5-bit mask; None when unknown."""
+    if v is None:
+        return None
+    letters = "".join(_as_list(v)) if not isinstance(v, str) else v
+    letters = letters.upper()
+    if letters in ("C", "COLORLESS"):
+        return 0
+    mask = 0
+    for ch in letters:
+        i = COLORS.find(ch)
+        if i < 0:
+            raise ValueError(f"unknown color '{ch}' in {v!r}")
+        mask |= 1 << i
+    return mask
+
+
+def first_letter(name: str) -> str:
+    first = (name.strip()[:1] or "#").upper()
+    # "ß".upper() == "SS": only a single A-Z character counts
+    return first if len(first) == 1 and "A" <= first <= "Z" else "A"
+
+
+# ---------- Compilation ----------
+def _range_pred(spec: Any) -> Callable[[float], bool]:
+    if isinstance(spec, (int, float)):
+        lo = hi = float(spec)
+        below = None
+    else:
+        lo = float(spec["min"]) if spec.get("min") is not None else None
+        hi = float(spec["max"]) if spec.get("max") is not None else None
+        below = float(spec["below"]) if spec.get("below") is not None else None
+    return lambda v: ((lo is None or v >= lo) and (hi is None or v <= hi) and (below is None or v < below))
+
+
+def _range_points(spec: Any) -> List[float]:
+    if isinstance(spec, (int, float)):
+        return [float(spec)]
+    return [float(spec[k]) for k in ("min", "max", "below") if spec.get(k) is not None]
+
+
+class _NumericTable:
+    """Distinct bounds split the axis into slots (points and open gaps); one mask per slot."""
+    def __init__(self, preds: Dict[int, Callable[[float], bool]], points: List[float], unconstrained: int):
+        self.points = sorted(set(points))
+        self.unconstrained = unconstrained
+        reps = []
+        p = self.points
+        for k in range(len(p) + 1):
+            lo = p[k - 1] if k > 0 else None
+            hi = p[k] if k < len(p) else None
+            if lo is None and hi is None:
+                reps.append(0.0)
+            elif lo is None:
+                reps.append(hi - 1.0)
+            elif hi is None:
+                reps.append(lo + 1.0)
+            else:
+                reps.append((lo + hi) / 2.0)
+            if hi is not None:
+                reps.append(hi)
+        self.masks = []
+        for rep in reps:
+            m = unconstrained
+            for bit, pred in preds.items():
+                if pred(rep):
+                    m |= 1 << bit
+            self.masks.append(m)
+
+    def lookup(self, v: Optional[float]) -> int:
+        if v is None:
+            return self.unconstrained
+        k = bisect.bisect_left(self.points, v)
+        if k < len(self.points) and self.points[k] == v:
+            return self.masks[2 * k + 1]
+        return self.masks[2 * k]
+
+
+class RuleSet:
+    def __init__(self, rules: List[Rule]):
+        self.rules = rules
+        self.hits = [0] * len(rules)
+        self.misses = 0
+        self.all = (1 << len(rules)) - 1
+        self._compile()
+
+    def _compile(self) -> None:
+        free = {f: 0 for f in FIELDS}            # rules that do not constrain the field
+        exact: Dict[str, Dict[Any, int]] = {f: {} for f in ("game", "set", "rarity", "letter", "name")}
+        color_specs: Dict[int, Tuple[List[int], str]] = {}
+        preds: Dict[str, Dict[int, Callable[[float], bool]]] = {f: {} for f in NUMERIC}
+        points: Dict[str, List[float]] = {f: [] for f in NUMERIC}
+
+        for r in self.rules:
+            bit = 1 << r.index
+            for f in FIELDS:
+                spec = r.when.get(f)
+                if spec is None:
+                    free[f] |= bit
+                elif f in NUMERIC:
+                    preds[f][r.index] = _range_pred(spec)
+                    points[f].extend(_range_points(spec))
+                elif f == "color_identity":
+                    wanted = []
+                    for v in _as_list(spec):
+                        wanted.append(-1 if _low(v) == "multi" else _color_mask(v))
+                    color_specs[r.index] = (wanted, r.when.get("color_match", "exact"))
+                else:
+                    for v in _as_list(spec):
+                        key = first_letter(str(v)) if f == "letter" else _low(v)
+                        exact[f][key] = exact[f].get(key, 0) | bit
+
+        self._free = free
+        self._exact = {f: {k: m | free[f] for k, m in t.items()} for f, t in exact.items()}
+        # all 32 color identities, precomputed
+        self._colors = []
+        for cmask in range(32):
+            m = free["color_identity"]
+            ncolors = bin(cmask).count("1")
+            for idx, (wanted, mode) in color_specs.items():
+                for w in wanted:
+                    if w == -1:
+                        ok = ncolors >= 2
+                    elif mode == "within":
+                        ok = cmask & ~w == 0
+                    elif mode == "includes":
+                        ok = cmask & w == w
+                    else:
+                        ok = cmask == w
+                    if ok:
+                        m |= 1 << idx
+                        break
+            self._colors.append(m)
+        self._numeric = {f: _NumericTable(preds[f], points[f], free[f]) for f in NUMERIC}
+
+    # ------ evaluation ------
+    def mask(self, card: Any) -> int:
+        m = self.all
+        ex = self._exact
+        name = card.name or ""
+        m &= ex["game"].get(_low(card.game), self._free["game"])
+        m &= ex["letter"].get(first_letter(name), self._free["letter"])
+        m &= ex["name"].get(_low(name), self._free["name"])
+        set_code = getattr(card, "set_code", None)
+        m &= ex["set"].get(_low(set_code), self._free["set"]) if set_code else self._free["set"]
+        rarity = getattr(card, "rarity", None)
+        m &= ex["rarity"].get(_low(rarity), self._free["rarity"]) if rarity else self._free["rarity"]
+        if not m:
+            return 0
+        try:
+            cmask = _color_mask(getattr(card, "color_identity", None))
+        except ValueError:
+            cmask = None
+        m &= self._colors[cmask] if cmask is not None else self._free["color_identity"]
+        m &= self._numeric["mana_value"].lookup(getattr(card, "mana_value", None))
+        m &= self._numeric["price"].lookup(getattr(card, "price", None))
+        return m
+
+    def match(self, card: Any) -> Optional[Rule]:
+        m = self.mask(card)
+        if not m:
+            self.misses += 1
+            return None
+        idx = (m & -m).bit_length() - 1
+        self.hits[idx] += 1
+        return self.rules[idx]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rules": len(self.rules),
+            "hits": {r.name: self.hits[r.index] for r in self.rules},
+            "unmatched": self.misses,
+        }
+
+    def reset_stats(self) -> None:
+        self.hits = [0] * len(self.rules)
+        self.misses = 0
+
+
+def compile_rules(rule_dicts: Iterable[Dict[str, Any]], cells: Dict[str, Any],
+                  feeder_re: Optional[re.Pattern] = None) -> RuleSet:
+    """Validate and compile the `rules:` config list (cells must exist and not be feeders)."""
+    rules: List[Rule] = []
+    names = set()
+    for i, rd in enumerate(rule_dicts or []):
+        name = str(rd.get("name") or f"rule{i + 1}")
+        if name in names:
+            raise ValueError(f"rules: duplicate rule name '{name}'")
+        names.add(name)
+        targets = [str(c) for c in _as_list(rd.get("cells") or rd.get("cell") or [])]
+        if not targets:
+            raise ValueError(f"rules: '{name}' has no cell")
+        for cid in targets:
+            if cid not in cells:
+                raise ValueError(f"rules: cell '{cid}' for rule '{name}' not defined in cells:")
+            if feeder_re and feeder_re.search(cid):
+                raise ValueError(f"rules: rule '{name}' targets feeder cell '{cid}', which is forbidden")
+        when = dict(rd.get("when") or {})
+        unknown = set(when) - set(FIELDS) - {"color_match"}
+        if unknown:
+            raise ValueError(f"rules: '{name}' has unknown condition(s) {sorted(unknown)}")
+        if when.get("color_match", "exact") not in COLOR_MATCH:
+            raise ValueError(f"rules: '{name}' color_match must be one of {COLOR_MATCH}")
+        if when.get("color_identity") is not None:
+            for v in _as_list(when["color_identity"]):
+                if _low(v) != "multi":
+                    _color_mask(v)
+        rules.append(Rule(index=i, name=name, cells=targets, when=when))
+    return RuleSet(rules)
+
+
+# ---------- Card attributes ----------
+def card_attrs(rec: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Rule-relevant attributes from a card-DB / identify record (missing ones omitted)."""
+    if not rec:
+        return {}
+    out: Dict[str, Any] = {}
+    if rec.get("rarity"):
+        out["rarity"] = str(rec["rarity"])
+    ci = rec.get("color_identity")
+    if ci is not None:
+        out["color_identity"] = "".join(ci) if isinstance(ci, (list, tuple)) else str(ci)
+    mv = rec.get("mana_value", rec.get("cmc"))
+    if mv is not None:
+        try:
+            out["mana_value"] = float(mv)
+        except (TypeError, ValueError):
+            pass
+    price = rec.get("price")
+    if price is None and isinstance(rec.get("prices"), dict):
+        price = rec["prices"].get("usd")
+    if price is not None:
+        try:
+            out["price"] = float(price)
+        except (TypeError, ValueError):
+            pass
+    return out
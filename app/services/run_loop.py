@@ -3,33 +3,144 @@ import yaml
 from services.assign import load_config, Config, SystemState, Card, assign_card
 import asyncio
 import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 from services import motion as motion_svc
+from services import kinematics
+from services import route_plan
+from services.feeders import FeederEmpty, FeederScheduler
+from services.coordinator import Coordinator
+from services.cell_store import get_store
+from services.rules import card_attrs
+from services.radix_plan import SortPass
+from services.rescan import RescanCascade, from_cfg as rescan_from_cfg
+from services.catalogs import get_registry
 
 LOG = logging.getLogger("sort.runloop")
 
-CFG: Config = load_config(yaml.safe_load(open("config.yaml")))
-state = SystemState(counts_by_cell={cid: 0 for cid in CFG.cells})
+_RAW_CFG = yaml.safe_load(open("config.yaml"))
+CFG: Config = load_config(_RAW_CFG)
+# one authoritative count store per process (shared with any Coordinator heads)
+store = get_store(CFG)
+state = store.state
+# per-game index / vocabulary / sorting config (config.yaml games:); CFG for the default game
+catalogs = get_registry(_RAW_CFG, CFG)
 
-# configure motion controller with positions from CFG.cells (if available)
+# configure motion controller with positions from config.yaml: explicit cells: x/y, else the
+# grid implied by the cell ids at simulator.pitch_mm (kinematics.cell_layout). Route planning
+# and feeder choice measure travel between these, so they must not all be the origin.
 try:
     ctrl = motion_svc.get_controller()
-    # build mapping cid -> {x,y,z} from CFG.cells (Cell objects or dicts)
-    cells_map = {}
-    for cid, c in CFG.cells.items():
-        # support both dataclass-like objects and plain dicts
-        try:
-            x = float(getattr(c, "x", c.get("x")))
-            y = float(getattr(c, "y", c.get("y")))
-            z = float(getattr(c, "z", c.get("z", 0.0)))
-        except Exception:
-            # fallback: zeroed coords
-            x, y, z = 0.0, 0.0, 0.0
-        cells_map[cid] = {"x": x, "y": y, "z": z}
-    ctrl.configure_cells(cells_map)
+    ctrl.configure_cells(kinematics.cell_layout(_RAW_CFG, CFG.cells.keys()))
     LOG.info("Motion controller configured from CFG")
 except Exception as e:
     LOG.warning("Failed to configure motion controller from CFG: %s", e)
 
+def _card_from_meta(meta: dict) -> Card:
+    return Card(
+        game=meta.get("game", "mtg"),
+        name=meta["name"],
+        set_code=meta.get("set_code"),
+        collector_number=meta.get("collector_number"),
+        confidence=float(meta.get("confidence", 1.0)),
+        **card_attrs(meta),
+    )
+
+try:
+    feeder_scheduler: Optional[FeederScheduler] = FeederScheduler.from_cfg(CFG)
+except ValueError:
+    feeder_scheduler = None   # no feeder.reserve_pattern cells: fall back to column A / any cell
+
+def _pick_source_cell(meta: dict, to_cell: Optional[str] = None):
+    """
+    Source cell from meta (from_cell/source_cell/feeder); otherwise the feeder scheduler's
+    choice for to_cell (least travel among feeders with cards, skipping ones being reloaded).
+    Without a scheduler: a cell in column A, else any cell with non-zero count, else the first cell.
+    Feeder picks are counted against the feeder's stack (see _release_source on failure).
+    """
+    source_cell = meta.get("from_cell") or meta.get("source_cell") or meta.get("feeder")
+    if source_cell and feeder_scheduler is not None:
+        feeder_scheduler.take(source_cell, to_cell)
+    if not source_cell and feeder_scheduler is not None and to_cell is not None:
+        return feeder_scheduler.next_source(to_cell, motion_svc.get_controller())
+    if not source_cell:
+        # prefer feeders in column A, else any cell with non-zero count, else first cell
+        feeders = [cid for cid in CFG.cells.keys() if str(cid).upper().startswith("A")]
+        if feeders:
+            source_cell = feeders[0]
+        else:
+            nonempty = [cid for cid, cnt in state.counts_by_cell.items() if cnt > 0]
+            source_cell = nonempty[0] if nonempty else (list(CFG.cells.keys())[0] if CFG.cells else None)
+    if source_cell is None:
+        raise RuntimeError("No source cell available to pick from")
+    return source_cell
+
+def _release_source(source_cell: str) -> None:
+    """A transfer failed before the card left its feeder: give the card back to the stack."""
+    if feeder_scheduler is not None:
+        feeder_scheduler.release(source_cell)
+
+# ---------- Feeder reloads (operator) ----------
+def feeder_status() -> Dict[str, Any]:
+    return feeder_scheduler.status() if feeder_scheduler is not None else {"feeders": {}}
+
+def begin_feeder_reload(cell_id: str) -> Dict[str, Any]:
+    """Take one feeder out of rotation; intake keeps pulling from the others."""
+    if feeder_scheduler is None:
+        raise RuntimeError("No feeders configured")
+    return feeder_scheduler.begin_reload(cell_id)
+
+def end_feeder_reload(cell_id: str, count: Optional[int] = None) -> Dict[str, Any]:
+    if feeder_scheduler is None:
+        raise RuntimeError("No feeders configured")
+    return feeder_scheduler.end_reload(cell_id, count)
+
+# ---------- Multi-pass sorting (radix_plan script, one pass at a time) ----------
+sort_pass: Optional[SortPass] = None
+
+def _route_assign(card: Card, divert: Optional[str] = None):
+    """
+    store.assign with the card's game config, routed by the active sort pass when there is one.
+    divert: a cell the card must go to regardless (the placement queue's drop_err1 overflow).
+    """
+    if divert:
+        return store.assign(card, catalogs.config(card.game),
+                            route=lambda _card, _cfg, _state: (divert, "divert:backpressure"))
+    return store.assign(card, catalogs.config(card.game), route=sort_pass.route if sort_pass is not None else None)
+
+def begin_sort_pass(sp: SortPass) -> Dict[str, Any]:
+    """Route placements by sp's buckets until end_sort_pass(); its cells should be empty."""
+    global sort_pass
+    busy = {cid: store.get(cid) for b in sp.buckets for cid in b.cells if store.get(cid)}
+    if busy:
+        LOG.warning("Sort pass %d starts on non-empty cells: %s", sp.index, busy)
+    sort_pass = sp
+    LOG.info("Sort pass %d (%s): %d cards into %d buckets", sp.index, sp.group, sp.cards, len(sp.buckets))
+    return sp.as_dict()
+
+def end_sort_pass() -> Dict[str, Any]:
+    """Back to normal assignment; returns the cards placed per bucket cell."""
+    global sort_pass
+    sp, sort_pass = sort_pass, None
+    if sp is None:
+        return {"pass": None}
+    return {"pass": sp.index, "cells": {cid: store.get(cid) for b in sp.buckets for cid in b.cells}}
+
+# ---------- Placement events ----------
+# callables (event, payload) told about every placement outcome: 'placement',
+# 'placement_failed' and 'placement_diverted' (queue full under drop_err1)
+placement_listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+
+def _notify(event: str, payload: Dict[str, Any]) -> None:
+    for listener in list(placement_listeners):
+        try:
+            listener(event, payload)
+        except Exception:
+            LOG.exception("placement listener failed on %s", event)
+
 # make an async handler so callers can schedule it safely
 async def _handle_card_identified_async(meta: dict):
     """
@@ -39,29 +150,17 @@ async def _handle_card_identified_async(meta: dict):
     If not provided, will attempt to select a reasonable feeder (cells starting with 'A').
     """
     try:
-        card = Card(
-            game=meta.get("game", "mtg"),
-            name=meta["name"],
-            set_code=meta.get("set_code"),
-            collector_number=meta.get("collector_number"),
-            confidence=float(meta.get("confidence", 1.0)),
-        )
+        card = _card_from_meta(meta)
 
-        cell_id, reason = assign_card(card, CFG, state)
+        # assign + reserve the slot atomically (the store is shared with other placers)
+        cell_id, reason = _route_assign(card, meta.get("divert"))
 
         # determine source cell
-        source_cell = meta.get("from_cell") or meta.get("source_cell") or meta.get("feeder")
-        if not source_cell:
-            # prefer feeders in column A, else any cell with non-zero count, else first cell
-            feeders = [cid for cid in CFG.cells.keys() if str(cid).upper().startswith("A")]
-            if feeders:
-                source_cell = feeders[0]
-            else:
-                nonempty = [cid for cid, cnt in state.counts_by_cell.items() if cnt > 0]
-                source_cell = nonempty[0] if nonempty else (list(CFG.cells.keys())[0] if CFG.cells else None)
-
-        if source_cell is None:
-            raise RuntimeError("No source cell available to pick from")
+        try:
+            source_cell = _pick_source_cell(meta, cell_id)
+        except Exception:
+            store.release(cell_id, card)
+            raise
 
         # transfer using motion controller (async)
         controller = motion_svc.get_controller()
@@ -69,34 +168,616 @@ async def _handle_card_identified_async(meta: dict):
         try:
             await controller.transfer_card(source_cell, cell_id)
         except Exception as e:
+            _release_source(source_cell)
+            store.release(cell_id, card)
             LOG.error("Transfer failed: %s", e)
             # publish failure and return
-            try:
-                events.publish("placement_failed", {"card": card.name, "from": source_cell, "to": cell_id, "error": str(e)})
-            except Exception:
-                pass
+            _notify("placement_failed", {"card": card.name, "from": source_cell, "to": cell_id, "error": str(e)})
             return
-
-        # update state counts
-        state.counts_by_cell[cell_id] = state.counts_by_cell.get(cell_id, 0) + 1
+        store.placed(cell_id, card)
 
         # publish event for successful placement
+        _notify("placement", {"card": card.name, "cell": cell_id, "reason": reason})
+
+    except Exception as exc:
+        LOG.exception("on_card_identified failed: %s", exc)
+
+def _within_stock(jobs: list, supply: int) -> list:
+    """Keep the transfers the feeders can supply (arrival order); the rest fail like FeederEmpty."""
+    unfed = [t for t in jobs if not t.from_cell][supply:]
+    if not unfed:
+        return jobs
+    skip = {id(t) for t in unfed}
+    for t in unfed:
+        card = t.meta["card"]
+        store.release(t.to_cell, card)
+        LOG.error("No feeder stock left for '%s' -> %s", card.name, t.to_cell)
+        _notify("placement_failed", {"card": card.name, "from": None, "to": t.to_cell,
+                                     "error": "all feeders empty or reloading"})
+    return [t for t in jobs if id(t) not in skip]
+
+async def _handle_window_async(metas: list):
+    """
+    Place a window of queued cards: assign all of them in arrival order (reserving counts),
+    then let route_plan order the transfers and choose feeders to minimize travel.
+    """
+    controller = motion_svc.get_controller()
+    jobs = []
+    for meta in metas:
         try:
-            events.publish("placement", {"card": card.name, "cell": cell_id, "reason": reason})
-        except Exception:
-            LOG.debug("events.publish unavailable or failed")
+            card = _card_from_meta(meta)
+            cell_id, reason = _route_assign(card, meta.get("divert"))
+            fixed = meta.get("from_cell") or meta.get("source_cell") or meta.get("feeder")
+            jobs.append(route_plan.Transfer(cell_id, fixed, {"card": card, "reason": reason}))
+        except Exception as exc:
+            LOG.exception("assignment failed: %s", exc)
+    if not jobs:
+        return
+    try:
+        if feeder_scheduler is not None:
+            # only feeders with cards that are not being reloaded, as for a single card
+            # (feeder_scheduler.next_source): never fall back to an empty or reloading one
+            feeders = feeder_scheduler.available()
+            if not feeders:
+                raise FeederEmpty("all feeders empty or reloading")
+            stock = feeder_scheduler.stock()
+            jobs = _within_stock(jobs, sum(stock[f] for f in feeders))
+        else:
+            feeders = [_pick_source_cell({})]
+            stock = {feeders[0]: len(jobs)}
+        planned = route_plan.plan_window(jobs, controller.cells, feeders, stock, controller.current,
+                                         controller.default_speed, controller.driver)
+    except Exception:
+        # nothing has moved yet: every slot reserved above goes back
+        for t in jobs:
+            store.release(t.to_cell, t.meta["card"])
+        raise
+    t0 = controller.driver.clock()
+    for pt in planned["order"]:
+        card, reason = pt.transfer.meta["card"], pt.transfer.meta["reason"]
+        LOG.info("Transferring card '%s' from %s -> %s (reason=%s)", card.name, pt.from_cell, pt.transfer.to_cell, reason)
+        if feeder_scheduler is not None:
+            feeder_scheduler.take(pt.from_cell, pt.transfer.to_cell)
+        try:
+            await controller.transfer_card(pt.from_cell, pt.transfer.to_cell)
+        except Exception as e:
+            _release_source(pt.from_cell)
+            store.release(pt.transfer.to_cell, card)
+            LOG.error("Transfer failed: %s", e)
+            _notify("placement_failed", {"card": card.name, "from": pt.from_cell, "to": pt.transfer.to_cell, "error": str(e)})
+            continue
+        store.placed(pt.transfer.to_cell, card)
+        _notify("placement", {"card": card.name, "cell": pt.transfer.to_cell, "reason": reason})
+    actual = controller.driver.clock() - t0
+    route_stats["windows"] += 1
+    route_stats["transfers"] += len(planned["order"])
+    route_stats["est_saved_s"] += planned["est_saved_s"]
+    route_stats["actual_saved_s"] += planned["est_baseline_s"] - actual
+    LOG.info("Route window of %d: est %.2fs (baseline %.2fs), actual %.2fs",
+             len(planned["order"]), planned["est_planned_s"], planned["est_baseline_s"], actual)
+
+route_stats = {"windows": 0, "transfers": 0, "est_saved_s": 0.0, "actual_saved_s": 0.0}
+
+# ---------- Several pick heads (run_loop.heads > 1, services/coordinator) ----------
+_RUN_CFG = _RAW_CFG.get("run_loop", {}) or {}
+HEADS = max(1, int(_RUN_CFG.get("heads", 1)))
+_heads: List[motion_svc.MotionController] = []
+_coordinator: Optional[Coordinator] = None
+_coordinator_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def _head_controllers() -> List[motion_svc.MotionController]:
+    """
+    Head 0 is the shared controller; head i > 0 streams G-code to SORTME_GCODE_PORT_<i>
+    (baud SORTME_GCODE_BAUD) or runs on the SimulatedDriver. Heads sit on the rail in this order.
+    """
+    if not _heads:
+        _heads.append(motion_svc.get_controller())
+        for i in range(1, HEADS):
+            driver = None
+            port = os.environ.get(f"SORTME_GCODE_PORT_{i}")
+            if port:
+                from services.gcode import GcodeDriver
+                driver = GcodeDriver(port, baud=int(os.environ.get("SORTME_GCODE_BAUD", "115200")))
+            head = motion_svc.MotionController(driver=driver)
+            head.configure_cells(kinematics.cell_layout(_RAW_CFG, CFG.cells.keys()))
+            _heads.append(head)
+    return _heads
+
+def get_coordinator() -> Coordinator:
+    """The coordinator over every head, built on (and for) the running event loop."""
+    global _coordinator, _coordinator_loop
+    loop = asyncio.get_running_loop()
+    if _coordinator is None or _coordinator_loop is not loop:
+        # its conditions belong to one loop; a new loop (placement queue restarted) gets a new one
+        _coordinator = Coordinator(_head_controllers(), CFG, store, feeder_scheduler,
+                                   clearance=float(_RUN_CFG.get("head_clearance_mm", 60.0)))
+        _coordinator_loop = loop
+    return _coordinator
+
+def coordinator_stats() -> Dict[str, Any]:
+    return _coordinator.stats() if _coordinator is not None else {"heads": []}
+
+async def _handle_card_coordinated_async(meta: dict):
+    """
+    As _handle_card_identified_async, with the coordinator choosing the head (and, without a
+    source in meta, the feeder); the placement queue runs one of these per head concurrently.
+    """
+    try:
+        card = _card_from_meta(meta)
+        source = meta.get("from_cell") or meta.get("source_cell") or meta.get("feeder")
+        if not source and feeder_scheduler is None:
+            source = _pick_source_cell(meta)
+        assigned = []
+
+        def assign(c: Card):
+            assigned.append(_route_assign(c, meta.get("divert")))
+            return assigned[-1]
+
+        try:
+            res = await get_coordinator().place(card, source, assign=assign)
+        except Exception as e:
+            if not assigned:
+                raise
+            # the coordinator has released the slot and the feeder's card already
+            LOG.error("Transfer failed: %s", e)
+            _notify("placement_failed", {"card": card.name, "from": source, "to": assigned[0][0], "error": str(e)})
+            return
+        _notify("placement", {"card": card.name, "cell": res["to"], "reason": res["reason"], "head": res["head"]})
 
     except Exception as exc:
         LOG.exception("on_card_identified failed: %s", exc)
 
-# sync wrapper for older callers: schedules the async handler
+# ---------- Placement queue ----------
+# Long-lived consumers behind a bounded FIFO -- one, or one per pick head when several heads
+# share the grid (run_loop.heads, services/coordinator): placements start in arrival order
+# and never contend for a motion lock. When the queue is full the configured backpressure
+# policy applies:
+#   block     : the producer waits for room (sync callers block, async callers await)
+#   drop_err1 : the producer does not wait; the card is marked meta['divert'] = overflow cell
+#               and queued behind the others as soon as there is room, so the handler assigns
+#               it straight to the error pile (store.assign) and moves it there for a re-feed
+#   reject    : PlacementRejected is raised to the producer
+
+BACKPRESSURE_POLICIES = ("block", "drop_err1", "reject")
+
+class PlacementRejected(Exception):
+    pass
+
+class PlacementQueue:
+    def __init__(self,
+                 handler: Callable[[dict], Awaitable[None]],
+                 maxsize: int = 8,
+                 policy: str = "block",
+                 window: int = 1,
+                 window_handler: Optional[Callable[[list], Awaitable[None]]] = None,
+                 overflow_cell: Optional[str] = None,
+                 consumers: int = 1):
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"backpressure must be one of {BACKPRESSURE_POLICIES}, got '{policy}'")
+        self.handler = handler
+        self.maxsize = maxsize
+        self.policy = policy
+        # >1: the consumer takes up to `window` already-queued cards at once and hands them
+        # to window_handler so their transfers can be route-planned together
+        self.window = max(1, int(window))
+        self.window_handler = window_handler
+        self.overflow_cell = overflow_cell or (CFG.overflow_cells[0] if CFG.overflow_cells else None)
+        # concurrent handler calls (one per pick head); the handler must allow that
+        self.consumers = max(1, int(consumers))
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumers: List[asyncio.Task] = []
+        self._thread: Optional[threading.Thread] = None
+        self._closing = False
+        self._pending_puts = 0
+        self.metrics = {
+            "enqueued": 0, "processed": 0, "failed": 0, "dropped": 0, "rejected": 0,
+            "max_depth": 0, "wait_s_total": 0.0,
+        }
+
+    # ------ loop binding ------
+    def _bound(self) -> bool:
+        """The queue's loop is still running its consumer (it has not been stopped / closed)."""
+        return self.loop is not None and self.loop.is_running()
+
+    def _ensure_started(self, loop: asyncio.AbstractEventLoop) -> None:
+        if self._queue is not None and self.loop is loop:
+            return
+        if self._queue is not None:
+            if self._bound():
+                raise RuntimeError("placement queue is bound to another running event loop")
+            # the old loop ended (e.g. one asyncio.run() per batch): start over on this one
+            lost = self._queue.qsize() + self._pending_puts
+            if lost:
+                LOG.warning("Placement queue's event loop ended with %d card(s) unplaced", lost)
+            self._pending_puts = 0
+            self._thread = None
+        self.loop = loop
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._consumers = [loop.create_task(self._consume()) for _ in range(self.consumers)]
+
+    def _ensure_background_loop(self) -> asyncio.AbstractEventLoop:
+        """No loop running in this thread: host the consumer on one long-lived background loop."""
+        if not self._bound():
+            loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=loop.run_forever, name="placement-queue", daemon=True)
+            self._thread.start()
+            asyncio.run_coroutine_threadsafe(self._start_on_loop(), loop).result()
+        return self.loop
+
+    async def _start_on_loop(self) -> None:
+        self._ensure_started(asyncio.get_running_loop())
+
+    # ------ producer side ------
+    def _on_full(self, meta: dict) -> bool:
+        """Apply drop/reject policy. Returns True if the item was handled (not to be queued)."""
+        if self.policy == "reject":
+            self.metrics["rejected"] += 1
+            raise PlacementRejected(f"placement queue full ({self.maxsize})")
+        if self.policy == "drop_err1" and self.overflow_cell:
+            self.metrics["dropped"] += 1
+            LOG.warning("Placement queue full; diverting '%s' to %s", meta.get("name"), self.overflow_cell)
+            _notify("placement_diverted", {"card": meta.get("name"), "cell": self.overflow_cell,
+                                           "reason": "divert:backpressure"})
+            # called on the queue's loop: the put waits for room, the producer does not
+            self._pending_puts += 1
+            self.loop.create_task(self._deferred_put(dict(meta, divert=self.overflow_cell)))
+            return True
+        return False
+
+    def _note_enqueued(self) -> None:
+        self.metrics["enqueued"] += 1
+        self.metrics["max_depth"] = max(self.metrics["max_depth"], self._queue.qsize())
+
+    async def submit(self, meta: dict) -> None:
+        """Async producer API; from a loop other than the consumer's it is forwarded there."""
+        if self._closing:
+            raise PlacementRejected("placement queue is draining")
+        running = asyncio.get_running_loop()
+        if self._bound() and self.loop is not running:
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self.submit(meta), self.loop))
+            return
+        self._ensure_started(running)
+        if self._queue.full() and self._on_full(meta):
+            return
+        await self._queue.put((time.perf_counter(), meta))
+        self._note_enqueued()
+
+    def submit_nowait(self, meta: dict) -> None:
+        """Sync producer API, usable with or without a running loop in the calling thread."""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is not None and (not self._bound() or self.loop is running):
+            # same loop: we cannot block it, so 'block' waits in a put task (FIFO among waiters)
+            if self._closing:
+                raise PlacementRejected("placement queue is draining")
+            self._ensure_started(running)
+            if self._queue.full() and self._on_full(meta):
+                return
+            if self._pending_puts == 0 and not self._queue.full():
+                self._queue.put_nowait((time.perf_counter(), meta))
+                self._note_enqueued()
+            else:
+                # keep FIFO behind cards already waiting for room
+                self._pending_puts += 1
+                running.create_task(self._deferred_put(meta))
+            return
+        loop = self._ensure_background_loop()
+        # blocks the calling thread for 'block'; raises PlacementRejected for 'reject'
+        asyncio.run_coroutine_threadsafe(self.submit(meta), loop).result()
+
+    async def _deferred_put(self, meta: dict) -> None:
+        try:
+            await self._queue.put((time.perf_counter(), meta))
+            self._note_enqueued()
+        finally:
+            self._pending_puts -= 1
+
+    # ------ consumer side ------
+    async def _consume(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            if self.window > 1 and self.window_handler is not None:
+                while len(batch) < self.window and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+            now = time.perf_counter()
+            for queued_at, _ in batch:
+                self.metrics["wait_s_total"] += now - queued_at
+            try:
+                if len(batch) > 1:
+                    await self.window_handler([meta for _, meta in batch])
+                else:
+                    await self.handler(batch[0][1])
+                self.metrics["processed"] += len(batch)
+            except Exception as exc:
+                self.metrics["failed"] += len(batch)
+                LOG.exception("placement failed: %s", exc)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _settle(self) -> None:
+        # queued cards, then any put still waiting for room (block / drop_err1 overflow)
+        await self._queue.join()
+        while self._pending_puts:
+            await asyncio.sleep(0)
+            await self._queue.join()
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        """Stop accepting new cards, finish everything queued, then stop the consumers."""
+        self._closing = True
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._settle(), timeout)
+        finally:
+            for task in self._consumers:
+                task.cancel()
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """Sync drain for the background-loop mode (e.g. at process exit)."""
+        if self._thread is None or self.loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.drain(timeout), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        m = dict(self.metrics)
+        done = m["processed"] + m["failed"]
+        m.update({
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "maxsize": self.maxsize,
+            "policy": self.policy,
+            "avg_wait_s": round(m["wait_s_total"] / done, 4) if done else 0.0,
+        })
+        return m
+
+placement_queue = PlacementQueue(
+    _handle_card_coordinated_async if HEADS > 1 else _handle_card_identified_async,
+    maxsize=int(_RUN_CFG.get("queue_size", 8)),
+    policy=str(_RUN_CFG.get("backpressure", "block")),
+    # route windows plan one head's moves; with several heads the coordinator orders them
+    window=int(_RUN_CFG.get("route_window", 1)) if HEADS == 1 else 1,
+    window_handler=_handle_window_async,
+    overflow_cell=CFG.overflow_cells[0] if CFG.overflow_cells else None,
+    consumers=HEADS,
+)
+
+# sync wrapper for older callers: enqueues onto the bounded placement queue
 def on_card_identified(meta: dict):
     """
-    Backwards-compatible entrypoint: schedule the async handler on the event loop.
+    Backwards-compatible entrypoint: enqueue the card for the placement consumer(s).
+    Raises PlacementRejected when the queue is full and backpressure is 'reject'.
     """
-    try:
+    placement_queue.submit_nowait(meta)
+
+
+# ---------- Pipelined run loop ----------
+# capture -> [q] -> identify -> [q] -> assign -> [q] -> motion
+# Bounded queues let card N+1 be captured/identified/assigned while card N is being
+# transferred, so the gantry always has its next destination waiting.
+
+_END = object()
+
+@dataclass
+class StageStats:
+    name: str
+    items: int = 0
+    errors: int = 0
+    busy_s: float = 0.0       # doing work
+    starved_s: float = 0.0    # waiting for input from upstream
+    blocked_s: float = 0.0    # waiting for room downstream
+
+    def as_dict(self, wall_s: float) -> Dict[str, Any]:
+        return {
+            "items": self.items,
+            "errors": self.errors,
+            "busy_s": round(self.busy_s, 3),
+            "starved_s": round(self.starved_s, 3),
+            "blocked_s": round(self.blocked_s, 3),
+            "utilization": round(self.busy_s / wall_s, 3) if wall_s > 0 else 0.0,
+        }
+
+def identify_from_image(item: dict, profile: str = "default", rotation: int = 0) -> dict:
+    """
+    OCR item['image'] (ocr.OCR_PROFILES profile, rotated by `rotation` degrees) and identify
+    it against its game's catalog, returning run-loop meta (game, name, confidence, set_code,
+    collector_number). The game is item['game'], else detected from the card frame.
+    """
+    from services import ocr, card_id
+    game = item.get("game") or catalogs.detect(item["image"])[0]
+    cat = catalogs.get(game)
+    ocr_res = ocr.process_card_image(item["image"], game=cat.game, profile=profile, rotation=rotation,
+                                     vocab_path=cat.vocab_path)
+    region_texts = {k: v.get("text", "") for k, v in ocr_res.get("regions", {}).items()}
+    id_res = card_id.identify_card_from_ocr(region_texts, embeddings_dir=cat.embeddings_dir)
+    best = id_res.get("best") or {}
+    meta = {k: v for k, v in item.items() if k != "image"}
+    meta.update({
+        "game": cat.game,
+        "name": (best.get("name") or region_texts.get("name") or "").strip(),
+        "confidence": min(1.0, float(id_res.get("score", 0.0)) / 100.0),
+        "set_code": best.get("set") or best.get("set_code"),
+        "collector_number": best.get("collector_number") or best.get("collector"),
+    })
+    return meta
+
+# low-confidence cards are re-scanned (better OCR, rotation, image lookup) before they are
+# assigned, instead of going to ERR1 for a re-feed; config.yaml rescan: section
+rescan_cascade: Optional[RescanCascade] = rescan_from_cfg(_RAW_CFG, identify_from_image, CFG.low_conf_thresh)
+
+def identify_and_rescan(item: dict) -> dict:
+    """Default identify stage (CPU-bound, runs in an executor): identify, then the cascade."""
+    meta = identify_from_image(item)
+    if rescan_cascade is not None:
+        meta = rescan_cascade.rescue(item, meta)
+    return meta
+
+def rescan_stats() -> Dict[str, Any]:
+    return rescan_cascade.stats() if rescan_cascade is not None else {"enabled": False}
+
+class RunPipeline:
+    """
+    Staged run loop with bounded queues between capture, identify, assign and motion.
+
+    capture : async () -> item dict (e.g. {'image': ndarray, ...}) or None when the feed is empty
+    identify: sync item -> meta (see identify_and_rescan); run in an executor so it overlaps motion
+
+    A failing capture is retried with exponential backoff (capture_retry_s, doubling up to
+    capture_retry_max_s); after max_capture_failures failures in a row capture stops as if the
+    feed were empty, and the last error is reported in stats()["capture_error"].
+
+    Assignment reserves the destination count as soon as a card is assigned (not after the
+    transfer) so look-ahead cards see pending placements in capacity checks; a failed
+    transfer releases the reservation.
+    """
+
+    def __init__(self,
+                 capture: Callable[[], Awaitable[Optional[dict]]],
+                 identify: Callable[[dict], dict] = identify_and_rescan,
+                 controller: Optional[motion_svc.MotionController] = None,
+                 queue_size: int = 2,
+                 executor=None,
+                 capture_retry_s: float = 0.1,
+                 capture_retry_max_s: float = 2.0,
+                 max_capture_failures: int = 10):
+        self.capture = capture
+        self.identify = identify
+        self.controller = controller or motion_svc.get_controller()
+        self.queue_size = queue_size
+        self.executor = executor
+        self.capture_retry_s = capture_retry_s
+        self.capture_retry_max_s = capture_retry_max_s
+        self.max_capture_failures = max_capture_failures
+        self.capture_error: Optional[str] = None
+        self.stats_by_stage = {n: StageStats(n) for n in ("capture", "identify", "assign", "motion")}
+        self._stop = False
+        self._started = 0.0
+        self._finished: Optional[float] = None
+        self._queues = []
+
+    # ------ stage bodies ------
+    async def _identify(self, item: dict) -> dict:
         loop = asyncio.get_running_loop()
-        loop.create_task(_handle_card_identified_async(meta))
-    except RuntimeError:
-        # no running loop; start a new one briefly
-        asyncio.run(_handle_card_identified_async(meta))
+        return await loop.run_in_executor(self.executor, self.identify, item)
+
+    async def _assign(self, meta: dict) -> dict:
+        card = _card_from_meta(meta)
+        cell_id, reason = _route_assign(card)
+        try:
+            source = _pick_source_cell(meta, cell_id)
+        except Exception:
+            store.release(cell_id, card)
+            raise
+        return {"card": card, "to": cell_id, "reason": reason, "from": source}
+
+    async def _motion(self, job: dict) -> None:
+        card = job["card"]
+        LOG.info("Transferring card '%s' from %s -> %s (reason=%s)", card.name, job["from"], job["to"], job["reason"])
+        try:
+            await self.controller.transfer_card(job["from"], job["to"])
+        except Exception as e:
+            _release_source(job["from"])
+            store.release(job["to"], card)
+            LOG.error("Transfer failed: %s", e)
+            _notify("placement_failed", {"card": card.name, "from": job["from"], "to": job["to"], "error": str(e)})
+            raise
+        store.placed(job["to"], card)
+        _notify("placement", {"card": card.name, "cell": job["to"], "reason": job["reason"]})
+
+    # ------ stage runners ------
+    async def _put(self, stats: StageStats, outq: Optional[asyncio.Queue], item: Any) -> None:
+        if outq is None:
+            return
+        t0 = time.perf_counter()
+        await outq.put(item)
+        stats.blocked_s += time.perf_counter() - t0
+
+    async def _source(self, outq: asyncio.Queue) -> None:
+        stats = self.stats_by_stage["capture"]
+        failures = 0
+        while not self._stop:
+            t0 = time.perf_counter()
+            try:
+                item = await self.capture()
+            except Exception as exc:
+                stats.errors += 1
+                failures += 1
+                self.capture_error = str(exc)
+                if failures >= self.max_capture_failures:
+                    LOG.error("capture failed %d times in a row, stopping: %s", failures, exc)
+                    break
+                LOG.exception("capture failed: %s", exc)
+                # a dead camera must not spin the loop: back off before the next try
+                await asyncio.sleep(min(self.capture_retry_s * 2 ** (failures - 1), self.capture_retry_max_s))
+                continue
+            failures = 0
+            stats.busy_s += time.perf_counter() - t0
+            if item is None:
+                break
+            stats.items += 1
+            await self._put(stats, outq, item)
+        await outq.put(_END)
+
+    async def _stage(self, name: str, fn, inq: asyncio.Queue, outq: Optional[asyncio.Queue]) -> None:
+        stats = self.stats_by_stage[name]
+        while True:
+            t0 = time.perf_counter()
+            item = await inq.get()
+            t1 = time.perf_counter()
+            stats.starved_s += t1 - t0
+            if item is _END:
+                await self._put(stats, outq, _END)
+                return
+            try:
+                out = await fn(item)
+            except Exception as exc:
+                stats.errors += 1
+                stats.busy_s += time.perf_counter() - t1
+                LOG.warning("%s stage failed: %s", name, exc)
+                continue
+            stats.busy_s += time.perf_counter() - t1
+            stats.items += 1
+            await self._put(stats, outq, out)
+
+    # ------ control ------
+    async def run(self) -> Dict[str, Any]:
+        """Run until capture returns None (or stop() is called) and every stage drains."""
+        self._stop = False
+        self._started = time.perf_counter()
+        self._finished = None
+        self.capture_error = None
+        q_id, q_as, q_mo = (asyncio.Queue(maxsize=self.queue_size) for _ in range(3))
+        self._queues = [("identify", q_id), ("assign", q_as), ("motion", q_mo)]
+        await asyncio.gather(
+            self._source(q_id),
+            self._stage("identify", self._identify, q_id, q_as),
+            self._stage("assign", self._assign, q_as, q_mo),
+            self._stage("motion", self._motion, q_mo, None),
+        )
+        self._finished = time.perf_counter()
+        return self.stats()
+
+    def stop(self) -> None:
+        """Stop capturing; cards already in flight are still identified and placed."""
+        self._stop = True
+
+    def stats(self) -> Dict[str, Any]:
+        end = self._finished or time.perf_counter()
+        wall = end - self._started if self._started else 0.0
+        stages = {n: s.as_dict(wall) for n, s in self.stats_by_stage.items()}
+        placed = self.stats_by_stage["motion"].items
+        return {
+            "wall_s": round(wall, 3),
+            "placed": placed,
+            "cards_per_hour": round(3600.0 * placed / wall, 1) if wall > 0 else 0.0,
+            "queue_depths": {n: q.qsize() for n, q in self._queues},
+            "stages": stages,
+            # the stage with the highest busy fraction limits throughput
+            "bottleneck": max(stages, key=lambda n: stages[n]["utilization"]) if wall > 0 else None,
+            "rescan": rescan_stats(),
+            "capture_error": self.capture_error,
+        }
@@ -0,0 +1,230 @@
+"""
+Write-ahead log for cell counts and the per-card placement ledger.
+
+Provides:
+ - StateJournal(dir): append-only log of count changes with group commit and compaction
+     * append(rec) only queues the record (no I/O on the placement path); a background
+       thread writes everything queued, then fsyncs once per group (every group_commit_ms)
+     * flush() waits until everything appended so far is on disk
+     * recover() -> (counts, last_seq): latest snapshot + replay of the active log
+     * every compact_every records the flusher writes a snapshot and rotates the active log
+       to placements.<first>-<last>.log, which is kept as the placement ledger
+ - apply(counts, rec): how a record changes counts (shared by recovery and compaction)
+
+On-disk layout (default data/state/):
+    snapshot.json                  {"seq": N, "counts": {...}}  (atomic replace)
+    placements.log                 active log, one JSON record per line
+    placements.<a>-<b>.log         rotated segments (ledger history)
+
+Records: {"seq", "t", "op": add|release|placed|set|reset, "cell", "n", "card", "reason",
+"set", "number"}. "placed" (transfer finished) does not change counts; it orders the pile
+for the inventory index (services/inventory.py).
+A crash loses at most the last group (<= group_commit_ms) of records; a torn last line is
+ignored on recovery.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import logging
+import os
+import threading
+import time
+
+LOG = logging.getLogger("sort.journal")
+
+SNAPSHOT = "snapshot.json"
+ACTIVE = "placements.log"
+
+
+def apply(counts: Dict[str, int], rec: Dict[str, Any]) -> None:
+    op = rec.get("op")
+    if op == "reset":
+        for k in counts:
+            counts[k] = 0
+    elif op == "set":
+        counts[rec["cell"]] = max(0, int(rec["n"]))
+    elif op in ("add", "release"):
+        counts[rec["cell"]] = max(0, counts.get(rec["cell"], 0) + int(rec["n"]))
+
+
+class StateJournal:
+    def __init__(self,
+                 root: str = os.path.join("data", "state"),
+                 group_commit_ms: float = 5.0,
+                 compact_every: int = 5000,
+                 fsync: bool = True):
+        self.root = root
+        self.group_commit_s = max(0.0, group_commit_ms) / 1000.0
+        self.compact_every = max(1, int(compact_every))
+        self.fsync = fsync
+        os.makedirs(self.root, exist_ok=True)
+        self._cond = threading.Condition()
+        self._queue: List[Dict[str, Any]] = []
+        self._seq = 0
+        self._durable_seq = 0
+        self._closed = False
+        self._shadow: Dict[str, int] = {}   # counts as of _durable_seq, for snapshots
+        self._segment_first = 0              # first seq in the active log
+        self._since_snapshot = 0
+        self._fh = None
+        self._thread: Optional[threading.Thread] = None
+        self.stats_counters = {"records": 0, "groups": 0, "fsync_s_total": 0.0, "compactions": 0}
+
+    # ------ recovery ------
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def recover(self) -> Tuple[Dict[str, int], int]:
+        """Load snapshot + active log, open the log for appends and start the flusher."""
+        counts: Dict[str, int] = {}
+        seq = 0
+        snap = self._path(SNAPSHOT)
+        if os.path.exists(snap):
+            with open(snap, "r", encoding="utf8") as fh:
+                data = json.load(fh)
+            counts = {k: int(v) for k, v in data.get("counts", {}).items()}
+            seq = int(data.get("seq", 0))
+        snap_seq = seq
+        replayed = 0
+        log = self._path(ACTIVE)
+        if os.path.exists(log):
+            good = 0
+            with open(log, "rb") as fh:
+                for raw in fh:
+                    if not raw.endswith(b"\n"):
+                        break   # torn tail from a crash mid-write
+                    try:
+                        rec = json.loads(raw)
+                    except ValueError:
+                        break
+                    good += len(raw)
+                    if int(rec["seq"]) <= seq:
+                        continue    # already in the snapshot (crash between snapshot and rotate)
+                    apply(counts, rec)
+                    seq = int(rec["seq"])
+                    replayed += 1
+            with open(log, "rb+") as fh:
+                fh.truncate(good)
+        self._seq = self._durable_seq = seq
+        self._shadow = dict(counts)
+        self._segment_first = snap_seq + 1
+        self._since_snapshot = replayed
+        self._fh = open(log, "a", encoding="utf8")
+        self._thread = threading.Thread(target=self._flusher, name="state-journal", daemon=True)
+        self._thread.start()
+        LOG.info("Recovered cell counts at seq %d (snapshot %d + %d log records)", seq, snap_seq, replayed)
+        return counts, seq
+
+    # ------ append path ------
+    def append(self, rec: Dict[str, Any]) -> int:
+        """Queue one record; returns its sequence number. Callers serialize (CellStore lock)."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("journal closed")
+            self._seq += 1
+            rec = dict(rec, seq=self._seq, t=round(time.time(), 3))
+            self._queue.append(rec)
+            self._cond.notify_all()
+            return self._seq
+
+    def flush(self, timeout: Optional[float] = 5.0) -> bool:
+        """Block until every record appended so far is durable."""
+        with self._cond:
+            target = self._seq
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._durable_seq >= target or self._closed, timeout)
+
+    # ------ flusher ------
+    def _flusher(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._closed)
+                if not self._queue and self._closed:
+                    return
+            # let a group form: records arriving in the next few ms share one fsync
+            if self.group_commit_s:
+                time.sleep(self.group_commit_s)
+            with self._cond:
+                batch, self._queue = self._queue, []
+            if not batch:
+                continue
+            self._fh.write("".join(json.dumps(r, separators=(",", ":")) + "\n" for r in batch))
+            self._fh.flush()
+            t0 = time.perf_counter()
+            if self.fsync:
+                os.fsync(self._fh.fileno())
+            fsync_s = time.perf_counter() - t0
+            for r in batch:
+                apply(self._shadow, r)
+            self._since_snapshot += len(batch)
+            with self._cond:
+                self._durable_seq = batch[-1]["seq"]
+                c = self.stats_counters
+                c["records"] += len(batch)
+                c["groups"] += 1
+                c["fsync_s_total"] += fsync_s
+                self._cond.notify_all()
+            if self._since_snapshot >= self.compact_every:
+                self._compact()
+
+    def _compact(self) -> None:
+        """Snapshot counts at _durable_seq, then rotate the active log into the ledger."""
+        seq = self._durable_seq
+        snap = self._path(SNAPSHOT)
+        tmp = snap + ".tmp"
+        with open(tmp, "w", encoding="utf8") as fh:
+            json.dump({"seq": seq, "counts": self._shadow}, fh)
+            fh.flush()
+            if self.fsync:
+                os.fsync(fh.fileno())
+        os.replace(tmp, snap)
+        self._fh.close()
+        os.replace(self._path(ACTIVE), self._path(f"placements.{self._segment_first}-{seq}.log"))
+        self._fh = open(self._path(ACTIVE), "a", encoding="utf8")
+        self._segment_first = seq + 1
+        self._since_snapshot = 0
+        self.stats_counters["compactions"] += 1
+        LOG.info("Compacted cell-count journal at seq %d", seq)
+
+    # ------ lifecycle / metrics ------
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        if self._thread is None:
+            return
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self._thread = None
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            c = dict(self.stats_counters)
+            c.update({
+                "seq": self._seq,
+                "durable_seq": self._durable_seq,
+                "queued": len(self._queue),
+                "since_snapshot": self._since_snapshot,
+            })
+        c["avg_group"] = round(c["records"] / c["groups"], 2) if c["groups"] else 0.0
+        c["avg_fsync_ms"] = round(1000.0 * c["fsync_s_total"] / c["groups"], 3) if c["groups"] else 0.0
+        return c
+
+
+def iter_ledger(root: str = os.path.join("data", "state")):
+    """Yield every placement record, oldest first (rotated segments, then the active log)."""
+    segments = []
+    for name in os.listdir(root):
+        if name.startswith("placements.") and name.endswith(".log") and name != ACTIVE:
+            first = name[len("placements."):-len(".log")].split("-")[0]
+            segments.append((int(first), name))
+    for _, name in sorted(segments) + [(0, ACTIVE)]:
+        path = os.path.join(root, name)
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf8") as fh:
+            for line in fh:
+                if line.endswith("\n"):
+                    yield json.loads(line)
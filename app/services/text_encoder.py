@@ -0,0 +1,194 @@
+"""
+Query text encoders for embedding-based card lookup.
+
+Provides:
+ - load_encoder(backend, model_name, model_dir, min_agreement): returns an object with
+   encode(texts, convert_to_numpy=True) -> np.ndarray (same call shape as SentenceTransformer)
+ - backends:
+     'fp32' : sentence-transformers model at full precision (reference)
+     'int8' : the same model with torch dynamic int8 quantization of all Linear layers
+     'onnx' : exported ONNX graph run with onnxruntime + tokenizers (no torch import)
+ - top1_agreement(): fraction of queries whose nearest indexed card is unchanged vs fp32
+
+Quantized/ONNX artifacts are produced by export_encoder.py, which also writes
+encoder_meta.json with the measured agreement, the model it was exported from and the
+embedding width. A backend whose recorded agreement is below min_agreement, that has never
+been checked, or that was exported from another model / to another width is refused and
+fp32 is used instead.
+"""
+from typing import Any, Dict, List, Optional, Sequence
+import json
+import logging
+import os
+
+import numpy as np
+
+LOG = logging.getLogger("sort.encoder")
+
+BACKENDS = ("fp32", "int8", "onnx")
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+META_FILE = "encoder_meta.json"
+INT8_FILE = "model_int8.pt"
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_int8.onnx"
+
+
+class SentenceTransformerEncoder:
+    """fp32 / int8 backend wrapping a sentence-transformers model."""
+
+    def __init__(self, model: Any, backend: str = "fp32"):
+        self.model = model
+        self.backend = backend
+
+    def encode(self, texts: Sequence[str], convert_to_numpy: bool = True, **kwargs) -> np.ndarray:
+        return self.model.encode(list(texts), convert_to_numpy=True, **kwargs)
+
+
+class OnnxEncoder:
+    """
+    onnxruntime backend. Reproduces the sentence-transformers pipeline for
+    all-MiniLM-L6-v2: tokenize -> transformer -> mean pooling -> L2 normalize.
+    """
+
+    def __init__(self, model_path: str, tokenizer_path: str, max_length: int = 256):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        self.backend = "onnx"
+
+    def encode(self, texts: Sequence[str], convert_to_numpy: bool = True, **kwargs) -> np.ndarray:
+        encs = self.tokenizer.encode_batch(list(texts))
+        ids = np.asarray([e.ids for e in encs], dtype=np.int64)
+        mask = np.asarray([e.attention_mask for e in encs], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.asarray([e.type_ids for e in encs], dtype=np.int64)
+        hidden = self.session.run(None, feeds)[0]
+        # mean pooling over non-padding tokens
+        m = mask[..., None].astype(np.float32)
+        pooled = (hidden * m).sum(axis=1) / np.clip(m.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+
+# ------ loaders ------
+
+def _load_fp32(model_name: str) -> SentenceTransformerEncoder:
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformerEncoder(SentenceTransformer(model_name), backend="fp32")
+
+
+def quantize_int8(model: Any) -> Any:
+    """Apply torch dynamic int8 quantization to every nn.Linear of a SentenceTransformer."""
+    import torch
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _load_int8(model_name: str, model_dir: Optional[str]) -> SentenceTransformerEncoder:
+    import torch
+    path = os.path.join(model_dir, INT8_FILE) if model_dir else None
+    if path and os.path.exists(path):
+        model = torch.load(path, weights_only=False)
+    else:
+        # quantizing on load is cheap (a second or two); the exported file only saves that step
+        from sentence_transformers import SentenceTransformer
+        model = quantize_int8(SentenceTransformer(model_name))
+    return SentenceTransformerEncoder(model, backend="int8")
+
+
+def _load_onnx(model_dir: str) -> OnnxEncoder:
+    model_path = os.path.join(model_dir, ONNX_INT8_FILE)
+    if not os.path.exists(model_path):
+        model_path = os.path.join(model_dir, ONNX_FILE)
+    return OnnxEncoder(model_path, os.path.join(model_dir, "tokenizer.json"))
+
+
+def read_meta(model_dir: Optional[str]) -> Dict[str, Any]:
+    if not model_dir:
+        return {}
+    path = os.path.join(model_dir, META_FILE)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf8") as fh:
+            return json.load(fh)
+    except Exception:
+        return {}
+
+
+def _agreement_ok(backend: str, model_dir: Optional[str], min_agreement: float,
+                  model_name: str = DEFAULT_MODEL, dim: Optional[int] = None) -> bool:
+    meta = read_meta(model_dir)
+    check = meta.get("backends", {}).get(backend, {})
+    agreement = check.get("agreement")
+    if agreement is None:
+        LOG.warning("Encoder backend %s has no recorded agreement check in %s; run export_encoder.py", backend, model_dir)
+        return False
+    # the agreement only vouches for the model it was measured against
+    if check.get("model") != model_name:
+        LOG.warning("Encoder backend %s in %s was exported from %s, not %s", backend, model_dir,
+                    check.get("model"), model_name)
+        return False
+    expected = dim if dim is not None else check.get("reference_dim")
+    if check.get("dim") is None or expected is None or int(check["dim"]) != int(expected):
+        LOG.warning("Encoder backend %s in %s encodes to %s dims, expected %s", backend, model_dir,
+                    check.get("dim"), expected)
+        return False
+    if float(agreement) < min_agreement:
+        LOG.warning("Encoder backend %s top-1 agreement %.4f < %.4f", backend, float(agreement), min_agreement)
+        return False
+    return True
+
+
+def load_encoder(backend: str = "fp32",
+                 model_name: str = DEFAULT_MODEL,
+                 model_dir: Optional[str] = None,
+                 min_agreement: float = 0.98,
+                 dim: Optional[int] = None) -> Any:
+    """
+    Load the query encoder for the requested backend.
+    Non-fp32 backends are only used if they were exported from model_name (to dim dims,
+    when given) and their recorded top-1 agreement with the fp32 model is >= min_agreement;
+    otherwise (or on any load error) fall back to fp32.
+    """
+    backend = (backend or "fp32").lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown encoder backend '{backend}' (expected one of {BACKENDS})")
+    if backend != "fp32" and _agreement_ok(backend, model_dir, min_agreement, model_name, dim):
+        try:
+            enc = _load_int8(model_name, model_dir) if backend == "int8" else _load_onnx(model_dir)
+            LOG.info("Loaded %s query encoder from %s", backend, model_dir)
+            return enc
+        except Exception as exc:
+            LOG.warning("Failed to load %s encoder (%s); falling back to fp32", backend, exc)
+    return _load_fp32(model_name)
+
+
+# ------ agreement check ------
+
+def top1_indices(queries: np.ndarray, index: np.ndarray, chunk: int = 256) -> np.ndarray:
+    """Brute-force L2 nearest neighbour (matches NearestNeighbors' default metric)."""
+    index = index.astype(np.float32)
+    sq = (index ** 2).sum(axis=1)
+    out: List[np.ndarray] = []
+    for i in range(0, len(queries), chunk):
+        q = queries[i:i + chunk].astype(np.float32)
+        d = sq[None, :] - 2.0 * q @ index.T
+        out.append(d.argmin(axis=1))
+    return np.concatenate(out) if out else np.zeros(0, dtype=np.int64)
+
+
+def top1_agreement(reference: Any, candidate: Any, texts: Sequence[str], index: np.ndarray) -> float:
+    """Fraction of texts for which candidate and reference encoders hit the same top-1 card."""
+    if not texts:
+        return 1.0
+    ref = top1_indices(np.asarray(reference.encode(texts, convert_to_numpy=True)), index)
+    cand = top1_indices(np.asarray(candidate.encode(texts, convert_to_numpy=True)), index)
+    return float((ref == cand).mean())
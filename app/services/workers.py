@@ -0,0 +1,246 @@
+"""
+Process-pool execution for the CPU-bound part of batch identification.
+
+Provides:
+ - get_pool(): lazily created ProcessPoolExecutor (size from SORTME_WORKERS, default = CPU count;
+   SORTME_WORKERS=0 runs inline on a thread instead)
+ - run_analysis(raw, db_path, ocr_only, game=None): awaitable that decodes, OCRs and identifies
+   one upload on the pool (against its game's catalog, detected when not given) and returns
+   the analysis dict
+ - utilization(): per-worker task counts and busy time since the pool was started
+ - encoder_stats(): query-encoder counters reported back by each process that identified cards
+ - catalog_stats(): game-catalog loads / evictions / frame detections, summed over this process
+   and every worker (each process has its own catalogs.CatalogRegistry)
+
+Each worker loads the card DB, the OCR correction vocabulary and the embedding index/encoder
+once (initializer + the per-process card_catalog, which all three read from, and card_id's
+NN index / encoder cache), so per-image calls only pay for the
+actual OCR and lookup. A worker identifies one image at a time, so query micro-batching
+(card_id / batching.py) is off in the pool: there is never a second query to share a forward
+pass with. Assignment is NOT done here: it depends on live counts and stays in the server
+process.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from concurrent.futures import Executor, ProcessPoolExecutor
+import asyncio
+import logging
+import os
+import threading
+import time
+
+LOG = logging.getLogger("sort.workers")
+
+EMBEDDINGS_DIR = os.path.join("data", "embeddings")
+
+# ------ worker-side state (one copy per process, in card_catalog) ------
+def _worker_card_db(path: Optional[str]) -> Optional[List[dict]]:
+    if not path:
+        return None
+    from . import card_catalog
+    return card_catalog.get_catalog(path).rows
+
+
+def _has_embeddings(directory: str = EMBEDDINGS_DIR) -> bool:
+    return (os.path.exists(os.path.join(directory, 'embeddings.npy'))
+            and os.path.exists(os.path.join(directory, 'cards_metadata.json')))
+
+
+def _init_worker(db_path: Optional[str]) -> None:
+    """Pool initializer: pay model/index load costs once per worker, not per image."""
+    from . import card_id
+    from .catalogs import get_registry
+    # one task at a time per worker: batching would only add its latency window to every query
+    card_id.set_query_batching(1)
+    try:
+        _worker_card_db(db_path)
+        # the default game's index + vocabulary; other games load on their first card
+        cat = get_registry().get(None)
+        if _has_embeddings(cat.embeddings_dir):
+            # first call fills card_id's embedding/encoder cache for this process
+            card_id.identify_card_from_ocr({'full': 'warmup'}, embeddings_dir=cat.embeddings_dir)
+        LOG.info("Worker %d ready", os.getpid())
+    except Exception as exc:
+        LOG.warning("Worker %d warmup failed: %s", os.getpid(), exc)
+
+
+def analyze_image(raw: bytes, db_path: Optional[str], ocr_only: bool = False,
+                  game: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Decode + OCR + identify a single uploaded image. Runs inside a pool worker.
+    Returns a plain dict (picklable) with the game, OCR regions and identification result.
+    game=None detects it from the card frame; the game's catalog (catalogs.py) supplies the
+    embedding index, OCR vocabulary and, without db_path, the card DB.
+    """
+    import cv2
+    import numpy as np
+    from . import card_id, ocr
+    from .catalogs import get_registry
+
+    if not raw:
+        raise ValueError("Empty file")
+    buffer = np.frombuffer(raw, dtype=np.uint8)
+    img = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Unsupported image format")
+
+    registry = get_registry()
+    game = registry.resolve(game) if game else registry.detect(img)[0]
+    cat = registry.get(game)
+    ocr_res = ocr.process_card_image(img, game=cat.game, vocab_path=cat.vocab_path)
+    regions = ocr_res.get("regions", {})
+    region_texts = {key: (val.get("text", "") if isinstance(val, dict) else "") for key, val in regions.items()}
+    out: Dict[str, Any] = {
+        "game": cat.game,
+        "rotation": ocr_res.get("rotation_detected"),
+        "rotation_confidence": ocr_res.get("rotation_confidence"),
+        "regions": regions,
+        "region_texts": region_texts,
+    }
+    if ocr_only:
+        return out
+
+    # If a cards DB is available, run identification. If not, but precomputed embeddings exist,
+    # still run identification using the embeddings-only path.
+    cards_db = _worker_card_db(db_path or cat.spec.card_db)
+    has_embeddings = _has_embeddings(cat.embeddings_dir)
+    if cards_db or has_embeddings:
+        identify_res = card_id.identify_card_from_ocr(
+            region_texts,
+            cards_list=cards_db if cards_db else None,
+            embeddings_dir=cat.embeddings_dir if has_embeddings else None,
+        )
+    else:
+        identify_res = {}
+    out["identify"] = identify_res
+    return out
+
+
+def _timed_analyze(raw: bytes, db_path: Optional[str], ocr_only: bool,
+                   game: Optional[str] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    from . import card_id
+    from .catalogs import get_registry
+    start = time.perf_counter()
+    try:
+        res = {"ok": analyze_image(raw, db_path, ocr_only, game)}
+    except Exception as exc:
+        res = {"error": str(exc)}
+    return res, {"pid": os.getpid(), "busy_s": time.perf_counter() - start,
+                 "encoder": card_id.encoder_stats(), "catalogs": get_registry().stats()}
+
+
+# ------ server-side pool management ------
+_POOL: Optional[Executor] = None
+_POOL_STARTED: float = 0.0
+_POOL_LOCK = threading.Lock()
+_UTIL: Dict[int, Dict[str, float]] = {}
+_ENCODER: Dict[int, Dict[str, Any]] = {}       # pid -> that process's latest card_id.encoder_stats()
+_CATALOGS: Dict[int, Dict[str, Any]] = {}      # pid -> that process's latest CatalogRegistry.stats()
+
+
+def pool_size() -> int:
+    env = os.environ.get("SORTME_WORKERS")
+    if env is not None:
+        return max(0, int(env))
+    return os.cpu_count() or 1
+
+
+def get_pool(db_path: Optional[str] = None) -> Optional[Executor]:
+    """Return the shared process pool, or None when running inline (SORTME_WORKERS=0)."""
+    global _POOL, _POOL_STARTED
+    size = pool_size()
+    if size == 0:
+        return None
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ProcessPoolExecutor(max_workers=size, initializer=_init_worker, initargs=(db_path,))
+            _POOL_STARTED = time.perf_counter()
+            LOG.info("Started identification pool with %d workers", size)
+        return _POOL
+
+
+def shutdown_pool() -> None:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=True, cancel_futures=True)
+            _POOL = None
+            _UTIL.clear()
+            _ENCODER.clear()
+            _CATALOGS.clear()
+
+
+def _record(util: Dict[int, Dict[str, float]], timing: Dict[str, Any]) -> None:
+    u = util.setdefault(timing["pid"], {"tasks": 0, "busy_s": 0.0})
+    u["tasks"] += 1
+    u["busy_s"] += timing["busy_s"]
+
+
+async def run_analysis(raw: bytes,
+                       db_path: Optional[str],
+                       ocr_only: bool = False,
+                       util: Optional[Dict[int, Dict[str, float]]] = None,
+                       game: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Run analyze_image on the pool (or a thread) without blocking the event loop.
+    util, if given, accumulates per-worker timings for the caller's own report.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_pool(db_path)
+    if pool is None:
+        res, timing = await asyncio.to_thread(_timed_analyze, raw, db_path, ocr_only, game)
+    else:
+        res, timing = await loop.run_in_executor(pool, _timed_analyze, raw, db_path, ocr_only, game)
+    _record(_UTIL, timing)
+    if timing.get("encoder"):
+        _ENCODER[timing["pid"]] = timing["encoder"]
+    if timing.get("catalogs"):
+        _CATALOGS[timing["pid"]] = timing["catalogs"]
+    if util is not None:
+        _record(util, timing)
+    if "error" in res:
+        raise RuntimeError(res["error"])
+    return res["ok"]
+
+
+def summarize_util(util: Dict[int, Dict[str, float]], wall: float) -> Dict[str, Any]:
+    return {
+        str(pid): {
+            "tasks": int(u["tasks"]),
+            "busy_s": round(u["busy_s"], 3),
+            "utilization": round(u["busy_s"] / wall, 3) if wall > 0 else None,
+        }
+        for pid, u in sorted(util.items())
+    }
+
+
+def utilization() -> Dict[str, Any]:
+    """Per-worker task counts and busy fraction since the pool was started."""
+    wall = (time.perf_counter() - _POOL_STARTED) if _POOL is not None else 0.0
+    return {"pool_size": pool_size(), "wall_s": round(wall, 3), "workers": summarize_util(_UTIL, wall)}
+
+
+def encoder_stats() -> Dict[str, Any]:
+    """Query encodes / forward passes summed over the processes that identified cards."""
+    procs = {str(pid): {k: e[k] for k in ("max_batch", "queries", "forward_passes", "avg_batch_size")}
+             for pid, e in sorted(_ENCODER.items())}
+    queries = sum(e["queries"] for e in _ENCODER.values())
+    passes = sum(e["forward_passes"] for e in _ENCODER.values())
+    return {
+        "queries": queries,
+        "forward_passes": passes,
+        "avg_batch_size": queries / passes if passes else 0.0,
+        "forward_s_total": round(sum(e["forward_s_total"] for e in _ENCODER.values()), 3),
+        "processes": procs,
+    }
+
+
+def catalog_stats() -> Dict[str, Any]:
+    """Catalog metrics summed over this process (its registry, live) and the pool's workers."""
+    from .catalogs import METRICS, get_registry
+    procs = dict(_CATALOGS)
+    procs[os.getpid()] = get_registry().stats()    # inline analyses and the run loop count here
+    return {
+        **{k: sum(p[k] for p in procs.values()) for k in METRICS},
+        "processes": {str(pid): {"loaded": p["loaded"], **{k: p[k] for k in METRICS}}
+                      for pid, p in sorted(procs.items())},
+    }
@@ -483,11 +483,28 @@ async function runDemoBatchTest(){
   form.append('use_filename_expected', demoFilenameExpect?.checked ? 'true' : 'false');
 
   try{
-    // Use api() wrapper so demo mode is honored (demoApi will handle the simulated response)
-    const data = await api('/demo/batch_identify', {method:'POST', body: form});
-    renderDemoBatchResults(data);
+    if(demo){
+      // Use api() wrapper so demo mode is honored (demoApi will handle the simulated response)
+      const data = await api('/demo/batch_identify', {method:'POST', body: form});
+      renderDemoBatchResults(data);
+    }else{
+      // Stream results so rows appear as each image finishes instead of after the whole batch
+      resetDemoBatchTable();
+      let total = files.length, done = 0;
+      await streamDemoBatch(form, (ev)=>{
+        if(ev.event === 'start'){ total = ev.total || total; }
+        else if(ev.event === 'result'){
+          done = ev.done || done+1;
+          appendDemoBatchRow(ev.result);
+          show(demoBatchWrap);
+          demoBatchSummary.textContent = `Processing… ${done}/${total} image${total===1?'':'s'} done.`;
+        }
+        else if(ev.event === 'summary'){ renderDemoBatchSummary(ev.summary || {}, done); }
+      });
+    }
     toast('Batch test complete');
   }catch(err){
+    if(demoBatchSummary) demoBatchSummary.textContent = `Batch test failed: ${err.message}`;
     toast(`Batch test failed: ${err.message}`);
   }finally{
     if(btn){
@@ -497,85 +514,126 @@ async function runDemoBatchTest(){
   }
 }
 
-function renderDemoBatchResults(payload){
-  if(!demoBatchTableBody || !demoBatchSummary || !demoBatchWrap){
-    console.warn('Batch tester elements missing');
-    return;
+async function streamDemoBatch(form, onEvent){
+  const r = await fetch(`${BASE}/demo/batch_identify_stream`, {method:'POST', body: form});
+  if(!r.ok){
+    const text = await r.text().catch(()=> "");
+    throw new Error(`${r.status} ${r.statusText} ${text}`.trim());
   }
-  demoBatchTableBody.innerHTML = '';
-  const rows = payload?.results || [];
-  if(rows.length === 0){
-    demoBatchSummary.textContent = 'No results returned.';
-    hide(demoBatchWrap);
-    return;
+  // NDJSON: one event object per line
+  const reader = r.body.getReader();
+  const decoder = new TextDecoder();
+  let buf = '';
+  let summarized = false;
+  const emit = (ev)=>{ if(ev.event === 'summary') summarized = true; onEvent(ev); };
+  for(;;){
+    const {value, done} = await reader.read();
+    if(done) break;
+    buf += decoder.decode(value, {stream:true});
+    let nl;
+    while((nl = buf.indexOf('\n')) >= 0){
+      const line = buf.slice(0, nl).trim();
+      buf = buf.slice(nl+1);
+      if(line) emit(JSON.parse(line));
+    }
   }
+  if(buf.trim()) emit(JSON.parse(buf));
+  // the server closes the stream after the summary; ending without one means the batch was cut short
+  if(!summarized) throw new Error('stream ended before the batch summary');
+}
 
-  const summary = payload?.summary || {};
-  const total = summary.total || rows.length;
+function resetDemoBatchTable(){
+  if(demoBatchTableBody) demoBatchTableBody.innerHTML = '';
+  if(demoBatchSummary) demoBatchSummary.textContent = '';
+}
+
+function renderDemoBatchSummary(summary, count){
+  const total = summary.total || count;
   const matchName = summary.name_matches ?? '-';
   const matchCell = summary.cell_matches ?? '-';
   const matchBoth = summary.both_matches ?? '-';
   const dbInfo = summary.db_path ? ` • DB: ${summary.db_path}` : '';
-  demoBatchSummary.textContent = `Processed ${total} image${total===1?'':'s'}. Name matches: ${matchName}/${total}, Cell matches: ${matchCell}/${total}, Both: ${matchBoth}/${total}${dbInfo}`;
+  const timeInfo = typeof summary.elapsed_s === 'number' ? ` • ${summary.elapsed_s.toFixed(1)}s` : '';
+  demoBatchSummary.textContent = `Processed ${total} image${total===1?'':'s'}. Name matches: ${matchName}/${total}, Cell matches: ${matchCell}/${total}, Both: ${matchBoth}/${total}${dbInfo}${timeInfo}`;
+}
 
+function appendDemoBatchRow(row){
   const createCell = (text)=>{
     const td = document.createElement('td');
     td.textContent = text ?? '—';
     return td;
   };
 
-  rows.forEach((row, idx)=>{
-    const tr = document.createElement('tr');
-    if(row.error){
-      tr.classList.add('error-row');
-    }else if(row.match_name && row.match_cell){
-      tr.classList.add('match-row');
-    }else if(row.match_name || row.match_cell){
-      tr.classList.add('partial-row');
-    }else{
-      tr.classList.add('mismatch-row');
-    }
+  const tr = document.createElement('tr');
+  if(row.error){
+    tr.classList.add('error-row');
+  }else if(row.match_name && row.match_cell){
+    tr.classList.add('match-row');
+  }else if(row.match_name || row.match_cell){
+    tr.classList.add('partial-row');
+  }else{
+    tr.classList.add('mismatch-row');
+  }
 
-    const expectedName = row?.expected?.name || '—';
-    const expectedCell = row?.expected?.cell || '—';
-    const ocrName = row?.region_texts?.name || '—';
-    const identified = row?.identified_name || '—';
-    const cell = row?.assignment?.cell || '—';
-    const reason = row?.error || row?.assignment?.reason || '';
-    const idScore = typeof row?.id_score === 'number' ? row.id_score.toFixed(1) : '—';
-    let matchLabel = '—';
-    if(row.error){
-      matchLabel = 'Error';
-    }else if(row.match_name && row.match_cell){
-      matchLabel = '✓ Name & Cell';
-    }else if(row.match_name){
-      matchLabel = 'Name only';
-    }else if(row.match_cell){
-      matchLabel = 'Cell only';
-    }else{
-      matchLabel = 'No match';
-    }
+  const expectedName = row?.expected?.name || '—';
+  const expectedCell = row?.expected?.cell || '—';
+  const ocrName = row?.region_texts?.name || '—';
+  const identified = row?.identified_name || '—';
+  const cell = row?.assignment?.cell || '—';
+  const reason = row?.error || row?.assignment?.reason || '';
+  const idScore = typeof row?.id_score === 'number' ? row.id_score.toFixed(1) : '—';
+  let matchLabel = '—';
+  if(row.error){
+    matchLabel = 'Error';
+  }else if(row.match_name && row.match_cell){
+    matchLabel = '✓ Name & Cell';
+  }else if(row.match_name){
+    matchLabel = 'Name only';
+  }else if(row.match_cell){
+    matchLabel = 'Cell only';
+  }else{
+    matchLabel = 'No match';
+  }
 
-    tr.appendChild(createCell(idx+1));
-    tr.appendChild(createCell(row.filename || '—'));
-    tr.appendChild(createCell(expectedName));
-    tr.appendChild(createCell(ocrName));
-    tr.appendChild(createCell(identified));
-    tr.appendChild(createCell(cell));
-    tr.appendChild(createCell(expectedCell));
-    tr.appendChild(createCell(matchLabel));
-    tr.appendChild(createCell(idScore));
-    tr.appendChild(createCell(reason));
-
-    if(row?.ocr){
-      const rot = row.ocr.rotation ?? 0;
-      const rotConf = row.ocr.rotation_confidence ?? 0;
-      tr.title = `Rotation: ${rot}° (conf ${rotConf.toFixed ? rotConf.toFixed(2) : rotConf})`;
-    }
+  const index = row.index ?? (demoBatchTableBody.children.length + 1);
+  tr.dataset.index = index;
+  tr.appendChild(createCell(index));
+  tr.appendChild(createCell(row.filename || '—'));
+  tr.appendChild(createCell(expectedName));
+  tr.appendChild(createCell(ocrName));
+  tr.appendChild(createCell(identified));
+  tr.appendChild(createCell(cell));
+  tr.appendChild(createCell(expectedCell));
+  tr.appendChild(createCell(matchLabel));
+  tr.appendChild(createCell(idScore));
+  tr.appendChild(createCell(reason));
+
+  if(row?.ocr){
+    const rot = row.ocr.rotation ?? 0;
+    const rotConf = row.ocr.rotation_confidence ?? 0;
+    tr.title = `Rotation: ${rot}° (conf ${rotConf.toFixed ? rotConf.toFixed(2) : rotConf})`;
+  }
 
-    demoBatchTableBody.appendChild(tr);
-  });
+  // streamed rows arrive in completion order; keep the table in upload order
+  const after = Array.from(demoBatchTableBody.children).find(el => Number(el.dataset.index) > index);
+  demoBatchTableBody.insertBefore(tr, after || null);
+}
+
+function renderDemoBatchResults(payload){
+  if(!demoBatchTableBody || !demoBatchSummary || !demoBatchWrap){
+    console.warn('Batch tester elements missing');
+    return;
+  }
+  demoBatchTableBody.innerHTML = '';
+  const rows = payload?.results || [];
+  if(rows.length === 0){
+    demoBatchSummary.textContent = 'No results returned.';
+    hide(demoBatchWrap);
+    return;
+  }
 
+  renderDemoBatchSummary(payload?.summary || {}, rows.length);
+  rows.forEach(appendDemoBatchRow);
   show(demoBatchWrap);
 }
 
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+bench_cycle.py
+
+Sorter cycle-time benchmark: replay N synthetic cards through assign_card and the
+MotionController on the kinematic simulator (services/kinematics.py) and report
+
+ - throughput (cards/hour) and mean cycle time per card
+ - per-phase time breakdown (pick / travel / place, from the motion plans)
+ - axis utilization, which axis limited the moves, actuator and dwell time
+
+By default it runs on virtual time (thousands of cards in a second or two). Axis limits and
+actuator latencies come from the `simulator:` section of config.yaml and can be overridden
+on the command line to see what a faster Z axis or vacuum would buy.
+
+Usage:
+  python bench_cycle.py --cards 1000
+  python bench_cycle.py --cards 500 --route-window 4 --json out.json
+  python bench_cycle.py --cards 300 --schedule-feeders
+  python bench_cycle.py --cards 300 --heads 2 --feeder-ends
+  python bench_cycle.py --z-vmax 300 --vacuum-on 0.03
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+from typing import Optional
+
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+
+from app.services.assign import load_config, SystemState, Card, assign_card
+from app.services import kinematics, route_plan
+from app.services.feeders import FeederScheduler
+from app.services.cell_store import CellStore
+from app.services.coordinator import Coordinator
+from app.services.motion import MotionController
+
+# rough English initial-letter frequencies, so piles fill unevenly like a real collection
+LETTER_WEIGHTS = {
+    "A": 6.0, "B": 5.5, "C": 6.5, "D": 4.5, "E": 3.0, "F": 4.0, "G": 4.0, "H": 3.5, "I": 2.0,
+    "J": 1.0, "K": 1.5, "L": 3.5, "M": 5.0, "N": 2.0, "O": 2.0, "P": 4.5, "Q": 0.3, "R": 4.5,
+    "S": 9.0, "T": 5.5, "U": 1.0, "V": 2.0, "W": 3.5, "X": 0.1, "Y": 0.5, "Z": 0.5,
+}
+
+
+def synthetic_cards(n: int, low_conf_rate: float, seed: int):
+    rng = random.Random(seed)
+    letters = list(LETTER_WEIGHTS)
+    weights = [LETTER_WEIGHTS[l] for l in letters]
+    for i in range(n):
+        first = rng.choices(letters, weights)[0]
+        conf = rng.uniform(0.3, 0.79) if rng.random() < low_conf_rate else rng.uniform(0.85, 1.0)
+        yield Card(game="mtg", name=f"{first}card {i}", confidence=conf)
+
+
+def build_driver(raw_cfg: dict, args, time_scale: Optional[float] = None) -> kinematics.KinematicDriver:
+    """time_scale given: scaled real clock (needed for concurrent heads); else virtual unless --real-time."""
+    sim = dict(raw_cfg.get("simulator") or {})
+    axes = {a: dict(v) for a, v in (sim.get("axes") or {}).items()}
+    for a in kinematics.AXES:
+        for key in ("vmax", "accel"):
+            val = getattr(args, f"{a}_{key}")
+            if val is not None:
+                axes.setdefault(a, {})[key] = val
+    actuators = dict(sim.get("actuators") or {})
+    for op in kinematics.DEFAULT_ACTUATORS:
+        val = getattr(args, op)
+        if val is not None:
+            actuators[op] = val
+    sim.update({"axes": axes, "actuators": actuators})
+    if time_scale is not None:
+        return kinematics.KinematicDriver.from_cfg(sim, virtual_time=False, time_scale=time_scale)
+    return kinematics.KinematicDriver.from_cfg(sim, virtual_time=not args.real_time)
+
+
+def build_cells(raw_cfg: dict, cfg, feeder_ends: bool = False) -> dict:
+    pitch = (raw_cfg.get("simulator") or {}).get("pitch_mm") or {}
+    layout = kinematics.cell_layout(raw_cfg, cfg.cells.keys())
+    if feeder_ends and cfg.feeder_re:
+        # two-ended intake: every other feeder moves to the far end of the rail
+        far = max(p["x"] for p in layout.values()) + float(pitch.get("x", 90.0))
+        feeders = [cid for cid in cfg.cells if cfg.feeder_re.search(cid)]
+        for cid in feeders[1::2]:
+            layout[cid] = dict(layout[cid], x=far)
+    return layout
+
+
+async def run(args) -> dict:
+    with open(args.config, "r", encoding="utf8") as fh:
+        raw_cfg = yaml.safe_load(fh)
+    cfg = load_config(raw_cfg)
+    state = SystemState(counts_by_cell={cid: 0 for cid in cfg.cells})
+    feeders = [cid for cid in cfg.cells if cfg.feeder_re and cfg.feeder_re.search(cid)] or [next(iter(cfg.cells))]
+
+    driver = build_driver(raw_cfg, args)
+    ctrl = MotionController(driver=driver)
+    ctrl.configure_cells(build_cells(raw_cfg, cfg))
+    ctrl.default_speed = args.feed
+
+    scheduler = FeederScheduler.from_cfg(cfg) if args.schedule_feeders and cfg.feeder_re else None
+    phases: dict = {}
+    assign_s = 0.0
+    reasons: dict = {}
+    cycles = []
+    window = []
+
+    async def flush():
+        if args.route_window > 1:
+            planned = route_plan.plan_window(window, ctrl.cells, feeders, {f: len(window) for f in feeders},
+                                             ctrl.current, ctrl.default_speed, driver)
+            order = [(pt.from_cell, pt.transfer.to_cell) for pt in planned["order"]]
+        elif scheduler is not None:
+            order = [(scheduler.next_source(t.to_cell, ctrl), t.to_cell) for t in window]
+        else:
+            # one at a time, always the first feeder
+            order = [(feeders[0], t.to_cell) for t in window]
+        for from_cell, to_cell in order:
+            res = await ctrl.transfer_card(from_cell, to_cell)
+            cycles.append(res["duration_s"])
+            for ph, s in res["phases"].items():
+                phases[ph] = phases.get(ph, 0.0) + s
+        window.clear()
+
+    driver.reset_stats()
+    t_start = driver.clock()
+    for card in synthetic_cards(args.cards, args.low_conf_rate, args.seed):
+        t0 = time.perf_counter()
+        cell_id, reason = assign_card(card, cfg, state)
+        assign_s += time.perf_counter() - t0
+        state.counts_by_cell[cell_id] = state.counts_by_cell.get(cell_id, 0) + 1
+        kind = reason.split(":", 1)[0]
+        reasons[kind] = reasons.get(kind, 0) + 1
+        window.append(route_plan.Transfer(cell_id))
+        if len(window) >= args.route_window:
+            await flush()
+    if window:
+        await flush()
+    elapsed = driver.clock() - t_start
+
+    util = driver.utilization()
+    s = driver.stats
+    n = len(cycles)
+    return {
+        "cards": n,
+        "virtual_time": not args.real_time,
+        "route_window": args.route_window,
+        "feed_mm_s": args.feed,
+        "elapsed_s": round(elapsed, 3),
+        "cards_per_hour": round(3600.0 * n / elapsed, 1) if elapsed > 0 else None,
+        "cycle_s": {
+            "mean": round(sum(cycles) / n, 4) if n else None,
+            "min": round(min(cycles), 4) if n else None,
+            "max": round(max(cycles), 4) if n else None,
+        },
+        "phases_s": {ph: round(v, 3) for ph, v in sorted(phases.items())},
+        "phases_share": {ph: round(v / elapsed, 3) for ph, v in sorted(phases.items())} if elapsed > 0 else {},
+        "axis_utilization": {a: round(u, 3) for a, u in util["axes"].items()},
+        "axis_limiting_moves": s["axis_limiting"],
+        "axis_travel_m": {a: round(v / 1000.0, 2) for a, v in s["axis_travel_mm"].items()},
+        "moves": s["moves"],
+        "move_s": round(s["move_s"], 3),
+        "actuator_s": round(s["actuator_s"], 3),
+        "actuations": s["actuations"],
+        "assign_ms_per_card": round(1000.0 * assign_s / max(1, n), 4),
+        "assign_reasons": reasons,
+    }
+
+
+async def run_heads(args) -> dict:
+    """
+    Several heads on one grid through services/coordinator (scaled real time: heads run
+    concurrently; virtual time when the coordinator keeps a single head active).
+    """
+    with open(args.config, "r", encoding="utf8") as fh:
+        raw_cfg = yaml.safe_load(fh)
+    cfg = load_config(raw_cfg)
+    cells = build_cells(raw_cfg, cfg, args.feeder_ends)
+    heads = []
+    for _ in range(args.heads):
+        ctrl = MotionController(driver=build_driver(raw_cfg, args, time_scale=args.time_scale))
+        ctrl.configure_cells(cells)
+        ctrl.default_speed = args.feed
+        heads.append(ctrl)
+    feeders = FeederScheduler.from_cfg(cfg, initial={}) if cfg.feeder_re else None
+    if feeders is not None:
+        # the benchmark never runs out of cards
+        for f in feeders.feeders.values():
+            f.capacity = f.remaining = args.cards
+    coord = Coordinator(heads, cfg, CellStore(cfg.cells.keys()), feeders, clearance=args.clearance,
+                        partition=not args.no_partition)
+    time_scale: Optional[float] = args.time_scale
+    if len(coord.active) == 1 and not args.real_time:
+        # one working head (feeders on one side only): motion is serial, so every head can run
+        # on one virtual clock and the result is comparable with the single-head benchmark
+        clock = kinematics.VirtualClock()
+        for c in heads:
+            c.driver.virtual = clock
+            c.driver.reset_stats()
+        time_scale = None
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for card in synthetic_cards(args.cards, args.low_conf_rate, args.seed):
+        queue.put_nowait(card)
+    queue.put_nowait(None)
+    t_start = heads[coord.active[0]].driver.clock()
+    await coord.serve(queue)
+    elapsed = heads[coord.active[0]].driver.clock() - t_start
+
+    st = coord.stats()
+    n = sum(h["transfers"] for h in st["heads"])
+    return {
+        "cards": n,
+        "heads": args.heads,
+        "time_scale": time_scale,
+        "active_heads": list(coord.active),
+        "elapsed_s": round(elapsed, 3),
+        "cards_per_hour": round(3600.0 * n / elapsed, 1) if elapsed > 0 else None,
+        "per_head": [
+            {
+                "transfers": h["transfers"],
+                "failures": h["failures"],
+                # coordinator timings are in driver (simulated) seconds
+                "busy_share": round(h["busy_s"] / elapsed, 3) if elapsed > 0 else None,
+                "zone_wait_s": round(h["zone_wait_s"], 3),
+                "parks": h["parks"],
+                "axis_utilization": {a: round(u, 3) for a, u in c.driver.utilization()["axes"].items()},
+            }
+            for h, c in zip(st["heads"], heads)
+        ],
+    }
+
+
+def print_heads_report(rep: dict) -> None:
+    clock = f"time scale {rep['time_scale']}" if rep["time_scale"] else "virtual"
+    print(f"cards: {rep['cards']}  heads: {rep['heads']} (active {rep['active_heads']})"
+          f"  elapsed: {rep['elapsed_s']:.1f}s ({clock})")
+    print(f"throughput: {rep['cards_per_hour']} cards/h")
+    for i, h in enumerate(rep["per_head"]):
+        util = " ".join(f"{a}={100 * u:.0f}%" for a, u in h["axis_utilization"].items())
+        print(f"  head {i}: {h['transfers']} transfers  busy {100 * (h['busy_share'] or 0):.0f}%"
+              f"  zone wait {h['zone_wait_s']:.1f}s  parks {h['parks']}  axes {util}")
+
+
+def print_report(rep: dict) -> None:
+    print(f"cards: {rep['cards']}  elapsed: {rep['elapsed_s']:.1f}s ({'virtual' if rep['virtual_time'] else 'real'})"
+          f"  route window: {rep['route_window']}")
+    print(f"throughput: {rep['cards_per_hour']} cards/h   mean cycle: {rep['cycle_s']['mean']}s")
+    print("phases:")
+    for ph, v in rep["phases_s"].items():
+        print(f"  {ph:<8} {v:9.2f}s  {100 * rep['phases_share'].get(ph, 0):5.1f}%")
+    print("axes:")
+    for a, u in rep["axis_utilization"].items():
+        print(f"  {a}  utilization {100 * u:5.1f}%  limiting {rep['axis_limiting_moves'][a]:6d} moves"
+              f"  travel {rep['axis_travel_m'][a]:.1f} m")
+    print(f"actuators: {rep['actuator_s']:.2f}s over {sum(rep['actuations'].values())} actuations")
+    print(f"assign: {rep['assign_ms_per_card']} ms/card  {rep['assign_reasons']}")
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Replay synthetic cards through assignment + motion on the kinematic simulator")
+    p.add_argument("--config", default="config.yaml")
+    p.add_argument("--cards", type=int, default=500)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--low-conf-rate", type=float, default=0.05, help="share of cards below the confidence gate")
+    p.add_argument("--feed", type=float, default=400.0, help="path feed rate in mm/s (MotionController.default_speed)")
+    p.add_argument("--route-window", type=int, default=1, help="plan N transfers together (services/route_plan)")
+    p.add_argument("--schedule-feeders", action="store_true",
+                   help="one at a time, feeder chosen by services/feeders.FeederScheduler instead of the first")
+    p.add_argument("--heads", type=int, default=1, help="pick heads sharing the grid (services/coordinator)")
+    p.add_argument("--feeder-ends", action="store_true",
+                   help="with --heads > 1: put every other feeder at the far end of the rail")
+    p.add_argument("--no-partition", action="store_true",
+                   help="with --heads > 1: any free head takes any card (default: each head owns a slice of the rail;"
+                        " with feeders on one side only, a single head does the work)")
+    p.add_argument("--clearance", type=float, default=60.0, help="collision clearance between heads along X (mm)")
+    p.add_argument("--time-scale", type=float, default=0.02,
+                   help="with --heads > 1: real seconds slept per simulated second")
+    p.add_argument("--real-time", action="store_true", help="really sleep instead of using virtual time")
+    p.add_argument("--json", default=None, help="also write the report to this file")
+    for a in kinematics.AXES:
+        p.add_argument(f"--{a}-vmax", type=float, default=None)
+        p.add_argument(f"--{a}-accel", type=float, default=None)
+    for op in kinematics.DEFAULT_ACTUATORS:
+        p.add_argument(f"--{op.replace('_', '-')}", dest=op, type=float, default=None, help=f"{op} latency (s)")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    args.route_window = max(1, args.route_window)
+    logging.getLogger("sort").setLevel(logging.WARNING)
+    if args.heads > 1:
+        rep = asyncio.run(run_heads(args))
+        print_heads_report(rep)
+    else:
+        rep = asyncio.run(run(args))
+        print_report(rep)
+    if args.json:
+        with open(args.json, "w", encoding="utf8") as fh:
+            json.dump(rep, fh, indent=2)
+        print(f"wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
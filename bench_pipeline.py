@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+bench_pipeline.py
+
+End-to-end recognition benchmark: the bundled card photos (data/Sample *.jpg) and
+synthetically degraded copies of them go through the three stages every scanned card takes
+
+ - ocr:      ocr.process_card_image (tesseract)
+ - identify: card_id.identify_card_from_ocr (card DB and / or embedding index)
+ - assign:   assign.assign_card
+
+and the report gives p50 / p95 / p99 latency per stage and end to end, images per second per
+core (one image at a time, tesseract limited to one thread), and name / cell accuracy overall
+and per variant. Ground truth is data/demo_assigned_results.json (identified_name per
+filename); the expected cell is what assign_card gives the true name at full confidence under
+the current config, as /demo/batch_identify_assign does.
+
+Variants (--augment, all by default): blur (Gaussian), glare (bright elliptical highlight),
+rotate (small skew, replicated border), scale (downscaled photo), each --variants times with
+random strength from --seed.
+
+Baselines: --json writes the report; --compare BASELINE flags stages whose p50 / p95 grew by
+more than --latency-tol (relative), throughput that fell by more than --latency-tol, and any
+name / cell accuracy drop larger than --accuracy-tol, overall or per variant. Exits 1 on a
+regression, so speed work cannot quietly cost accuracy.
+
+Usage:
+  python bench_pipeline.py --json data/bench/pipeline_baseline.json
+  python bench_pipeline.py --compare data/bench/pipeline_baseline.json
+  python bench_pipeline.py --augment blur,glare --variants 3 --repeat 2
+  python bench_pipeline.py --card-db data/demo_cards.json --embeddings-dir data/embeddings
+"""
+import os
+import sys
+import glob
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+from typing import Any, Callable, Dict, List, Optional
+
+# "per core": tesseract (OpenMP) would otherwise spread one image over every core
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+import numpy as np
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+
+from app.services import card_catalog
+from app.services.assign import Card, SystemState, assign_card, load_config
+from app.services.rules import card_attrs
+
+STAGES = ("ocr", "identify", "assign", "total")
+PERCENTILES = (50, 95, 99)
+
+
+# ---------- Augmentations ----------
+def _blur(img: np.ndarray, rng: random.Random) -> np.ndarray:
+    import cv2
+    k = rng.choice((3, 5, 7))
+    return cv2.GaussianBlur(img, (k, k), 0)
+
+
+def _glare(img: np.ndarray, rng: random.Random) -> np.ndarray:
+    # a soft white highlight somewhere on the card, like a sleeve reflecting the light
+    h, w = img.shape[:2]
+    cy, cx = rng.uniform(0.2, 0.8) * h, rng.uniform(0.2, 0.8) * w
+    ry, rx = rng.uniform(0.1, 0.25) * h, rng.uniform(0.15, 0.35) * w
+    yy, xx = np.ogrid[:h, :w]
+    d = ((yy - cy) / ry) ** 2 + ((xx - cx) / rx) ** 2
+    mask = (np.exp(-d) * rng.uniform(0.5, 0.9))[..., None]
+    return (img * (1.0 - mask) + 255.0 * mask).astype(np.uint8)
+
+
+def _rotate(img: np.ndarray, rng: random.Random) -> np.ndarray:
+    import cv2
+    h, w = img.shape[:2]
+    angle = rng.uniform(2.0, 6.0) * rng.choice((-1, 1))
+    m = cv2.getRotationMatrix2D((w / 2.0, h / 2.0), angle, 1.0)
+    return cv2.warpAffine(img, m, (w, h), borderMode=cv2.BORDER_REPLICATE)
+
+
+def _scale(img: np.ndarray, rng: random.Random) -> np.ndarray:
+    import cv2
+    f = rng.uniform(0.45, 0.7)
+    return cv2.resize(img, None, fx=f, fy=f, interpolation=cv2.INTER_AREA)
+
+
+AUGMENTATIONS: Dict[str, Callable[[np.ndarray, random.Random], np.ndarray]] = {
+    "blur": _blur,
+    "glare": _glare,
+    "rotate": _rotate,
+    "scale": _scale,
+}
+
+
+# ---------- Inputs ----------
+def load_truth(path: str) -> Dict[str, str]:
+    with open(path, "r", encoding="utf8") as fh:
+        data = json.load(fh)
+    rows = data.get("results", []) if isinstance(data, dict) else data
+    return {r["filename"]: r["identified_name"] for r in rows if r.get("identified_name")}
+
+
+def build_items(images: List[str], truth: Dict[str, str], augment: List[str], variants: int,
+                seed: int) -> List[Dict[str, Any]]:
+    """(filename, variant, image, true name) for every original and augmented copy."""
+    import cv2
+    rng = random.Random(seed)
+    items = []
+    for path in images:
+        name = truth.get(os.path.basename(path))
+        if name is None:
+            continue
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is None:
+            logging.warning("could not read %s", path)
+            continue
+        items.append({"file": os.path.basename(path), "variant": "original", "image": img, "truth": name})
+        for aug in augment:
+            for _ in range(variants):
+                items.append({"file": os.path.basename(path), "variant": aug,
+                              "image": AUGMENTATIONS[aug](img, rng), "truth": name})
+    return items
+
+
+# ---------- Stats ----------
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """p50 / p95 / p99 and mean in ms (values in seconds)."""
+    if not values:
+        return {f"p{p}": None for p in PERCENTILES}
+    arr = 1000.0 * np.asarray(values, dtype=float)
+    out = {f"p{p}": round(float(np.percentile(arr, p)), 2) for p in PERCENTILES}
+    out["mean"] = round(float(arr.mean()), 2)
+    return out
+
+
+def _accuracy(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    n = len(rows)
+    return {
+        "n": n,
+        "name": round(sum(r["name_ok"] for r in rows) / n, 4) if n else None,
+        "cell": round(sum(r["cell_ok"] for r in rows) / n, 4) if n else None,
+    }
+
+
+# ---------- Run ----------
+def run(args) -> Dict[str, Any]:
+    from app.services import card_id, ocr
+
+    with open(args.config, "r", encoding="utf8") as fh:
+        cfg = load_config(yaml.safe_load(fh))
+    truth = load_truth(args.truth)
+    images = sorted(glob.glob(os.path.join(args.data, "Sample *.jpg")))
+    augment = [a for a in args.augment.split(",") if a] if args.augment else []
+    unknown = set(augment) - set(AUGMENTATIONS)
+    if unknown:
+        raise SystemExit(f"unknown augmentation(s) {sorted(unknown)} (one of {sorted(AUGMENTATIONS)})")
+    items = build_items(images, truth, augment, args.variants, args.seed)
+    if not items:
+        raise SystemExit(f"no labelled images in {args.data} (truth: {args.truth})")
+
+    cards_list = card_catalog.get_catalog(args.card_db).rows if args.card_db and os.path.exists(args.card_db) else None
+    emb_dir = args.embeddings_dir if args.embeddings_dir and os.path.isdir(args.embeddings_dir) else None
+    can_identify = cards_list is not None or emb_dir is not None
+    if not can_identify:
+        logging.warning("no card DB or embedding index: names come straight from the OCR text")
+
+    expected_cell = {}
+    for name in set(truth.values()):
+        expected_cell[name] = assign_card(Card(game="mtg", name=name, confidence=1.0), cfg,
+                                          SystemState(counts_by_cell={c: 0 for c in cfg.cells}))[0]
+
+    # warm-up: model / index / vocabulary loading is not per-card latency
+    warm = items[0]
+    o = ocr.process_card_image(warm["image"], game="mtg", vocab_path=args.vocab_path)
+    if can_identify:
+        card_id.identify_card_from_ocr({"full": o["regions"]["full"]["text"]}, cards_list=cards_list,
+                                       embeddings_dir=emb_dir)
+
+    times: Dict[str, List[float]] = {s: [] for s in STAGES}
+    rows: List[Dict[str, Any]] = []
+    wall0 = time.perf_counter()
+    for _ in range(args.repeat):
+        for it in items:
+            t0 = time.perf_counter()
+            res = ocr.process_card_image(it["image"], game="mtg", vocab_path=args.vocab_path)
+            region_texts = {k: (v.get("text", "") if isinstance(v, dict) else "") for k, v in res.get("regions", {}).items()}
+            t1 = time.perf_counter()
+            best, score = {}, 0.0
+            if can_identify:
+                ident = card_id.identify_card_from_ocr(region_texts, cards_list=cards_list, embeddings_dir=emb_dir)
+                best, score = ident.get("best") or {}, float(ident.get("score", 0.0))
+            # without a match the OCR text stands in for the name (its first letter still sorts)
+            name = (best.get("name") or best.get("title") or region_texts.get("name") or region_texts.get("full") or "").strip()
+            t2 = time.perf_counter()
+            card = Card(game="mtg", name=name, confidence=min(1.0, score / 100.0),
+                        set_code=best.get("set") or best.get("set_code"),
+                        collector_number=best.get("collector_number") or best.get("collector"),
+                        **card_attrs(best))
+            cell, _reason = assign_card(card, cfg, SystemState(counts_by_cell={c: 0 for c in cfg.cells}))
+            t3 = time.perf_counter()
+            for stage, dt in zip(STAGES, (t1 - t0, t2 - t1, t3 - t2, t3 - t0)):
+                times[stage].append(dt)
+            rows.append({
+                "file": it["file"], "variant": it["variant"], "name": name,
+                "name_ok": card_catalog.normalize_name(name) == card_catalog.normalize_name(it["truth"]),
+                "cell_ok": cell == expected_cell[it["truth"]],
+            })
+    wall = time.perf_counter() - wall0
+
+    variants = sorted({r["variant"] for r in rows})
+    return {
+        "meta": {
+            "images": len(images),
+            "items": len(items),
+            "runs": len(rows),
+            "augment": augment,
+            "variants_per_augmentation": args.variants,
+            "seed": args.seed,
+            "identify": {"card_db": args.card_db if cards_list is not None else None, "embeddings_dir": emb_dir},
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        },
+        "latency_ms": {s: percentiles(times[s]) for s in STAGES},
+        "images_per_s_per_core": round(len(rows) / wall, 3) if wall > 0 else None,
+        "accuracy": _accuracy(rows),
+        "accuracy_by_variant": {v: _accuracy([r for r in rows if r["variant"] == v]) for v in variants},
+        "misses": sorted({(r["file"], r["variant"], r["name"]) for r in rows if not r["name_ok"]})[:50],
+    }
+
+
+# ---------- Compare ----------
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], latency_tol: float = 0.15,
+            accuracy_tol: float = 0.0) -> List[str]:
+    """Regressions of current against baseline, as readable lines (empty: none)."""
+    out = []
+    for stage in STAGES:
+        b, c = baseline.get("latency_ms", {}).get(stage) or {}, current.get("latency_ms", {}).get(stage) or {}
+        for p in ("p50", "p95"):
+            if b.get(p) and c.get(p) is not None and c[p] > b[p] * (1.0 + latency_tol) and c[p] - b[p] > 0.05:
+                out.append(f"latency {stage} {p}: {b[p]} -> {c[p]} ms (+{100.0 * (c[p] / b[p] - 1.0):.0f}%)")
+    b_tp, c_tp = baseline.get("images_per_s_per_core"), current.get("images_per_s_per_core")
+    if b_tp and c_tp is not None and c_tp < b_tp * (1.0 - latency_tol):
+        out.append(f"throughput: {b_tp} -> {c_tp} images/s/core")
+    scopes = [("overall", baseline.get("accuracy") or {}, current.get("accuracy") or {})]
+    for v, b in (baseline.get("accuracy_by_variant") or {}).items():
+        scopes.append((v, b, (current.get("accuracy_by_variant") or {}).get(v) or {}))
+    for scope, b, c in scopes:
+        for key in ("name", "cell"):
+            if b.get(key) is not None and c.get(key) is not None and c[key] < b[key] - accuracy_tol - 1e-9:
+                out.append(f"accuracy {key} ({scope}): {b[key]} -> {c[key]}")
+    return out
+
+
+def print_report(r: Dict[str, Any]) -> None:
+    m = r["meta"]
+    print(f"{m['runs']} runs ({m['images']} images, {m['items']} variants: original + {', '.join(m['augment']) or 'none'})")
+    print(f"{'stage':<10}{'p50':>10}{'p95':>10}{'p99':>10}{'mean':>10}   ms")
+    for s in STAGES:
+        l = r["latency_ms"][s]
+        print(f"{s:<10}" + "".join(f"{l.get(k) if l.get(k) is not None else '-':>10}" for k in ("p50", "p95", "p99", "mean")))
+    print(f"throughput: {r['images_per_s_per_core']} images/s/core")
+    a = r["accuracy"]
+    print(f"accuracy:   name {a['name']}  cell {a['cell']}")
+    for v, a in r["accuracy_by_variant"].items():
+        print(f"  {v:<10} name {a['name']}  cell {a['cell']}  (n={a['n']})")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="End-to-end OCR / identify / assign benchmark")
+    ap.add_argument("--config", default="config.yaml")
+    ap.add_argument("--data", default="data", help="directory with 'Sample *.jpg'")
+    ap.add_argument("--truth", default=os.path.join("data", "demo_assigned_results.json"))
+    ap.add_argument("--card-db", default=os.environ.get("SORTME_CARD_DB_PATH", os.path.join("data", "demo_cards.json")))
+    ap.add_argument("--embeddings-dir", default=os.path.join("data", "embeddings"))
+    ap.add_argument("--vocab-path", default=None, help="OCR correction vocabulary (default: ocr.py's)")
+    ap.add_argument("--augment", default=",".join(AUGMENTATIONS), help="comma-separated; empty for originals only")
+    ap.add_argument("--variants", type=int, default=1, help="copies per augmentation and image")
+    ap.add_argument("--repeat", type=int, default=1, help="passes over all variants")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--json", help="write the report (e.g. as a new baseline)")
+    ap.add_argument("--compare", help="baseline report to check this run against")
+    ap.add_argument("--latency-tol", type=float, default=0.15, help="allowed relative p50/p95 growth")
+    ap.add_argument("--accuracy-tol", type=float, default=0.0, help="allowed absolute accuracy drop")
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(message)s")
+
+    report = run(args)
+    print_report(report)
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf8") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"wrote {args.json}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf8") as fh:
+            baseline = json.load(fh)
+        regressions = compare(baseline, report, args.latency_tol, args.accuracy_tol)
+        if regressions:
+            print(f"REGRESSIONS against {args.compare}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"no regressions against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
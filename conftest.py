@@ -0,0 +1 @@
+# Repo-root conftest: puts the repo root on sys.path so tests can import app.services.*
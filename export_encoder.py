@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+export_encoder.py
+
+Export CPU-friendly variants of the query encoder used by card_id.try_embedding_match
+and check that they still find the same nearest card as the fp32 model.
+
+Outputs (in --out-dir):
+ - model_int8.pt          (torch dynamic int8 quantized SentenceTransformer)   [--backend int8]
+ - model.onnx             (ONNX graph of the transformer)                      [--backend onnx]
+ - model_int8.onnx        (onnxruntime dynamic int8 quantized graph)           [--backend onnx --quantize]
+ - tokenizer.json         (fast tokenizer used by the ONNX backend)
+ - encoder_meta.json      (top-1 agreement with fp32, source model and width per backend)
+
+Usage:
+  python export_encoder.py --backend onnx --quantize --out-dir data/models/encoder
+  SORTME_ENCODER_BACKEND=onnx uvicorn main:app
+
+Requirements:
+  pip install sentence-transformers torch            (export)
+  pip install onnx onnxruntime tokenizers            (onnx backend)
+"""
+import os
+import json
+import time
+import random
+import argparse
+import numpy as np
+
+from app.services import text_encoder
+
+
+def load_query_texts(emb_dir: str, sample: int, seed: int = 0) -> list:
+    # Agreement queries: a sample of card names plus any recorded OCR texts (real, noisy queries)
+    texts = []
+    meta_path = os.path.join(emb_dir, "cards_metadata.json")
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as fh:
+            names = [m.get("name") for m in json.load(fh) if m.get("name")]
+        rng = random.Random(seed)
+        texts.extend(rng.sample(names, min(sample, len(names))))
+    ocr_path = os.path.join("data", "demo_ocr_texts_new.json")
+    if os.path.exists(ocr_path):
+        with open(ocr_path, "r", encoding="utf-8") as fh:
+            for r in json.load(fh).get("results", []):
+                full = (r.get("region_texts") or {}).get("full")
+                if full:
+                    texts.append(full)
+    return texts
+
+
+def export_int8(model, out_dir: str) -> None:
+    import torch
+    qmodel = text_encoder.quantize_int8(model)
+    path = os.path.join(out_dir, text_encoder.INT8_FILE)
+    torch.save(qmodel, path)
+    print("Saved int8 model ->", path)
+
+
+def export_onnx(model, out_dir: str, quantize: bool) -> None:
+    import torch
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+    tokenizer.save_pretrained(out_dir)  # writes tokenizer.json for the fast tokenizer
+    dummy = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [k for k in ("input_ids", "attention_mask", "token_type_ids") if k in dummy]
+    dynamic = {k: {0: "batch", 1: "seq"} for k in input_names}
+    dynamic["last_hidden_state"] = {0: "batch", 1: "seq"}
+    path = os.path.join(out_dir, text_encoder.ONNX_FILE)
+    torch.onnx.export(
+        transformer,
+        tuple(dummy[k] for k in input_names),
+        path,
+        input_names=input_names,
+        output_names=["last_hidden_state"],
+        dynamic_axes=dynamic,
+        opset_version=14,
+    )
+    print("Saved ONNX model ->", path)
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        qpath = os.path.join(out_dir, text_encoder.ONNX_INT8_FILE)
+        quantize_dynamic(path, qpath, weight_type=QuantType.QInt8)
+        print("Saved quantized ONNX model ->", qpath)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=["int8", "onnx"], required=True, help="Variant to export")
+    parser.add_argument("--out-dir", "-o", default=os.path.join("data", "models", "encoder"), help="Output directory")
+    parser.add_argument("--model", default=text_encoder.DEFAULT_MODEL, help="SentenceTransformers model")
+    parser.add_argument("--quantize", action="store_true", help="(onnx) also write an int8 quantized graph")
+    parser.add_argument("--embeddings-dir", default=os.path.join("data", "embeddings"), help="Index used for the agreement check")
+    parser.add_argument("--sample", type=int, default=2000, help="Number of card names used as agreement queries")
+    parser.add_argument("--min-agreement", type=float, default=0.98, help="Fail if top-1 agreement with fp32 is below this")
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    try:
+        from sentence_transformers import SentenceTransformer
+    except Exception as e:
+        raise SystemExit("Please install sentence-transformers (pip install sentence-transformers). Error: " + str(e))
+
+    print("Loading model:", args.model)
+    model = SentenceTransformer(args.model)
+
+    if args.backend == "int8":
+        export_int8(model, args.out_dir)
+    else:
+        export_onnx(model, args.out_dir, args.quantize)
+
+    # --- agreement check against the fp32 model on the real index ---
+    emb_path = os.path.join(args.embeddings_dir, "embeddings.npy")
+    if not os.path.exists(emb_path):
+        raise SystemExit(f"No index at {emb_path}; run embed_scryfall.py first so agreement can be checked")
+    index = np.load(emb_path)
+    texts = load_query_texts(args.embeddings_dir, args.sample)
+    print(f"Checking top-1 agreement on {len(texts)} queries against {index.shape[0]} cards...")
+
+    reference = text_encoder.SentenceTransformerEncoder(model)
+    # bypass the agreement gate: this is the check that feeds it
+    if args.backend == "int8":
+        candidate = text_encoder._load_int8(args.model, args.out_dir)
+    else:
+        candidate = text_encoder._load_onnx(args.out_dir)
+
+    agreement = text_encoder.top1_agreement(reference, candidate, texts, index)
+
+    t0 = time.perf_counter()
+    ref_out = reference.encode(texts[:64])
+    t_ref = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    cand_out = candidate.encode(texts[:64])
+    t_cand = time.perf_counter() - t0
+
+    meta = text_encoder.read_meta(args.out_dir)
+    meta.setdefault("backends", {})[args.backend] = {
+        "model": args.model,
+        "dim": int(np.asarray(cand_out).shape[-1]),
+        "reference_dim": int(np.asarray(ref_out).shape[-1]),
+        "agreement": agreement,
+        "num_queries": len(texts),
+        "min_agreement": args.min_agreement,
+        "speedup_64": (t_ref / t_cand) if t_cand > 0 else None,
+        "checked_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    meta_path = os.path.join(args.out_dir, text_encoder.META_FILE)
+    with open(meta_path, "w", encoding="utf-8") as fh:
+        json.dump(meta, fh, indent=2)
+
+    print(f"Top-1 agreement with fp32: {agreement:.4f} (bound {args.min_agreement}); speedup x{meta['backends'][args.backend]['speedup_64'] or 0:.2f}")
+    print("Saved metadata ->", meta_path)
+    if agreement < args.min_agreement:
+        raise SystemExit(f"Agreement {agreement:.4f} below --min-agreement {args.min_agreement}; card_id will refuse this backend")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+import_budget.py
+
+Import-time budget check: import each target module in a fresh interpreter under
+`python -X importtime`, and report
+
+ - the target's cumulative import time (best of --runs) against its budget
+ - a breakdown by top-level package (self time summed over each package's modules), so the
+   dependency that got expensive is named, not just the total
+ - heavy backends (scikit-learn, torch, cv2, tesseract, ...) the import pulled in: these are
+   deferred to first use (app/services/lazy.py) and must not load at import time
+
+Exits 1 when a target is over budget or loads a heavy backend, so it can gate CI.
+A target that cannot be imported here (missing dependency) is reported and skipped.
+
+Usage:
+  python import_budget.py
+  python import_budget.py --top 15 app.services.card_id
+  python import_budget.py --budget main=800 --json importtime.json
+  python import_budget.py simple-text-ocr:src.cli          # <dir>:<module> imports from <dir>
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+from typing import Any, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# target -> budget in ms (cumulative import time of the target itself, interpreter startup excluded)
+BUDGETS_MS = {
+    "main": 1500.0,
+    "app.services.card_id": 400.0,
+    "app.services.ocr": 300.0,
+    "app.services.embeddings": 300.0,
+    "app.services.catalogs": 400.0,
+    "app.services.rescan": 400.0,
+    "simple-text-ocr:src.cli": 600.0,
+}
+HEAVY = ("sklearn", "scipy", "torch", "torchvision", "cv2", "pytesseract", "easyocr",
+         "sentence_transformers", "onnxruntime", "transformers", "tokenizers")
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """(module, self_us, cumulative_us, depth) per `-X importtime` line, in output order."""
+    out = []
+    for line in stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            out.append((m.group(4), int(m.group(1)), int(m.group(2)), (len(m.group(3)) - 1) // 2))
+    return out
+
+
+def _run(target: str) -> Tuple[Optional[List[Tuple[str, int, int, int]]], str]:
+    cwd, module = ROOT, target
+    if ":" in target:
+        sub, module = target.split(":", 1)
+        cwd = os.path.join(ROOT, sub)
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=cwd, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        err = [l for l in proc.stderr.splitlines() if not l.startswith("import time:")]
+        return None, (err[-1] if err else f"exit {proc.returncode}")
+    return parse_importtime(proc.stderr), ""
+
+
+def measure(target: str, runs: int = 3, top: int = 10) -> Dict[str, Any]:
+    """Best-of-runs import profile of one target (imports run in fresh interpreters)."""
+    module = target.split(":", 1)[-1]
+    best = None
+    for _ in range(max(1, runs)):
+        rows, err = _run(target)
+        if rows is None:
+            return {"target": target, "error": err}
+        total = next((cum for name, _, cum, depth in reversed(rows) if name == module and depth == 0), None)
+        if total is None:
+            total = sum(cum for _, _, cum, depth in rows if depth == 0)
+        if best is None or total < best[0]:
+            best = (total, rows)
+    total, rows = best
+    # modules imported by the target: everything after interpreter startup (the last lines up to
+    # and including the target's own line; its children are listed before it)
+    end = max(i for i, r in enumerate(rows) if r[0] == module or i == len(rows) - 1)
+    start = end
+    while start > 0 and rows[start - 1][3] > 0:
+        start -= 1
+    mine = rows[start:end + 1]
+    by_pkg: Dict[str, int] = {}
+    for name, self_us, _, _ in mine:
+        pkg = name.split(".")[0]
+        by_pkg[pkg] = by_pkg.get(pkg, 0) + self_us
+    heavy = sorted({n.split(".")[0] for n, _, _, _ in mine if n.split(".")[0] in HEAVY})
+    return {
+        "target": target,
+        "ms": round(total / 1000.0, 1),
+        "modules": len(mine),
+        "packages": [{"package": p, "ms": round(us / 1000.0, 1)}
+                     for p, us in sorted(by_pkg.items(), key=lambda kv: -kv[1])[:top]],
+        "heavy": heavy,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Import-time budget check")
+    ap.add_argument("targets", nargs="*", help="modules (default: every target with a budget)")
+    ap.add_argument("--budget", action="append", default=[], metavar="TARGET=MS")
+    ap.add_argument("--runs", type=int, default=3, help="fresh imports per target; the fastest counts")
+    ap.add_argument("--top", type=int, default=8, help="packages listed per target")
+    ap.add_argument("--json", help="write the report here")
+    args = ap.parse_args()
+
+    budgets = dict(BUDGETS_MS)
+    for b in args.budget:
+        k, _, v = b.partition("=")
+        budgets[k] = float(v)
+    targets = args.targets or list(budgets)
+
+    report, failed = [], False
+    for t in targets:
+        r = measure(t, runs=args.runs, top=args.top)
+        report.append(r)
+        if "error" in r:
+            print(f"{t:<28} SKIP  ({r['error']})")
+            continue
+        budget = budgets.get(t)
+        over = budget is not None and r["ms"] > budget
+        r["budget_ms"], r["ok"] = budget, not over and not r["heavy"]
+        failed |= not r["ok"]
+        status = "OK" if r["ok"] else "FAIL"
+        print(f"{t:<28} {status:<5} {r['ms']:8.1f} ms  (budget {budget or '-'} ms, {r['modules']} modules)")
+        for p in r["packages"]:
+            print(f"    {p['package']:<24} {p['ms']:8.1f} ms")
+        if r["heavy"]:
+            print(f"    heavy backends imported at import time: {', '.join(r['heavy'])}")
+    if args.json:
+        with open(args.json, "w", encoding="utf8") as fh:
+            json.dump(report, fh, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
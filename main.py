@@ -1,16 +1,22 @@
 # app/main.py (or similar)
+import asyncio
+import json
 import os
+import time
 from typing import List, Optional
 
-import cv2
-import numpy as np
 import yaml
 from fastapi import File, Form, HTTPException, UploadFile
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-
-from app.services import card_id, ocr
+from fastapi.responses import FileResponse, StreamingResponse
+
+from app.services import alpha_balance, card_catalog, card_id, jobs, prefork, radix_plan, workers
+from app.services.assign_batch import assign_cards_batch
+from app.services.catalogs import get_registry
+from app.services.cell_store import get_store
+from app.services.inventory import Want, parse_decklist
+from app.services.rules import card_attrs
 from app.services.assign import Card, SystemState, assign_card, load_config
 
 app = FastAPI()
@@ -31,7 +37,11 @@ def read_index():
     raise HTTPException(status_code=404, detail="Web UI not found. Ensure app/static/index.html exists.")
 
 CFG = load_config(yaml.safe_load(open("config.yaml")))
-STATE = SystemState(counts_by_cell={cid: 0 for cid in CFG.cells})
+# authoritative live counts (STATE.counts_by_cell is the store's dict)
+STORE = get_store(CFG)
+STATE = STORE.state
+# per-game catalogs (config.yaml games:); the default game sorts with CFG
+CATALOGS = get_registry(yaml.safe_load(open("config.yaml")), CFG)
 
 
 def _default_card_db_path() -> Optional[str]:
@@ -47,62 +57,332 @@ def _default_card_db_path() -> Optional[str]:
     return None
 
 
-_CARD_DB_CACHE: Optional[List[dict]] = None
-_CARD_DB_PATH: Optional[str] = None
-
-
 def _load_card_db(path: str) -> List[dict]:
-    """Load and cache the local card DB to avoid repeated disk hits."""
-
-    global _CARD_DB_CACHE, _CARD_DB_PATH
-
+    """The local card DB's rows from the shared card catalog (parsed once, reloaded on change)."""
     if not path:
         raise ValueError("Card database path is required")
-
-    path = os.path.expanduser(path)
-    if _CARD_DB_CACHE is None or _CARD_DB_PATH != path:
-        cards = card_id.load_local_db(path)
-        _CARD_DB_CACHE = cards
-        _CARD_DB_PATH = path
-    return _CARD_DB_CACHE
+    return card_catalog.get_catalog(path).rows
 
 @app.get("/debug/alpha_map")
 def alpha_map():
-    return {"letter_to_cell": CFG.letter_to_cell}
+    return {
+        "letter_to_cell": CFG.letter_to_cell,
+        "balanced": CFG.balanced.as_dict() if CFG.balanced else None,
+    }
+
+
+def _balance_names(source: str) -> List[str]:
+    if source == "ledger":
+        return alpha_balance.names_from_ledger(STORE.journal.root) if STORE.journal else []
+    db_path = _default_card_db_path()
+    return alpha_balance.names_from_db(_load_card_db(db_path)) if db_path else []
+
+
+# alpha_balanced without saved ranges: learn them from the ledger, else from the card DB
+if CFG.mode == "alpha_balanced" and CFG.balanced is None:
+    for _source in ("ledger", "db"):
+        try:
+            alpha_balance.rebalance(CFG, _balance_names(_source), source=_source)
+            break
+        except (ValueError, OSError):
+            continue
+
+
+@app.post("/debug/rebalance")
+def rebalance(payload: dict):
+    """
+    Relearn alpha_balanced ranges: {"source": "ledger" | "db", "expected_cards": N}.
+    Only between runs (placement cells empty) unless "force": true.
+    """
+    source = payload.get("source", "ledger")
+    busy = {cid: n for cid, n in STORE.counts().items()
+            if n and cid not in CFG.overflow_cells and not (CFG.feeder_re and CFG.feeder_re.search(cid))}
+    if busy and not payload.get("force"):
+        raise HTTPException(status_code=409, detail=f"Cells not empty (reset between runs first): {busy}")
+    try:
+        bmap = alpha_balance.rebalance(CFG, _balance_names(source), payload.get("expected_cards"), source)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    capacity = {cid: c.capacity for cid, c in CFG.cells.items()}
+    return {"balanced": bmap.as_dict(), "predicted_overflow": alpha_balance.predicted_overflow(bmap, capacity)}
 
 @app.post("/debug/reset_counts")
 def reset_counts():
-    for k in STATE.counts_by_cell.keys():
-        STATE.counts_by_cell[k] = 0
+    STORE.reset()
     return {"ok": True}
 
 @app.post("/debug/assign")
 def debug_assign(payload: dict):
     name = str(payload.get("name","")).strip()
     conf = float(payload.get("confidence", 1.0))
-    card = Card(game=payload.get("game","mtg"), name=name, confidence=conf)
-    cell, reason = assign_card(card, CFG, STATE)
-    STATE.counts_by_cell[cell] = STATE.counts_by_cell.get(cell, 0) + 1
-    return {"cell": cell, "reason": reason, "counts": STATE.counts_by_cell}
+    card = Card(game=CATALOGS.resolve(payload.get("game")), name=name, confidence=conf,
+                set_code=payload.get("set_code"), **card_attrs(payload))
+    cell, reason = STORE.assign(card, CATALOGS.config(card.game))
+    return {"cell": cell, "reason": reason, "counts": STORE.counts()}
+
+@app.post("/debug/assign_batch")
+def debug_assign_batch(payload: dict):
+    """
+    Dry run of a whole collection against the current counts: {"game": "mtg", "cards": [{"name",
+    "confidence", "set_code", "rarity", "color_identity", "mana_value", "price"}],
+    "include_cards": true}.
+    Same cells and reasons as assigning one by one; nothing is counted.
+    """
+    game = CATALOGS.resolve(payload.get("game"))
+    cards = [Card(game=game, name=str(c.get("name", "")).strip(),
+                  confidence=float(c.get("confidence", 1.0)), set_code=c.get("set_code"),
+                  collector_number=c.get("collector_number"), **card_attrs(c))
+             for c in payload.get("cards") or []]
+    res = assign_cards_batch(cards, CATALOGS.config(game), STORE.snapshot())
+    return res.as_dict(include_cards=bool(payload.get("include_cards", True)))
+
+@app.get("/debug/rules")
+def rule_stats():
+    # per-rule hit counters (default_mode: rules)
+    return {"mode": CFG.mode, "rules": CFG.rules.stats() if CFG.rules else None}
+
+@app.get("/debug/encoder_stats")
+def encoder_stats():
+    # query encoder counters: this process's micro-batcher, and every process that identified
+    # cards (the pool workers, or this process when SORTME_WORKERS=0)
+    return {"query_encoder": card_id.encoder_stats(), "identification": workers.encoder_stats()}
 
 # Non-mutating preview endpoint for the UI assignment preview
 @app.post("/debug/assign_preview")
 def debug_assign_preview(payload: dict):
     name = str(payload.get("name","")).strip()
     conf = float(payload.get("confidence", 1.0))
-    card = Card(game=payload.get("game","mtg"), name=name, confidence=conf)
+    card = Card(game=CATALOGS.resolve(payload.get("game")), name=name, confidence=conf,
+                set_code=payload.get("set_code"), **card_attrs(payload))
     # reuse same assignment logic but DO NOT increment STATE
-    cell, reason = assign_card(card, CFG, STATE)
+    cell, reason = assign_card(card, CATALOGS.config(card.game), STATE)
     first = (name[:1].upper() if name and name[0].isalpha() else "A")
     return {"cell": cell, "reason": reason, "first": first}
 
 
+def _expected_from_filename(filename: Optional[str], state: SystemState, game: Optional[str] = None):
+    """Parse "Card_Name__B1.jpg" style filenames into (expected_name, expected_cell)."""
+    expected_name = None
+    expected_cell = None
+    if filename:
+        base = os.path.splitext(os.path.basename(filename))[0]
+        if "__" in base:
+            parts = base.split("__", 1)
+            expected_name = parts[0].replace("_", " ").strip()
+            expected_cell = parts[1].strip().upper() or None
+        else:
+            expected_name = base.replace("_", " ").strip()
+
+    if expected_cell is None and expected_name:
+        tmp_card = Card(game=CATALOGS.resolve(game), name=expected_name, confidence=1.0)
+        expected_cell, _ = assign_card(tmp_card, CATALOGS.config(tmp_card.game), state)
+    return expected_name, expected_cell
+
+
+def _finish_file_result(file_result: dict,
+                        analysis: dict,
+                        ocr_only: bool,
+                        use_filename_expected: bool,
+                        state_snapshot: SystemState) -> dict:
+    """Turn a worker analysis (OCR + identify) into the per-image result, assigning a cell."""
+    region_texts = analysis.get("region_texts", {})
+
+    # If ocr_only flag present, skip identification and assignment and return simplified OCR-only data
+    if ocr_only:
+        # Build a single aggregated text string from the region_texts (preserve readable order if available)
+        ordered_keys = [k for k in ['name','type_line','oracle','collector','full'] if k in region_texts]
+        # append any other keys in their existing order
+        ordered_keys += [k for k in region_texts.keys() if k not in ordered_keys]
+        parts = [region_texts.get(k) for k in ordered_keys if region_texts.get(k)]
+        aggregated = "\n".join(parts) if parts else ""
+
+        # Return only filename and the aggregated OCR text and the simple per-region strings
+        file_result.update({
+            "ocr_text": aggregated,
+            "region_texts": region_texts,  # simple map of region -> text (strings only)
+        })
+        return file_result
+
+    identify_res = analysis.get("identify") or {}
+    if identify_res:
+        best = identify_res.get("best") or {}
+        identified_name = (best.get("name") or best.get("title") or region_texts.get("name") or "").strip()
+        id_score = float(identify_res.get("score", 0.0))
+    else:
+        best = {}
+        identified_name = (region_texts.get("name") or "").strip()
+        id_score = 0.0
+
+    card_conf = min(1.0, id_score / 100.0) if id_score > 0 else 0.0
+
+    card = Card(
+        game=CATALOGS.resolve(analysis.get("game")),
+        name=identified_name,
+        set_code=(best.get("set") or best.get("set_code")),
+        collector_number=(best.get("collector_number") or best.get("collector")),
+        confidence=card_conf,
+        **card_attrs(best),
+    )
+
+    cell, reason = assign_card(card, CATALOGS.config(card.game), state_snapshot)
+
+    expected_name, expected_cell = (None, None)
+    if use_filename_expected:
+        expected_name, expected_cell = _expected_from_filename(file_result.get("filename"), state_snapshot, card.game)
+
+    match_name = False
+    if expected_name and identified_name:
+        match_name = expected_name.lower() == identified_name.lower()
+
+    match_cell = False
+    if expected_cell and cell:
+        match_cell = expected_cell.upper() == cell.upper()
+
+    file_result.update(
+        {
+            "expected": {
+                "name": expected_name,
+                "cell": expected_cell,
+            },
+            "ocr": {
+                "rotation": analysis.get("rotation"),
+                "rotation_confidence": analysis.get("rotation_confidence"),
+                "regions": analysis.get("regions", {}),
+            },
+            "game": card.game,
+            "region_texts": region_texts,
+            "identify": identify_res,
+            "identify_debug": identify_res.get("debug"),
+            "identified_name": identified_name,
+            "id_score": id_score,
+            "assignment": {
+                "cell": cell,
+                "reason": reason,
+            },
+            "match_name": match_name,
+            "match_cell": match_cell,
+        }
+    )
+    return file_result
+
+
+def _batch_summary(results: List[dict], active_db_path: Optional[str]) -> dict:
+    name_matches = sum(1 for r in results if r.get("match_name"))
+    cell_matches = sum(1 for r in results if r.get("match_cell"))
+    both_matches = sum(1 for r in results if r.get("match_name") and r.get("match_cell"))
+    return {
+        "total": len(results),
+        "db_path": active_db_path,
+        "name_matches": name_matches,
+        "cell_matches": cell_matches,
+        "both_matches": both_matches,
+    }
+
+
+def _resolve_batch_db(db_path: Optional[str]) -> Optional[str]:
+    active_db_path = db_path or _default_card_db_path()
+    # only check the file is there: the workers parse it (once each, see services/workers.py),
+    # so the server never holds a copy it does not use. No path means OCR-only operation.
+    if active_db_path and not os.path.isfile(os.path.expanduser(active_db_path)):
+        raise HTTPException(status_code=400, detail=f"Card DB not found: {active_db_path}")
+    return active_db_path
+
+
+@app.on_event("shutdown")
+async def _shutdown_workers():
+    await JOBS.stop()
+    workers.shutdown_pool()
+    STORE.close()
+
+
+@app.get("/debug/state")
+def debug_state():
+    # live counts plus write-ahead log progress (durable seq, group size, fsync time)
+    return {"counts": STORE.counts(), "journal": STORE.journal.stats() if STORE.journal else None}
+
+
+@app.get("/inventory/locate")
+def inventory_locate(name: str, set_code: Optional[str] = None, collector_number: Optional[str] = None):
+    # every copy of a card: cell, position from the bottom and how many cards sit on top of it
+    return {"name": name, "copies": STORE.locate(name, set_code, collector_number)}
+
+
+@app.get("/inventory/pile/{cell_id}")
+def inventory_pile(cell_id: str):
+    if cell_id not in CFG.cells:
+        raise HTTPException(status_code=404, detail=f"Unknown cell {cell_id}")
+    return {"cell": cell_id, "count": STORE.get(cell_id), "cards": STORE.pile(cell_id)}
+
+
+@app.post("/inventory/dig_plan")
+def inventory_dig_plan(payload: dict):
+    """
+    Pull plan for a decklist: {"decklist": "4 Lightning Bolt\n1 Opt (ELD) 59"} or
+    {"cards": [{"name", "qty", "set_code", "collector_number"}]}.
+    """
+    if payload.get("decklist"):
+        wants = parse_decklist(str(payload["decklist"]))
+    else:
+        wants = [
+            Want(name=str(c["name"]), qty=int(c.get("qty", 1)),
+                 set_code=c.get("set_code"), collector_number=c.get("collector_number"))
+            for c in payload.get("cards", []) if c.get("name")
+        ]
+    if not wants:
+        raise HTTPException(status_code=400, detail="No cards requested")
+    return STORE.plan_dig(wants)
+
+
+@app.post("/plan/full_sort")
+def plan_full_sort(payload: dict):
+    """
+    Multi-pass script putting a collection in full order: {"game": "mtg", "order": "name" | "set",
+    "cards": [{"name", "set_code", "collector_number"}]}; without cards, everything in the
+    inventory index. Cells are assumed emptied first (the collection goes to the feeders).
+    game (else the first card's, else the default game) picks the catalog config the plan uses.
+    """
+    given = [c for c in payload.get("cards") or [] if c.get("name")]
+    game = CATALOGS.resolve(payload.get("game") or next((c.get("game") for c in given if c.get("game")), None))
+    if payload.get("cards"):
+        cards = [Card(game=game, name=str(c["name"]), set_code=c.get("set_code"),
+                      collector_number=c.get("collector_number"))
+                 for c in given]
+    else:
+        cards = [Card(game=game, name=d["name"], set_code=d["set_code"], collector_number=d["collector_number"])
+                 for cid in CFG.cells for d in STORE.pile(cid) if d["name"]]
+    try:
+        plan = radix_plan.plan_sort(cards, CATALOGS.config(game), None, payload.get("order", "name"))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return radix_plan.script(plan)
+
+
+@app.get("/debug/catalogs")
+def debug_catalogs():
+    # which game catalogs are loaded here (MB); loads / evictions / frame detections summed
+    # over this process and the identification workers (per process under "processes"); and
+    # the shared card lists behind them (rows, version)
+    return {**CATALOGS.stats(), **workers.catalog_stats(), "card_catalog": card_catalog.stats()}
+
+
+@app.get("/debug/memory")
+def debug_memory():
+    # unique vs shared RSS per process; under serve.py every worker plus the preloading parent
+    return {"worker": os.environ.get("SORTME_WORKER_INDEX"), **prefork.worker_memory()}
+
+
+@app.get("/debug/workers")
+def debug_workers():
+    return workers.utilization()
+
+
 @app.post("/demo/batch_identify")
 async def demo_batch_identify(
     files: List[UploadFile] = File(...),
     db_path: Optional[str] = Form(None),
     use_filename_expected: bool = Form(True),
     ocr_only: bool = Form(False),
+    game: Optional[str] = Form(None),
 ):
     """
     Run a batch OCR + identification pass for uploaded images.
@@ -113,166 +393,199 @@ async def demo_batch_identify(
         supply the expected card name and/or cell.
       - Returns per-image OCR details, identification guesses, assignments,
         and aggregate accuracy stats.
+
+    OCR + identification run concurrently on the worker pool (see services/workers.py);
+    results are returned in upload order. game: force one game's catalog; by default each
+    image's game is detected from its card frame (services/catalogs.py).
     """
 
     if not files:
         raise HTTPException(status_code=400, detail="No images uploaded")
 
-    active_db_path = db_path or _default_card_db_path()
-    cards_db = None
-    # Try to load a card DB if a path is provided; otherwise allow OCR-only operation
-    if active_db_path:
-        try:
-            cards_db = _load_card_db(active_db_path)
-        except Exception as exc:  # pragma: no cover - defensive guard
-            raise HTTPException(status_code=400, detail=f"Failed to load card DB: {exc}")
-
-    results = []
-    name_matches = 0
-    cell_matches = 0
-    both_matches = 0
+    active_db_path = _resolve_batch_db(db_path)
 
     # local state snapshot so we don't mutate live counts
-    state_snapshot = SystemState(counts_by_cell=dict(STATE.counts_by_cell))
+    state_snapshot = STORE.snapshot()
+
+    util: dict = {}
+    started = time.perf_counter()
+
+    async def analyze(upload: UploadFile):
+        raw = await upload.read()
+        return await workers.run_analysis(raw, active_db_path, ocr_only, util=util, game=game)
+
+    analyses = await asyncio.gather(*(analyze(u) for u in files), return_exceptions=True)
 
-    for idx, upload in enumerate(files, start=1):
+    results = []
+    for idx, (upload, analysis) in enumerate(zip(files, analyses), start=1):
         file_result = {
             "index": idx,
             "filename": upload.filename,
         }
-
         try:
-            raw = await upload.read()
-            if not raw:
-                raise ValueError("Empty file")
-
-            buffer = np.frombuffer(raw, dtype=np.uint8)
-            img = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
-            if img is None:
-                raise ValueError("Unsupported image format")
-
-            ocr_res = ocr.process_card_image(img, game="mtg")
-            regions = ocr_res.get("regions", {})
-            region_texts = {key: (val.get("text", "") if isinstance(val, dict) else "") for key, val in regions.items()}
-
-            # If ocr_only flag present, skip identification and assignment and return simplified OCR-only data
-            if ocr_only:
-                # Build a single aggregated text string from the region_texts (preserve readable order if available)
-                ordered_keys = [k for k in ['name','type_line','oracle','collector','full'] if k in region_texts]
-                # append any other keys in their existing order
-                ordered_keys += [k for k in region_texts.keys() if k not in ordered_keys]
-                parts = [region_texts.get(k) for k in ordered_keys if region_texts.get(k)]
-                aggregated = "\n".join(parts) if parts else ""
-
-                # Return only filename and the aggregated OCR text and the simple per-region strings
-                file_result.update({
-                    "ocr_text": aggregated,
-                    "region_texts": region_texts,  # simple map of region -> text (strings only)
-                })
-                results.append(file_result)
-                continue
-
-            # If a cards DB is available, run identification. If not, but precomputed embeddings exist,
-            # still run identification using the embeddings-only path.
-            embeddings_dir = os.path.join("data", "embeddings")
-            has_embeddings = os.path.exists(os.path.join(embeddings_dir, 'embeddings.npy')) and os.path.exists(os.path.join(embeddings_dir, 'cards_metadata.json'))
-
-            if cards_db or has_embeddings:
-                identify_res = card_id.identify_card_from_ocr(
-                    region_texts,
-                    cards_list=cards_db if cards_db else None,
-                    embeddings_dir=embeddings_dir if has_embeddings else None,
-                )
-                best = identify_res.get("best") or {}
-                identified_name = (best.get("name") or best.get("title") or region_texts.get("name") or "").strip()
-                id_score = float(identify_res.get("score", 0.0))
-            else:
-                identify_res = {}
-                best = {}
-                identified_name = (region_texts.get("name") or "").strip()
-                id_score = 0.0
-
-            card_conf = min(1.0, id_score / 100.0) if id_score > 0 else 0.0
-
-            card = Card(
-                game="mtg",
-                name=identified_name,
-                set_code=(best.get("set") or best.get("set_code")),
-                collector_number=(best.get("collector_number") or best.get("collector")),
-                confidence=card_conf,
-            )
-
-            cell, reason = assign_card(card, CFG, state_snapshot)
-
-            expected_name = None
-            expected_cell = None
-            if use_filename_expected and upload.filename:
-                base = os.path.splitext(os.path.basename(upload.filename))[0]
-                if "__" in base:
-                    parts = base.split("__", 1)
-                    expected_name = parts[0].replace("_", " ").strip()
-                    expected_cell = parts[1].strip().upper() or None
-                else:
-                    expected_name = base.replace("_", " ").strip()
-
-            if expected_cell is None and expected_name:
-                tmp_card = Card(game="mtg", name=expected_name, confidence=1.0)
-                expected_cell, _ = assign_card(tmp_card, CFG, state_snapshot)
-
-            match_name = False
-            if expected_name and identified_name:
-                match_name = expected_name.lower() == identified_name.lower()
-
-            match_cell = False
-            if expected_cell and cell:
-                match_cell = expected_cell.upper() == cell.upper()
-
-            if match_name:
-                name_matches += 1
-            if match_cell:
-                cell_matches += 1
-            if match_name and match_cell:
-                both_matches += 1
-
-            file_result.update(
-                {
-                    "expected": {
-                        "name": expected_name,
-                        "cell": expected_cell,
-                    },
-                    "ocr": {
-                        "rotation": ocr_res.get("rotation_detected"),
-                        "rotation_confidence": ocr_res.get("rotation_confidence"),
-                        "regions": regions,
-                    },
-                    "region_texts": region_texts,
-                    "identify": identify_res,
-                    "identify_debug": identify_res.get("debug"),
-                    "identified_name": identified_name,
-                    "id_score": id_score,
-                    "assignment": {
-                        "cell": cell,
-                        "reason": reason,
-                    },
-                    "match_name": match_name,
-                    "match_cell": match_cell,
-                }
-            )
-
+            if isinstance(analysis, BaseException):
+                raise analysis
+            _finish_file_result(file_result, analysis, ocr_only, use_filename_expected, state_snapshot)
         except Exception as exc:
             file_result.update({"error": str(exc)})
-
         results.append(file_result)
 
-    summary = {
-        "total": len(results),
-        "db_path": active_db_path,
-        "name_matches": name_matches,
-        "cell_matches": cell_matches,
-        "both_matches": both_matches,
-    }
+    wall = time.perf_counter() - started
+    summary = _batch_summary(results, active_db_path)
+    summary["elapsed_s"] = round(wall, 3)
+    summary["workers"] = workers.summarize_util(util, wall)
 
     return {
         "summary": summary,
         "results": results,
     }
+
+
+def _stream_event(kind: str, payload: dict, stream_format: str) -> str:
+    data = json.dumps({"event": kind, **payload}, default=str)
+    if stream_format == "sse":
+        return f"event: {kind}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+@app.post("/demo/batch_identify_stream")
+async def demo_batch_identify_stream(
+    files: List[UploadFile] = File(...),
+    db_path: Optional[str] = Form(None),
+    use_filename_expected: bool = Form(True),
+    ocr_only: bool = Form(False),
+    stream_format: str = Form("ndjson"),
+    game: Optional[str] = Form(None),
+):
+    """
+    Streaming variant of /demo/batch_identify.
+
+    Emits one event per image as soon as it finishes (completion order, each carrying its
+    upload "index"), then a final "summary" event with the same aggregate as the
+    non-streaming endpoint. stream_format: "ndjson" (one JSON object per line) or "sse".
+    """
+
+    if not files:
+        raise HTTPException(status_code=400, detail="No images uploaded")
+    if stream_format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="stream_format must be 'ndjson' or 'sse'")
+
+    active_db_path = _resolve_batch_db(db_path)
+    state_snapshot = STORE.snapshot()
+
+    # read uploads up front: the request's files are closed once this handler returns
+    uploads = [(idx, upload.filename, await upload.read()) for idx, upload in enumerate(files, start=1)]
+
+    async def analyze(idx: int, filename: Optional[str], raw: bytes, util: dict):
+        file_result = {"index": idx, "filename": filename}
+        try:
+            analysis = await workers.run_analysis(raw, active_db_path, ocr_only, util=util, game=game)
+            _finish_file_result(file_result, analysis, ocr_only, use_filename_expected, state_snapshot)
+        except Exception as exc:
+            file_result.update({"error": str(exc)})
+        return file_result
+
+    async def events():
+        util: dict = {}
+        started = time.perf_counter()
+        tasks = [asyncio.ensure_future(analyze(idx, name, raw, util)) for idx, name, raw in uploads]
+        results = []
+        try:
+            yield _stream_event("start", {"total": len(tasks)}, stream_format)
+            for next_done in asyncio.as_completed(tasks):
+                file_result = await next_done
+                results.append(file_result)
+                yield _stream_event("result", {"result": file_result, "done": len(results)}, stream_format)
+            wall = time.perf_counter() - started
+            results.sort(key=lambda r: r["index"])
+            summary = _batch_summary(results, active_db_path)
+            summary["elapsed_s"] = round(wall, 3)
+            summary["workers"] = workers.summarize_util(util, wall)
+            yield _stream_event("summary", {"summary": summary}, stream_format)
+        finally:
+            # client went away mid-batch: don't leave work queued on the pool
+            for t in tasks:
+                t.cancel()
+
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type)
+
+
+# ---------- Background identification jobs ----------
+JOBS = jobs.JobManager(
+    analyze=lambda raw, job_db_path: workers.run_analysis(raw, job_db_path),
+    finish=lambda file_result, analysis, state: _finish_file_result(file_result, analysis, False, True, state),
+    # like the demo batch, jobs assign against a snapshot and never mutate live counts
+    new_state=lambda: STORE.snapshot(),
+    max_queued=int(os.environ.get("SORTME_JOB_QUEUE", "16")),
+    runners=int(os.environ.get("SORTME_JOB_RUNNERS", "1")),
+    in_flight=int(os.environ.get("SORTME_JOB_IN_FLIGHT", str(max(2, 2 * workers.pool_size())))),
+)
+
+
+def _require_jobs_worker() -> None:
+    # under serve.py every worker sees data/jobs: only worker 0 runs and resumes jobs, so an
+    # interrupted job is picked up once and the job table has one writer
+    if not prefork.is_primary_worker():
+        raise HTTPException(status_code=503, headers={"Retry-After": "1"},
+                            detail=f"Jobs are handled by worker 0, not worker {prefork.worker_index()}")
+
+
+@app.on_event("startup")
+async def _start_jobs():
+    if prefork.is_primary_worker():
+        await JOBS.start()
+
+
+@app.post("/jobs")
+async def submit_job(payload: dict):
+    """Submit {"path": <directory|.zip|.tar>, "db_path": optional} for background identification."""
+    _require_jobs_worker()
+    path = str(payload.get("path") or "").strip()
+    if not path:
+        raise HTTPException(status_code=400, detail="path is required")
+    try:
+        active_db_path = _resolve_batch_db(payload.get("db_path"))
+        return await JOBS.submit(path, db_path=active_db_path)
+    except jobs.JobQueueFull as exc:
+        raise HTTPException(status_code=429, detail=str(exc))
+    except FileNotFoundError as exc:
+        raise HTTPException(status_code=404, detail=f"Not found: {exc}")
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+@app.get("/jobs")
+def list_jobs():
+    _require_jobs_worker()
+    return {"jobs": JOBS.list()}
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    _require_jobs_worker()
+    try:
+        return JOBS.get(job_id)
+    except jobs.JobNotFound:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+
+
+@app.get("/jobs/{job_id}/results")
+def job_results(job_id: str, offset: int = 0, follow: bool = False):
+    """NDJSON of finished images from line offset; follow=true tails until the job ends."""
+    _require_jobs_worker()
+    try:
+        JOBS.get(job_id)
+    except jobs.JobNotFound:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return StreamingResponse(JOBS.iter_results(job_id, offset=offset, follow=follow),
+                             media_type="application/x-ndjson")
+
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    _require_jobs_worker()
+    try:
+        return JOBS.cancel(job_id)
+    except jobs.JobNotFound:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
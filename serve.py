@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+serve.py
+
+Multi-worker API server that loads the large read-only state once. The parent process
+preloads the default game's embedding index (memory-mapped), the card catalogs with their
+name index and OCR vocabulary and the heavy imports (app/services/prefork.py; the torch query
+encoder is loaded by each worker, after the fork),
+binds the listening socket, then forks the workers. Each worker imports main and runs uvicorn
+on the inherited socket, so the preloaded pages are shared copy-on-write instead of loaded N
+times as with `uvicorn --workers N` (which starts every worker from scratch).
+
+GET /debug/memory on any worker reports every process's unique (private) vs shared RSS and
+PSS; the sum of PSS is what the whole server really costs.
+
+Per-worker state: each worker has its own cell counts and recent results. Only worker 0
+keeps the state journal (SORTME_STATE_DIR; it is single-writer), the others count in memory;
+only worker 0 runs and resumes background jobs (data/jobs), the others answer /jobs with 503
+(retry: the next connection may land on worker 0, or run a single worker for job traffic) --
+so run several workers for identification traffic (/demo/*, /identify_*), and keep the
+sorter's run loop on a single worker (python serve.py --workers 1 or plain uvicorn).
+The per-request process pool (SORTME_WORKERS) defaults to inline here, since the HTTP workers
+already use the cores; set it explicitly to override.
+
+Usage:
+  python serve.py --workers 4
+  python serve.py --workers 2 --host 0.0.0.0 --port 8000 --card-db data/demo_cards.json
+"""
+import os
+import sys
+import socket
+import logging
+import argparse
+
+import yaml
+
+from app.services import prefork
+
+LOG = logging.getLogger("sort.serve")
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _serve_one(args):
+    def run(index: int, sock: socket.socket) -> None:
+        import asyncio
+        import uvicorn
+        if index != 0:
+            os.environ["SORTME_STATE_DIR"] = ""
+        os.environ["SORTME_WORKER_INDEX"] = str(index)
+        config = uvicorn.Config("main:app", log_level=args.log_level, access_log=False)
+        asyncio.run(uvicorn.Server(config).serve(sockets=[sock]))
+    return run
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Preload-then-fork API server")
+    ap.add_argument("--workers", type=int, default=int(os.environ.get("SORTME_HTTP_WORKERS", "2")))
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--config", default="config.yaml")
+    ap.add_argument("--card-db", default=os.environ.get("SORTME_CARD_DB_PATH", os.path.join("data", "demo_cards.json")))
+    ap.add_argument("--no-preload", action="store_true", help="fork without preloading (to compare memory)")
+    ap.add_argument("--log-level", default="info")
+    args = ap.parse_args()
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.INFO),
+                        format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    os.environ.setdefault("SORTME_WORKERS", "0")
+    if not args.no_preload:
+        with open(args.config, "r", encoding="utf8") as fh:
+            prefork.preload(yaml.safe_load(fh), card_db=args.card_db)
+    sock = _bind(args.host, args.port)
+    LOG.info("Listening on %s:%d with %d workers", args.host, args.port, args.workers)
+    prefork.run_workers(max(1, args.workers), _serve_one(args), sock)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,6 @@
 import argparse
 from pathlib import Path
-from .ocr import ocr_with_easyocr
-from .embeddings import SimpleEmbedder
+from .ocr import ocr_with_easyocr, ocr_with_tesseract
 
 
 def main():
@@ -16,7 +15,7 @@ def main():
         return
 
     if args.use_tesseract:
-        text = __import__('src.ocr', fromlist=['']).ocr_with_tesseract(str(img))
+        text = ocr_with_tesseract(str(img))
     else:
         text = ocr_with_easyocr(str(img))
 
@@ -24,6 +23,8 @@ def main():
     print(text)
 
     print('\n--- Embedding (first 10 dims) ---')
+    # torch is only needed from here on: import it now, not at startup
+    from .embeddings import SimpleEmbedder
     emb = SimpleEmbedder().embed(str(img))
     print(emb[:10])
 
@@ -1,13 +1,11 @@
+import importlib.util
 import os
 from typing import Optional
 from PIL import Image
 import pytesseract
 
-try:
-    import easyocr
-    _HAS_EASYOCR = True
-except Exception:
-    _HAS_EASYOCR = False
+# easyocr pulls in torch: only check it is installed here, import it on first use
+_HAS_EASYOCR = importlib.util.find_spec('easyocr') is not None
 
 
 def ocr_with_tesseract(image_path: str, lang: str = 'eng') -> str:
@@ -30,6 +28,7 @@ def ocr_with_easyocr(image_path: str, lang_list: Optional[list] = None) -> str:
         return ocr_with_tesseract(image_path)
     if lang_list is None:
         lang_list = ['en']
+    import easyocr
     reader = easyocr.Reader(lang_list, gpu=False)
     results = reader.readtext(image_path)
     # results is list of (bbox, text, conf)
@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+from app.services import alpha_balance
+from app.services.assign import Card, SystemState, assign_card, load_config
+
+LETTERS = {'S': 12, 'B': 9, 'C': 8, 'D': 7, 'T': 6, 'M': 6, 'A': 5, 'Q': 0.3, 'X': 0.2, 'Z': 0.5}
+CELLS = [f'{c}{r}' for c in 'BCDE' for r in (1, 2, 3)]
+
+
+def _raw(mode, ranges_file):
+    return {
+        'sorting': {'default_mode': mode},
+        'cells': [{'id': 'A1', 'capacity': 100}] + [{'id': c, 'capacity': 40} for c in CELLS] +
+                 [{'id': 'ERR1', 'capacity': 500}],
+        'feeder': {'reserve_pattern': '^A'},
+        'alpha_exact': {'letter_to_cell': {k: CELLS[i % len(CELLS)] for i, k in enumerate(sorted(LETTERS))}},
+        'overflow': {'cells': ['ERR1']},
+        'alpha_balanced': {'ranges_file': ranges_file},
+    }
+
+
+def _names(rnd, n):
+    letters, weights = list(LETTERS), list(LETTERS.values())
+    return [rnd.choices(letters, weights)[0] + ''.join(rnd.choice('aeilnorst') for _ in range(6)) for _ in range(n)]
+
+
+def _overflow(cfg, names):
+    state = SystemState({c: 0 for c in cfg.cells})
+    for n in names:
+        cell, _ = assign_card(Card('mtg', n), cfg, state)
+        state.counts_by_cell[cell] += 1
+    return state.counts_by_cell['ERR1']
+
+
+def test_balanced_ranges_keep_overflow_near_zero(tmp_path):
+    rnd = random.Random(11)
+    ranges_file = str(tmp_path / 'ranges.json')
+    run = _names(rnd, 400)                  # 400 cards into 12 x 40 slots
+    exact = load_config(_raw('alpha_exact', ranges_file))
+    balanced = load_config(_raw('alpha_balanced', ranges_file))
+    assert balanced.balanced is None        # nothing learned yet: letters
+    bmap = alpha_balance.rebalance(balanced, _names(rnd, 3000), expected_cards=400, source='test')
+
+    assert bmap.starts == sorted(bmap.starts) and bmap.cells == CELLS
+    assert max(bmap.predicted.values()) <= 40
+    assert _overflow(exact, run) > 100
+    assert _overflow(balanced, run) <= 10
+
+    # saved between runs: a fresh config picks the same ranges up
+    again = load_config(_raw('alpha_balanced', ranges_file))
+    assert again.balanced.as_dict() == bmap.as_dict()
+    assert assign_card(Card('mtg', 'Sorin'), again, SystemState({c: 0 for c in again.cells}))[1].startswith('alpha_balanced:')
+
+
+def test_heavy_prefixes_are_refined():
+    weights = alpha_balance.learn_weights(['Sta'] * 50 + ['Stb'] * 50 + ['Ab'], prefix_len=2, split_above=60)
+    assert weights == {'sta': 50, 'stb': 50, 'ab': 1}
+
+
+def test_zero_capacity_cells_get_no_range(tmp_path):
+    bmap = alpha_balance.balance({'aa': 5, 'bb': 5}, [('A1', 10), ('A2', 0)])
+    assert bmap.cells == ['A1'] and bmap.predicted == {'A1': 10.0}
+    with pytest.raises(ValueError):
+        alpha_balance.balance({'aa': 5}, [('A1', 0)])
+
+    raw = _raw('alpha_balanced', str(tmp_path / 'ranges.json'))
+    raw['cells'][1]['capacity'] = 0                     # B1 closed
+    cfg = load_config(raw)
+    bmap = alpha_balance.rebalance(cfg, _names(random.Random(3), 500), expected_cards=300)
+    assert 'B1' not in bmap.cells and len(bmap.cells) == len(CELLS) - 1
+    # the split threshold still comes from the open cells (a 0 would refine every prefix)
+    assert max(len(s) for s in bmap.starts) < 4
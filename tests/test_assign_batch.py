@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.services import alpha_balance
+from app.services.assign import Card, SystemState, assign_card, load_config
+from app.services.assign_batch import assign_cards_batch
+
+CELLS = ['A1', 'B1', 'B2', 'B3', 'C1', 'C2', 'ERR1', 'ERR2']
+
+
+def _raw(mode='alpha_exact', **extra):
+    raw = {
+        'sorting': {'default_mode': mode, 'low_confidence_threshold': 0.5},
+        'cells': [{'id': c, 'capacity': 9 if c.startswith('ERR') else 6} for c in CELLS],
+        'feeder': {'reserve_pattern': '^A'},
+        'alpha_exact': {'letter_to_cell': {chr(65 + i): CELLS[1 + i % 5] for i in range(26)}},
+        'overflow': {'cells': ['ERR1', 'ERR2']},
+        'alpha_balanced': {'ranges_file': '/nonexistent/ranges.json'},
+    }
+    raw.update(extra)
+    return raw
+
+
+def _cards(rnd, n):
+    return [Card('mtg', rnd.choice('ABCSSSTXZ') + rnd.choice('aeiou') + str(i), rnd.choice(['DMU', 'BRO']),
+                 confidence=rnd.choice([1.0, 1.0, 1.0, 0.3]), rarity=rnd.choice(['common', 'rare']),
+                 color_identity=rnd.choice(['U', 'UB', '']), mana_value=rnd.randint(0, 6),
+                 price=rnd.choice([0.1, 2.0, 30.0]))
+            for i in range(n)]
+
+
+def _sequential(cards, cfg, state):
+    state = SystemState(dict(state.counts_by_cell))
+    out = []
+    for c in cards:
+        cell, reason = assign_card(c, cfg, state)
+        state.counts_by_cell[cell] = state.counts_by_cell.get(cell, 0) + 1
+        out.append((cell, reason))
+    return out, state.counts_by_cell
+
+
+@pytest.mark.parametrize('mode', ['alpha_exact', 'alpha_balanced', 'rules'])
+def test_batch_matches_sequential(mode):
+    rnd = random.Random(hash(mode) % 1000)
+    rules = [
+        {'name': 'pricey', 'when': {'price': {'min': 20}}, 'cells': ['C2', 'B1']},
+        {'name': 'blue', 'when': {'color_identity': ['U'], 'mana_value': {'max': 3}}, 'cells': ['C1', 'C2', 'ERR2']},
+        {'name': 'dmu_rares', 'when': {'set': ['DMU'], 'rarity': ['rare']}, 'cell': 'B3'},
+    ]
+    cfg = load_config(_raw(mode, rules=rules))
+    if mode == 'alpha_balanced':
+        alpha_balance.rebalance(cfg, [c.name for c in _cards(rnd, 200)], save=False)
+    for n in (0, 1, 25, 120):
+        cards = _cards(rnd, n)
+        state = SystemState({c: rnd.choice([0, 0, 2, 7]) for c in CELLS})
+        expected, counts = _sequential(cards, cfg, state)
+        res = assign_cards_batch(cards, cfg, state)
+        assert list(zip(res.cells, res.reasons)) == expected
+        assert res.counts == counts
+        assert state.counts_by_cell != counts or n == 0     # state itself is untouched
+
+
+def test_first_letters_match_python_rule():
+    from app.services.assign_batch import _first_letters
+    from app.services.rules import first_letter
+    names = ['  bolt', 'éclair', 'ß', '', '9lives', 'zed', '\tq', 'ǆx', 'Ꮎ']
+    assert _first_letters(names).tolist() == [ord(first_letter(n)) - 65 for n in names]
@@ -0,0 +1,90 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.services import card_id
+from app.services.batching import MicroBatcher
+
+
+class SlowEncoder:
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, texts, convert_to_numpy=True):
+        self.batches.append(len(texts))
+        time.sleep(0.01)
+        return np.asarray([[float(len(t))] for t in texts], dtype=np.float32)
+
+
+def _concurrently(fn, items):
+    out = [None] * len(items)
+    start = threading.Barrier(len(items))
+
+    def run(i):
+        start.wait()
+        out[i] = fn(items[i])
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(items))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return out
+
+
+def test_concurrent_submits_share_forward_passes():
+    calls = []
+    batcher = MicroBatcher(lambda xs: calls.append(len(xs)) or [x * 2 for x in xs],
+                           max_batch=4, max_latency_ms=50, name="test")
+    try:
+        assert _concurrently(batcher.run, list(range(8))) == [x * 2 for x in range(8)]
+    finally:
+        batcher.close()
+    s = batcher.stats()
+    assert s["items"] == 8 and sum(calls) == 8
+    assert max(calls) <= 4 and s["batches"] < 8 and s["max_batch_seen"] > 1
+
+
+def test_cancelled_items_and_failed_batches_do_not_stop_the_worker():
+    batcher = MicroBatcher(lambda xs: [x + 1 for x in xs], max_batch=8, max_latency_ms=50, name="test")
+    try:
+        gone, kept = batcher.submit(1), batcher.submit(2)
+        assert gone.cancel()                      # still queued: cancelled before the batch runs
+        assert kept.result(timeout=2) == 3
+        real = batcher._run_batch
+
+        def broken(batch):
+            batcher._run_batch = real
+            raise RuntimeError("boom")
+        batcher._run_batch = broken
+        with pytest.raises(RuntimeError):
+            batcher.run(5, timeout=2)             # the failed batch fails its callers
+        assert batcher.run(10, timeout=2) == 11     # the thread is still serving
+    finally:
+        batcher.close()
+    assert batcher.stats()["items"] == 2
+
+
+def test_concurrent_queries_are_grouped_and_counted():
+    saved = (card_id.ENCODER_MAX_BATCH, card_id.ENCODER_MAX_LATENCY_MS)
+    enc = SlowEncoder()
+    try:
+        card_id.set_query_batching(32, 50)
+        before = card_id.encoder_stats()
+        out = _concurrently(lambda t: card_id._encode_query(enc, t), ["a" * i for i in range(1, 9)])
+        assert [float(v[0]) for v in out] == [float(i) for i in range(1, 9)]
+        assert len(enc.batches) < 8 and sum(enc.batches) == 8
+        after = card_id.encoder_stats()
+        assert after["queries"] - before["queries"] == 8
+        assert after["forward_passes"] - before["forward_passes"] == len(enc.batches)
+
+        # batching off (as in pool workers): one pass per query, no latency window
+        card_id.set_query_batching(1)
+        enc.batches.clear()
+        t0 = time.perf_counter()
+        card_id._encode_query(enc, "solo")
+        assert enc.batches == [1] and time.perf_counter() - t0 < 0.05
+        assert card_id.encoder_stats()["forward_passes"] == after["forward_passes"] + 1
+    finally:
+        card_id.set_query_batching(*saved)
@@ -0,0 +1,45 @@
+import random
+
+import numpy as np
+import pytest
+
+import bench_pipeline
+
+
+def _report(p50, name_acc, glare_cell=1.0, tp=2.0):
+    return {
+        "latency_ms": {s: {"p50": p50, "p95": 2 * p50, "p99": 3 * p50} for s in bench_pipeline.STAGES},
+        "images_per_s_per_core": tp,
+        "accuracy": {"n": 10, "name": name_acc, "cell": 1.0},
+        "accuracy_by_variant": {"original": {"n": 5, "name": 1.0, "cell": 1.0},
+                                "glare": {"n": 5, "name": name_acc, "cell": glare_cell}},
+    }
+
+
+def test_compare_flags_latency_throughput_and_accuracy():
+    base = _report(100.0, 0.9)
+    assert bench_pipeline.compare(base, _report(110.0, 0.9)) == []
+    slow = bench_pipeline.compare(base, _report(130.0, 0.9, tp=1.5))
+    assert any(l.startswith("latency ocr p50") for l in slow)
+    assert any(l.startswith("throughput") for l in slow)
+    worse = bench_pipeline.compare(base, _report(80.0, 0.8, glare_cell=0.8))
+    assert "accuracy name (overall): 0.9 -> 0.8" in worse
+    assert "accuracy cell (glare): 1.0 -> 0.8" in worse
+    assert not any(l.startswith("latency") for l in worse)
+    assert bench_pipeline.compare(base, _report(80.0, 0.8), accuracy_tol=0.15) == []
+
+
+def test_percentiles_in_ms():
+    p = bench_pipeline.percentiles([0.001 * i for i in range(1, 101)])
+    assert p["p50"] == pytest.approx(50.5)
+    assert p["p99"] == pytest.approx(99.01)
+    assert bench_pipeline.percentiles([])["p95"] is None
+
+
+def test_augmentations_keep_a_card_image():
+    pytest.importorskip("cv2")
+    img = np.full((680, 488, 3), 40, dtype=np.uint8)
+    for name, fn in bench_pipeline.AUGMENTATIONS.items():
+        out = fn(img, random.Random(1))
+        assert out.dtype == np.uint8 and out.ndim == 3, name
+    assert bench_pipeline.AUGMENTATIONS["glare"](img, random.Random(1)).max() > 40
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from app.services import card_catalog
+
+ROWS = [
+    {'name': 'Lightning Bolt', 'set': 'm10', 'rarity': 'common', 'oracle_text': 'Deal 3 damage.'},
+    {'name': 'Lightning Bolt', 'set': 'm11', 'rarity': 'common'},
+    {'name': 'Æther Vial', 'set': 'dst', 'rarity': 'uncommon'},
+]
+
+
+def _write(path, rows):
+    path.write_text(json.dumps(rows))
+    return str(path)
+
+
+def test_rows_are_loaded_once_with_shared_views(tmp_path):
+    path = _write(tmp_path / 'cards_metadata.json', ROWS)
+    cat = card_catalog.get_catalog(path)
+    assert card_catalog.get_catalog(path) is cat
+    # repeated short strings are one object
+    assert cat.rows[0]['rarity'] is cat.rows[1]['rarity']
+    assert cat.vocabulary == ['bolt', 'lightning', 'vial', 'æther']
+    assert [r['set'] for r in cat.by_name('LIGHTNING  bolt!')] == ['m10', 'm11']
+    assert cat.by_name('Æther vial')[0]['set'] == 'dst'
+    assert card_catalog.catalog_of(cat.rows) is cat
+    assert card_catalog.catalog_of(list(cat.rows)) is None
+    card_catalog.drop(path)
+
+
+def test_changed_file_reloads_every_view_under_a_new_version(tmp_path, monkeypatch):
+    monkeypatch.setattr(card_catalog, 'CHECK_S', 0.0)
+    path = _write(tmp_path / 'db.json', ROWS)
+    old = card_catalog.get_catalog(path)
+    old.vocabulary
+    _write(tmp_path / 'db.json', ROWS + [{'name': 'Opt', 'set': 'eld'}])
+    new = card_catalog.get_catalog(path)
+    assert new is not old and new.version > old.version
+    assert 'opt' in new.vocabulary and new.by_name('opt')
+    assert card_catalog.catalog_of(old.rows) is None
+    card_catalog.drop(path)
+    assert card_catalog.loaded(path) is None
+
+
+def test_identify_uses_the_catalog_name_index(tmp_path):
+    pytest.importorskip('sklearn')
+    from app.services import card_id
+    path = _write(tmp_path / 'db.json', ROWS)
+    res = card_id.identify_card_from_ocr({'name': 'lightning bolt'}, db_path=path)
+    assert res['best']['set'] == 'm10' and res['score'] == 100.0
+    fuzzy = card_id.identify_card_from_ocr({'name': 'Lightnin Bolt'}, db_path=path)
+    assert fuzzy['best']['name'] == 'Lightning Bolt'
+    assert card_id.load_local_db(path) is card_catalog.get_catalog(path).rows
+    card_catalog.drop(path)
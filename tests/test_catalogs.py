@@ -0,0 +1,75 @@
+import json
+
+import numpy as np
+import pytest
+
+from app.services.catalogs import CatalogRegistry
+
+RAW = {
+    'sorting': {'default_mode': 'alpha_exact', 'low_confidence_threshold': 0.5},
+    'cells': [{'id': c, 'capacity': 10} for c in ('A1', 'B1', 'B2', 'ERR1')],
+    'feeder': {'reserve_pattern': '^A'},
+    'alpha_exact': {'letter_to_cell': {'A': 'B1'}},
+    'overflow': {'cells': ['ERR1']},
+}
+
+
+def _card(border_bgr, h=352, w=252):
+    img = np.full((h, w, 3), 128, dtype=np.uint8)
+    img[:] = border_bgr
+    img[20:-20, 20:-20] = (90, 160, 40)        # artwork / text box
+    return img
+
+
+def _registry(tmp_path, **games):
+    return CatalogRegistry(dict(RAW, games=dict({'default': 'mtg'}, **games)))
+
+
+def test_detects_game_from_border_colour(tmp_path):
+    reg = _registry(tmp_path,
+                    mtg={'frame': {'border_rgb': [20, 20, 20]}},
+                    pokemon={'frame': {'border_rgb': [235, 200, 40]}})
+    assert reg.detect(_card((40, 205, 230)))[0] == 'pokemon'     # BGR yellow
+    assert reg.detect(_card((15, 15, 15)))[0] == 'mtg'
+    # a white-bordered card matches neither: default game
+    assert reg.detect(_card((250, 250, 250)))[0] == 'mtg'
+    assert reg.stats()['undetected'] == 1
+    # grayscale frames (2-D arrays) compare as grey
+    gray = np.full((352, 252), 18, dtype=np.uint8)
+    gray[20:-20, 20:-20] = 200
+    assert reg.detect(gray)[0] == 'mtg' and reg.stats()['detected'] == 3
+
+
+def test_sorting_overrides_are_per_game(tmp_path):
+    base = CatalogRegistry(RAW).config(None)
+    reg = CatalogRegistry(dict(RAW, games={'mtg': {}, 'lorcana': {'alpha_exact': {'letter_to_cell': {'A': 'B2'}}}}),
+                          base_cfg=base)
+    assert reg.config('MTG') is base
+    assert reg.config('lorcana').letter_to_cell['A'] == 'B2'
+    assert reg.config('unknown-game') is base
+    with pytest.raises(ValueError):
+        CatalogRegistry(dict(RAW, games={'mtg': {'cells': []}}))
+
+
+def _index(root, game, n):
+    d = root / game
+    d.mkdir()
+    np.save(d / 'embeddings.npy', np.zeros((n, 64), dtype=np.float32))
+    (d / 'cards_metadata.json').write_text(json.dumps([{'name': f'{game} card {i}'} for i in range(n)]))
+    return str(d)
+
+
+def test_indexes_load_lazily_and_evict_least_recently_used(tmp_path):
+    pytest.importorskip('sklearn')
+    pytest.importorskip('cv2')          # the OCR vocabulary lives in ocr.py
+    games = {g: {'embeddings_dir': _index(tmp_path, g, 2000)} for g in ('mtg', 'pokemon', 'lorcana')}
+    # each game is ~1.5 MB resident (vectors twice + catalog rows): room for two
+    reg = CatalogRegistry(dict(RAW, games=dict(games, memory_budget_mb=3.5)))
+    assert reg.stats()['loaded'] == {}
+    reg.get('mtg')
+    reg.get('pokemon')
+    reg.get('mtg')                      # mtg is now the most recently used
+    reg.get('lorcana')
+    s = reg.stats()
+    assert sorted(s['loaded']) == ['lorcana', 'mtg']
+    assert (s['loads'], s['evictions'], s['hits']) == (3, 1, 1)
@@ -0,0 +1,67 @@
+import threading
+
+from app.services.assign import Card, load_config
+from app.services.cell_store import CellStore
+
+CFG = load_config({
+    'cells': [{'id': 'A1', 'capacity': 50}, {'id': 'B1', 'capacity': 2}, {'id': 'ERR1', 'capacity': 50}],
+    'feeder': {'reserve_pattern': '^A'},
+    'alpha_exact': {'letter_to_cell': {'B': 'B1'}},
+    'overflow': {'cells': ['ERR1']},
+})
+
+
+def _store():
+    return CellStore(['A1', 'B1', 'ERR1'])
+
+
+def test_assign_reserves_the_slot_and_release_gives_it_back():
+    store = _store()
+    bolt, bear = Card('mtg', 'Bolt'), Card('mtg', 'Bear')
+    assert store.assign(bolt, CFG)[0] == 'B1'
+    assert store.assign(bear, CFG)[0] == 'B1'
+    # both reservations count against capacity before either card has arrived
+    assert store.get('B1') == 2
+    assert store.assign(Card('mtg', 'Bog'), CFG)[0] == 'ERR1'
+    assert store.release('B1', bear) == 1
+    assert [c['name'] for c in store.pile('B1')] == []
+    assert store.assign(Card('mtg', 'Brute'), CFG)[0] == 'B1'
+
+
+def test_placed_keeps_the_count_and_records_the_pile():
+    store = _store()
+    bolt = Card('mtg', 'Bolt', set_code='M10')
+    cell, _ = store.assign(bolt, CFG)
+    store.placed(cell, bolt)
+    assert store.get('B1') == 1
+    assert [c['name'] for c in store.pile('B1')] == ['Bolt']
+    assert store.locate('Bolt')[0]['cell'] == 'B1'
+
+
+def test_snapshot_is_independent_of_the_store():
+    store = _store()
+    store.assign(Card('mtg', 'Bolt'), CFG)
+    snap = store.snapshot()
+    snap.counts_by_cell['B1'] = 0
+    store.add('ERR1', 3)
+    assert store.get('B1') == 1 and snap.counts_by_cell['ERR1'] == 0
+    assert store.state.counts_by_cell['ERR1'] == 3        # state is the live view for readers
+
+
+def test_concurrent_placers_never_share_the_last_slot():
+    store = _store()
+    store.add('B1', 1)
+    barrier = threading.Barrier(8)
+    cells = []
+
+    def place(i):
+        barrier.wait()
+        cells.append(store.assign(Card('mtg', f'Bolt{i}'), CFG)[0])
+
+    threads = [threading.Thread(target=place, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert cells.count('B1') == 1 and cells.count('ERR1') == 7
+    assert store.get('B1') == 2
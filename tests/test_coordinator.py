@@ -0,0 +1,146 @@
+import asyncio
+
+import pytest
+
+from app.services import kinematics
+from app.services.assign import Card, load_config
+from app.services.cell_store import CellStore
+from app.services.coordinator import Coordinator, ZoneTable
+from app.services.feeders import FeederScheduler
+from app.services.motion import MotionController
+
+COLUMNS = "BCDEFGHI"
+CFG = load_config({
+    'cells': [{'id': c, 'capacity': 100} for c in ['A1', 'A2'] + [f'{l}1' for l in COLUMNS] + ['ERR1']],
+    'feeder': {'reserve_pattern': '^A'},
+    'alpha_exact': {'letter_to_cell': {l: f'{l}1' for l in COLUMNS}},
+    'overflow': {'cells': ['ERR1']},
+})
+
+
+def _heads(n, feeder_ends=False, fail=False):
+    layout = kinematics.grid_layout(list(CFG.cells))
+    if feeder_ends:
+        # second feeder at the far end of the rail, as bench_cycle --feeder-ends
+        layout["A2"] = dict(layout["A2"], x=max(p["x"] for p in layout.values()) + 90.0)
+
+    class Head(MotionController):
+        async def transfer_card(self, from_cell, to_cell):
+            if fail:
+                raise RuntimeError("vacuum lost")
+            return await super().transfer_card(from_cell, to_cell)
+
+    heads = []
+    for _ in range(n):
+        h = Head(kinematics.KinematicDriver(virtual_time=True))
+        h.configure_cells(layout)
+        heads.append(h)
+    return heads
+
+
+def _cards(n):
+    return [Card('mtg', f'{COLUMNS[i % len(COLUMNS)]}card{i}') for i in range(n)]
+
+
+async def _serve(coord, cards):
+    queue = asyncio.Queue()
+    for c in cards:
+        queue.put_nowait(c)
+    queue.put_nowait(None)
+    await coord.serve(queue)
+
+
+# ---------- ZoneTable ----------
+def _table(pos):
+    return ZoneTable(10.0, lambda h: pos[h], park_x=[0.0, 1000.0])
+
+
+def test_overlapping_zone_waits_for_release_and_disjoint_zones_run_together():
+    zt = _table({0: 100.0, 1: 900.0})
+    a = zt.open(100.0, 200.0)
+    a.head = 0
+    b = zt.open(190.0)
+    b.head = 1
+    zt.grant_ready()
+    assert a.granted and not b.granted           # b's span (from 900 down to 190) crosses a's
+    c = zt.open(950.0)
+    c.head = 1
+    zt.cancel(b)
+    zt.grant_ready()
+    assert c.granted and zt.active == {0: (90.0, 210.0), 1: (890.0, 960.0)}
+    zt.release(0)
+    zt.release(1)
+    assert zt.active == {}
+
+
+def test_zones_are_granted_in_ticket_order():
+    zt = _table({0: 100.0, 1: 900.0})
+    first = zt.open(500.0)          # no head yet: still holds its place in line
+    later = zt.open(480.0)
+    later.head = 1
+    zt.grant_ready()
+    assert not first.granted and not later.granted
+    first.head = 0
+    zt.grant_ready()
+    assert first.granted and not later.granted
+    zt.release(0)
+    zt.grant_ready()
+    assert later.granted
+
+
+def test_idle_head_in_the_way_is_parked_unless_its_park_spot_is_blocked():
+    pos = {0: 100.0, 1: 300.0}
+    zt = _table(pos)
+    req = zt.open(400.0)
+    req.head = 0
+    zt.grant_ready()
+    assert req.granted and req.park == [1]
+    zt.release(0)
+    blocked = zt.open(1000.0)       # head 1's park spot is inside this zone
+    blocked.head = 0
+    zt.grant_ready()
+    assert not blocked.granted
+
+
+# ---------- Coordinator ----------
+def test_feeders_at_both_ends_keep_every_head_busy():
+    async def main():
+        store, feeders = CellStore(CFG.cells.keys()), FeederScheduler.from_cfg(CFG)
+        coord = Coordinator(_heads(2, feeder_ends=True), CFG, store, feeders)
+        assert coord.active == [0, 1]
+        await _serve(coord, _cards(24))
+        return coord, store, feeders
+
+    coord, store, feeders = asyncio.run(main())
+    per_head = [h["transfers"] for h in coord.stats()["heads"]]
+    assert sum(per_head) == 24 and min(per_head) > 0
+    assert sum(store.counts().values()) == 24
+    assert sum(feeders.stock().values()) == 200 - 24
+    assert coord.zones.active == {}
+
+
+def test_feeders_on_one_side_leave_a_single_head_working():
+    async def main():
+        coord = Coordinator(_heads(2), CFG, CellStore(CFG.cells.keys()), FeederScheduler.from_cfg(CFG))
+        assert coord.active == [0] and not coord.partition
+        await _serve(coord, _cards(10))
+        return coord
+
+    st = asyncio.run(main()).stats()["heads"]
+    assert [h["transfers"] for h in st] == [10, 0]
+    assert [h["active"] for h in st] == [True, False]
+
+
+def test_failed_transfer_releases_the_slot_the_feeder_card_and_the_head():
+    async def main():
+        store, feeders = CellStore(CFG.cells.keys()), FeederScheduler.from_cfg(CFG)
+        coord = Coordinator(_heads(2, feeder_ends=True, fail=True), CFG, store, feeders)
+        with pytest.raises(RuntimeError):
+            await coord.place(Card('mtg', 'Bcard'))
+        return coord, store, feeders
+
+    coord, store, feeders = asyncio.run(main())
+    assert sum(store.counts().values()) == 0 and store.pile("B1") == []
+    assert feeders.stock() == {"A1": 100, "A2": 100}
+    assert coord.zones.active == {} and not any(coord._busy)
+    assert sum(h["failures"] for h in coord.stats()["heads"]) == 1
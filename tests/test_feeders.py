@@ -0,0 +1,31 @@
+import pytest
+
+from app.services import kinematics
+from app.services.feeders import FeederEmpty, FeederScheduler
+
+CELLS = kinematics.grid_layout(["A1", "A2", "A3", "B1", "B3", "J3"])
+
+
+def _driver():
+    return kinematics.KinematicDriver(virtual_time=True)
+
+
+def test_choose_prefers_the_feeder_nearest_the_destination():
+    fs = FeederScheduler({"A1": 10, "A2": 10, "A3": 10})
+    assert fs.choose("B1", CELLS, (0.0, 0.0, 0.0), 400.0, _driver(), plan_ahead=False) == "A1"
+    assert fs.choose("B3", CELLS, (0.0, 140.0, 0.0), 400.0, _driver(), plan_ahead=False) == "A3"
+
+
+def test_choose_skips_reloading_and_empty_feeders_and_rotates_ties():
+    fs = FeederScheduler({"A1": 10, "A2": 10}, initial={"A1": 3, "A2": 5})
+    assert fs.choose("J3") == "A2"                         # no coordinates: fullest first
+    fs.begin_reload("A2")
+    assert fs.choose("B3", CELLS, (0.0, 140.0, 0.0), 400.0, _driver()) == "A1"
+    for _ in range(3):
+        fs.take(fs.choose("B1"), "B1")
+    with pytest.raises(FeederEmpty):
+        fs.next_source("B1")
+    fs.end_reload("A2", 2)
+    assert fs.next_source("B1") == "A2" and fs.stock() == {"A1": 0, "A2": 1}
+    fs.release("A2")
+    assert fs.stock()["A2"] == 2
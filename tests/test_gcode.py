@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("termios")
+
+from app.services import gcode, motion
+
+CELLS = {
+    'A1': {'x': 0.0, 'y': 0.0, 'z': 0.0},
+    'B1': {'x': 90.0, 'y': 70.0, 'z': 0.0},
+}
+
+
+def _transfer(fake, count=3):
+    async def run():
+        driver = gcode.GcodeDriver(fake.port, rx_buffer=fake.rx_buffer)
+        ctrl = motion.MotionController(driver=driver)
+        ctrl.configure_cells(CELLS)
+        try:
+            for _ in range(count):
+                await ctrl.transfer_card('A1', 'B1')
+                await ctrl.transfer_card('B1', 'A1')
+            await driver.sync()
+            return driver.stats
+        finally:
+            await driver.close()
+    return asyncio.run(asyncio.wait_for(run(), timeout=10))
+
+
+def test_streams_within_rx_buffer_and_keeps_planner_fed():
+    with gcode.FakeGrblController(rx_buffer=128, planner_blocks=15, block_s=0.005) as fake:
+        stats = _transfer(fake)
+    assert not fake.overflow and fake.max_rx_used <= 128
+    assert stats['acks'] == stats['lines_sent'] == len(fake.lines)
+    # several lines in flight at once, i.e. not stop-and-wait
+    assert stats['max_lines_in_flight'] > 1
+    assert fake.max_planner_depth > 1
+    assert fake.lines[-1] == 'G4 P0'
+    assert any(l.startswith('G90 G1 X90.000 Y70.000') for l in fake.lines)
+
+
+def test_error_ack_fails_the_transfer():
+    with gcode.FakeGrblController(reject=('M8',)) as fake:
+        with pytest.raises(gcode.GcodeError):
+            _transfer(fake, count=1)
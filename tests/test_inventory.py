@@ -0,0 +1,63 @@
+from app.services.assign import Card, load_config
+from app.services.cell_store import CellStore
+from app.services.inventory import InventoryIndex, Want, parse_decklist, plan_dig
+from app.services.state_journal import StateJournal
+
+CFG = load_config({
+    'cells': [{'id': c, 'capacity': 50} for c in ('A1', 'B1', 'C1', 'ERR1')],
+    'feeder': {'reserve_pattern': '^A'},
+    'alpha_exact': {'letter_to_cell': {'B': 'B1', 'C': 'C1', 'O': 'B1'}},
+    'overflow': {'cells': ['ERR1']},
+})
+
+
+def _pile(index, cell, names):
+    for n in names:
+        index.reserve(cell, n)
+        index.place(cell, n)
+
+
+def test_stack_order_follows_transfer_completion(tmp_path):
+    store = CellStore(CFG.cells.keys(), journal=StateJournal(str(tmp_path), group_commit_ms=1))
+    bolt, opt = Card('mtg', 'Bolt', 'M10', '146'), Card('mtg', 'Opt', 'ELD', '59')
+    for card in (bolt, opt):
+        assert store.assign(card, CFG)[0] == 'B1'
+    # a route window transferred Opt first; Bolt landed on top of it
+    store.placed('B1', opt)
+    store.placed('B1', bolt)
+    bogus = Card('mtg', 'Bogles')
+    store.assign(bogus, CFG)
+    store.release('B1', bogus)
+
+    assert [c['name'] for c in store.pile('B1')] == ['Bolt', 'Opt']
+    assert store.locate('opt')[0]['depth'] == 1
+    assert store.locate('Bolt', set_code='m10')[0]['position'] == 1
+    assert store.locate('Bogles') == []
+    store.close()
+
+    again = CellStore(CFG.cells.keys(), journal=StateJournal(str(tmp_path), group_commit_ms=1))
+    assert [c['name'] for c in again.pile('B1')] == ['Bolt', 'Opt']
+    assert again.counts()['B1'] == 2
+    again.close()
+
+
+def test_dig_plan_prefers_shallow_copies_and_shares_digs():
+    index = InventoryIndex()
+    _pile(index, 'B1', ['Opt', 'x1', 'x2', 'x3', 'Bolt'])     # Opt at the bottom
+    _pile(index, 'C1', ['Opt', 'Counterspell', 'y1'])
+    plan = plan_dig(index, parse_decklist('1 Bolt\n1 Opt\n1 Counterspell\n// sideboard\n2 Brainstorm'))
+
+    # Opt comes from C1 (dug anyway for Counterspell), not from under four cards in B1
+    assert plan['pulled'] == 3
+    assert plan['lifted'] == 4 and plan['set_aside'] == 1
+    assert plan['missing'] == [{'name': 'Brainstorm', 'set_code': None, 'collector_number': None, 'qty': 2}]
+    c1 = next(d for d in plan['digs'] if d['cell'] == 'C1')
+    assert [(s['name'], s['action']) for s in c1['steps']] == [
+        ('y1', 'set_aside'), ('Counterspell', 'pull'), ('Opt', 'pull')]
+
+
+def test_parse_decklist():
+    wants = parse_decklist('Deck\n4x Lightning Bolt\nOpt (ELD) 59\n\n# note')
+    assert [(w.name, w.qty, w.set_code, w.collector_number) for w in wants] == [
+        ('Lightning Bolt', 4, None, None), ('Opt', 1, 'ELD', '59')]
+    assert isinstance(wants[0], Want)
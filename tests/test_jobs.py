@@ -0,0 +1,116 @@
+import asyncio
+import json
+import os
+
+from app.services import jobs
+
+
+def _source(tmp_path, n=5):
+    src = tmp_path / "scans"
+    src.mkdir()
+    for i in range(n):
+        (src / f"card_{i}.jpg").write_bytes(f"img{i}".encode())
+    (src / "notes.txt").write_text("not an image")
+    return src
+
+
+def _manager(root, seen, gate=None):
+    async def analyze(raw, db_path):
+        if gate is not None:
+            await gate.wait()
+        seen.append(raw)
+        if raw == b"img3":
+            raise ValueError("unreadable")
+        return {"name": raw.decode()}
+
+    def finish(file_result, analysis, state):
+        file_result["name"] = analysis["name"]
+        file_result["match_name"] = True
+        return file_result
+
+    return jobs.JobManager(analyze, finish, new_state=dict, root=str(root), in_flight=2)
+
+
+async def _wait(manager, job_id, status="done"):
+    for _ in range(200):
+        if manager.get(job_id)["status"] == status:
+            return manager.get(job_id)
+        await asyncio.sleep(0.01)
+    raise AssertionError(manager.get(job_id))
+
+
+def _results(root, job_id):
+    with open(os.path.join(root, job_id, "results.ndjson"), "r", encoding="utf8") as fh:
+        return [json.loads(line) for line in fh]
+
+
+def test_submit_runs_every_image_and_records_results(tmp_path):
+    src = _source(tmp_path)
+    seen = []
+
+    async def main():
+        m = _manager(tmp_path / "jobs", seen)
+        await m.start()
+        job = await m.submit(str(src))
+        assert job["total"] == 5 and job["status"] == "queued"
+        done = await _wait(m, job["id"])
+        await m.stop()
+        return done
+
+    done = asyncio.run(main())
+    assert (done["done"], done["errors"], done["name_matches"]) == (5, 1, 4)
+    recs = _results(tmp_path / "jobs", done["id"])
+    assert sorted(r["filename"] for r in recs) == [f"card_{i}.jpg" for i in range(5)]
+    assert [r for r in recs if "error" in r][0]["filename"] == "card_3.jpg"
+
+
+def test_cancel_stops_a_running_job(tmp_path):
+    src = _source(tmp_path)
+    seen = []
+
+    async def main():
+        gate = asyncio.Event()
+        m = _manager(tmp_path / "jobs", seen, gate)
+        await m.start()
+        job = await m.submit(str(src))
+        await _wait(m, job["id"], "running")
+        assert m.cancel(job["id"])["status"] == "cancelled"
+        gate.set()
+        await asyncio.sleep(0.05)
+        await m.stop()
+        return m.get(job["id"])
+
+    job = asyncio.run(main())
+    assert job["status"] == "cancelled" and job["done"] == 0
+    assert len(seen) <= 2                      # only the in-flight window was ever read
+
+
+def test_resume_skips_files_already_recorded(tmp_path):
+    src = _source(tmp_path)
+    root = tmp_path / "jobs"
+    job_dir = root / "abc"
+    job_dir.mkdir(parents=True)
+    (job_dir / "job.json").write_text(json.dumps({
+        "id": "abc", "source": str(src), "db_path": None, "status": "running", "created": 0,
+        "total": 5, "done": 0, "errors": 0, "name_matches": 0, "cell_matches": 0}))
+    # finished before the restart: two files (recorded under different indexes) and a torn line
+    (job_dir / "results.ndjson").write_text(
+        json.dumps({"index": 9, "filename": "card_1.jpg", "match_name": True}) + "\n"
+        + json.dumps({"index": 1, "filename": "card_4.jpg", "match_name": True}) + "\n"
+        + '{"index": 3, "filen')
+    (src / "card_5.jpg").write_bytes(b"img5")     # added to the source while the server was down
+    seen = []
+
+    async def main():
+        m = _manager(root, seen)
+        await m.start()
+        done = await _wait(m, "abc")
+        await m.stop()
+        return done
+
+    done = asyncio.run(main())
+    assert sorted(seen) == [b"img0", b"img2", b"img3", b"img5"]
+    assert done["resumed"] == 1 and done["done"] == done["total"] == 6 and done["name_matches"] == 5
+    assert sorted(r["filename"] for r in _results(root, "abc")) == [f"card_{i}.jpg" for i in range(6)]
+    with open(job_dir / "job.json", "r", encoding="utf8") as fh:
+        assert json.load(fh)["done"] == 6
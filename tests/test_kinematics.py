@@ -0,0 +1,54 @@
+import asyncio
+import sys
+
+import pytest
+
+import bench_cycle
+from app.services import kinematics
+from app.services.kinematics import AxisLimits, KinematicDriver, trapezoid_s
+
+
+def test_trapezoid_and_triangular_profiles():
+    # 500 mm/s, 3000 mm/s^2: vmax is reached after 83.3 mm of ramp up + down
+    assert trapezoid_s(900.0, 500.0, 3000.0) == pytest.approx(900.0 / 500.0 + 500.0 / 3000.0)
+    assert trapezoid_s(-30.0, 500.0, 3000.0) == pytest.approx(2.0 * (30.0 / 3000.0) ** 0.5)
+    assert trapezoid_s(0.0, 500.0, 3000.0) == 0.0
+
+
+def test_virtual_time_move_takes_the_slowest_axis():
+    drv = KinematicDriver(axes={"z": AxisLimits(vmax=50.0, accel=500.0)}, virtual_time=True)
+    est = drv.estimate_move_s((0, 0, 0), (100.0, 0.0, 40.0), 400.0)
+    asyncio.run(drv.move_absolute(100.0, 0.0, 40.0, 400.0))
+    assert drv.clock() == pytest.approx(est)
+    assert drv.stats["axis_limiting"]["z"] == 1 and drv.pos == (100.0, 0.0, 40.0)
+    asyncio.run(drv.vacuum_on())
+    assert drv.clock() == pytest.approx(est + kinematics.DEFAULT_ACTUATORS["vacuum_on"])
+
+
+def test_cell_layout_uses_pitch_and_explicit_coordinates():
+    raw = {"simulator": {"pitch_mm": {"x": 100, "y": 50}},
+           "cells": [{"id": "B2"}, {"id": "C1", "x": 7, "y": 8}, {"id": "ERR1"}]}
+    layout = kinematics.cell_layout(raw, ["B2", "C1", "ERR1"])
+    assert layout["B2"] == {"x": 100.0, "y": 50.0, "z": 0.0}
+    assert layout["C1"] == {"x": 7.0, "y": 8.0, "z": 0.0}
+    assert layout["ERR1"]["x"] == 300.0               # column after the last lettered one
+
+
+def test_bench_cycle_reports_throughput(monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["bench_cycle.py", "--cards", "40"])
+    args = bench_cycle.parse_args()
+    rep = asyncio.run(bench_cycle.run(args))
+    assert rep["cards"] == 40 and rep["cards_per_hour"] > 0
+    assert set(rep["phases_s"]) >= {"pick", "place"}
+    args.route_window = 4
+    planned = asyncio.run(bench_cycle.run(args))
+    assert planned["elapsed_s"] <= rep["elapsed_s"]
+
+
+def test_two_heads_with_feeders_on_one_side_match_one_head(monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["bench_cycle.py", "--cards", "40", "--schedule-feeders"])
+    one = asyncio.run(bench_cycle.run(bench_cycle.parse_args()))
+    monkeypatch.setattr(sys, "argv", ["bench_cycle.py", "--cards", "40", "--heads", "2"])
+    two = asyncio.run(bench_cycle.run_heads(bench_cycle.parse_args()))
+    assert two["active_heads"] == [0] and two["time_scale"] is None
+    assert two["cards_per_hour"] >= 0.95 * one["cards_per_hour"]
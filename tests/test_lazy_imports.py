@@ -0,0 +1,38 @@
+import subprocess
+import sys
+
+import import_budget
+from app.services.lazy import LazyModule
+
+
+def test_service_modules_defer_heavy_backends():
+    code = ("import sys, app.services.card_id, app.services.ocr, app.services.embeddings, "
+            "app.services.catalogs, app.services.rescan; "
+            f"print(sorted(m for m in {import_budget.HEAVY!r} if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
+
+
+def test_recognition_modules_defer_numpy():
+    code = ("import sys, app.services.card_id, app.services.ocr, app.services.embeddings; "
+            "print('numpy' in sys.modules)")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "False"
+
+
+def test_lazy_module_imports_on_first_use():
+    mod = LazyModule("colorsys")
+    assert "not loaded" in repr(mod)
+    assert mod.rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+    assert "(loaded)" in repr(mod)
+
+
+def test_parse_importtime_and_measure():
+    rows = import_budget.parse_importtime(
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |     numpy.core\n"
+        "import time:       300 |        420 |   numpy\n"
+        "import time:        50 |        470 | app.services.card_id\n")
+    assert rows == [("numpy.core", 120, 120, 2), ("numpy", 300, 420, 1), ("app.services.card_id", 50, 470, 0)]
+    r = import_budget.measure("app.services.rules", runs=1)
+    assert r["ms"] > 0 and r["heavy"] == []
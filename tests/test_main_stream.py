@@ -0,0 +1,68 @@
+import asyncio
+import importlib
+import json
+import os
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")        # fastapi's TestClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def main():
+    # main reads config.yaml from the cwd; an empty SORTME_STATE_DIR keeps its cell store in memory
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(ROOT)
+        mp.setenv("SORTME_STATE_DIR", "")
+        mod = importlib.import_module("main")
+    return mod
+
+
+def _files():
+    # the fake analysis reads the card name back out of the "image" bytes
+    names = ["Lightning_Bolt__B1.jpg", "Ancestral_Recall.jpg", "broken.jpg", "Giant_Growth.jpg"]
+    return [("files", (n, n.split("__")[0].replace("_", " ").replace(".jpg", "").encode(), "image/jpeg"))
+            for n in names]
+
+
+def test_stream_emits_each_image_then_the_batch_summary(main, monkeypatch):
+    async def fake_analysis(raw, db_path, ocr_only=False, util=None, game=None):
+        name = raw.decode()
+        await asyncio.sleep(0.01 * (len(name) % 3))     # finish out of upload order
+        if name == "broken":
+            raise RuntimeError("Unsupported image format")
+        return {"game": "mtg", "region_texts": {"name": name},
+                "identify": {"best": {"name": name}, "score": 90.0}}
+
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setattr(main.workers, "run_analysis", fake_analysis)
+    from fastapi.testclient import TestClient
+    client = TestClient(main.app)
+    form = {"db_path": "", "use_filename_expected": "true"}
+
+    batch = client.post("/demo/batch_identify", files=_files(), data=form)
+    assert batch.status_code == 200
+    batch = batch.json()
+
+    resp = client.post("/demo/batch_identify_stream", files=_files(), data=form)
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    events = [json.loads(line) for line in resp.text.splitlines() if line.strip()]
+
+    assert events[0] == {"event": "start", "total": 4}
+    assert events[-1]["event"] == "summary"
+    results = [e for e in events[1:-1] if e["event"] == "result"]
+    assert len(results) == 4 and [e["done"] for e in results] == [1, 2, 3, 4]
+    streamed = sorted((e["result"] for e in results), key=lambda r: r["index"])
+    assert streamed == batch["results"]
+    assert "error" in streamed[2] and streamed[0]["match_name"]
+
+    def stable(summary):
+        # wall time and per-worker timings differ between the two runs
+        return {k: v for k, v in summary.items() if k not in ("elapsed_s", "workers")}
+
+    assert stable(events[-1]["summary"]) == stable(batch["summary"])
+    assert batch["summary"]["total"] == 4
@@ -0,0 +1,42 @@
+import asyncio
+
+from app.services import motion, motion_plan
+
+
+CELLS = {
+    'A1': {'x': 0.0, 'y': 0.0, 'z': 0.0},
+    'B1': {'x': 5.0, 'y': 0.0, 'z': 0.0},
+}
+
+
+def _controller():
+    ctrl = motion.MotionController()
+    ctrl.default_speed = 1e6  # keep simulated moves short
+    ctrl.configure_cells(CELLS)
+    return ctrl
+
+
+def test_transfer_card_completes_under_single_lock():
+    ctrl = _controller()
+    res = asyncio.run(asyncio.wait_for(ctrl.transfer_card('A1', 'B1'), timeout=5))
+    assert res['to'] == 'B1'
+    assert ctrl.current == (5.0, 0.0, 10.0)
+    assert not ctrl.lock.locked()
+
+
+def test_optimize_drops_repeated_safe_z_move():
+    raw = motion_plan.compile_transfer(CELLS, 'A1', 'B1', 100.0)
+    plan = motion_plan.optimize(raw, (0.0, 0.0, 0.0))
+    moves = [p.target for p in plan if p.op == 'move']
+    # travel already ends above B1, so place must not move there again
+    assert moves.count((5.0, 0.0, 10.0)) == 2  # arrive + retract
+    assert len(plan) == len(raw) - 1
+
+
+def test_optimize_merges_collinear_moves():
+    plan = [
+        motion_plan.Primitive("move", "travel", (1.0, 0.0, 0.0), 10.0),
+        motion_plan.Primitive("move", "travel", (2.0, 0.0, 0.0), 10.0),
+    ]
+    out = motion_plan.optimize(plan, (0.0, 0.0, 0.0))
+    assert len(out) == 1 and out[0].target == (2.0, 0.0, 0.0) and out[0].merged == 2
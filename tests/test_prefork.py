@@ -0,0 +1,101 @@
+import gc
+import json
+import os
+import signal
+import socket
+import time
+
+import numpy as np
+import pytest
+
+from app.services import prefork
+
+pytestmark = pytest.mark.skipif(not os.path.exists("/proc/self/smaps_rollup"), reason="needs Linux smaps_rollup")
+
+
+def test_process_memory_splits_rss():
+    m = prefork.process_memory()
+    assert m["pid"] == os.getpid()
+    assert m["rss_mb"] > 0
+    assert m["unique_mb"] + m["shared_mb"] == pytest.approx(m["rss_mb"], abs=0.3)
+
+
+def test_forked_worker_shares_preloaded_array(monkeypatch):
+    big = np.ones(64 * 2 ** 20 // 8)          # 64 MB, touched in the parent before the fork
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        float(big[::512].sum())               # read it: stays shared
+        os.write(w, b"x")
+        time.sleep(30)
+        os._exit(0)
+    os.close(w)
+    try:
+        assert os.read(r, 1) == b"x"
+        monkeypatch.setenv("SORTME_PREFORK_PARENT", str(os.getpid()))
+        report = prefork.worker_memory()
+        workers = [p for p in report["processes"] if p["role"] == "worker"]
+        child = next(p for p in workers if p["pid"] == pid)
+        assert child["shared_mb"] >= 60
+        assert child["unique_mb"] < 30
+        assert report["total_pss_mb"] < report["sum_rss_mb"]
+    finally:
+        os.kill(pid, 9)
+        os.waitpid(pid, 0)
+        os.close(r)
+
+
+def test_run_workers_restarts_until_stopped(monkeypatch):
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    exits = []
+    real_wait = os.wait
+
+    def wait():
+        # every worker exits at once; SIGTERM after the first restarts ends the loop
+        pid, status = real_wait()
+        exits.append(pid)
+        if len(exits) == 3:
+            os.kill(os.getpid(), signal.SIGTERM)
+        return pid, status
+
+    monkeypatch.setattr(os, "wait", wait)
+    handlers = signal.getsignal(signal.SIGTERM), signal.getsignal(signal.SIGINT)
+    try:
+        prefork.run_workers(2, lambda index, s: os._exit(0), sock, restart_delay_s=0.0)
+    finally:
+        signal.signal(signal.SIGTERM, handlers[0])
+        signal.signal(signal.SIGINT, handlers[1])
+        os.environ.pop("SORTME_PREFORK_PARENT", None)
+        sock.close()
+    assert len(exits) == 4          # 2 first workers + 2 restarts; none after the stop
+
+
+def test_only_worker_zero_is_primary(monkeypatch):
+    monkeypatch.delenv("SORTME_WORKER_INDEX", raising=False)
+    assert prefork.worker_index() == 0 and prefork.is_primary_worker()      # not under serve.py
+    monkeypatch.setenv("SORTME_WORKER_INDEX", "0")
+    assert prefork.is_primary_worker()
+    monkeypatch.setenv("SORTME_WORKER_INDEX", "2")
+    assert prefork.worker_index() == 2 and not prefork.is_primary_worker()
+
+
+def test_preload_leaves_the_query_encoder_to_the_workers(tmp_path, monkeypatch):
+    pytest.importorskip("sklearn")
+    pytest.importorskip("cv2")
+    from app.services import card_id, catalogs
+
+    np.save(tmp_path / "embeddings.npy", np.zeros((10, 8), dtype=np.float32))
+    (tmp_path / "cards_metadata.json").write_text(json.dumps([{"name": f"card {i}"} for i in range(10)]))
+
+    def encoder(*args, **kwargs):
+        raise AssertionError("query encoder loaded before the fork")
+
+    monkeypatch.setattr(card_id, "_query_encoder", encoder)
+    monkeypatch.setattr(catalogs, "_REGISTRY", None)
+    try:
+        loaded = prefork.preload({"cells": [{"id": "A1"}], "games": {"mtg": {"embeddings_dir": str(tmp_path)}}})
+    finally:
+        gc.unfreeze()
+    assert loaded["embeddings"] == str(tmp_path) and "encoder" not in loaded
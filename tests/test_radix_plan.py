@@ -0,0 +1,66 @@
+import random
+
+from app.services.assign import Card, SystemState, load_config
+from app.services.radix_plan import plan_sort, sort_key
+
+CELLS = ['A1'] + [f'{c}{r}' for c in 'BCD' for r in (1, 2)] + ['ERR1']
+CFG = load_config({
+    'cells': [{'id': c, 'capacity': 120 if c == 'A1' else 20} for c in CELLS],
+    'feeder': {'reserve_pattern': '^A'},
+    'alpha_exact': {'letter_to_cell': {'A': 'B1'}},
+    'overflow': {'cells': ['ERR1']},
+})
+
+
+def _collection(rnd):
+    names = [f'card {i:03d}' for i in range(150)]
+    cards = [Card('mtg', rnd.choice(names), 'SET', str(rnd.randint(1, 3))) for _ in range(300)]
+    return cards + [Card('mtg', 'Island', 'SET', '1')] * 60
+
+
+def test_executing_the_script_yields_sorted_single_key_piles():
+    rnd = random.Random(3)
+    cards = _collection(rnd)
+    plan = plan_sort(cards, CFG)
+    assert plan['cells'] == 6
+
+    groups = {'all': list(cards)}
+    finished = {}
+    placements = 0
+    for sp in plan['passes']:
+        state = SystemState({c: 0 for c in CELLS})
+        feed = [c for g in sp.group.split(',') for c in groups.pop(g)]
+        rnd.shuffle(feed)
+        assert len(feed) == sp.cards
+        piles = {b.id: [] for b in sp.buckets}
+        for card in feed:
+            cell, reason = sp.route(card, CFG, state)
+            if reason.startswith('sweep_needed'):
+                bucket = next(b for b in sp.buckets if b.id == reason.split(':')[1])
+                for cid in bucket.cells:        # operator empties the bucket's cells
+                    state.counts_by_cell[cid] = 0
+                cell, reason = sp.route(card, CFG, state)
+            assert cell in CFG.cells and cell != 'ERR1', reason
+            state.counts_by_cell[cell] += 1
+            piles[reason.split(':')[1]].append(card)
+            placements += 1
+        for b in sp.buckets:
+            (finished if b.final else groups)[b.id] = piles[b.id]
+
+    assert not groups
+    assert placements == plan['pick_and_place']
+    # every finished pile holds one key; the basic lands were split off in the first pass
+    keys = sorted(sort_key(p[0]) for p in finished.values())
+    assert all(len({sort_key(c) for c in p}) == 1 for p in finished.values())
+    assert len(keys) == len(set(keys)) == plan['distinct_keys']
+    island = next(b for b in plan['passes'][0].buckets if b.first[0] == 'island')
+    assert island.final and island.cards == 60
+    assert plan['avg_passes_per_card'] < 4
+
+
+def test_unplanned_card_is_diverted():
+    plan = plan_sort([Card('mtg', n) for n in ('a', 'b', 'c')], CFG)
+    sp = plan['passes'][0]
+    state = SystemState({c: 0 for c in CELLS})
+    assert sp.route(Card('mtg', 'bb'), CFG, state) == ('ERR1', 'divert:unplanned')
+    assert sp.route(Card('mtg', 'b'), CFG, state)[1] == f'pass1:{sp.buckets[1].id}'
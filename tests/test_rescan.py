@@ -0,0 +1,54 @@
+from app.services.rescan import RescanCascade, Tier
+
+
+class Clock:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def _tier(clock, name, cost_s, results, est_ms=100.0):
+    def run(item):
+        clock.t += cost_s
+        conf = results.get(item['id'])
+        return None if conf is None else {'name': f'{name}:{item["id"]}', 'confidence': conf}
+    return Tier(name, run, est_ms)
+
+
+def test_cascade_stops_at_first_confident_tier_and_counts_rescues():
+    clock = Clock()
+    tiers = [_tier(clock, 'ocr_thorough', 0.4, {1: 0.6, 2: 0.9}),
+             _tier(clock, 'rotate_180', 0.2, {1: 0.95}),
+             _tier(clock, 'image_embedding', 0.1, {})]
+    cascade = RescanCascade(tiers, threshold=0.8, budget_ms=1000, refeed_s=5.0, clock=clock)
+
+    assert cascade.rescue({'id': 0}, {'name': 'ok', 'confidence': 0.9}) == {'name': 'ok', 'confidence': 0.9}
+    one = cascade.rescue({'id': 1}, {'name': 'x', 'confidence': 0.2})
+    assert one['name'] == 'rotate_180:1'
+    assert one['rescan']['tried'] == ['ocr_thorough', 'rotate_180']
+    two = cascade.rescue({'id': 2}, {'name': 'y', 'confidence': 0.2})
+    assert two['rescan']['tier'] == 'ocr_thorough'
+    three = cascade.rescue({'id': 3}, {'name': 'z', 'confidence': 0.5})
+    assert three['name'] == 'z' and three['rescan']['tier'] is None
+
+    s = cascade.stats()
+    assert (s['cards'], s['low_confidence'], s['rescued'], s['still_low']) == (4, 3, 2, 1)
+    assert s['tiers']['ocr_thorough']['rescued'] == 1 and s['tiers']['ocr_thorough']['improved'] == 1
+    assert s['tiers']['rotate_180']['rescued'] == 1
+    assert s['tiers']['image_embedding']['unavailable'] == 1
+    assert s['refeed_saved_s'] == 10.0
+
+
+def test_tier_is_skipped_when_its_measured_cost_exceeds_the_budget():
+    clock = Clock()
+    slow = _tier(clock, 'ocr_thorough', 0.9, {}, est_ms=100.0)
+    fast = _tier(clock, 'image_embedding', 0.05, {1: 0.9, 2: 0.9, 3: 0.9})
+    cascade = RescanCascade([slow, fast], threshold=0.8, budget_ms=500, clock=clock)
+    tiers = [cascade.rescue({'id': i}, {'confidence': 0.1})['rescan']['tier'] for i in (1, 2, 3)]
+    # the first run (model load) is not timed, so the slow tier runs twice on its guess and
+    # leaves no budget for the next tier; measured at 900 ms > 500 ms it is skipped after that
+    assert tiers == [None, None, 'image_embedding']
+    assert slow.attempts == 2 and slow.skipped_budget == 1 and fast.skipped_budget == 2
+    assert cascade.stats()['rescued'] == 1
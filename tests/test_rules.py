@@ -0,0 +1,98 @@
+import random
+
+from app.services.assign import Card, SystemState, assign_card, load_config
+from app.services.rules import _color_mask, _low, compile_rules, first_letter
+
+
+def _cfg(rules):
+    return load_config({
+        'sorting': {'default_mode': 'rules'},
+        'cells': [{'id': c, 'capacity': 2} for c in ('A1', 'B1', 'C1', 'D1', 'ERR1')],
+        'feeder': {'reserve_pattern': '^A'},
+        'alpha_exact': {'letter_to_cell': {'L': 'B1', 'O': 'B1'}},
+        'overflow': {'cells': ['ERR1']},
+        'rules': rules,
+    })
+
+
+def test_first_matching_rule_with_capacity_and_fallback():
+    cfg = _cfg([
+        {'name': 'pricey', 'when': {'price': {'min': 20}}, 'cells': ['D1']},
+        {'name': 'blue_cheap', 'when': {'color_identity': 'U', 'mana_value': {'max': 2}, 'rarity': ['common']},
+         'cells': ['C1', 'D1']},
+        {'name': 'multi', 'when': {'color_identity': ['multi'], 'set': ['dmu']}, 'cell': 'C1'},
+    ])
+    state = SystemState({c: 0 for c in cfg.cells})
+
+    def place(card):
+        cell, reason = assign_card(card, cfg, state)
+        state.counts_by_cell[cell] += 1
+        return cell, reason
+
+    opt = Card('mtg', 'Opt', rarity='common', color_identity='U', mana_value=1, price=0.1)
+    assert place(opt) == ('C1', 'rule:blue_cheap')
+    assert place(Card('mtg', 'Opt', rarity='common', color_identity='U', mana_value=1, price=25)) == ('D1', 'rule:pricey')
+    assert place(Card('mtg', 'Jodah', set_code='DMU', color_identity='WUBRG')) == ('C1', 'rule:multi')
+    # C1 full: the rule's next cell, then overflow once every cell of the rule is full
+    assert place(opt) == ('D1', 'rule:blue_cheap')
+    assert place(opt) == ('ERR1', 'overflow:rule:blue_cheap')
+    # unmatched (mana value 3 > 2) -> letter mapping
+    assert place(Card('mtg', 'Lat-Nam', rarity='common', color_identity='U', mana_value=3)) == ('B1', 'alpha_exact:L')
+    assert cfg.rules.stats()['hits'] == {'pricey': 1, 'blue_cheap': 3, 'multi': 1}
+
+
+def _brute(rule, card):
+    w = rule.when
+    for f, attr in (('set', 'set_code'), ('rarity', 'rarity'), ('game', 'game'), ('name', 'name')):
+        if w.get(f) is not None:
+            v = getattr(card, attr)
+            if v is None or _low(v) not in [_low(x) for x in w[f]]:
+                return False
+    if w.get('letter') is not None and first_letter(card.name) not in w['letter']:
+        return False
+    if w.get('color_identity') is not None:
+        if card.color_identity is None:
+            return False
+        c = _color_mask(card.color_identity)
+        if not any((bin(c).count('1') >= 2) if s == 'multi' else c == _color_mask(s) for s in w['color_identity']):
+            return False
+    for f in ('mana_value', 'price'):
+        spec = w.get(f)
+        if spec is not None:
+            v = getattr(card, f)
+            if v is None or v < spec.get('min', -1e9) or v > spec.get('max', 1e9) or v >= spec.get('below', 1e9):
+                return False
+    return True
+
+
+def test_compiled_tables_agree_with_brute_force_on_many_rules():
+    rnd = random.Random(7)
+    sets, rarities, colors = ['dmu', 'bro', 'one', 'mom'], ['common', 'uncommon', 'rare', 'mythic'], ['W', 'U', 'UB', 'C', 'multi']
+    rules = []
+    for i in range(300):
+        when = {}
+        if rnd.random() < 0.4:
+            when['set'] = rnd.sample(sets, 2)
+        if rnd.random() < 0.4:
+            when['rarity'] = rnd.sample(rarities, 1)
+        if rnd.random() < 0.3:
+            when['color_identity'] = rnd.sample(colors, 2)
+        if rnd.random() < 0.3:
+            when['letter'] = rnd.sample('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 5)
+        if rnd.random() < 0.4:
+            lo = rnd.randint(0, 5)
+            when['mana_value'] = {'min': lo, 'max': lo + rnd.randint(0, 3)}
+        if rnd.random() < 0.4:
+            lo = round(rnd.uniform(0, 10), 2)
+            when['price'] = {'min': lo, 'below': lo + rnd.choice([0.5, 1, 5])}
+        rules.append({'when': when, 'cell': 'C1'})
+    rs = compile_rules(rules, {'C1': None})
+    for _ in range(2000):
+        card = Card('mtg', rnd.choice('ABCXYZ') + 'x',
+                    set_code=rnd.choice(sets).upper() if rnd.random() < 0.9 else None,
+                    rarity=rnd.choice(rarities + [None]),
+                    color_identity=rnd.choice(['W', 'U', 'UB', '', 'WUBRG', None]),
+                    mana_value=rnd.choice([0, 1, 2, 3, 4.5, 7, None]),
+                    price=rnd.choice([0.0, 0.5, 1.0, 2.37, 5.0, 9.99, 12.0, None]))
+        expected = next((r for r in rs.rules if _brute(r, card)), None)
+        assert rs.match(card) is expected
@@ -0,0 +1,304 @@
+import asyncio
+import importlib
+import os
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def run_loop():
+    # run_loop imports services.* (app/ on sys.path) and reads config.yaml from the cwd;
+    # an empty SORTME_STATE_DIR keeps its cell store in memory
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(ROOT)
+        mp.syspath_prepend(os.path.join(ROOT, "app"))
+        mp.setenv("SORTME_STATE_DIR", "")
+        mod = importlib.import_module("services.run_loop")
+    return mod
+
+
+@pytest.fixture
+def rl(run_loop):
+    run_loop.store.reset()
+    run_loop.feeder_scheduler = run_loop.FeederScheduler.from_cfg(run_loop.CFG)
+    return run_loop
+
+
+class FakeGantry:
+    def __init__(self, move_s=0.0):
+        self.move_s = move_s
+        self.moves = []
+
+    async def transfer_card(self, from_cell, to_cell):
+        await asyncio.sleep(self.move_s)
+        self.moves.append((from_cell, to_cell))
+        return {"duration_s": self.move_s}
+
+
+def _capture(names):
+    items = iter([{"id": i, "name": n} for i, n in enumerate(names)])
+
+    async def capture():
+        await asyncio.sleep(0)
+        return next(items, None)
+    return capture
+
+
+def _identify(delay_s):
+    def identify(item):
+        time.sleep(delay_s)
+        return {"game": "mtg", "name": item["name"], "confidence": 0.99}
+    return identify
+
+
+def test_pipeline_overlaps_identify_with_motion_and_keeps_order(rl):
+    names = ["Bolt", "Zap", "Aether", "Cancel", "Yawn", "Bolt"]
+    gantry = FakeGantry(move_s=0.05)
+    pipe = rl.RunPipeline(_capture(names), identify=_identify(0.05), controller=gantry)
+    stats = asyncio.run(pipe.run())
+
+    # alpha_exact: B -> B2, Z -> J2, A -> B1, C -> B3, Y -> J1
+    assert [to for _, to in gantry.moves] == ["B2", "J2", "B1", "B3", "J1", "B2"]
+    assert all(src in ("A1", "A2", "A3") for src, _ in gantry.moves)
+    assert stats["placed"] == 6 and rl.store.get("B2") == 2
+    assert [c["name"] for c in rl.store.pile("B2")] == ["Bolt", "Bolt"]
+    # one card identified while the previous one moves: well under 6 x (0.05 + 0.05) s serial
+    assert stats["wall_s"] < 0.5
+    assert stats["stages"]["identify"]["items"] == stats["stages"]["motion"]["items"] == 6
+
+
+def _gated_queue(rl, policy, maxsize=1):
+    gate = asyncio.Event()
+    handled = []
+
+    async def handler(meta):
+        await gate.wait()
+        handled.append(meta)
+    return rl.PlacementQueue(handler, maxsize=maxsize, policy=policy, overflow_cell="ERR1"), gate, handled
+
+
+def test_backpressure_block_waits_for_room(rl):
+    async def main():
+        q, gate, handled = _gated_queue(rl, "block")
+        await q.submit({"name": "one"})
+        await asyncio.sleep(0)                   # consumer takes it and waits on the gantry
+        await q.submit({"name": "two"})          # fills the queue
+        third = asyncio.create_task(q.submit({"name": "three"}))
+        await asyncio.sleep(0.05)
+        assert not third.done()
+        gate.set()
+        await third
+        await q.drain(timeout=1)
+        return q, handled
+
+    q, handled = asyncio.run(main())
+    assert [m["name"] for m in handled] == ["one", "two", "three"]
+    assert q.stats()["processed"] == 3 and q.stats()["dropped"] == q.stats()["rejected"] == 0
+
+
+def test_backpressure_reject_raises(rl):
+    async def main():
+        q, gate, handled = _gated_queue(rl, "reject")
+        await q.submit({"name": "one"})
+        await asyncio.sleep(0)
+        await q.submit({"name": "two"})
+        with pytest.raises(rl.PlacementRejected):
+            await q.submit({"name": "three"})
+        gate.set()
+        await q.drain(timeout=1)
+        return q, handled
+
+    q, handled = asyncio.run(main())
+    assert [m["name"] for m in handled] == ["one", "two"]
+    assert q.stats()["rejected"] == 1
+
+
+def test_backpressure_drop_err1_diverts_without_waiting(rl):
+    events = []
+    rl.placement_listeners.append(lambda event, payload: events.append((event, payload)))
+
+    async def main():
+        q, gate, handled = _gated_queue(rl, "drop_err1")
+        await q.submit({"name": "one"})
+        await asyncio.sleep(0)
+        await q.submit({"name": "two"})
+        await asyncio.wait_for(q.submit({"name": "three"}), 0.05)    # returns at once
+        gate.set()
+        await q.drain(timeout=1)
+        return q, handled
+
+    try:
+        q, handled = asyncio.run(main())
+    finally:
+        rl.placement_listeners.clear()
+    assert [(m["name"], m.get("divert")) for m in handled] == [("one", None), ("two", None), ("three", "ERR1")]
+    assert q.stats()["dropped"] == 1 and q.stats()["processed"] == 3
+    assert events == [("placement_diverted", {"card": "three", "cell": "ERR1", "reason": "divert:backpressure"})]
+
+
+def test_diverted_card_is_assigned_and_moved_to_the_overflow_cell(rl, monkeypatch):
+    gantry = FakeGantry()
+    monkeypatch.setattr(rl.motion_svc, "get_controller", lambda: gantry)
+    events = []
+    rl.placement_listeners.append(lambda event, payload: events.append(event))
+    try:
+        asyncio.run(rl._handle_card_identified_async(
+            {"game": "mtg", "name": "Bolt", "confidence": 0.99, "divert": "ERR1", "from_cell": "A1"}))
+    finally:
+        rl.placement_listeners.clear()
+    assert gantry.moves == [("A1", "ERR1")]
+    assert rl.store.get("ERR1") == 1 and rl.store.get("B2") == 0
+    assert events == ["placement"]
+
+
+def test_queue_rebinds_after_its_loop_closes(rl):
+    handled = []
+
+    async def handler(meta):
+        handled.append(meta["name"])
+
+    q = rl.PlacementQueue(handler, maxsize=2)
+
+    async def one(name):
+        await q.submit({"name": name})
+        await q._settle()
+
+    asyncio.run(one("first"))
+    asyncio.run(one("second"))               # the first loop is closed by now
+    assert handled == ["first", "second"]
+
+
+def _sim_controller(rl):
+    from services import kinematics, motion
+
+    class Recording(motion.MotionController):
+        async def transfer_card(self, from_cell, to_cell):
+            self.moves.append((from_cell, to_cell))
+            return await super().transfer_card(from_cell, to_cell)
+
+    ctrl = Recording(kinematics.KinematicDriver.from_cfg(rl._RAW_CFG.get("simulator"), virtual_time=True))
+    ctrl.moves = []
+    ctrl.configure_cells(kinematics.cell_layout(rl._RAW_CFG, rl.CFG.cells.keys()))
+    return ctrl
+
+
+def test_cells_get_grid_coordinates(rl):
+    cells = rl.ctrl.cells
+    assert len({(c["x"], c["y"]) for c in cells.values()}) == len(cells)
+    assert cells["B1"]["x"] < cells["J2"]["x"] and cells["A1"]["y"] < cells["A3"]["y"]
+
+
+def test_window_is_reordered_to_cut_travel(rl, monkeypatch):
+    ctrl = _sim_controller(rl)
+    monkeypatch.setattr(rl.motion_svc, "get_controller", lambda: ctrl)
+    before = dict(rl.route_stats)
+    # arrival order alternates between the far (J) and near (B) ends of the grid
+    metas = [{"game": "mtg", "name": n, "confidence": 0.99} for n in ("Zap", "Aether", "Yawn", "Cancel")]
+    asyncio.run(rl._handle_window_async(metas))
+
+    dests = [to for _, to in ctrl.moves]
+    assert sorted(dests) == ["B1", "B3", "J1", "J2"]
+    assert dests != ["J2", "B1", "J1", "B3"]
+    assert rl.route_stats["est_saved_s"] > before["est_saved_s"]
+    assert all(rl.store.get(c) == 1 for c in dests)
+    assert len({src for src, _ in ctrl.moves}) > 1           # feeders picked per transfer
+
+
+def test_window_releases_reservations_when_planning_fails(rl, monkeypatch):
+    monkeypatch.setattr(rl.motion_svc, "get_controller", lambda: _sim_controller(rl))
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("planner failed")
+
+    monkeypatch.setattr(rl.route_plan, "plan_window", broken)
+    metas = [{"game": "mtg", "name": n, "confidence": 0.99} for n in ("Zap", "Aether")]
+    with pytest.raises(RuntimeError):
+        asyncio.run(rl._handle_window_async(metas))
+    assert rl.store.get("J2") == rl.store.get("B1") == 0
+    assert rl.store.pile("J2") == [] and rl.store.pile("B1") == []
+
+
+def test_window_never_picks_from_reloading_feeders(rl, monkeypatch):
+    monkeypatch.setattr(rl.motion_svc, "get_controller", lambda: _sim_controller(rl))
+    for f in ("A1", "A2", "A3"):
+        rl.feeder_scheduler.begin_reload(f)
+    metas = [{"game": "mtg", "name": n, "confidence": 0.99} for n in ("Zap", "Aether")]
+    with pytest.raises(rl.FeederEmpty):
+        asyncio.run(rl._handle_window_async(metas))
+    assert rl.store.get("J2") == rl.store.get("B1") == 0
+
+
+def test_window_places_only_what_the_feeders_hold(rl, monkeypatch):
+    ctrl = _sim_controller(rl)
+    monkeypatch.setattr(rl.motion_svc, "get_controller", lambda: ctrl)
+    rl.feeder_scheduler = rl.FeederScheduler({"A1": 10, "A2": 10, "A3": 10}, initial={"A1": 1, "A2": 0, "A3": 0})
+    events = []
+    rl.placement_listeners.append(lambda event, payload: events.append((event, payload.get("to", payload.get("cell")))))
+    try:
+        metas = [{"game": "mtg", "name": n, "confidence": 0.99} for n in ("Zap", "Aether", "Yawn")]
+        asyncio.run(rl._handle_window_async(metas))
+    finally:
+        rl.placement_listeners.clear()
+    assert ctrl.moves == [("A1", "J2")]                      # the first card; nothing from A2 / A3
+    assert events == [("placement_failed", "B1"), ("placement_failed", "J1"), ("placement", "J2")]
+    assert rl.store.get("J2") == 1 and rl.store.get("B1") == rl.store.get("J1") == 0
+
+
+def test_queue_places_through_the_coordinator_with_a_consumer_per_head(rl, monkeypatch):
+    heads = [_sim_controller(rl), _sim_controller(rl)]
+    far = max(c["x"] for c in heads[0].cells.values()) + 90.0
+    for h in heads:
+        h.cells["A3"] = dict(h.cells["A3"], x=far)       # a feeder at each end of the rail
+    monkeypatch.setattr(rl, "_heads", heads)
+    monkeypatch.setattr(rl, "_coordinator", None)
+    events = []
+    rl.placement_listeners.append(lambda event, payload: events.append((event, payload.get("head"))))
+    names = ["Zap", "Aether", "Yawn", "Cancel", "Bolt", "Zap"]
+
+    async def main():
+        q = rl.PlacementQueue(rl._handle_card_coordinated_async, maxsize=4, consumers=2)
+        for n in names:
+            await q.submit({"game": "mtg", "name": n, "confidence": 0.99})
+        await q.drain()
+        return q
+
+    try:
+        q = asyncio.run(main())
+    finally:
+        rl.placement_listeners.clear()
+    assert q.metrics["processed"] == 6 and all(e == "placement" for e, _ in events)
+    assert {h for _, h in events} == {0, 1}
+    assert rl.store.get("J2") == 2 and rl.store.get("B1") == 1
+    assert sum(len(h.moves) for h in heads) == 6
+    assert rl.coordinator_stats()["heads"][1]["transfers"] > 0
+
+
+def test_capture_failures_back_off_and_stop_after_too_many(rl):
+    calls = []
+
+    async def flaky():
+        calls.append(time.perf_counter())
+        if len(calls) <= 2:
+            raise OSError("camera timeout")
+        return None if len(calls) > 3 else {"id": 0, "name": "Bolt"}
+
+    gantry = FakeGantry()
+    pipe = rl.RunPipeline(flaky, identify=_identify(0), controller=gantry, capture_retry_s=0.02)
+    stats = asyncio.run(pipe.run())
+    assert stats["placed"] == 1 and stats["stages"]["capture"]["errors"] == 2
+    # 0.02 s then 0.04 s between the failed tries
+    assert calls[2] - calls[0] >= 0.055
+
+    async def dead():
+        calls.append(time.perf_counter())
+        raise OSError("camera unplugged")
+
+    calls.clear()
+    pipe = rl.RunPipeline(dead, identify=_identify(0), controller=gantry,
+                          capture_retry_s=0.001, max_capture_failures=3)
+    stats = asyncio.run(pipe.run())
+    assert len(calls) == 3 and stats["placed"] == 0
+    assert stats["capture_error"] == "camera unplugged"
@@ -0,0 +1,42 @@
+import os
+
+from app.services.cell_store import CellStore
+from app.services.state_journal import StateJournal, iter_ledger
+
+CELLS = ['A1', 'B1', 'B2', 'ERR1']
+
+
+def _store(root, **kw):
+    return CellStore(CELLS, journal=StateJournal(str(root), group_commit_ms=1, **kw))
+
+
+def test_counts_survive_restart_and_torn_tail(tmp_path):
+    store = _store(tmp_path)
+    store.add('B1', 3)
+    store.release('B1')
+    store.add('B2')
+    store.close()
+    # simulate a crash in the middle of writing the next record
+    with open(os.path.join(tmp_path, 'placements.log'), 'a') as fh:
+        fh.write('{"seq": 4, "op": "add", "cel')
+
+    store = _store(tmp_path)
+    assert store.counts() == {'A1': 0, 'B1': 2, 'B2': 1, 'ERR1': 0}
+    store.add('B1')
+    store.close()
+    assert _store(tmp_path).counts()['B1'] == 3
+
+
+def test_compaction_keeps_counts_and_ledger(tmp_path):
+    store = _store(tmp_path, compact_every=3)
+    for _ in range(7):
+        store.add('B2')
+        store.flush()
+    store.reset()
+    store.add('B1')
+    store.close()
+
+    assert os.path.exists(os.path.join(tmp_path, 'snapshot.json'))
+    assert _store(tmp_path).counts() == {'A1': 0, 'B1': 1, 'B2': 0, 'ERR1': 0}
+    seqs = [r['seq'] for r in iter_ledger(str(tmp_path))]
+    assert seqs == list(range(1, 10))
@@ -0,0 +1,53 @@
+import json
+
+import numpy as np
+
+import export_encoder
+from app.services import text_encoder
+
+
+class FixedEncoder:
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def encode(self, texts, convert_to_numpy=True):
+        return np.asarray([self.vectors[t] for t in texts], dtype=np.float32)
+
+
+def _write_meta(tmp_path, **check):
+    entry = {"model": text_encoder.DEFAULT_MODEL, "dim": 384, "reference_dim": 384, "agreement": 0.99}
+    entry.update(check)
+    (tmp_path / text_encoder.META_FILE).write_text(json.dumps({"backends": {"onnx": entry}}))
+
+
+def test_agreement_gate_checks_score_model_and_width(tmp_path):
+    assert not text_encoder._agreement_ok("onnx", str(tmp_path), 0.98)          # never checked
+    _write_meta(tmp_path)
+    assert text_encoder._agreement_ok("onnx", str(tmp_path), 0.98)
+    assert text_encoder._agreement_ok("onnx", str(tmp_path), 0.98, dim=384)
+    assert not text_encoder._agreement_ok("onnx", str(tmp_path), 0.995)
+    assert not text_encoder._agreement_ok("onnx", str(tmp_path), 0.98, model_name="all-mpnet-base-v2")
+    assert not text_encoder._agreement_ok("onnx", str(tmp_path), 0.98, dim=768)
+    _write_meta(tmp_path, dim=256)
+    assert not text_encoder._agreement_ok("onnx", str(tmp_path), 0.98)
+    _write_meta(tmp_path, dim=None)
+    assert not text_encoder._agreement_ok("onnx", str(tmp_path), 0.98)
+    assert not text_encoder._agreement_ok("int8", str(tmp_path), 0.98)
+
+
+def test_top1_agreement_counts_unchanged_nearest_cards():
+    index = np.eye(3, dtype=np.float32)
+    assert list(text_encoder.top1_indices(index[[2, 0, 1]], index)) == [2, 0, 1]
+    ref = FixedEncoder({"a": [1, 0, 0], "b": [0, 1, 0], "c": [0, 0, 1], "d": [0.9, 0.1, 0]})
+    cand = FixedEncoder({"a": [0.8, 0.1, 0], "b": [0, 0.2, 0.9], "c": [0, 0, 1], "d": [1, 0, 0]})
+    assert text_encoder.top1_agreement(ref, cand, ["a", "b", "c", "d"], index) == 0.75
+    assert text_encoder.top1_agreement(ref, cand, [], index) == 1.0
+
+
+def test_export_queries_sample_card_names(tmp_path):
+    rows = [{"name": f"Card {i}"} for i in range(10)] + [{"name": None}]
+    (tmp_path / "cards_metadata.json").write_text(json.dumps(rows))
+    texts = export_encoder.load_query_texts(str(tmp_path), 4)
+    assert len(texts) >= 4 and all(t for t in texts)
+    assert set(texts[:4]) <= {r["name"] for r in rows[:10]}
+    assert texts[:4] == export_encoder.load_query_texts(str(tmp_path), 4)[:4]
@@ -0,0 +1,45 @@
+import asyncio
+import os
+
+import pytest
+
+from app.services import workers
+
+
+def test_pool_size_zero_runs_inline(monkeypatch):
+    monkeypatch.setenv("SORTME_WORKERS", "0")
+    seen = []
+
+    def fake_analyze(raw, db_path, ocr_only=False, game=None):
+        seen.append((os.getpid(), raw, db_path, game))
+        if raw == b"bad":
+            raise ValueError("Unsupported image format")
+        return {"game": game or "mtg", "region_texts": {}}
+
+    monkeypatch.setattr(workers, "analyze_image", fake_analyze)
+    assert workers.get_pool() is None
+
+    util = {}
+    out = asyncio.run(workers.run_analysis(b"img", "cards.json", util=util, game="mtg"))
+    assert out == {"game": "mtg", "region_texts": {}}
+    assert seen == [(os.getpid(), b"img", "cards.json", "mtg")]
+    assert util[os.getpid()]["tasks"] == 1
+    with pytest.raises(RuntimeError, match="Unsupported image format"):
+        asyncio.run(workers.run_analysis(b"bad", None))
+    assert workers.utilization()["pool_size"] == 0
+    assert str(os.getpid()) in workers.encoder_stats()["processes"]
+
+
+def test_catalog_stats_sum_this_process_and_workers(monkeypatch):
+    np = pytest.importorskip("numpy")
+    from app.services.catalogs import CatalogRegistry, get_registry
+
+    # another worker's registry, as reported back with its last task (_timed_analyze)
+    worker = CatalogRegistry({"cells": [{"id": "A1"}], "games": {"mtg": {"frame": {"border_rgb": [20, 20, 20]}}}})
+    worker.detect(np.full((100, 70, 3), 20, dtype=np.uint8))
+    monkeypatch.setattr(workers, "_CATALOGS", {999999: worker.stats()})
+    here = get_registry().stats()
+    out = workers.catalog_stats()
+    assert out["detected"] == here["detected"] + 1
+    assert set(out["processes"]) == {"999999", str(os.getpid())}
+    assert out["processes"]["999999"]["detected"] == 1